@@ -1,5 +1,7 @@
 # backend/app/api/v1/routes_analysis.py
 
+import asyncio
+import json
 import os
 import tempfile
 from pathlib import Path
@@ -7,18 +9,32 @@ from fastapi import HTTPException
 from datetime import datetime
 
 
-from fastapi import APIRouter, UploadFile, File
+from fastapi import APIRouter, UploadFile, File, Request
+from fastapi.responses import StreamingResponse
 from app.schemas.analysis import (
     SourceInput,
     DataProfile,
     FileAnalysisRequest,
     DBAnalysisRequest,
+    DBBulkAnalysisRequest,
 )
-from app.services.analysis_service import analyze_source, analyze_file, analyze_db
+from app.services.analysis_service import analyze_source, analyze_file, analyze_db, analyze_db_bulk
 from app.services.monitoring_service import monitor_performance
 
 router = APIRouter()
 
+
+async def _cancel_on_disconnect(request: Request, coro, poll_interval: float = 0.5):
+    """Выполнить корутину; при разрыве соединения клиента — отменить её вместе с запросами к БД."""
+    task = asyncio.ensure_future(coro)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=poll_interval)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            task.cancel()
+            raise HTTPException(status_code=499, detail="Клиент закрыл соединение")
+
 # --- Upload файла (multipart/form-data) ---
 # ВАЖНО: router для этого модуля подключается с prefix="/analysis" в router.py,
 # поэтому здесь путь КОРОТКИЙ — "/profile"
@@ -77,8 +93,18 @@ async def analyze_file_source(payload: FileAnalysisRequest) -> DataProfile:
     summary="Analyze DB source (JSON)",
     response_model_exclude_none=True,   # <-- добавили
 )
-async def analyze_db_source(payload: DBAnalysisRequest) -> DataProfile:
-    return await analyze_db(payload)
+async def analyze_db_source(payload: DBAnalysisRequest, request: Request) -> DataProfile:
+    return await _cancel_on_disconnect(request, analyze_db(payload))
+
+
+# --- Пакетный анализ всех таблиц схемы/БД (NDJSON-стрим) ---
+@router.post("/db/bulk", summary="Profile all tables of a DB schema (NDJSON stream)", response_model=None)
+async def analyze_db_bulk_source(payload: DBBulkAnalysisRequest) -> StreamingResponse:
+    async def _ndjson():
+        async for item in analyze_db_bulk(payload):
+            yield json.dumps(item, ensure_ascii=False, default=str) + "\n"
+
+    return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
 
 
 @router.post("/_debug/upload", response_model=None)
@@ -3,6 +3,7 @@ from app.integrations.airflow_client import airflow_client
 from app.connectors.database_connector import PostgresConnector, ClickHouseConnector
 from app.core.config import settings
 from app.services.monitoring_service import monitoring_service, monitor_performance
+from app.services.llm_service import llm_service
 import asyncio
 
 
@@ -61,6 +62,19 @@ async def airflow_health():
         }
 
 
+@router.get("/llm")
+async def llm_health():
+    """Проверка LLM сервиса и состояние автоматов защиты провайдеров"""
+    probe = await llm_service.health_check()
+    monitoring_service.record_health_check("llm", probe["healthy"])
+    return {
+        "status": "ok" if probe["healthy"] else "error",
+        "llm_url": settings.llm_base_url,
+        "probe": probe,
+        "circuits": {name: b.snapshot() for name, b in llm_service.transport.breakers.items()},
+    }
+
+
 @router.get("/databases")
 async def databases_health():
     """Проверка доступности баз данных"""
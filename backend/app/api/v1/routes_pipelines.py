@@ -1,6 +1,14 @@
-from fastapi import APIRouter
-from app.schemas.pipelines import PipelineDraftRequest, PipelineDraftResponse
+from fastapi import APIRouter, HTTPException
+from app.schemas.pipelines import (
+    PipelineDraftRequest, PipelineDraftResponse, StagingLoadRequest, StagingLoadResponse,
+    TransferRequest, TransferResponse, PipelineRunRequest, PipelineRunResponse,
+    MergeRequest, MergeResponse,
+)
 from app.services.pipeline_service import create_pipeline_draft
+from app.services.staging_load_service import load_to_staging
+from app.services.transfer_service import transfer
+from app.services.pipeline_executor import run_pipeline
+from app.services.merge_service import merge
 from app.integrations.airflow_client import airflow_client
 
 
@@ -9,12 +17,18 @@ router = APIRouter()
 
 @router.post("/draft", response_model=PipelineDraftResponse)
 async def create_draft(payload: PipelineDraftRequest) -> PipelineDraftResponse:
-    return await create_pipeline_draft(payload)
+    try:
+        return await create_pipeline_draft(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/publish")
 async def publish_dag(payload: PipelineDraftRequest) -> dict:
-    draft = await create_pipeline_draft(payload)
+    try:
+        draft = await create_pipeline_draft(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     result = await airflow_client.create_dag(draft.dag_id, draft.dag_code)
     return {"publish": result}
 
@@ -31,3 +45,37 @@ async def dag_status(dag_id: str) -> dict:
     return {"status": status}
 
 
+@router.post("/load/staging", response_model=StagingLoadResponse)
+async def load_staging(payload: StagingLoadRequest) -> StagingLoadResponse:
+    """Потоковая загрузка источника в рабочую БД через COPY"""
+    try:
+        return await load_to_staging(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/transfer", response_model=TransferResponse)
+async def transfer_to_clickhouse(payload: TransferRequest) -> TransferResponse:
+    """Перенос Postgres -> ClickHouse через Arrow-батчи с метриками по стадиям"""
+    try:
+        return await transfer(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/merge", response_model=MergeResponse)
+async def merge_into_target(payload: MergeRequest) -> MergeResponse:
+    """Повторяющаяся загрузка со слиянием по ключу (upsert / ReplacingMergeTree / CollapsingMergeTree)"""
+    try:
+        return await merge(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/run", response_model=PipelineRunResponse)
+async def run_pipeline_locally(payload: PipelineRunRequest) -> PipelineRunResponse:
+    """Выполнить JSON-DAG рекомендации локально (без Airflow) с метриками по операциям"""
+    try:
+        return await run_pipeline(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,215 @@
+"""
+Единая точка получения потока Arrow-батчей из описания источника
+(тот же формат словаря, что у ml.sources.loader.load_sample).
+"""
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.json as pajson
+import pyarrow.parquet as pq
+
+from app.connectors.parallel_reader import slice_batch
+from ml.sources.csv_rejects import RejectSink, csv_parse_options
+
+DEFAULT_BATCH_ROWS = 50_000
+DEFAULT_CSV_BLOCK_BYTES = 16 * 1024 * 1024
+
+
+def _skip(batches: Iterator[pa.RecordBatch], rows: int) -> Iterator[pa.RecordBatch]:
+    for batch in batches:
+        if rows >= batch.num_rows:
+            rows -= batch.num_rows
+            continue
+        yield batch.slice(rows) if rows else batch
+        rows = 0
+
+
+def _failing_rows(values: pa.Array, target: pa.DataType, offset: int = 0) -> List[int]:
+    """Строки, не приводимые к target: делением пополам, O(битых · log n) векторных cast."""
+    try:
+        pc.cast(values, target)
+        return []
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        if len(values) == 1:
+            return [offset]
+    middle = len(values) // 2
+    return (_failing_rows(values.slice(0, middle), target, offset)
+            + _failing_rows(values.slice(middle), target, offset + middle))
+
+
+def _convert_or_reject(batch: pa.RecordBatch, schema: pa.Schema, rejects: RejectSink,
+                       line_of: Callable[[int], int], delimiter: str) -> pa.RecordBatch:
+    """
+    Строковый батч -> типы схемы. Значение, не подходящее к типу колонки, не роняет
+    загрузку: строка целиком уходит в rejects с номером строки файла line_of(row).
+    """
+    arrays, reasons = [], {}
+    for field in schema:
+        values = batch.column(field.name)
+        if values.type == field.type:
+            arrays.append(values)
+            continue
+        try:
+            arrays.append(pc.cast(values, field.type))
+            continue
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            pass
+        bad = _failing_rows(values, field.type)
+        for row in bad:
+            reasons.setdefault(row, f"column {field.name}: cannot convert {values[row].as_py()!r} to {field.type}")
+        mask = np.zeros(len(values), dtype=bool)
+        mask[bad] = True
+        arrays.append(pc.cast(pc.if_else(pa.array(mask), pa.scalar(None, values.type), values), field.type))
+    if not reasons:
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    for row in sorted(reasons):
+        text = delimiter.join("" if v is None else str(v) for v in (c[row].as_py() for c in batch.columns))
+        if not rejects.add(line_of(row), reasons[row], text):
+            raise rejects.overflow_error()
+    keep = np.ones(batch.num_rows, dtype=bool)
+    keep[list(reasons)] = False
+    return pa.RecordBatch.from_arrays(arrays, schema=schema).filter(pa.array(keep))
+
+
+def _typed_csv(open_reader: Callable[..., pacsv.CSVStreamingReader], rejects: RejectSink, skip_rows: int,
+               delimiter: str) -> Iterator[pa.RecordBatch]:
+    """
+    Типы выводятся по первому блоку, как обычно, но поток читается строками
+    и приводится к ним по батчам: несовпадение типа в дальнем блоке — отбракованная
+    строка, а не ошибка всей загрузки. Колонка без значений в первом блоке — строка.
+    Номер строки файла — по счёту строк данных с поправкой на строки, уже
+    отброшенные парсером (многострочные значения в кавычках его сдвигают).
+    """
+    probe = open_reader(record_rejects=False)
+    schema = pa.schema([pa.field(f.name, pa.string() if pa.types.is_null(f.type) else f.type)
+                        for f in probe.schema])
+    probe.close()
+    first_line = skip_rows + 2  # строка 1 — заголовок
+    rows_before = 0
+    converted_lines: set = set()
+
+    def _line_of(offset: int) -> Callable[[int], int]:
+        skipped = sorted(r.line for r in rejects.rows if r.line is not None and r.line not in converted_lines)
+
+        def _line(row: int) -> int:
+            line = first_line + offset + row
+            for parsed in skipped:
+                if parsed > line:
+                    break
+                line += 1
+            converted_lines.add(line)
+            return line
+        return _line
+
+    for batch in open_reader(column_types={f.name: pa.string() for f in schema}):
+        converted = _convert_or_reject(batch, schema, rejects, _line_of(rows_before), delimiter)
+        rows_before += batch.num_rows
+        yield converted
+
+
+def _iter_csv(open_reader: Callable[[], Iterable[pa.RecordBatch]], batch_rows: int,
+              rejects: Optional[RejectSink]) -> Iterator[pa.RecordBatch]:
+    try:
+        for batch in open_reader():
+            yield from slice_batch(batch, batch_rows)
+    except pa.ArrowInvalid as e:
+        if rejects is not None and rejects.overflowed:
+            raise rejects.overflow_error() from e
+        raise
+    finally:
+        if rejects is not None:
+            rejects.close()
+
+
+def _iter_file(source: Dict[str, Any], batch_rows: int, skip_rows: int = 0,
+               rejects: Optional[RejectSink] = None) -> Iterator[pa.RecordBatch]:
+    path = Path(source["path"])
+    fmt = (source.get("format") or path.suffix.lstrip(".")).lower()
+    if fmt == "csv":
+        delimiter = source.get("delimiter", ",")
+
+        def _open(column_types: Optional[Dict[str, pa.DataType]] = None,
+                  record_rejects: bool = True) -> pacsv.CSVStreamingReader:
+            parse_options = csv_parse_options(delimiter, rejects) if record_rejects else \
+                pacsv.ParseOptions(delimiter=delimiter, invalid_row_handler=lambda row: "skip")
+            return pacsv.open_csv(
+                path,
+                # skip_rows_after_names: при продолжении загрузки уже записанные строки не конвертируются
+                read_options=pacsv.ReadOptions(block_size=int(source.get("block_bytes", DEFAULT_CSV_BLOCK_BYTES)),
+                                               encoding=source.get("encoding", "utf8"),
+                                               skip_rows_after_names=skip_rows),
+                # rejects — битые строки уходят в приёмник, а не роняют загрузку
+                parse_options=parse_options,
+                # пустое поле — NULL, явная пустая строка "" остаётся строкой
+                convert_options=pacsv.ConvertOptions(column_types=column_types, strings_can_be_null=True,
+                                                     quoted_strings_can_be_null=False),
+            )
+        if rejects is None:
+            yield from _iter_csv(_open, batch_rows, rejects)
+        else:
+            yield from _iter_csv(lambda: _typed_csv(_open, rejects, skip_rows, delimiter), batch_rows, rejects)
+    elif fmt == "parquet":
+        yield from _skip(pq.ParquetFile(path).iter_batches(batch_size=batch_rows, columns=source.get("columns")),
+                         skip_rows)
+    elif fmt in ("json", "jsonl", "ndjson"):
+        # pyarrow читает JSON Lines блоками, но отдаёт таблицей целиком
+        yield from _skip(iter(pajson.read_json(path).to_batches(max_chunksize=batch_rows)), skip_rows)
+    else:
+        raise ValueError(f"Unsupported file format: {fmt}")
+
+
+def open_file_batches(source: Dict[str, Any], batch_rows: int = DEFAULT_BATCH_ROWS,
+                      skip_rows: int = 0) -> Iterator[pa.RecordBatch]:
+    """Файл начиная со строки skip_rows (продолжение прерванной загрузки)."""
+    return _iter_file(source, batch_rows, skip_rows)
+
+
+def open_batches(source: Dict[str, Any], batch_rows: int = DEFAULT_BATCH_ROWS,
+                 rejects: Optional[RejectSink] = None) -> Iterator[pa.RecordBatch]:
+    """
+    source:
+      {"type":"file","path":"/abs/path.csv","format":"csv|parquet|jsonl","delimiter":","}
+      {"type":"postgres","dsn":"...","table":"schema.table"|"query":"...","columns":[...],"where":"...",
+       "mode":"cursor|copy","key_column":"id","parallelism":4,"ordered":true}
+      {"type":"clickhouse","host":"...","database":"...","table":"..."|"query":"...","columns":[...],"where":"...",
+       "ordered":true}
+    ordered (по умолчанию true) — параллельные читатели отдают батчи в порядке
+    диапазонов/партиций: номера блоков загрузки (токены дедупликации ClickHouse)
+    при повторном запуске приходятся на те же строки. false — по готовности, быстрее.
+    rejects — приёмник битых строк CSV; без него битая строка — ошибка чтения.
+    """
+    source_type = (source.get("type") or "").lower()
+    if source_type == "file":
+        return _iter_file(source, batch_rows, rejects=rejects)
+
+    if source_type == "postgres":
+        from app.connectors.postgres_extractor import PostgresExtractor
+        extractor = PostgresExtractor(source.get("dsn"), batch_rows=batch_rows, mode=source.get("mode", "cursor"),
+                                      parallelism=source.get("parallelism"))
+        if source.get("key_column") and source.get("table"):
+            return extractor.iter_batches_parallel(source["table"], source["key_column"],
+                                                   columns=source.get("columns"), where=source.get("where"),
+                                                   params=source.get("params"),
+                                                   ordered=source.get("ordered", True))
+        return extractor.iter_batches(table=source.get("table"), query=source.get("query"),
+                                      columns=source.get("columns"), where=source.get("where"),
+                                      params=source.get("params"))
+
+    if source_type == "clickhouse":
+        from app.connectors.clickhouse_extractor import ClickHouseExtractor
+        extractor = ClickHouseExtractor(host=source.get("host"), port=source.get("port"),
+                                        user=source.get("user"), password=source.get("password"),
+                                        database=source.get("database"), batch_rows=batch_rows,
+                                        parallelism=source.get("parallelism"))
+        if source.get("table") and not source.get("query"):
+            return extractor.iter_batches_parallel(source["table"], columns=source.get("columns"),
+                                                   where=source.get("where"), parameters=source.get("params"),
+                                                   ordered=source.get("ordered", True))
+        return extractor.iter_batches(query=source.get("query"), parameters=source.get("params"))
+
+    raise ValueError(f"Unsupported source type: {source_type}")
@@ -0,0 +1,184 @@
+"""
+Потоковая выгрузка из ClickHouse в Arrow RecordBatch.
+
+Таблица читается по партициям (список из system.parts) параллельно,
+каждая партиция — отдельным query_arrow_stream на своём клиенте.
+Проекция колонок и фильтр выполняются на сервере, в памяти — только
+текущие батчи, а не вся таблица.
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import clickhouse_connect
+import pyarrow as pa
+from loguru import logger
+
+from app.core.config import settings
+from app.connectors.database_connector import _ch_table_ref, _quote_ch, _split_table
+from app.connectors.parallel_reader import parallel_batches, slice_batch
+from app.connectors.postgres_extractor import KeyRange, linspace_bounds, ranges_from_cuts
+
+DEFAULT_BATCH_ROWS = 65_536
+
+
+class ClickHouseExtractor:
+    """
+    Итератор Arrow-батчей по таблице ClickHouse.
+
+    batch_rows задаёт max_block_size на сервере и верхнюю границу строк в батче;
+    parallelism — сколько партиций читается одновременно (по клиенту на поток).
+    """
+
+    def __init__(self,
+                 host: Optional[str] = None,
+                 port: Optional[int] = None,
+                 user: Optional[str] = None,
+                 password: Optional[str] = None,
+                 database: Optional[str] = None,
+                 batch_rows: int = DEFAULT_BATCH_ROWS,
+                 parallelism: Optional[int] = None,
+                 max_execution_time: Optional[int] = None) -> None:
+        self.host = host or settings.clickhouse_host
+        self.port = port or settings.clickhouse_port
+        self.user = user or settings.clickhouse_user
+        self.password = password or settings.clickhouse_password
+        self.database = database or settings.clickhouse_database
+        self.batch_rows = max(1, int(batch_rows))
+        self.parallelism = max(1, int(parallelism or settings.extract_max_parallelism))
+        # 0 — без ограничения: выгрузка большой таблицы может идти долго
+        self.max_execution_time = max_execution_time or 0
+
+    def _new_client(self):
+        """Отдельный клиент на поток: HTTP-стрим занимает соединение до конца чтения."""
+        return clickhouse_connect.get_client(
+            host=self.host,
+            port=self.port,
+            username=self.user,
+            password=self.password,
+            database=self.database,
+            autogenerate_session_id=False,
+        )
+
+    def _query_settings(self) -> Dict[str, Any]:
+        return {
+            "max_block_size": self.batch_rows,
+            "max_execution_time": self.max_execution_time,
+        }
+
+    def _table_parts(self, table: str) -> Tuple[str, str]:
+        database, name = _split_table(table)
+        return database or self.database, name
+
+    def list_partitions(self, table: str) -> List[Dict[str, Any]]:
+        """Активные партиции таблицы с числом строк и размером на диске."""
+        database, name = self._table_parts(table)
+        client = self._new_client()
+        try:
+            result = client.query(
+                """
+                SELECT partition_id, any(partition) AS partition,
+                       sum(rows) AS rows, sum(bytes_on_disk) AS bytes
+                FROM system.parts
+                WHERE database = {database:String} AND table = {table:String} AND active
+                GROUP BY partition_id
+                ORDER BY partition_id
+                """,
+                parameters={"database": database, "table": name},
+            )
+            return [dict(zip(result.column_names, row)) for row in result.result_rows]
+        finally:
+            client.close()
+
+    def column_type(self, table: str, column: str) -> str:
+        """Тип колонки ClickHouse — для типизированного параметра {name:Type} в фильтре."""
+        database, name = self._table_parts(table)
+        client = self._new_client()
+        try:
+            result = client.query(
+                "SELECT type FROM system.columns WHERE database = {db:String} AND table = {tbl:String} "
+                "AND name = {col:String}",
+                parameters={"db": database, "tbl": name, "col": column},
+            )
+        finally:
+            client.close()
+        if not result.result_rows:
+            raise ValueError(f"Колонка {column} не найдена в {table}")
+        return result.result_rows[0][0]
+
+    def plan_ranges(self, table: str, key_column: str, partitions: Optional[int] = None) -> List[KeyRange]:
+        """
+        Диапазоны ключа примерно равной ширины между min и max (числа, даты);
+        для остальных типов — один диапазон. NULL в ключе — отдельный диапазон.
+        """
+        partitions = max(1, int(partitions or self.parallelism))
+        col = _quote_ch(key_column)
+        client = self._new_client()
+        try:
+            low, high, nulls = client.query(
+                f"SELECT min({col}), max({col}), countIf(isNull({col})) FROM {_ch_table_ref(table)}"
+            ).result_rows[0]
+        finally:
+            client.close()
+        ranges = ranges_from_cuts(linspace_bounds(low, high, partitions), bool(nulls))
+        logger.info(f"ClickHouse extract plan for {table}.{key_column}: {len(ranges)} ranges")
+        return ranges
+
+    @staticmethod
+    def build_query(table: Optional[str] = None, query: Optional[str] = None,
+                    columns: Optional[List[str]] = None, where: Optional[str] = None,
+                    partition_id: Optional[str] = None, order_by: Optional[str] = None) -> str:
+        """SELECT с проекцией и фильтром; партиция — через виртуальную колонку _partition_id."""
+        if query:
+            return query.strip().rstrip(";")
+        if not table:
+            raise ValueError("Either table or query must be provided")
+        projection = ", ".join(_quote_ch(c) for c in columns) if columns else "*"
+        conditions = []
+        if partition_id is not None:
+            conditions.append("_partition_id = {etl_partition_id:String}")
+        if where:
+            conditions.append(f"({where})")
+        sql = f"SELECT {projection} FROM {_ch_table_ref(table)}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if order_by:
+            sql += f" ORDER BY {_quote_ch(order_by)}"
+        return sql
+
+    def iter_batches(self, table: Optional[str] = None, query: Optional[str] = None,
+                     columns: Optional[List[str]] = None, where: Optional[str] = None,
+                     parameters: Optional[Dict[str, Any]] = None,
+                     partition_id: Optional[str] = None,
+                     order_by: Optional[str] = None) -> Iterator[pa.RecordBatch]:
+        """Один поток чтения (вся таблица, одна партиция или произвольный запрос)."""
+        sql = self.build_query(table, query, columns, where, partition_id, order_by)
+        params = dict(parameters or {})
+        if partition_id is not None:
+            params["etl_partition_id"] = partition_id
+        client = self._new_client()
+        try:
+            with client.query_arrow_stream(sql, parameters=params, settings=self._query_settings()) as stream:
+                for batch in stream:
+                    yield from slice_batch(batch, self.batch_rows)
+        finally:
+            client.close()
+
+    def iter_batches_parallel(self, table: str, columns: Optional[List[str]] = None,
+                              where: Optional[str] = None, parameters: Optional[Dict[str, Any]] = None,
+                              ordered: bool = False) -> Iterator[pa.RecordBatch]:
+        """Читать партиции таблицы параллельно; непартиционированная таблица — одним потоком."""
+        partitions = self.list_partitions(table)
+        if len(partitions) <= 1:
+            yield from self.iter_batches(table=table, columns=columns, where=where, parameters=parameters)
+            return
+
+        logger.info(f"ClickHouse extract {table}: {len(partitions)} partitions, parallelism={self.parallelism}")
+        # крупные партиции первыми — меньше хвост из одной долгой партиции в конце
+        if not ordered:
+            partitions = sorted(partitions, key=lambda p: p["rows"], reverse=True)
+
+        def _source(partition_id: str):
+            return lambda: self.iter_batches(table=table, columns=columns, where=where,
+                                             parameters=parameters, partition_id=partition_id)
+
+        sources = [_source(p["partition_id"]) for p in partitions]
+        yield from parallel_batches(sources, self.parallelism, ordered, thread_name_prefix="ch-part-extract")
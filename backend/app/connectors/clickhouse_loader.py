@@ -0,0 +1,400 @@
+"""
+Колоночная загрузка в ClickHouse: Arrow-батчи (или словари NumPy-колонок)
+склеиваются в блоки заданного размера в байтах и вставляются insert_arrow
+в несколько параллельных потоков.
+
+Повтор вставки безопасен: у каждого блока детерминированный
+insert_deduplication_token — {load_id}-{номер блока}-{хеш содержимого}, и
+ClickHouse отбрасывает повторно пришедший блок. Токен работает только на
+Replicated*MergeTree или при non_replicated_deduplication_window > 0 —
+ensure_deduplication включает окно на нереплицированной таблице. Хеш
+содержимого гарантирует, что при повторном запуске один и тот же токен не
+покроет другие строки (тогда блок просто вставится, а не потеряется);
+чтобы повтор действительно дедуплицировался, источник должен отдавать
+батчи в том же порядке (см. ordered в batch_sources.open_batches).
+
+replace_partitions — идемпотентная перезагрузка: строки группируются по
+ключу партиции, заливаются во временную таблицу той же структуры и
+атомарно подменяют затронутые партиции через REPLACE PARTITION.
+"""
+import hashlib
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+import clickhouse_connect
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from clickhouse_connect.driver.exceptions import DatabaseError, OperationalError
+from loguru import logger
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_exponential
+
+from app.core.config import settings
+from app.connectors.database_connector import _split_table
+
+DEFAULT_MAX_BLOCK_BYTES = 64 * 1024 * 1024
+
+# Ошибки сервера, после которых вставку имеет смысл повторить
+_TRANSIENT_CODES = (
+    "Code: 159",  # TIMEOUT_EXCEEDED
+    "Code: 202",  # TOO_MANY_SIMULTANEOUS_QUERIES
+    "Code: 209",  # SOCKET_TIMEOUT
+    "Code: 210",  # NETWORK_ERROR
+    "Code: 242",  # TABLE_IS_READ_ONLY
+    "Code: 252",  # TOO_MANY_PARTS
+    "Code: 319",  # UNKNOWN_STATUS_OF_INSERT
+)
+
+Batch = Union[pa.RecordBatch, pa.Table, Dict[str, np.ndarray]]
+
+
+def _is_transient(error: BaseException) -> bool:
+    if isinstance(error, OperationalError):
+        return True
+    return isinstance(error, DatabaseError) and any(code in str(error) for code in _TRANSIENT_CODES)
+
+
+class _HashSink:
+    """Файлоподобный приёмник IPC-потока: считает хеш, ничего не храня."""
+
+    def __init__(self) -> None:
+        self.hash = hashlib.blake2b(digest_size=8)
+        self.closed = False
+
+    def write(self, data: Any) -> int:
+        self.hash.update(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def block_digest(block: pa.Table) -> str:
+    """Хеш схемы и значений блока (IPC-сериализация пишет только видимую часть срезов)."""
+    sink = _HashSink()
+    with pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), block.schema) as writer:
+        writer.write_table(block)
+    return sink.hash.hexdigest()
+
+
+def to_arrow(batch: Batch) -> pa.Table:
+    """Arrow-батч, таблица или {колонка: np.ndarray} -> pa.Table (числовые колонки без копирования)."""
+    if isinstance(batch, pa.Table):
+        return batch
+    if isinstance(batch, pa.RecordBatch):
+        return pa.Table.from_batches([batch])
+    return pa.table({name: pa.array(values) for name, values in batch.items()})
+
+
+def partition_keys(column: Union[pa.Array, pa.ChunkedArray]) -> pa.Array:
+    """Значение toDate(column) для каждой строки — ключ партиции из generate_ddl."""
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+    if pa.types.is_date(column.type):
+        return column
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        column = pc.cast(column, pa.timestamp("us"))
+    if pa.types.is_timestamp(column.type):
+        # tz-aware метки переводятся в дату по UTC — как toDate при серверной зоне UTC
+        return pc.cast(column, pa.date32(), safe=False)
+    return column
+
+
+def split_by_partition(table: pa.Table, column: str) -> Iterator[pa.Table]:
+    """Разрезать таблицу на куски с одним значением ключа партиции (сортировка + run-length)."""
+    keys = partition_keys(table.column(column))
+    order = pc.sort_indices(keys)
+    sorted_table = table.take(order)
+    counts = pc.value_counts(keys.take(order)).field("counts").to_pylist()
+    offset = 0
+    for count in counts:
+        yield sorted_table.slice(offset, count)
+        offset += count
+
+
+class ClickHouseLoader:
+    """
+    Вставка потока батчей в одну таблицу.
+
+    max_block_bytes — размер одного INSERT (крупные блоки = меньше партов и merge'ей);
+    concurrency — число одновременных INSERT (по клиенту на поток);
+    async_insert — буферизация на стороне сервера для частых мелких вставок.
+    """
+
+    def __init__(self,
+                 host: Optional[str] = None,
+                 port: Optional[int] = None,
+                 user: Optional[str] = None,
+                 password: Optional[str] = None,
+                 database: Optional[str] = None,
+                 max_block_bytes: int = DEFAULT_MAX_BLOCK_BYTES,
+                 concurrency: Optional[int] = None,
+                 async_insert: bool = False,
+                 retries: int = 3) -> None:
+        self.host = host or settings.target_clickhouse_host
+        self.port = port or settings.target_clickhouse_port
+        self.user = user or settings.target_clickhouse_user
+        self.password = password or settings.target_clickhouse_password
+        self.database = database or settings.target_clickhouse_database
+        self.max_block_bytes = max(1024, int(max_block_bytes))
+        self.concurrency = max(1, int(concurrency or settings.load_max_concurrency))
+        self.async_insert = async_insert
+        self.retries = max(1, int(retries))
+        self._local = threading.local()
+        self._clients: List[Any] = []
+
+    def _client(self):
+        """Клиент на поток: HTTP-соединение не делится между параллельными INSERT."""
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = clickhouse_connect.get_client(
+                host=self.host,
+                port=self.port,
+                username=self.user,
+                password=self.password,
+                database=self.database,
+                autogenerate_session_id=False,
+            )
+            self._local.client = client
+            self._clients.append(client)
+        return client
+
+    def _standalone_client(self):
+        return clickhouse_connect.get_client(
+            host=self.host,
+            port=self.port,
+            username=self.user,
+            password=self.password,
+            database=self.database,
+            autogenerate_session_id=False,
+        )
+
+    def command(self, sql: str, settings: Optional[Dict[str, Any]] = None,
+                parameters: Optional[Dict[str, Any]] = None) -> Any:
+        """DDL/служебная команда (CREATE TABLE, ALTER ...) на отдельном клиенте."""
+        client = self._standalone_client()
+        try:
+            return client.command(sql, parameters=parameters, settings=settings)
+        finally:
+            client.close()
+
+    def query_arrow(self, sql: str, parameters: Optional[Dict[str, Any]] = None) -> pa.Table:
+        """Небольшой служебный SELECT (например, текущее состояние ключей) на отдельном клиенте."""
+        client = self._standalone_client()
+        try:
+            return client.query_arrow(sql, parameters=parameters, use_strings=True)
+        finally:
+            client.close()
+
+    def close(self) -> None:
+        for client in self._clients:
+            try:
+                client.close()
+            except Exception:
+                pass
+        self._clients = []
+        self._local = threading.local()
+
+    def ensure_deduplication(self, table: str) -> bool:
+        """
+        Включить non_replicated_deduplication_window у нереплицированной
+        MergeTree-таблицы, если окна нет: иначе токены дедупликации игнорируются.
+        True — дедупликация вставок работает.
+        """
+        database, name = _split_table(table)
+        client = self._client()
+        try:
+            rows = client.query(
+                "SELECT engine, engine_full FROM system.tables WHERE database = {db:String} AND name = {tbl:String}",
+                parameters={"db": database or self.database, "tbl": name},
+            ).result_rows
+            if not rows:
+                return False
+            engine, engine_full = rows[0]
+            if engine.startswith("Replicated"):
+                return True
+            if not engine.endswith("MergeTree"):
+                return False
+            match = re.search(r"non_replicated_deduplication_window\s*=\s*(\d+)", engine_full or "")
+            if match and int(match.group(1)) > 0:
+                return True
+            client.command(f"ALTER TABLE `{database or self.database}`.`{name}` "
+                           f"MODIFY SETTING non_replicated_deduplication_window = {settings.load_dedup_window}")
+            return True
+        except Exception as e:
+            logger.warning(f"Insert deduplication is not guaranteed for {table}: {e}")
+            return False
+
+    def _insert_settings(self, token: str) -> Dict[str, Any]:
+        insert_settings: Dict[str, Any] = {"insert_deduplication_token": token}
+        if self.async_insert:
+            # у асинхронной вставки своя дедупликация, по умолчанию выключенная
+            insert_settings.update({"async_insert": 1, "wait_for_async_insert": 1, "async_insert_deduplicate": 1})
+        return insert_settings
+
+    def _insert_block(self, table: str, block: pa.Table, token: str, stats: Dict[str, Any],
+                      lock: threading.Lock) -> None:
+        database, name = _split_table(table)
+        token = f"{token}-{block_digest(block)}"
+        for attempt in Retrying(stop=stop_after_attempt(self.retries),
+                                wait=wait_exponential(multiplier=0.5, min=0.5, max=10),
+                                retry=retry_if_exception(_is_transient), reraise=True):
+            with attempt:
+                if attempt.retry_state.attempt_number > 1:
+                    with lock:
+                        stats["retries"] += 1
+                    logger.warning(f"Retrying ClickHouse insert into {table} (token={token})")
+                self._client().insert_arrow(name, block, database=database or self.database,
+                                            settings=self._insert_settings(token))
+        with lock:
+            stats["rows"] += block.num_rows
+            stats["bytes"] += block.nbytes
+            stats["inserts"] += 1
+
+    def _blocks(self, batches: Iterable[Batch]) -> Iterator[pa.Table]:
+        """Склеить поток батчей в блоки ~max_block_bytes."""
+        pending: List[pa.Table] = []
+        pending_bytes = 0
+        for batch in batches:
+            chunk = to_arrow(batch)
+            if chunk.num_rows == 0:
+                continue
+            pending.append(chunk)
+            pending_bytes += chunk.nbytes
+            if pending_bytes >= self.max_block_bytes:
+                yield pa.concat_tables(pending) if len(pending) > 1 else pending[0]
+                pending, pending_bytes = [], 0
+        if pending:
+            yield pa.concat_tables(pending) if len(pending) > 1 else pending[0]
+
+    def _partition_blocks(self, batches: Iterable[Batch], column: str) -> Iterator[pa.Table]:
+        """
+        Блоки, в каждом из которых одна партиция: INSERT не разбрасывает строки
+        по множеству партов и не упирается в max_partitions_per_insert_block.
+        В памяти не больше 2·max_block_bytes — сверх этого сбрасывается самая крупная партиция.
+        """
+        pending: Dict[Any, List[pa.Table]] = {}
+        sizes: Dict[Any, int] = {}
+        total = 0
+        for batch in batches:
+            chunk = to_arrow(batch)
+            if chunk.num_rows == 0:
+                continue
+            for part in split_by_partition(chunk, column):
+                key = partition_keys(part.column(column).slice(0, 1))[0].as_py()
+                pending.setdefault(key, []).append(part)
+                sizes[key] = sizes.get(key, 0) + part.nbytes
+                total += part.nbytes
+            while sizes and (max(sizes.values()) >= self.max_block_bytes or total >= 2 * self.max_block_bytes):
+                key = max(sizes, key=sizes.get)
+                total -= sizes.pop(key)
+                yield pa.concat_tables(pending.pop(key))
+        for key in list(pending):
+            yield pa.concat_tables(pending.pop(key))
+
+    def _insert_blocks(self, table: str, blocks: Iterable[pa.Table], load_id: str) -> Dict[str, Any]:
+        """Параллельная вставка готовых блоков; токен дедупликации — {load_id}-{номер блока}-{хеш}."""
+        stats: Dict[str, Any] = {"rows": 0, "bytes": 0, "inserts": 0, "retries": 0}
+        lock = threading.Lock()
+        # не больше 2·concurrency блоков в памяти: остальные ждут в источнике
+        slots = threading.BoundedSemaphore(self.concurrency * 2)
+        futures: List[Future] = []
+        started = time.perf_counter()
+
+        def _raise_failed() -> None:
+            # упавшая вставка останавливает чтение источника
+            for future in futures:
+                if future.done() and not future.cancelled() and future.exception():
+                    raise future.exception()
+            futures[:] = [f for f in futures if not f.done()]
+
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ch-insert")
+        try:
+            for seq, block in enumerate(blocks):
+                _raise_failed()
+                slots.acquire()
+                future = pool.submit(self._insert_block, table, block, f"{load_id}-{seq}", stats, lock)
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+            pool.shutdown(wait=True)
+            _raise_failed()
+        except BaseException:
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+        finally:
+            self.close()
+
+        seconds = time.perf_counter() - started
+        stats.update({
+            "load_id": load_id,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(stats["rows"] / seconds, 1) if seconds > 0 else 0.0,
+            "mb_per_second": round(stats["bytes"] / seconds / 1024 / 1024, 2) if seconds > 0 else 0.0,
+        })
+        return stats
+
+    def insert_batches(self, table: str, batches: Iterable[Batch],
+                       load_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Залить поток батчей. load_id — префикс токенов дедупликации: повторный
+        запуск той же загрузки с тем же load_id и тем же порядком батчей не
+        задвоит уже вставленные блоки.
+        """
+        deduplication = self.ensure_deduplication(table)
+        stats = self._insert_blocks(table, self._blocks(batches), load_id or uuid.uuid4().hex)
+        stats["deduplication"] = deduplication
+        logger.info(f"ClickHouse insert into {table}: {stats}")
+        return stats
+
+    def _touched_partitions(self, database: str, table: str) -> List[str]:
+        client = self._client()
+        try:
+            result = client.query(
+                "SELECT DISTINCT partition_id FROM system.parts "
+                "WHERE database = {db:String} AND table = {tbl:String} AND active",
+                parameters={"db": database, "tbl": table},
+            )
+            return sorted(row[0] for row in result.result_rows)
+        finally:
+            self.close()
+
+    def replace_partitions(self, table: str, batches: Iterable[Batch], partition_column: str,
+                           load_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Перезагрузить партиции, в которые попали строки: вставка во временную
+        таблицу (CREATE TABLE ... AS table) по блокам «одна партиция — один блок»,
+        затем ALTER TABLE ... REPLACE PARTITION ID для каждой затронутой партиции
+        параллельно. Каждая подмена атомарна, остальные партиции не трогаются,
+        повторный запуск даёт тот же результат.
+        """
+        load_id = load_id or uuid.uuid4().hex
+        database, name = _split_table(table)
+        database = database or self.database
+        temp = f"{name}__load_{re.sub(r'[^0-9a-zA-Z_]', '_', load_id)[:32]}"
+        target_ref, temp_ref = f"`{database}`.`{name}`", f"`{database}`.`{temp}`"
+
+        self.command(f"DROP TABLE IF EXISTS {temp_ref}")
+        self.command(f"CREATE TABLE {temp_ref} AS {target_ref}")
+        # повтор блока после сетевой ошибки не должен задвоить строки временной таблицы
+        self.ensure_deduplication(f"{database}.{temp}")
+        try:
+            stats = self._insert_blocks(f"{database}.{temp}", self._partition_blocks(batches, partition_column),
+                                        load_id)
+            partitions = self._touched_partitions(database, temp)
+            replace_started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ch-replace") as pool:
+                list(pool.map(lambda pid: self.command(
+                    f"ALTER TABLE {target_ref} REPLACE PARTITION ID '{pid}' FROM {temp_ref}"), partitions))
+        finally:
+            self.command(f"DROP TABLE IF EXISTS {temp_ref}")
+
+        stats.update({"partitions": partitions, "replace_seconds": round(time.perf_counter() - replace_started, 3)})
+        logger.info(f"ClickHouse partition replace into {table}: {stats}")
+        return stats
@@ -1,11 +1,54 @@
-from typing import Any, Dict, List, Optional
+import asyncio
+import math
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import NullPool
 from app.core.config import settings
+from app.connectors.query_budget import QueryBudget, QueryBudgetExceeded, run_with_budget
 from loguru import logger
 import clickhouse_connect
 
 
+def _split_table(table: str) -> Tuple[Optional[str], str]:
+    """'schema.table' -> ('schema', 'table'); 'table' -> (None, 'table')."""
+    if "." in table:
+        schema, name = table.split(".", 1)
+        return schema, name
+    return None, table
+
+
+def _quote_pg(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _quote_ch(name: str) -> str:
+    return "`" + name.replace("`", "\\`") + "`"
+
+
+def _pg_table_ref(table: str) -> str:
+    schema, name = _split_table(table)
+    return f"{_quote_pg(schema)}.{_quote_pg(name)}" if schema else _quote_pg(name)
+
+
+def _ch_table_ref(table: str) -> str:
+    database, name = _split_table(table)
+    return f"{_quote_ch(database)}.{_quote_ch(name)}" if database else _quote_ch(name)
+
+
+def default_budget() -> QueryBudget:
+    """Бюджет по умолчанию: только серверный таймаут на каждый запрос."""
+    return QueryBudget(statement_timeout_seconds=settings.db_statement_timeout_seconds)
+
+
+def _is_ch_timeout(error: Exception) -> bool:
+    # TIMEOUT_EXCEEDED (159) / QUERY_WAS_CANCELLED (394)
+    message = str(error)
+    return any(marker in message for marker in ("Code: 159", "Code: 394", "TIMEOUT_EXCEEDED", "QUERY_WAS_CANCELLED"))
+
+
 class PostgresConnector:
     def __init__(self, dsn: Optional[str] = None) -> None:
         self.dsn = dsn or settings.postgres_dsn
@@ -13,31 +56,75 @@ class PostgresConnector:
 
     def _get_engine(self) -> Engine:
         if self._engine is None:
-            self._engine = create_engine(self.dsn, pool_pre_ping=True)
+            # серверный таймаут по умолчанию на любой запрос сессии; точнее — SET LOCAL в _run
+            timeout_ms = int(settings.db_statement_timeout_seconds * 1000)
+            self._engine = create_engine(
+                self.dsn,
+                pool_pre_ping=True,
+                connect_args={"options": f"-c statement_timeout={timeout_ms}"},
+            )
         return self._engine
 
-    async def test_connection(self) -> bool:
+    async def _run(self, fn: Callable[[Connection], Any], budget: Optional[QueryBudget] = None) -> Any:
+        """
+        Выполнить fn(conn) в потоке: statement_timeout берётся из бюджета (SET LOCAL),
+        отмена бюджета (дедлайн, дисконнект клиента) отменяет запрос на сервере.
+        """
+        budget = budget or default_budget()
+
+        def _call() -> Any:
+            with self._get_engine().connect() as conn:
+                handle = budget.on_cancel(conn.connection.dbapi_connection.cancel)
+                try:
+                    conn.execute(text(f"SET LOCAL statement_timeout = {budget.statement_timeout_ms()}"))
+                    return fn(conn)
+                except OperationalError as e:
+                    if getattr(e.orig, "pgcode", None) == "57014":  # query_canceled
+                        raise QueryBudgetExceeded(f"Запрос отменён: {e.orig}") from e
+                    raise
+                finally:
+                    budget.off_cancel(handle)
+
+        return await run_with_budget(_call, budget)
+
+    def _probe(self) -> None:
+        """SELECT 1 на отдельном соединении без пула: недоступный сервер не ждёт дольше таймаута."""
+        timeout = settings.db_health_timeout_seconds
+        engine = create_engine(
+            self.dsn,
+            poolclass=NullPool,
+            connect_args={"connect_timeout": max(1, int(math.ceil(timeout))),
+                          "options": f"-c statement_timeout={int(timeout * 1000)}"},
+        )
         try:
-            engine = self._get_engine()
             with engine.connect() as conn:
                 conn.execute(text("SELECT 1"))
+        finally:
+            engine.dispose()
+
+    async def test_connection(self) -> bool:
+        """Проверка в потоке: блокирующее подключение не держит event loop."""
+        try:
+            await asyncio.to_thread(self._probe)
             return True
         except Exception as e:
             logger.error(f"Postgres connection failed: {e}")
             return False
 
-    async def sample_table_schema(self, table: str) -> Dict[str, Any]:
-        engine = self._get_engine()
+    async def sample_table_schema(self, table: str, budget: Optional[QueryBudget] = None) -> Dict[str, Any]:
+        schema, name = _split_table(table)
         sql = text(
             """
             SELECT column_name, data_type, is_nullable
             FROM information_schema.columns
             WHERE table_name = :table
+              AND table_schema = COALESCE(:schema, current_schema())
             ORDER BY ordinal_position
             """
         )
-        with engine.connect() as conn:
-            rows = conn.execute(sql, {"table": table}).mappings().all()
+        rows = await self._run(
+            lambda conn: conn.execute(sql, {"table": name, "schema": schema}).mappings().all(), budget
+        )
         columns = [
             {
                 "name": r["column_name"],
@@ -48,6 +135,97 @@ class PostgresConnector:
         ]
         return {"table": table, "columns": columns}
 
+    async def list_schema_columns(self, schema: Optional[str] = None,
+                                  tables: Optional[List[str]] = None,
+                                  budget: Optional[QueryBudget] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Колонки всех таблиц схемы (или всей БД, если schema не задана) одним запросом к каталогу.
+        Возвращает {"schema.table": [{name, dtype, nullable}, ...]}.
+        """
+        sql = text(
+            """
+            SELECT c.table_schema, c.table_name, c.column_name, c.data_type, c.is_nullable
+            FROM information_schema.columns c
+            JOIN information_schema.tables t
+              ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+            WHERE t.table_type = 'BASE TABLE'
+              AND (CAST(:schema AS text) IS NULL OR c.table_schema = :schema)
+              AND c.table_schema NOT IN ('pg_catalog', 'information_schema')
+              AND c.table_schema NOT LIKE 'pg_toast%'
+            ORDER BY c.table_schema, c.table_name, c.ordinal_position
+            """
+        )
+
+        rows = await self._run(lambda conn: conn.execute(sql, {"schema": schema}).mappings().all(), budget)
+        wanted = set(tables or [])
+        result: Dict[str, List[Dict[str, Any]]] = {}
+        for r in rows:
+            key = f"{r['table_schema']}.{r['table_name']}"
+            if wanted and key not in wanted and r["table_name"] not in wanted:
+                continue
+            result.setdefault(key, []).append({
+                "name": r["column_name"],
+                "dtype": r["data_type"],
+                "nullable": (r["is_nullable"] == "YES"),
+            })
+        return result
+
+    async def table_size_estimate(self, table: str, budget: Optional[QueryBudget] = None) -> Dict[str, Any]:
+        """Оценка числа строк из каталога (pg_class.reltuples) без скана таблицы."""
+        reltuples = await self._run(
+            lambda conn: conn.execute(
+                text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:table)"),
+                {"table": _pg_table_ref(table)},
+            ).scalar(),
+            budget,
+        )
+        # reltuples = -1, если таблица ещё ни разу не анализировалась
+        total = float(reltuples) if reltuples is not None and reltuples >= 0 else None
+        return {"total_rows": total}
+
+    async def sample_column_stats(self, table: str, columns: List[str], method: str,
+                                  fraction: float, seed: Optional[int] = None,
+                                  budget: Optional[QueryBudget] = None) -> Dict[str, Any]:
+        """
+        Агрегаты по выборке TABLESAMPLE SYSTEM/BERNOULLI (или по всей таблице при fraction=1):
+        число строк, non-null, уникальные и синглтоны по каждой колонке — за один запрос.
+        """
+        params: Dict[str, Any] = {}
+        sample_clause = ""
+        if fraction < 1.0:
+            sample_clause = f" TABLESAMPLE {'SYSTEM' if method == 'system' else 'BERNOULLI'} (:pct)"
+            params["pct"] = fraction * 100
+            if seed is not None:
+                sample_clause += " REPEATABLE (:seed)"
+                params["seed"] = seed
+
+        selects = ["count(*) AS n"]
+        for i, col in enumerate(columns):
+            q = _quote_pg(col)
+            selects.append(f"count({q}) AS nn_{i}")
+            selects.append(f"count(DISTINCT {q}::text) AS d_{i}")
+            selects.append(
+                f"(SELECT count(*) FROM (SELECT 1 FROM s WHERE {q} IS NOT NULL "
+                f"GROUP BY {q}::text HAVING count(*) = 1) AS f) AS f1_{i}"
+            )
+        sql = text(
+            f"WITH s AS MATERIALIZED (SELECT * FROM {_pg_table_ref(table)}{sample_clause}) "
+            f"SELECT {', '.join(selects)} FROM s"
+        )
+
+        row = await self._run(lambda conn: dict(conn.execute(sql, params).mappings().one()), budget)
+        return {
+            "rows": int(row["n"]),
+            "columns": {
+                col: {
+                    "non_null": int(row[f"nn_{i}"]),
+                    "distinct": int(row[f"d_{i}"]),
+                    "singletons": int(row[f"f1_{i}"]),
+                }
+                for i, col in enumerate(columns)
+            },
+        }
+
 
 class ClickHouseConnector:
     def __init__(self,
@@ -71,21 +249,83 @@ class ClickHouseConnector:
                 username=self.user,
                 password=self.password,
                 database=self.database,
+                # без общей сессии: клиент используется из нескольких потоков параллельно
+                autogenerate_session_id=False,
+                settings={"max_execution_time": int(math.ceil(settings.db_statement_timeout_seconds))},
             )
         return self._client
 
-    async def test_connection(self) -> bool:
+    def _kill_query(self, query_id: str) -> None:
+        """KILL QUERY из отдельного клиента: основной занят отменяемым запросом."""
+        killer = clickhouse_connect.get_client(
+            host=self.host,
+            port=self.port,
+            username=self.user,
+            password=self.password,
+            autogenerate_session_id=False,
+        )
+        try:
+            killer.command(f"KILL QUERY WHERE query_id = '{query_id}' ASYNC")
+        finally:
+            killer.close()
+
+    async def _run(self, fn: Callable[[Any, Dict[str, Any]], Any], budget: Optional[QueryBudget] = None) -> Any:
+        """
+        Выполнить fn(client, query_settings) в потоке: max_execution_time из бюджета,
+        отмена бюджета — KILL QUERY по query_id.
+        """
+        budget = budget or default_budget()
+        query_id = f"etl-{uuid.uuid4().hex}"
+
+        def _call() -> Any:
+            handle = budget.on_cancel(lambda: self._kill_query(query_id))
+            query_settings: Dict[str, Any] = {"query_id": query_id}
+            seconds = budget.statement_timeout_seconds_for_next()
+            if seconds is not None:
+                query_settings["max_execution_time"] = max(1, int(math.ceil(seconds)))
+            try:
+                return fn(self._get_client(), query_settings)
+            except Exception as e:
+                if _is_ch_timeout(e):
+                    raise QueryBudgetExceeded(f"Запрос отменён: {e}") from e
+                raise
+            finally:
+                budget.off_cancel(handle)
+
+        return await run_with_budget(_call, budget)
+
+    def _probe(self) -> None:
+        """SELECT 1 на отдельном клиенте с коротким таймаутом подключения и ответа."""
+        timeout = settings.db_health_timeout_seconds
+        client = clickhouse_connect.get_client(
+            host=self.host,
+            port=self.port,
+            username=self.user,
+            password=self.password,
+            database=self.database,
+            autogenerate_session_id=False,
+            connect_timeout=timeout,
+            send_receive_timeout=timeout,
+        )
         try:
-            client = self._get_client()
             client.command("SELECT 1")
+        finally:
+            client.close()
+
+    async def test_connection(self) -> bool:
+        """Проверка в потоке: блокирующее подключение не держит event loop."""
+        try:
+            await asyncio.to_thread(self._probe)
             return True
         except Exception as e:
             logger.error(f"ClickHouse connection failed: {e}")
             return False
 
-    async def sample_table_schema(self, table: str) -> Dict[str, Any]:
-        client = self._get_client()
-        rows = client.query(f"DESCRIBE TABLE {table}").named_results()
+    async def sample_table_schema(self, table: str, budget: Optional[QueryBudget] = None) -> Dict[str, Any]:
+        rows = await self._run(
+            lambda client, qs: list(client.query(f"DESCRIBE TABLE {_ch_table_ref(table)}", settings=qs).named_results()),
+            budget,
+        )
         columns = [
             {
                 "name": r["name"],
@@ -96,4 +336,105 @@ class ClickHouseConnector:
         ]
         return {"table": table, "columns": columns}
 
+    async def list_schema_columns(self, schema: Optional[str] = None,
+                                  tables: Optional[List[str]] = None,
+                                  budget: Optional[QueryBudget] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Колонки всех таблиц базы из system.columns одним запросом: {"db.table": [...]}."""
+        rows = await self._run(
+            lambda client, qs: list(client.query(
+                "SELECT database, table, name, type FROM system.columns "
+                "WHERE database = {db:String} ORDER BY table, position",
+                parameters={"db": schema or self.database},
+                settings=qs,
+            ).named_results()),
+            budget,
+        )
+        wanted = set(tables or [])
+        result: Dict[str, List[Dict[str, Any]]] = {}
+        for r in rows:
+            key = f"{r['database']}.{r['table']}"
+            if wanted and key not in wanted and r["table"] not in wanted:
+                continue
+            result.setdefault(key, []).append({
+                "name": r["name"],
+                "dtype": r["type"],
+                "nullable": ("Nullable(" in r["type"]),
+            })
+        return result
+
+    async def table_size_estimate(self, table: str, budget: Optional[QueryBudget] = None) -> Dict[str, Any]:
+        """Число строк и ключ сэмплирования из system.tables."""
+        database, name = _split_table(table)
+        rows = await self._run(
+            lambda client, qs: list(client.query(
+                "SELECT total_rows, sampling_key FROM system.tables "
+                "WHERE database = {db:String} AND name = {name:String}",
+                parameters={"db": database or self.database, "name": name},
+                settings=qs,
+            ).named_results()),
+            budget,
+        )
+        if not rows:
+            return {"total_rows": None, "sampling_key": None}
+        total = rows[0].get("total_rows")
+        return {
+            "total_rows": float(total) if total is not None else None,
+            "sampling_key": rows[0].get("sampling_key") or None,
+        }
+
+    async def sample_column_stats(self, table: str, columns: List[str], method: str,
+                                  fraction: float, sampling_key: Optional[str] = None,
+                                  total_rows: Optional[float] = None,
+                                  budget: Optional[QueryBudget] = None) -> Dict[str, Any]:
+        """
+        Агрегаты по выборке одним запросом. SAMPLE — для таблиц с SAMPLE BY. Без
+        ключа сэмплирования честной выборки без полного чтения нет: берём первые
+        fraction * total_rows строк через LIMIT (method="limit", смещение к
+        порядку хранения, random_sample=False и точный total_rows), а при
+        неизвестном размере читаем всю таблицу (method="full_scan", fraction=1).
+        """
+        ref = _ch_table_ref(table)
+        effective_method, effective_fraction = method, fraction
+        if fraction >= 1.0:
+            source = ref
+        elif sampling_key:
+            source = f"(SELECT * FROM {ref} SAMPLE {fraction:.8f})"
+        elif total_rows:
+            source = f"(SELECT * FROM {ref} LIMIT {max(1, math.ceil(fraction * total_rows))})"
+            effective_method = "limit"
+        else:
+            source = ref
+            effective_method, effective_fraction = "full_scan", 1.0
 
+        selects = ["count() AS n"]
+        for i, col in enumerate(columns):
+            q = _quote_ch(col)
+            selects.append(f"count({q}) AS nn_{i}")
+            selects.append(f"uniqExact({q}) AS d_{i}")
+            # синглтоны в том же проходе: частоты значений через sumMap, без запроса на колонку
+            selects.append(
+                f"arrayCount(c -> c = 1, (sumMapIf([assumeNotNull({q})], [toUInt64(1)], isNotNull({q}))).2) AS s_{i}"
+            )
+
+        row = await self._run(
+            lambda client, qs: list(client.query(f"SELECT {', '.join(selects)} FROM {source}",
+                                                 settings=qs).named_results())[0],
+            budget,
+        )
+        stats = {
+            "rows": int(row["n"]),
+            "method": effective_method,
+            "fraction": effective_fraction,
+            "columns": {
+                col: {
+                    "non_null": int(row[f"nn_{i}"]),
+                    "distinct": int(row[f"d_{i}"]),
+                    "singletons": int(row[f"s_{i}"] or 0),
+                }
+                for i, col in enumerate(columns)
+            },
+        }
+        if effective_method == "limit":
+            # префикс в порядке хранения — не случайная выборка; число строк точное из system.tables
+            stats.update(random_sample=False, total_rows=int(total_rows))
+        return stats
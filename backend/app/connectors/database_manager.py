@@ -7,9 +7,11 @@ from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.exc import SQLAlchemyError
 import clickhouse_connect
+import pyarrow.csv as pacsv
 from loguru import logger
 
 from app.core.config import get_settings
+from app.connectors.clickhouse_extractor import ClickHouseExtractor
 
 
 class DatabaseManager:
@@ -317,15 +319,26 @@ class DatabaseManager:
             backup_file = f"{backup_dir}/clickhouse_backup_{timestamp}.sql"
             # Экспорт основных таблиц
             tables = ["data_quality_metrics", "business_metrics", "data_lineage", "data_catalog", "etl_audit_log"]
-            with open(backup_file, 'w') as f:
+            # потоковая выгрузка по партициям: таблица не держится в памяти целиком
+            extractor = ClickHouseExtractor(
+                host=self.settings.target_clickhouse_host,
+                port=self.settings.target_clickhouse_port,
+                user=self.settings.target_clickhouse_user,
+                password=self.settings.target_clickhouse_password,
+                database=self.settings.target_clickhouse_database,
+            )
+            with open(backup_file, 'wb') as f:
                 for table in tables:
                     try:
-                        data = self.clickhouse_client.query_df(f"SELECT * FROM {table}")
-                        f.write(f"-- Table: {table}\n")
-                        data.to_csv(f, mode='a', index=False)
-                        f.write("\n")
+                        f.write(f"-- Table: {table}\n".encode())
+                        writer = None
+                        for batch in extractor.iter_batches_parallel(table, ordered=True):
+                            if writer is None:
+                                writer = pacsv.CSVWriter(f, batch.schema)
+                            writer.write_batch(batch)
+                        f.write(b"\n")
                     except Exception as table_error:
-                        f.write(f"-- Error exporting table {table}: {table_error}\n")
+                        f.write(f"-- Error exporting table {table}: {table_error}\n".encode())
             results["clickhouse_backup"] = backup_file
             logger.info(f"✅ Бэкап ClickHouse создан: {backup_file}")
         except Exception as e:
@@ -10,8 +10,12 @@ from datetime import datetime
 import asyncio
 import math
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 from loguru import logger
 
+from ml.sources.csv_rejects import DEFAULT_MAX_REJECTS, RejectSink, TooManyRejectsError, csv_parse_options
+
 # chardet опционален — но очень желателен; без него падаем на utf-8
 try:
     import chardet  # type: ignore
@@ -74,6 +78,9 @@ class FileConnector:
           - separator (str | 'auto') — разделитель
           - encoding (str | 'auto')  — кодировка
           - header (int | None)      — номер строки заголовка (по умолчанию 0)
+          - max_rejects (int)        — сколько битых строк отвести в сторону (по умолчанию 10000)
+        Читается парсером pyarrow; строки с неверным числом полей не роняют
+        чтение, а попадают в rejected_rows/rejects_sample результата.
         """
         path = Path(file_path)
         if not path.exists():
@@ -97,11 +104,24 @@ class FileConnector:
 
         sep = _detect_delimiter(sample) if sep_cfg in (None, "", "auto") else sep_cfg
 
+        rejects = RejectSink((connection or {}).get("max_rejects", DEFAULT_MAX_REJECTS))
+
         def _read() -> pd.DataFrame:
-            return pd.read_csv(path, sep=sep, encoding=encoding, engine="python", header=header)
+            try:
+                return _read_csv_arrow(path, sep, encoding, header, rejects)
+            except TooManyRejectsError:
+                raise
+            except (pa.ArrowInvalid, ValueError) as e:
+                # многосимвольный разделитель, кавычки через строку и т.п. — медленный путь
+                logger.warning(f"pyarrow CSV reader failed for {path.name} ({e}), using pandas python engine")
+                rejects.rows.clear()
+                return pd.read_csv(path, sep=sep, encoding=encoding, engine="python", header=header,
+                                   on_bad_lines=rejects.pandas_handler)
 
         df = await asyncio.to_thread(_read)
-        return _dataframe_to_meta(path, df)
+        meta = _dataframe_to_meta(path, df)
+        meta.update({k: v for k, v in rejects.as_dict().items() if k != "rejects_path"})
+        return meta
 
     @staticmethod
     async def read_json(file_path: str, connection: Dict[str, Any]) -> Dict[str, Any]:
@@ -348,6 +368,13 @@ class FileConnector:
 
             consistency = 100.0 if not issues else max(0.0, 100.0 - len(issues) * 10.0)
 
+            # отброшенные битые строки снижают консистентность пропорционально своей доле
+            rejected = int(data.get("rejected_rows", 0) or 0)
+            if rejected:
+                rejected_pct = rejected / (total_rows + rejected) * 100.0
+                issues.append(f"Отброшено {rejected} строк с неверным числом полей ({rejected_pct:.2f}%)")
+                consistency = max(0.0, consistency - max(rejected_pct, 1.0))
+
             return {
                 "completeness_score": completeness,
                 "consistency_score": consistency,
@@ -366,6 +393,24 @@ class FileConnector:
 
 # --------- ПРИВАТНЫЕ ПОМОЩНИКИ ---------
 
+def _read_csv_arrow(path: Path, sep: str, encoding: str, header: Optional[int],
+                    rejects: RejectSink) -> pd.DataFrame:
+    """CSV через потоковый парсер pyarrow: битые строки — в rejects (с номером строки)."""
+    read_options = pacsv.ReadOptions(
+        encoding=encoding,
+        skip_rows=header or 0,
+        autogenerate_column_names=header is None,
+    )
+    try:
+        reader = pacsv.open_csv(path, read_options=read_options, parse_options=csv_parse_options(sep, rejects))
+        table = reader.read_all()
+    except pa.ArrowInvalid as e:
+        if rejects.overflowed:
+            raise rejects.overflow_error() from e
+        raise
+    return table.to_pandas(coerce_temporal_nanoseconds=True)
+
+
 def _dataframe_to_meta(path: Path, df: pd.DataFrame) -> Dict[str, Any]:
     """Преобразовать DataFrame в структуру meta, ожидаемую сервисом анализа."""
     rows = int(len(df))
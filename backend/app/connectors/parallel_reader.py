@@ -0,0 +1,88 @@
+"""
+Параллельное чтение нескольких потоков Arrow-батчей (диапазоны ключа, партиции)
+через ограниченные очереди: медленный потребитель притормаживает читателей,
+а не копит батчи в памяти.
+"""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator, List, Tuple
+
+import pyarrow as pa
+
+_DONE = object()
+
+
+def parallel_batches(sources: List[Callable[[], Iterator[pa.RecordBatch]]], parallelism: int,
+                     ordered: bool = False, thread_name_prefix: str = "extract") -> Iterator[pa.RecordBatch]:
+    """
+    sources — фабрики итераторов батчей; одновременно работает не больше parallelism.
+    ordered=True — батчи отдаются в порядке sources (каждый источник буферизует
+    не больше двух батчей), иначе — по мере готовности.
+    Ошибка любого источника пробрасывается потребителю; закрытие генератора
+    останавливает всех читателей.
+    """
+    parallelism = max(1, parallelism)
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=2) for _ in sources] if ordered else None
+    shared: "queue.Queue[Tuple[int, Any]]" = queue.Queue(maxsize=parallelism * 2)
+
+    def _put(index: int, item: Any) -> bool:
+        target = queues[index] if queues else shared
+        payload = item if queues else (index, item)
+        while not stop.is_set():
+            try:
+                target.put(payload, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(index: int, factory: Callable[[], Iterator[pa.RecordBatch]]) -> None:
+        batches = None
+        try:
+            batches = factory()
+            for batch in batches:
+                if not _put(index, batch):
+                    return
+            _put(index, _DONE)
+        except BaseException as e:
+            _put(index, e)
+        finally:
+            close = getattr(batches, "close", None)
+            if close:
+                close()
+
+    pool = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix=thread_name_prefix)
+    try:
+        for index, factory in enumerate(sources):
+            pool.submit(_read, index, factory)
+
+        if queues:
+            for q in queues:
+                while (item := q.get()) is not _DONE:
+                    if isinstance(item, BaseException):
+                        raise item
+                    yield item
+        else:
+            remaining = len(sources)
+            while remaining:
+                _, item = shared.get()
+                if item is _DONE:
+                    remaining -= 1
+                elif isinstance(item, BaseException):
+                    raise item
+                else:
+                    yield item
+    finally:
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def slice_batch(batch: pa.RecordBatch, max_rows: int) -> Iterator[pa.RecordBatch]:
+    """Порезать батч на куски не длиннее max_rows строк (без копирования)."""
+    if batch.num_rows <= max_rows:
+        yield batch
+        return
+    for offset in range(0, batch.num_rows, max_rows):
+        yield batch.slice(offset, max_rows)
@@ -0,0 +1,414 @@
+"""
+Потоковая выгрузка данных из PostgreSQL в Arrow RecordBatch ограниченного размера.
+
+Два режима:
+  - cursor — именованный серверный курсор (stream_results + fetchmany):
+    сервер отдаёт строки порциями, в памяти держится не больше одного батча;
+  - copy   — COPY (...) TO STDOUT (CSV) через pipe в потоковый CSV-ридер pyarrow,
+    без Python-цикла по строкам; обычно в разы быстрее курсора.
+
+Большие таблицы можно выгружать параллельно: таблица режется на диапазоны
+по ключевой колонке (границы из pg_stats.histogram_bounds или min/max),
+диапазоны читаются одновременно из пула соединений.
+"""
+import json
+import os
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from loguru import logger
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+from app.connectors.database_connector import _pg_table_ref, _quote_pg, _split_table
+from app.connectors.parallel_reader import parallel_batches, slice_batch
+
+# OID типов PostgreSQL -> Arrow. Схема выгрузки фиксируется по description один раз:
+# numeric — по precision/scale колонки, прочие типы без соответствия — строкой
+_PG_OID_TO_ARROW: Dict[int, pa.DataType] = {
+    16: pa.bool_(),                      # boolean
+    20: pa.int64(),                      # bigint
+    21: pa.int16(),                      # smallint
+    23: pa.int32(),                      # integer
+    700: pa.float32(),                   # real
+    701: pa.float64(),                   # double precision
+    18: pa.string(),                     # "char"
+    25: pa.string(),                     # text
+    1042: pa.string(),                   # char(n)
+    1043: pa.string(),                   # varchar
+    2950: pa.string(),                   # uuid
+    1082: pa.date32(),                   # date
+    1114: pa.timestamp("us"),            # timestamp
+    1184: pa.timestamp("us", tz="UTC"),  # timestamptz
+    1083: pa.time64("us"),               # time
+    114: pa.string(),                    # json
+    3802: pa.string(),                   # jsonb
+}
+
+# массивы (курсор): OID массива -> OID элемента; в CSV COPY массив приходит текстом {..}
+_PG_ARRAY_ELEMENT_OID: Dict[int, int] = {
+    1000: 16, 1005: 21, 1007: 23, 1016: 20, 1021: 700, 1022: 701, 1014: 1042, 1009: 25,
+    1015: 1043, 2951: 2950, 1182: 1082, 1115: 1114, 1185: 1184, 1231: 1700,
+}
+
+_NUMERIC_OID = 1700
+_UUID_OID = 2950
+_JSON_OIDS = {114, 3802}
+# numeric без precision/scale: как у JDBC-коннекторов Spark — 20 знаков целой части, 18 дробной
+_UNBOUNDED_NUMERIC = pa.decimal128(38, 18)
+
+DEFAULT_BATCH_ROWS = 50_000
+DEFAULT_MAX_BATCH_BYTES = 64 * 1024 * 1024
+
+EXTRACT_MODES = {"cursor", "copy"}
+
+
+def arrow_type_for_oid(oid: int) -> Optional[pa.DataType]:
+    return _PG_OID_TO_ARROW.get(oid)
+
+
+def _numeric_type(precision: Optional[int], scale: Optional[int]) -> pa.DataType:
+    if not precision or precision > 76:
+        return _UNBOUNDED_NUMERIC
+    scale = scale or 0
+    return pa.decimal128(precision, scale) if precision <= 38 else pa.decimal256(precision, scale)
+
+
+def arrow_type_for_column(column: Any, copy: bool = False) -> pa.DataType:
+    """
+    Тип Arrow колонки результата (psycopg2 Column): известный OID, numeric(p, s),
+    массив — списком (copy=True — строкой, как его отдаёт CSV), остальное — строкой.
+    """
+    oid = getattr(column, "type_code", None)
+    if oid == _NUMERIC_OID:
+        return _numeric_type(getattr(column, "precision", None), getattr(column, "scale", None))
+    if oid in _PG_ARRAY_ELEMENT_OID:
+        if copy:
+            return pa.string()
+        element = _PG_ARRAY_ELEMENT_OID[oid]
+        value_type = _UNBOUNDED_NUMERIC if element == _NUMERIC_OID else _PG_OID_TO_ARROW[element]
+        return pa.list_(value_type)
+    return arrow_type_for_oid(oid) or pa.string()
+
+
+def _value_converter(column: Any, arrow_type: pa.DataType) -> Optional[Any]:
+    """Приведение значений psycopg2 перед pa.array: uuid.UUID, разобранный json, прочие объекты."""
+    oid = getattr(column, "type_code", None)
+    if oid in _JSON_OIDS:
+        return lambda v: v if v is None or isinstance(v, str) else json.dumps(v, ensure_ascii=False, default=str)
+    if oid == 2951:
+        return lambda v: v if v is None else [None if x is None else str(x) for x in v]
+    if oid == _UUID_OID or (pa.types.is_string(arrow_type) and oid not in _PG_OID_TO_ARROW):
+        return lambda v: v if v is None or isinstance(v, str) else str(v)
+    return None
+
+
+@dataclass
+class KeyRange:
+    """Полуинтервал [lower, upper) по ключевой колонке; None — граница открыта."""
+    lower: Any = None
+    upper: Any = None
+    nulls: bool = False  # диапазон строк с NULL в ключе
+
+    def predicate(self, column: str, index: int) -> Tuple[str, Dict[str, Any]]:
+        col = _quote_pg(column)
+        if self.nulls:
+            return f"{col} IS NULL", {}
+        parts, params = [f"{col} IS NOT NULL"], {}
+        if self.lower is not None:
+            parts.append(f"{col} >= :range_lo_{index}")
+            params[f"range_lo_{index}"] = self.lower
+        if self.upper is not None:
+            parts.append(f"{col} < :range_hi_{index}")
+            params[f"range_hi_{index}"] = self.upper
+        return " AND ".join(parts), params
+
+
+def split_bounds(bounds: List[Any], partitions: int) -> List[Any]:
+    """Выбрать partitions-1 точек разреза из упорядоченных границ гистограммы."""
+    if partitions <= 1 or len(bounds) < 2:
+        return []
+    cuts: List[Any] = []
+    last = len(bounds) - 1
+    for i in range(1, partitions):
+        value = bounds[round(i * last / partitions)]
+        if not cuts or cuts[-1] != value:
+            cuts.append(value)
+    return cuts
+
+
+def linspace_bounds(low: Any, high: Any, partitions: int) -> List[Any]:
+    """Равномерные точки разреза между min и max (числа, даты, timestamp)."""
+    if partitions <= 1 or low is None or high is None or low >= high:
+        return []
+    if isinstance(low, (datetime, date)):
+        step = (high - low) / partitions
+        return [low + step * i for i in range(1, partitions)]
+    if isinstance(low, int) and isinstance(high, int):
+        step = (high - low) / partitions
+        cuts = sorted({low + int(step * i) for i in range(1, partitions)})
+        return [c for c in cuts if low < c <= high]
+    if isinstance(low, (int, float, Decimal)):
+        step = (high - low) / partitions
+        return [low + step * i for i in range(1, partitions)]
+    return []
+
+
+def ranges_from_cuts(cuts: List[Any], with_nulls: bool) -> List[KeyRange]:
+    edges = [None, *cuts, None]
+    ranges = [KeyRange(edges[i], edges[i + 1]) for i in range(len(edges) - 1)]
+    if with_nulls:
+        ranges.append(KeyRange(nulls=True))
+    return ranges
+
+
+class PostgresExtractor:
+    """
+    Итератор Arrow-батчей по таблице или произвольному SELECT.
+
+    batch_rows ограничивает число строк в батче, max_batch_bytes — его размер:
+    если батч оказался больше, размер следующей порции уменьшается пропорционально.
+    """
+
+    def __init__(self, dsn: Optional[str] = None, batch_rows: int = DEFAULT_BATCH_ROWS,
+                 max_batch_bytes: int = DEFAULT_MAX_BATCH_BYTES, mode: str = "cursor",
+                 statement_timeout_seconds: Optional[float] = None,
+                 engine: Optional[Engine] = None, parallelism: Optional[int] = None) -> None:
+        if mode not in EXTRACT_MODES:
+            raise ValueError(f"Unsupported extract mode: {mode}")
+        self.dsn = dsn or settings.postgres_dsn
+        self.batch_rows = max(1, int(batch_rows))
+        self.max_batch_bytes = max(1024, int(max_batch_bytes))
+        self.mode = mode
+        # выгрузка больших таблиц — долгий запрос, по умолчанию без серверного таймаута
+        self.statement_timeout_seconds = statement_timeout_seconds
+        # сколько диапазонов читаем одновременно (и сколько соединений держим к источнику)
+        self.parallelism = max(1, int(parallelism or settings.extract_max_parallelism))
+        self._engine = engine
+
+    def _get_engine(self) -> Engine:
+        if self._engine is None:
+            timeout_ms = int((self.statement_timeout_seconds or 0) * 1000)
+            self._engine = create_engine(
+                self.dsn,
+                pool_pre_ping=True,
+                pool_size=self.parallelism,
+                max_overflow=1,
+                connect_args={"options": f"-c statement_timeout={timeout_ms} -c TimeZone=UTC"},
+            )
+        return self._engine
+
+    @staticmethod
+    def build_query(table: Optional[str] = None, query: Optional[str] = None,
+                    columns: Optional[List[str]] = None, where: Optional[str] = None,
+                    order_by: Optional[str] = None) -> str:
+        """SELECT по таблице (с проекцией, фильтром и сортировкой по колонке) либо готовый запрос."""
+        if query:
+            return query.strip().rstrip(";")
+        if not table:
+            raise ValueError("Either table or query must be provided")
+        projection = ", ".join(_quote_pg(c) for c in columns) if columns else "*"
+        sql = f"SELECT {projection} FROM {_pg_table_ref(table)}"
+        if where:
+            sql += f" WHERE {where}"
+        if order_by:
+            sql += f" ORDER BY {_quote_pg(order_by)}"
+        return sql
+
+    def _render(self, sql: str, params: Optional[Dict[str, Any]]) -> str:
+        """Подставить :параметры литералами — COPY не поддерживает bind-параметры."""
+        if not params:
+            return sql
+        clause = text(sql).bindparams(**params)
+        return str(clause.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+    def iter_batches(self, table: Optional[str] = None, query: Optional[str] = None,
+                     columns: Optional[List[str]] = None, where: Optional[str] = None,
+                     params: Optional[Dict[str, Any]] = None,
+                     order_by: Optional[str] = None) -> Iterator[pa.RecordBatch]:
+        sql = self.build_query(table, query, columns, where, order_by)
+        logger.info(f"Postgres extract ({self.mode}): {sql[:200]}")
+        if self.mode == "copy":
+            yield from self._iter_copy(self._render(sql, params))
+        else:
+            yield from self._iter_cursor(sql, params)
+
+    def read_table(self, **kwargs: Any) -> pa.Table:
+        """Собрать всё в один pa.Table (только для небольших выборок)."""
+        batches = list(self.iter_batches(**kwargs))
+        if not batches:
+            return pa.table({})
+        return pa.Table.from_batches(batches)
+
+    def schema_for(self, sql: str, params: Optional[Dict[str, Any]] = None, copy: bool = False) -> pa.Schema:
+        """Arrow-схема результата запроса по description (LIMIT 0, без чтения данных)."""
+        with self._get_engine().connect() as conn:
+            result = conn.execute(text(f"SELECT * FROM ({sql}) AS q LIMIT 0"), params or {})
+            description = result.cursor.description
+            result.close()
+        return self._schema_from_description(description, copy)
+
+    @staticmethod
+    def _schema_from_description(description: Any, copy: bool = False) -> pa.Schema:
+        return pa.schema([pa.field(col[0], arrow_type_for_column(col, copy)) for col in description])
+
+    @staticmethod
+    def _converters(description: Any, schema: pa.Schema) -> List[Optional[Any]]:
+        return [_value_converter(col, field.type) for col, field in zip(description, schema)]
+
+    def _rows_to_batch(self, rows: List[Any], schema: pa.Schema,
+                       converters: Optional[List[Optional[Any]]] = None) -> pa.RecordBatch:
+        """Батч строго по схеме выгрузки: одинаковые типы во всех батчах, в т.ч. полностью NULL."""
+        arrays = []
+        columns = list(zip(*rows)) if rows else [[] for _ in schema]
+        for i, (field, values) in enumerate(zip(schema, columns)):
+            convert = converters[i] if converters else None
+            if convert is not None:
+                values = [convert(v) for v in values]
+            arrays.append(pa.array(values, type=field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def _iter_cursor(self, sql: str, params: Optional[Dict[str, Any]]) -> Iterator[pa.RecordBatch]:
+        fetch_rows = self.batch_rows
+        with self._get_engine().connect() as conn:
+            # stream_results -> именованный (серверный) курсор psycopg2
+            conn = conn.execution_options(stream_results=True, max_row_buffer=self.batch_rows)
+            result = conn.execute(text(sql), params or {})
+            try:
+                description = result.cursor.description
+                schema = self._schema_from_description(description)
+                converters = self._converters(description, schema)
+                while True:
+                    rows = result.fetchmany(fetch_rows)
+                    if not rows:
+                        break
+                    batch = self._rows_to_batch(rows, schema, converters)
+                    if batch.nbytes > self.max_batch_bytes and fetch_rows > 1:
+                        fetch_rows = max(1, int(fetch_rows * self.max_batch_bytes / batch.nbytes))
+                    yield batch
+            finally:
+                result.close()
+
+    def _csv_convert_options(self, schema: pa.Schema) -> pacsv.ConvertOptions:
+        return pacsv.ConvertOptions(
+            # все типы заданы: иначе pyarrow выводит их по первому блоку, и батчи расходятся
+            column_types={f.name: f.type for f in schema},
+            true_values=["t"],
+            false_values=["f"],
+            # в CSV-выгрузке Postgres NULL — пустое поле без кавычек, пустая строка — ""
+            null_values=[""],
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+        )
+
+    def _iter_copy(self, sql: str) -> Iterator[pa.RecordBatch]:
+        schema = self.schema_for(sql, copy=True)
+        raw = self._get_engine().raw_connection()
+        read_fd, write_fd = os.pipe()
+        errors: List[BaseException] = []
+
+        def _produce() -> None:
+            try:
+                with os.fdopen(write_fd, "wb") as sink:
+                    cursor = raw.cursor()
+                    cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true)", sink)
+                    cursor.close()
+            except BaseException as e:  # ошибку поднимаем в потоке-потребителе
+                errors.append(e)
+
+        producer = threading.Thread(target=_produce, name="pg-copy-extract", daemon=True)
+        producer.start()
+        source = os.fdopen(read_fd, "rb")
+        completed = False
+        try:
+            reader = pacsv.open_csv(
+                source,
+                read_options=pacsv.ReadOptions(block_size=min(self.max_batch_bytes, 1 << 30)),
+                convert_options=self._csv_convert_options(schema),
+            )
+            for batch in reader:
+                # block_size ограничивает объём CSV на батч; дополнительно режем по числу строк
+                yield from slice_batch(batch, self.batch_rows)
+            completed = True
+        except pa.ArrowInvalid:
+            if errors:
+                raise errors[0]
+            raise
+        finally:
+            if not completed and producer.is_alive():
+                # потребитель остановился раньше — отменяем COPY на сервере
+                try:
+                    raw.driver_connection.cancel()
+                except Exception as e:
+                    logger.warning(f"Failed to cancel COPY: {e}")
+            source.close()
+            producer.join(timeout=5)
+            raw.close()
+        if errors:
+            raise errors[0]
+
+    # ---------- параллельная выгрузка по диапазонам ключа ----------
+
+    def plan_ranges(self, table: str, key_column: str, partitions: Optional[int] = None) -> List[KeyRange]:
+        """
+        Разбить таблицу на диапазоны примерно равного размера.
+        Сначала берём границы гистограммы pg_stats (после ANALYZE они отражают
+        реальное распределение), иначе — равномерную сетку между min и max.
+        """
+        partitions = max(1, int(partitions or self.parallelism))
+        schema, name = _split_table(table)
+        with self._get_engine().connect() as conn:
+            stats = conn.execute(
+                text(
+                    """
+                    SELECT histogram_bounds::text::text[] AS bounds, null_frac
+                    FROM pg_stats
+                    WHERE schemaname = COALESCE(:schema, current_schema())
+                      AND tablename = :table AND attname = :column
+                    """
+                ),
+                {"schema": schema, "table": name, "column": key_column},
+            ).mappings().first()
+            not_null = conn.execute(
+                text("SELECT attnotnull FROM pg_attribute WHERE attrelid = to_regclass(:ref) AND attname = :column"),
+                {"ref": _pg_table_ref(table), "column": key_column},
+            ).scalar()
+
+            cuts = split_bounds(list(stats["bounds"] or []), partitions) if stats else []
+            if not cuts and partitions > 1:
+                col = _quote_pg(key_column)
+                low, high = conn.execute(
+                    text(f"SELECT min({col}), max({col}) FROM {_pg_table_ref(table)}")
+                ).one()
+                cuts = linspace_bounds(low, high, partitions)
+
+        with_nulls = not not_null and (stats is None or (stats["null_frac"] or 0) > 0)
+        ranges = ranges_from_cuts(cuts, with_nulls)
+        logger.info(f"Postgres extract plan for {table}.{key_column}: {len(ranges)} ranges")
+        return ranges
+
+    def iter_batches_parallel(self, table: str, key_column: str, partitions: Optional[int] = None,
+                              columns: Optional[List[str]] = None, where: Optional[str] = None,
+                              params: Optional[Dict[str, Any]] = None, ordered: bool = False,
+                              ranges: Optional[List[KeyRange]] = None) -> Iterator[pa.RecordBatch]:
+        """
+        Читать диапазоны одновременно (не больше parallelism соединений).
+        ordered=True — батчи в порядке диапазонов.
+        """
+        ranges = ranges if ranges is not None else self.plan_ranges(table, key_column, partitions)
+
+        def _source(index: int, key_range: KeyRange):
+            predicate, range_params = key_range.predicate(key_column, index)
+            combined = f"({where}) AND {predicate}" if where else predicate
+            return lambda: self.iter_batches(table=table, columns=columns, where=combined,
+                                             params={**(params or {}), **range_params})
+
+        sources = [_source(i, r) for i, r in enumerate(ranges)]
+        yield from parallel_batches(sources, self.parallelism, ordered, thread_name_prefix="pg-range-extract")
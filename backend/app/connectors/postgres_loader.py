@@ -0,0 +1,238 @@
+"""
+Массовая загрузка Arrow-батчей в PostgreSQL через COPY FROM STDIN (CSV).
+
+CSV формируется C++-писателем pyarrow по мере чтения COPY, поэтому
+в памяти держится один батч, а не вся выгрузка; строки не проходят
+через Python-цикл и INSERT.
+"""
+import time
+import uuid
+from itertools import chain
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from loguru import logger
+from sqlalchemy.engine import Engine
+
+from app.connectors.database_connector import _pg_table_ref, _quote_pg, _split_table
+from app.core.config import settings
+
+DEFAULT_COPY_CHUNK_BYTES = 1024 * 1024
+
+
+class CSVBatchStream:
+    """
+    Файлоподобный объект для cursor.copy_expert: read() отдаёт CSV,
+    сгенерированный из очередного батча. Считает строки, байты и батчи.
+    """
+
+    def __init__(self, batches: Iterable[pa.RecordBatch]) -> None:
+        self._batches: Iterator[pa.RecordBatch] = iter(batches)
+        self._buffer = bytearray()
+        self._exhausted = False
+        self._options = pacsv.WriteOptions(include_header=False)
+        self.rows = 0
+        self.bytes = 0
+        self.batches = 0
+
+    def _fill(self, size: int) -> None:
+        while not self._exhausted and (size < 0 or len(self._buffer) < size):
+            batch = next(self._batches, None)
+            if batch is None:
+                self._exhausted = True
+                break
+            sink = pa.BufferOutputStream()
+            pacsv.write_csv(batch, sink, self._options)
+            self._buffer += sink.getvalue().to_pybytes()
+            self.rows += batch.num_rows
+            self.batches += 1
+
+    def read(self, size: int = -1) -> bytes:
+        self._fill(size)
+        if size < 0 or size >= len(self._buffer):
+            chunk = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            chunk = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        self.bytes += len(chunk)
+        return chunk
+
+    def readline(self, size: int = -1) -> bytes:
+        return self.read(size)
+
+
+class PostgresLoader:
+    """
+    COPY-загрузчик в одну таблицу: всё в одной транзакции, откат при ошибке.
+    statement_timeout транзакции загрузки задаётся явно (по умолчанию 0 — без
+    ограничения), чтобы не унаследовать короткий таймаут сессии.
+    """
+
+    def __init__(self, engine: Engine, copy_chunk_bytes: int = DEFAULT_COPY_CHUNK_BYTES,
+                 statement_timeout_seconds: Optional[float] = None) -> None:
+        self.engine = engine
+        self.copy_chunk_bytes = max(8192, int(copy_chunk_bytes))
+        if statement_timeout_seconds is None:
+            statement_timeout_seconds = settings.db_load_statement_timeout_seconds
+        self.statement_timeout_ms = max(0, int(statement_timeout_seconds * 1000))
+
+    def _begin_load(self, cursor: Any) -> None:
+        cursor.execute(f"SET LOCAL statement_timeout = {self.statement_timeout_ms}")
+
+    def execute_ddl(self, statements: List[str]) -> None:
+        raw = self.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            for statement in statements:
+                cursor.execute(statement)
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
+    def fetch_all(self, sql: str, params: Optional[Dict[str, Any]] = None) -> List[Tuple[Any, ...]]:
+        """Небольшой служебный SELECT на отдельном соединении."""
+        raw = self.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            cursor.execute(sql, params or {})
+            rows = cursor.fetchall()
+            raw.commit()
+            return rows
+        finally:
+            raw.close()
+
+    def copy_batches(self, table: str, batches: Iterable[pa.RecordBatch],
+                     truncate: bool = False,
+                     delete: Optional[Tuple[str, Dict[str, Any]]] = None,
+                     mark: Optional[Tuple[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Залить батчи одной командой COPY. delete — (SQL, параметры) удаления,
+        выполняемого в той же транзакции перед COPY (перезагрузка окна);
+        mark — (SQL, параметры) после COPY в той же транзакции, к параметрам
+        добавляется copied_rows (отметка о зафиксированной порции).
+        Возвращает строки, байты, время и скорость.
+        """
+        iterator = iter(batches)
+        first = next(iterator, None)
+        if first is None:
+            return {"rows": 0, "bytes": 0, "batches": 0, "seconds": 0.0,
+                    "rows_per_second": 0.0, "mb_per_second": 0.0}
+
+        columns = ", ".join(_quote_pg(name) for name in first.schema.names)
+        stream = CSVBatchStream(chain([first], iterator))
+        started = time.perf_counter()
+
+        raw = self.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            self._begin_load(cursor)
+            if truncate:
+                cursor.execute(f"TRUNCATE {_pg_table_ref(table)}")
+            if delete is not None:
+                cursor.execute(*delete)
+            cursor.copy_expert(
+                f"COPY {_pg_table_ref(table)} ({columns}) FROM STDIN WITH (FORMAT csv)",
+                stream,
+                size=self.copy_chunk_bytes,
+            )
+            if mark is not None:
+                sql, params = mark
+                cursor.execute(sql, {**params, "copied_rows": stream.rows})
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
+        stats = self._stats(stream, time.perf_counter() - started)
+        logger.info(f"COPY into {table}: {stats}")
+        return stats
+
+    @staticmethod
+    def _stats(stream: CSVBatchStream, seconds: float) -> Dict[str, Any]:
+        return {
+            "rows": stream.rows,
+            "bytes": stream.bytes,
+            "batches": stream.batches,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(stream.rows / seconds, 1) if seconds > 0 else 0.0,
+            "mb_per_second": round(stream.bytes / seconds / 1024 / 1024, 2) if seconds > 0 else 0.0,
+        }
+
+    @staticmethod
+    def _ensure_unique(cursor: Any, table: str, keys: List[str]) -> None:
+        """ON CONFLICT (keys) требует уникального индекса ровно на keys — создаём, если его нет."""
+        cursor.execute(
+            "SELECT 1 FROM pg_index i WHERE i.indrelid = %s::regclass AND i.indisunique "
+            "AND (SELECT array_agg(a.attname::text ORDER BY a.attname) FROM pg_attribute a "
+            "     WHERE a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)) = %s::text[]",
+            (_pg_table_ref(table), sorted(keys)),
+        )
+        if cursor.fetchone() is None:
+            _, name = _split_table(table)
+            index = _quote_pg(f"ux_{name}_{'_'.join(keys)}"[:63])
+            cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {_pg_table_ref(table)} "
+                           f"({', '.join(_quote_pg(k) for k in keys)})")
+
+    def upsert_batches(self, table: str, batches: Iterable[pa.RecordBatch], keys: List[str]) -> Dict[str, Any]:
+        """
+        Слияние по ключу: COPY во временную таблицу, затем один
+        INSERT ... SELECT ... ON CONFLICT (keys) DO UPDATE. Строки, совпадающие
+        с уже загруженными, не переписываются (WHERE ... IS DISTINCT FROM),
+        поэтому запись и рост таблицы пропорциональны изменившимся строкам.
+        """
+        iterator = iter(batches)
+        first = next(iterator, None)
+        if first is None:
+            return {**self._stats(CSVBatchStream([]), 0.0), "changed": 0}
+
+        names = first.schema.names
+        missing = [k for k in keys if k not in names]
+        if missing:
+            raise ValueError(f"Ключевые колонки отсутствуют в данных: {missing}")
+        columns = ", ".join(_quote_pg(n) for n in names)
+        key_list = ", ".join(_quote_pg(k) for k in keys)
+        values = [n for n in names if n not in keys]
+        if values:
+            assignments = ", ".join(f"{_quote_pg(n)} = EXCLUDED.{_quote_pg(n)}" for n in values)
+            current = ", ".join(f"t.{_quote_pg(n)}" for n in values)
+            incoming = ", ".join(f"EXCLUDED.{_quote_pg(n)}" for n in values)
+            conflict = f"DO UPDATE SET {assignments} WHERE ROW({current}) IS DISTINCT FROM ROW({incoming})"
+        else:
+            conflict = "DO NOTHING"
+        temp = _quote_pg(f"_merge_{uuid.uuid4().hex[:12]}")
+        stream = CSVBatchStream(chain([first], iterator))
+        started = time.perf_counter()
+
+        raw = self.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            self._begin_load(cursor)
+            self._ensure_unique(cursor, table, keys)
+            cursor.execute(f"CREATE TEMP TABLE {temp} (LIKE {_pg_table_ref(table)} INCLUDING DEFAULTS) "
+                           f"ON COMMIT DROP")
+            cursor.copy_expert(f"COPY {temp} ({columns}) FROM STDIN WITH (FORMAT csv)", stream,
+                               size=self.copy_chunk_bytes)
+            # DISTINCT ON: при повторе ключа в одной выгрузке побеждает последняя строка
+            cursor.execute(
+                f"INSERT INTO {_pg_table_ref(table)} AS t ({columns}) "
+                f"SELECT DISTINCT ON ({key_list}) {columns} FROM {temp} ORDER BY {key_list}, ctid DESC "
+                f"ON CONFLICT ({key_list}) {conflict}"
+            )
+            changed = cursor.rowcount
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
+        stats = {**self._stats(stream, time.perf_counter() - started), "changed": changed}
+        logger.info(f"Upsert into {table} by {keys}: {stats}")
+        return stats
@@ -0,0 +1,119 @@
+"""
+Бюджет времени для запросов к БД: дедлайн, серверный таймаут
+(statement_timeout / max_execution_time) и отмена запроса на сервере.
+"""
+import asyncio
+import itertools
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+
+class QueryBudgetExceeded(TimeoutError):
+    """Запрос не уложился в бюджет времени или был отменён."""
+
+
+class QueryBudget:
+    """
+    Дедлайн для одного HTTP-запроса (или одной таблицы внутри него).
+
+    - remaining() — сколько секунд осталось с учётом родительского бюджета;
+    - statement_timeout_ms() — серверный таймаут для очередного запроса;
+    - on_cancel()/cancel() — колбэки, отменяющие запросы на стороне СУБД
+      (pg cancel, KILL QUERY) при разрыве соединения клиента или истечении дедлайна.
+    """
+
+    def __init__(self, timeout_seconds: Optional[float] = None,
+                 statement_timeout_seconds: Optional[float] = None,
+                 parent: Optional["QueryBudget"] = None) -> None:
+        self.deadline = time.monotonic() + timeout_seconds if timeout_seconds else None
+        self.statement_timeout_seconds = statement_timeout_seconds
+        self.parent = parent
+        self.cancelled = False
+        self._callbacks: Dict[int, Callable[[], Any]] = {}
+        self._children: List["QueryBudget"] = []
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def child(self, timeout_seconds: Optional[float] = None) -> "QueryBudget":
+        """Бюджет подзадачи (например, одной таблицы): не длиннее родительского."""
+        budget = QueryBudget(timeout_seconds, self.statement_timeout_seconds, parent=self)
+        with self._lock:
+            self._children.append(budget)
+        return budget
+
+    def remaining(self) -> Optional[float]:
+        own = self.deadline - time.monotonic() if self.deadline is not None else None
+        inherited = self.parent.remaining() if self.parent else None
+        values = [v for v in (own, inherited) if v is not None]
+        return max(0.0, min(values)) if values else None
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return self.cancelled or (remaining is not None and remaining <= 0)
+
+    def statement_timeout_seconds_for_next(self) -> Optional[float]:
+        values = [v for v in (self.remaining(), self.statement_timeout_seconds) if v is not None]
+        return max(0.001, min(values)) if values else None
+
+    def statement_timeout_ms(self) -> int:
+        """0 — без ограничения (так statement_timeout трактует Postgres)."""
+        seconds = self.statement_timeout_seconds_for_next()
+        return int(seconds * 1000) if seconds is not None else 0
+
+    def on_cancel(self, callback: Callable[[], Any]) -> int:
+        with self._lock:
+            handle = next(self._ids)
+            self._callbacks[handle] = callback
+        return handle
+
+    def off_cancel(self, handle: int) -> None:
+        with self._lock:
+            self._callbacks.pop(handle, None)
+
+    def cancel(self) -> None:
+        """Отменить все запросы, выполняющиеся в рамках бюджета и его подбюджетов."""
+        self.cancelled = True
+        with self._lock:
+            callbacks = list(self._callbacks.values())
+            children = list(self._children)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Query cancel callback failed: {e}")
+        for budget in children:
+            budget.cancel()
+
+
+async def run_with_budget(fn: Callable[[], Any], budget: QueryBudget) -> Any:
+    """
+    Выполнить блокирующую функцию в потоке с учётом бюджета.
+    При истечении дедлайна или отмене корутины (дисконнект клиента)
+    запрос отменяется на сервере, а наружу уходит QueryBudgetExceeded / CancelledError.
+    """
+    if budget.expired:
+        raise QueryBudgetExceeded("Бюджет времени запроса исчерпан")
+
+    task = asyncio.ensure_future(asyncio.to_thread(fn))
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout=budget.remaining())
+    except asyncio.TimeoutError:
+        await _cancel_off_loop(budget)
+        raise QueryBudgetExceeded("Запрос не уложился в бюджет времени")
+    except asyncio.CancelledError:
+        # корутину уже отменили — отмену на сервере не ждём, она доработает в потоке
+        _cancel_off_loop(budget)
+        raise
+
+
+def _cancel_off_loop(budget: QueryBudget) -> "asyncio.Future[None]":
+    """
+    budget.cancel() в потоке: колбэки блокирующие (pg cancel, KILL QUERY через
+    новое HTTP-соединение) и не должны останавливать event loop.
+    """
+    budget.cancelled = True
+    return asyncio.get_running_loop().run_in_executor(None, budget.cancel)
@@ -47,6 +47,19 @@ class Settings(BaseSettings):
     clickhouse_password: str = ""
     clickhouse_database: str = "default"
 
+    # ===== Профилирование БД =====
+    db_statement_timeout_seconds: float = 30.0      # statement_timeout / max_execution_time на запрос профилирования (не загрузки)
+    db_load_statement_timeout_seconds: float = 0.0  # statement_timeout транзакции COPY/слияния; 0 — без ограничения
+    db_request_deadline_seconds: float = 120.0      # бюджет на весь HTTP-запрос профилирования
+    db_profiling_max_concurrency: int = 4
+    db_profiling_table_timeout_seconds: float = 60.0
+    db_health_timeout_seconds: float = 3.0          # подключение и SELECT 1 проверки здоровья
+
+    # ===== Выгрузка данных =====
+    extract_max_parallelism: int = 4                # одновременных потоков чтения из источника
+    load_max_concurrency: int = 4                   # одновременных INSERT в ClickHouse
+    load_dedup_window: int = 1000                   # non_replicated_deduplication_window таблиц MergeTree (блоков)
+
     # ===== HDFS/Kafka (заглушки) =====
     hdfs_host: str = "hdfs"
     hdfs_port: int = 9870
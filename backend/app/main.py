@@ -1,4 +1,6 @@
 # backend/app/main.py
+import asyncio
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI
@@ -8,6 +10,18 @@ from fastapi.staticfiles import StaticFiles
 from app.core.config import settings
 from app.api.v1.router import api_router
 from ml.api.service import router as ml_router
+from app.services.monitoring_service import periodic_health_checks
+from ml.recommend.transport import llm_transport
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # фоновые проверки БД и LLM (раз в 5 минут) -> monitoring_service
+    health_task = asyncio.create_task(periodic_health_checks())
+    yield
+    health_task.cancel()
+    # пул соединений к LLM живёт всё время работы приложения
+    await llm_transport.aclose()
 
 
 def create_app() -> FastAPI:
@@ -16,6 +30,7 @@ def create_app() -> FastAPI:
         version="0.1.0",
         docs_url="/api/docs",
         openapi_url="/api/openapi.json",
+        lifespan=lifespan,
     )
 
     # CORS
@@ -8,6 +8,8 @@ from .metadata import (
     Pipeline,
     PipelineRun,
     AnalysisResult,
+    PipelineWatermark,
+    LoadCheckpoint,
     DataSourceType,
     PipelineStatus,
     PipelineRunStatus
@@ -38,6 +40,8 @@ __all__ = [
     "Pipeline", 
     "PipelineRun",
     "AnalysisResult",
+    "PipelineWatermark",
+    "LoadCheckpoint",
     "DataSourceType",
     "PipelineStatus",
     "PipelineRunStatus",
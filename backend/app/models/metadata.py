@@ -260,3 +260,91 @@ class AnalysisResult(Base, TimestampMixin):
         Index('idx_analysis_alert', 'is_alert'),
         Index('idx_analysis_created', 'created_at'),
     )
+
+
+class PipelineWatermark(Base, TimestampMixin):
+    """Отметка уровня (high-water mark) для инкрементальной загрузки"""
+    __tablename__ = "pipeline_watermarks"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    pipeline_key = Column(
+        String(255),
+        nullable=False,
+        comment="Ключ пайплайна (имя пайплайна или целевой таблицы)"
+    )
+    column_name = Column(
+        String(255),
+        nullable=False,
+        comment="Колонка инкремента (время или монотонный id)"
+    )
+    value_type = Column(
+        String(20),
+        nullable=False,
+        comment="Тип значения (timestamp, date, integer)"
+    )
+    watermark_value = Column(
+        String(64),
+        nullable=False,
+        comment="Максимальное загруженное значение (ISO-8601 или число)"
+    )
+    last_run_id = Column(
+        Integer,
+        ForeignKey("pipeline_runs.id", ondelete="SET NULL"),
+        comment="ID запуска, который сдвинул отметку"
+    )
+    rows_loaded = Column(
+        BigInteger,
+        comment="Сколько строк загрузил последний запуск"
+    )
+
+    __table_args__ = (
+        UniqueConstraint('pipeline_key', 'column_name', name='uq_pipeline_watermark'),
+        Index('idx_watermark_pipeline_key', 'pipeline_key'),
+    )
+
+
+class LoadCheckpoint(Base, TimestampMixin):
+    """Контрольная точка длинной загрузки: позиция в источнике по единице загрузки"""
+    __tablename__ = "load_checkpoints"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    load_id = Column(
+        String(255),
+        nullable=False,
+        comment="ID загрузки (повторный запуск с тем же ID продолжает её)"
+    )
+    unit = Column(
+        String(255),
+        nullable=False,
+        comment="Единица загрузки: файл, диапазон ключа или партиция"
+    )
+    target_table = Column(
+        String(255),
+        nullable=False,
+        comment="Целевая таблица"
+    )
+    status = Column(
+        String(20),
+        nullable=False,
+        default="in_progress",
+        comment="Статус единицы (in_progress, completed)"
+    )
+    position = Column(
+        JSON,
+        comment="Позиция в источнике: смещение в строках или последний загруженный ключ"
+    )
+    rows_loaded = Column(
+        BigInteger,
+        default=0,
+        comment="Строк единицы, зафиксированных в цели"
+    )
+    pipeline_run_id = Column(
+        Integer,
+        ForeignKey("pipeline_runs.id", ondelete="SET NULL"),
+        comment="ID запуска пайплайна"
+    )
+
+    __table_args__ = (
+        UniqueConstraint('load_id', 'unit', name='uq_load_checkpoint'),
+        Index('idx_load_checkpoint_load_id', 'load_id'),
+    )
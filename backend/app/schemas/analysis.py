@@ -17,6 +17,15 @@ class ColumnProfile(BaseModel):
     null_count: Optional[int] = None
     null_percentage: Optional[float] = None
     numeric_stats: Optional[dict[str, Any]] = None
+    is_estimated: Optional[bool] = Field(default=None, description="Статистики оценены по выборке (False — точные)")
+    confidence_intervals: Optional[dict[str, list[float]]] = Field(
+        default=None,
+        description="Доверительные интервалы статистик: {stat: [low, high]}",
+    )
+    estimate_source: Optional[str] = Field(
+        default=None,
+        description="random_sample|non_random_sample (префикс через LIMIT, без интервалов)",
+    )
 
 
 class DataQualityMetrics(BaseModel):
@@ -34,6 +43,9 @@ class DataProfile(BaseModel):
     sample_data: Optional[list[dict[str, Any]]] = None
     data_quality: Optional[DataQualityMetrics] = None
     file_metadata: Optional[dict[str, Any]] = None
+    rows_is_estimated: Optional[bool] = None
+    rows_confidence_interval: Optional[list[float]] = None
+    sampling: Optional[dict[str, Any]] = None
 
 
 class FileAnalysisRequest(BaseModel):
@@ -42,9 +54,28 @@ class FileAnalysisRequest(BaseModel):
     connection: dict[str, Any] = Field(default_factory=dict)
 
 
+class SamplingOptions(BaseModel):
+    method: str = Field(default="bernoulli", description="exact|system|bernoulli")
+    fraction: Optional[float] = Field(default=None, gt=0, le=1, description="Доля строк в выборке (0, 1]")
+    target_rows: Optional[int] = Field(default=None, gt=0, description="Желаемый размер выборки в строках")
+    confidence: float = Field(default=0.95, gt=0, lt=1, description="Уровень доверия для интервалов")
+    seed: Optional[int] = Field(default=None, description="Seed для воспроизводимой выборки")
+
+
 class DBAnalysisRequest(BaseModel):
     db_type: str  # postgres|clickhouse
     table: str
     connection: dict[str, Any] = Field(default_factory=dict)
+    sampling: Optional[SamplingOptions] = None
+    timeout_seconds: Optional[float] = Field(default=None, gt=0, description="Бюджет времени на запрос")
 
 
+class DBBulkAnalysisRequest(BaseModel):
+    db_type: str  # postgres|clickhouse
+    connection: dict[str, Any] = Field(default_factory=dict)
+    schema_name: Optional[str] = Field(default=None, description="Схема PostgreSQL / база ClickHouse; пусто — вся БД")
+    tables: Optional[list[str]] = Field(default=None, description="Ограничить профилирование этими таблицами")
+    sampling: Optional[SamplingOptions] = None
+    max_concurrency: Optional[int] = Field(default=None, ge=1, le=64, description="Сколько таблиц профилировать параллельно")
+    table_timeout_seconds: Optional[float] = Field(default=None, gt=0, description="Таймаут на одну таблицу")
+    timeout_seconds: Optional[float] = Field(default=None, gt=0, description="Бюджет времени на весь запрос")
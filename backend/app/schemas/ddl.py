@@ -8,6 +8,10 @@ class DDLRequest(BaseModel):
     sample: dict[str, Any] = Field(description="Образец данных с колонками")
     schema_name: Optional[str] = Field(default=None, description="Имя схемы (для PostgreSQL)")
     database_name: Optional[str] = Field(default=None, description="Имя базы данных")
+    key_columns: Optional[List[str]] = Field(default=None, description="Ключ слияния (upsert/версии)")
+    merge_strategy: Optional[str] = Field(
+        default=None, description="upsert (postgres) | replacing | collapsing (clickhouse)"
+    )
 
 
 class DDLResponse(BaseModel):
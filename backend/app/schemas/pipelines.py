@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Any, Optional
+from typing import Any, Literal, Optional
 
 
 class PipelineDraftRequest(BaseModel):
@@ -16,3 +16,125 @@ class PipelineDraftResponse(BaseModel):
     preview_graph: dict[str, Any]
 
 
+
+
+class StagingLoadRequest(BaseModel):
+    source: dict[str, Any] = Field(description="Источник в формате ml.sources.loader (file/postgres/clickhouse)")
+    table_name: str = Field(description="Таблица в рабочей БД")
+    schema_name: Optional[str] = Field(default=None, description="Схема в рабочей БД")
+    profile: Optional[dict[str, Any]] = Field(default=None, description="Профиль источника для генерации DDL")
+    ddl_sql: Optional[str] = Field(default=None, description="Готовый DDL вместо сгенерированного")
+    mode: Literal["append", "replace"] = "append"
+    batch_rows: int = Field(default=50_000, ge=1)
+    checkpoint_rows: Optional[int] = Field(
+        default=None, ge=1, description="Фиксировать позицию в источнике каждые N строк (продолжаемая загрузка)"
+    )
+    load_id: Optional[str] = Field(default=None, description="ID загрузки; повтор с тем же ID продолжает её")
+    parallelism: int = Field(default=1, ge=1, description="Единиц (диапазонов, партиций) одновременно")
+    max_rejects: Optional[int] = Field(
+        default=None, ge=0,
+        description="Битые строки CSV — в таблицу <table>_rejects, не больше N; None — ошибка на первой же",
+    )
+    rejects_path: Optional[str] = Field(default=None, description="Дополнительно писать битые строки в JSONL")
+
+
+class StagingLoadResponse(BaseModel):
+    table: str
+    rows: int
+    bytes: int
+    seconds: float
+    rows_per_second: float
+    mb_per_second: float
+    ddl_sql: Optional[str] = None
+    processing_log_id: Optional[int] = None
+    load_id: Optional[str] = None
+    checkpoint: Optional[dict[str, Any]] = Field(default=None, description="Единицы загрузки: всего, пропущено, продолжено")
+    rejected_rows: int = 0
+    rejects_table: Optional[str] = None
+
+
+class TransferRequest(BaseModel):
+    source: dict[str, Any] = Field(description="Источник (обычно postgres) в формате ml.sources.loader")
+    target_table: str = Field(description="Таблица ClickHouse (db.table или table)")
+    target_database: Optional[str] = None
+    create_table: bool = Field(default=True, description="Создать таблицу по сгенерированному DDL")
+    batch_rows: int = Field(default=50_000, ge=1)
+    queue_size: int = Field(default=4, ge=1, description="Батчей в очереди между стадиями")
+    concurrency: Optional[int] = Field(default=None, ge=1, description="Параллельных INSERT")
+    async_insert: bool = False
+    load_id: Optional[str] = Field(default=None, description="Префикс токенов дедупликации (для повторного запуска)")
+    mode: Literal["append", "replace_partitions"] = Field(
+        default="append", description="replace_partitions — атомарная подмена затронутых партиций (идемпотентно)"
+    )
+    checkpoint_rows: Optional[int] = Field(
+        default=None, ge=1, description="Фиксировать позицию в источнике каждые N строк (продолжаемая загрузка)"
+    )
+    parallelism: int = Field(default=1, ge=1, description="Единиц загрузки одновременно (с checkpoint_rows)")
+
+
+class TransferResponse(BaseModel):
+    target_table: str
+    rows: int
+    seconds: float
+    rows_per_second: float
+    stages: dict[str, dict[str, Any]]
+    ddl_sql: Optional[str] = None
+    load_id: str
+    checkpoint: Optional[dict[str, Any]] = None
+
+
+class MergeRequest(BaseModel):
+    source: dict[str, Any] = Field(description="Источник в формате ml.sources.loader")
+    target: Literal["postgres", "clickhouse"] = "postgres"
+    table_name: str = Field(description="Целевая таблица (в рабочей БД для postgres)")
+    target_database: Optional[str] = Field(default=None, description="База ClickHouse")
+    key_columns: Optional[list[str]] = Field(default=None, description="Ключ слияния; по умолчанию из профиля")
+    strategy: Optional[Literal["upsert", "replacing", "collapsing"]] = Field(
+        default=None, description="upsert для postgres; replacing (по умолчанию) или collapsing для clickhouse "
+                                  "(collapsing читает текущее состояние через FINAL на каждый батч и требует "
+                                  "уникальности ключа в пределах загрузки)"
+    )
+    profile: Optional[dict[str, Any]] = Field(default=None, description="Профиль источника (кандидаты в ключ)")
+    batch_rows: int = Field(default=50_000, ge=1)
+    queue_size: int = Field(default=4, ge=1)
+    load_id: Optional[str] = None
+
+
+class MergeResponse(BaseModel):
+    table: str
+    strategy: str
+    key_columns: list[str]
+    rows: int
+    changed: Optional[int] = Field(default=None, description="Вставлено или изменено строк (postgres)")
+    seconds: float
+    stats: dict[str, Any] = Field(default_factory=dict)
+    stages: dict[str, Any] = Field(default_factory=dict)
+    ddl_sql: Optional[str] = None
+
+
+class PipelineRunRequest(BaseModel):
+    pipeline: dict[str, Any] = Field(description='JSON-DAG {"dag": [{"op": ..., "params": ...}]} из /ml/recommend')
+    source: Optional[dict[str, Any]] = Field(default=None, description="Источник вместо params.source шага Extract")
+    sink: Literal["target", "null", "memory"] = Field(
+        default="target", description="target — загрузка по шагу Load; null/memory — прогон без записи"
+    )
+    batch_rows: int = Field(default=50_000, ge=1)
+    queue_size: int = Field(default=4, ge=1)
+    load_id: Optional[str] = None
+    pipeline_key: Optional[str] = Field(
+        default=None, description="Ключ отметки уровня; по умолчанию имя пайплайна или target:table"
+    )
+    run_id: Optional[int] = Field(default=None, description="ID записи pipeline_runs, сдвигающей отметку")
+
+
+class PipelineRunResponse(BaseModel):
+    status: str
+    rows_in: int
+    rows_out: int
+    seconds: float
+    ops: list[dict[str, Any]] = Field(description="Строки, батчи, время и пропускная способность по операциям")
+    preview: Optional[list[dict[str, Any]]] = None
+    ddl_sql: Optional[str] = None
+    watermark: Optional[dict[str, Any]] = Field(
+        default=None, description="Отметка уровня инкрементального FilterByDate: до и после запуска"
+    )
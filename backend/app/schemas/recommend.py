@@ -10,6 +10,10 @@ class RecommendationRequest(BaseModel):
     update_frequency: Optional[str] = Field(default=None, description="Частота обновления (real-time|hourly|daily|batch)")
     budget_constraints: Optional[str] = Field(default=None, description="Ограничения бюджета")
     team_expertise: Optional[List[str]] = Field(default=None, description="Экспертиза команды")
+    latency_budget_ms: Optional[int] = Field(
+        default=None, ge=0,
+        description="Бюджет ожидания LLM в мс: по истечении — ответ по правилам, LLM дорабатывает в кэш",
+    )
 
 
 class RecommendationResponse(BaseModel):
@@ -20,5 +24,6 @@ class RecommendationResponse(BaseModel):
     performance_estimates: Optional[Dict[str, Any]] = Field(default=None, description="Оценки производительности")
     cost_estimates: Optional[Dict[str, Any]] = Field(default=None, description="Оценки стоимости")
     implementation_steps: Optional[List[str]] = Field(default=None, description="Шаги реализации")
+    source: str = Field(default="rules", description="Источник рекомендации: llm | similar | rules")
 
 
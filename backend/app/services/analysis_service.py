@@ -1,3 +1,10 @@
+import asyncio
+import time
+from typing import AsyncIterator, Optional
+
+from loguru import logger
+
+from app.core.config import settings
 from app.schemas.analysis import (
     SourceInput,
     DataProfile,
@@ -5,10 +12,14 @@ from app.schemas.analysis import (
     DataQualityMetrics,
     FileAnalysisRequest,
     DBAnalysisRequest,
+    DBBulkAnalysisRequest,
+    SamplingOptions,
 )
 from app.connectors.file_connector import FileConnector
 from app.connectors.database_connector import PostgresConnector, ClickHouseConnector
+from app.connectors.query_budget import QueryBudget, QueryBudgetExceeded
 from app.services.cache_service import cache_analysis
+from app.services.sampling_service import SAMPLING_METHODS, resolve_fraction, build_estimated_columns
 
 
 async def analyze_source(payload: SourceInput) -> DataProfile:
@@ -186,21 +197,94 @@ async def analyze_file(req: FileAnalysisRequest) -> DataProfile:
 
 
 async def analyze_db(req: DBAnalysisRequest) -> DataProfile:
-    if req.db_type == "postgres":
-        pg = PostgresConnector(req.connection.get("dsn"))
-        meta = await pg.sample_table_schema(req.table)
-    elif req.db_type == "clickhouse":
-        ch = ClickHouseConnector(
-            host=req.connection.get("host"),
-            port=req.connection.get("port"),
-            user=req.connection.get("user"),
-            password=req.connection.get("password"),
-            database=req.connection.get("database"),
+    budget = QueryBudget(req.timeout_seconds or settings.db_request_deadline_seconds,
+                         settings.db_statement_timeout_seconds)
+    connector = _db_connector(req.db_type, req.connection)
+    meta = await connector.sample_table_schema(req.table, budget=budget)
+    return await _profile_db_table(req.db_type, req.table, connector, meta, req.sampling, budget)
+
+
+async def analyze_db_bulk(req: DBBulkAnalysisRequest) -> AsyncIterator[dict]:
+    """
+    Профилирование всех таблиц схемы/БД: одна выборка из каталога на все колонки,
+    затем параллельный (под семафором) профиль таблиц с таймаутом на каждую.
+    Результаты отдаются по мере готовности; по дедлайну запроса оставшиеся
+    таблицы пропускаются, а уже готовые профили остаются в ответе.
+    """
+    started = time.perf_counter()
+    budget = QueryBudget(req.timeout_seconds or settings.db_request_deadline_seconds,
+                         settings.db_statement_timeout_seconds)
+    connector = _db_connector(req.db_type, req.connection)
+    catalog = await connector.list_schema_columns(req.schema_name, req.tables, budget=budget)
+
+    limit = req.max_concurrency or settings.db_profiling_max_concurrency
+    timeout = req.table_timeout_seconds or settings.db_profiling_table_timeout_seconds
+    semaphore = asyncio.Semaphore(limit)
+
+    async def _profile_one(table: str, columns: list[dict]) -> dict:
+        async with semaphore:
+            t0 = time.perf_counter()
+            result = {"type": "table", "table": table}
+            if budget.expired:
+                return {**result, "status": "skipped", "elapsed_seconds": 0.0,
+                        "error": "Исчерпан бюджет времени запроса"}
+            table_budget = budget.child(timeout)
+            try:
+                profile = await asyncio.wait_for(
+                    _profile_db_table(req.db_type, table, connector, {"table": table, "columns": columns},
+                                      req.sampling, table_budget),
+                    timeout=table_budget.remaining(),
+                )
+                partial = req.sampling is not None and profile.sampling is None
+                result.update(status="partial" if partial else "ok",
+                              profile=profile.model_dump(exclude_none=True))
+            except (asyncio.TimeoutError, QueryBudgetExceeded):
+                table_budget.cancel()
+                result.update(status="timeout", error=f"Превышен таймаут {timeout} с")
+            except Exception as e:
+                logger.error(f"Bulk profiling failed for {table}: {e}")
+                result.update(status="error", error=str(e))
+            result["elapsed_seconds"] = round(time.perf_counter() - t0, 3)
+            return result
+
+    counts = {"ok": 0, "partial": 0, "timeout": 0, "skipped": 0, "error": 0}
+    tasks = [asyncio.create_task(_profile_one(t, cols)) for t, cols in catalog.items()]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            item = await fut
+            counts[item["status"]] += 1
+            yield item
+    finally:
+        # клиент отключился или генератор закрыт — отменяем и серверные запросы
+        for task in tasks:
+            task.cancel()
+        budget.cancel()
+
+    yield {
+        "type": "summary",
+        "tables": len(catalog),
+        **counts,
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def _db_connector(db_type: str, connection: dict):
+    if db_type == "postgres":
+        return PostgresConnector(connection.get("dsn"))
+    if db_type == "clickhouse":
+        return ClickHouseConnector(
+            host=connection.get("host"),
+            port=connection.get("port"),
+            user=connection.get("user"),
+            password=connection.get("password"),
+            database=connection.get("database"),
         )
-        meta = await ch.sample_table_schema(req.table)
-    else:
-        raise ValueError("Unsupported db_type")
+    raise ValueError("Unsupported db_type")
+
 
+async def _profile_db_table(db_type: str, table: str, connector, meta: dict,
+                            sampling: Optional[SamplingOptions],
+                            budget: Optional[QueryBudget] = None) -> DataProfile:
     columns = [
         ColumnProfile(
             name=c.get("name", "col"),
@@ -210,6 +294,58 @@ async def analyze_db(req: DBAnalysisRequest) -> DataProfile:
         for c in meta.get("columns", [])
     ]
     is_ts = any(c.name in {"ts", "timestamp", "created_at"} or c.dtype.lower() in {"timestamp", "date", "datetime"} for c in columns)
-    return DataProfile(rows=0, columns=columns, is_time_series=is_ts)
 
+    if sampling is None:
+        return DataProfile(rows=0, columns=columns, is_time_series=is_ts)
+    try:
+        return await _profile_db_sampled(db_type, table, connector, meta, sampling, is_ts, budget)
+    except QueryBudgetExceeded as e:
+        # частичный результат: схема есть, статистики не успели посчитаться
+        logger.warning(f"Sampled profiling of {table} exceeded its budget: {e}")
+        return DataProfile(rows=0, columns=columns, is_time_series=is_ts,
+                           notes=f"Статистики не получены: {e}")
 
+
+async def _profile_db_sampled(db_type: str, table: str, connector, meta: dict,
+                              sampling: SamplingOptions, is_ts: bool,
+                              budget: Optional[QueryBudget] = None) -> DataProfile:
+    """Профиль по выборке TABLESAMPLE/SAMPLE с экстраполяцией и доверительными интервалами"""
+    if sampling.method not in SAMPLING_METHODS:
+        raise ValueError(f"Unsupported sampling method: {sampling.method}")
+
+    size = await connector.table_size_estimate(table, budget=budget)
+    fraction = resolve_fraction(sampling, size.get("total_rows"))
+    names = [c["name"] for c in meta.get("columns", [])]
+
+    if db_type == "clickhouse":
+        sample = await connector.sample_column_stats(
+            table, names, sampling.method, fraction, sampling_key=size.get("sampling_key"),
+            total_rows=size.get("total_rows"), budget=budget
+        )
+    else:
+        sample = await connector.sample_column_stats(
+            table, names, sampling.method, fraction, sampling.seed, budget=budget
+        )
+    # коннектор мог заменить способ выборки (ClickHouse без SAMPLE BY)
+    method = sample.get("method", sampling.method)
+    fraction = sample.get("fraction", fraction)
+
+    estimated, rows = build_estimated_columns(meta.get("columns", []), sample, fraction, sampling.confidence)
+    columns = [ColumnProfile(**c) for c in estimated]
+
+    return DataProfile(
+        rows=rows["rows"],
+        columns=columns,
+        is_time_series=is_ts,
+        data_quality=_analyze_data_quality_advanced(columns, rows["rows"]),
+        rows_is_estimated=rows["rows_is_estimated"],
+        rows_confidence_interval=rows["rows_confidence_interval"],
+        sampling={
+            "method": method if fraction < 1.0 else ("full_scan" if method == "full_scan" else "exact"),
+            "fraction": fraction,
+            "sample_rows": sample["rows"],
+            "random_sample": sample.get("random_sample", True),
+            "confidence": sampling.confidence,
+            "catalog_rows_estimate": size.get("total_rows"),
+        },
+    )
@@ -5,7 +5,7 @@
 import json
 import hashlib
 import time
-from typing import Any, Optional, Dict, Union, Tuple
+from typing import Any, Callable, Optional, Dict, Union, Tuple
 from functools import wraps
 import asyncio
 from dataclasses import is_dataclass, asdict
@@ -197,8 +197,18 @@ class CacheService:
             return {"error": str(e)}
 
 
-def cached(prefix: str, ttl: int = 3600, cache_service: Optional[CacheService] = None):
-    """Декоратор для кэширования результатов функций (поддержка async/sync)."""
+def cached(prefix: str, ttl: int = 3600, cache_service: Optional[CacheService] = None,
+           key_builder: Optional[Callable[..., str]] = None):
+    """
+    Декоратор для кэширования результатов функций (поддержка async/sync).
+    key_builder(*args, **kwargs) — свой ключ вместо хэша всех аргументов
+    (например, отпечаток без изменчивых полей).
+    """
+    def _key(*args, **kwargs) -> str:
+        if key_builder is not None:
+            return f"{prefix}:{key_builder(*args, **kwargs)}"
+        return cache_service._generate_key(prefix, *args, **kwargs)
+
     def decorator(func):
         if asyncio.iscoroutinefunction(func):
             @wraps(func)
@@ -206,7 +216,7 @@ def cached(prefix: str, ttl: int = 3600, cache_service: Optional[CacheService] =
                 if cache_service is None:
                     return await func(*args, **kwargs)
 
-                cache_key = cache_service._generate_key(prefix, *args, **kwargs)
+                cache_key = _key(*args, **kwargs)
                 cached_result = await cache_service.get(cache_key)
                 if cached_result is not None:
                     logger.debug(f"Cache hit for {cache_key}")
@@ -216,6 +226,10 @@ def cached(prefix: str, ttl: int = 3600, cache_service: Optional[CacheService] =
                 await cache_service.set(cache_key, value, ttl)
                 logger.debug(f"Cache set for {cache_key}")
                 return value
+            # ключ, хранилище и TTL снаружи: тот же кэш могут наполнять другие пути (потоковый ответ)
+            async_wrapper.cache_key = _key
+            async_wrapper.cache = cache_service
+            async_wrapper.cache_ttl = ttl
             return async_wrapper
         else:
             @wraps(func)
@@ -223,7 +237,7 @@ def cached(prefix: str, ttl: int = 3600, cache_service: Optional[CacheService] =
                 if cache_service is None:
                     return func(*args, **kwargs)
 
-                cache_key = cache_service._generate_key(prefix, *args, **kwargs)
+                cache_key = _key(*args, **kwargs)
                 # sync-ветка использует memory cache; Redis — только из async-клиента
                 entry = cache_service._memory_cache.get(cache_key)
                 now = time.time()
@@ -262,6 +276,6 @@ def cache_recommendations(ttl: int = 1800):
     return cached("recommendations", ttl, cache_service)
 
 
-def cache_llm(ttl: int = 3600):
+def cache_llm(ttl: int = 3600, key_builder: Optional[Callable[..., str]] = None):
     """Кэширование LLM ответов"""
-    return cached("llm", ttl, cache_service)
+    return cached("llm", ttl, cache_service, key_builder)
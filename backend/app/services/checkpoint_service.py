@@ -0,0 +1,568 @@
+"""
+Длинные загрузки с контрольными точками: источник делится на единицы
+(файл, диапазон ключа Postgres, партиция ClickHouse), каждая единица пишется
+порциями по checkpoint_rows строк. После фиксации порции в цели её позиция
+(смещение в строках или последний ключ) сохраняется в load_checkpoints БД
+метаданных. Повторный запуск с тем же load_id пропускает завершённые единицы
+и продолжает остальные с сохранённой позиции.
+
+Повторная порция не задваивается: при продолжении единицы с ключом её хвост
+в цели (ключ >= последнего зафиксированного и < верхней границы диапазона)
+удаляется перед первой порцией — в Postgres в её транзакции COPY, в ClickHouse
+синхронной мутацией ALTER TABLE ... DELETE. Чтение продолжается с того же
+ключа включительно: строки с повторяющимся граничным ключом, часть которых
+попала в зафиксированную порцию, перечитываются целиком, поэтому уникальность
+ключа не требуется (rows_committed может учесть их дважды). Файл продолжается
+по смещению в строках: в staging смещение пишется в etl_load_offsets той же
+транзакцией, что и COPY порции, и при продолжении берётся оттуда, если запись
+в load_checkpoints не успела; повтор порции в ClickHouse отсекают
+детерминированные токены дедупликации ({load_id}-{единица}-{номер порции}).
+"""
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+from loguru import logger
+
+from app.connectors.batch_sources import DEFAULT_BATCH_ROWS, open_file_batches
+from app.connectors.clickhouse_loader import ClickHouseLoader
+from app.connectors.database_connector import _ch_table_ref, _pg_table_ref, _quote_ch, _quote_pg, _split_table
+from app.connectors.database_manager import db_manager
+from app.connectors.postgres_extractor import KeyRange
+from app.connectors.postgres_loader import PostgresLoader
+from app.models.metadata import LoadCheckpoint
+from app.models.staging import ProcessingStatus
+from app.schemas.pipelines import StagingLoadRequest, StagingLoadResponse, TransferRequest, TransferResponse
+from app.services.staging_load_service import (
+    _qualified, _record_load, _staging_ddl, create_table_statements, normalize_batch, staging_column_name
+)
+from app.services.transfer_service import _ensure_target_table, clickhouse_target_schema, convert_batch
+from app.services.watermark_service import decode_watermark, encode_watermark
+
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+PLAN_UNIT = "_plan"  # сохранённое разбиение на диапазоны: гистограмма pg_stats меняется после ANALYZE
+OFFSETS_TABLE = "etl_load_offsets"  # смещения порций в staging, в транзакции COPY
+
+
+def encode_key(value: Any) -> Dict[str, Any]:
+    if isinstance(value, str):
+        return {"type": "string", "value": value}
+    value_type, encoded = encode_watermark(value)
+    return {"type": value_type, "value": encoded}
+
+
+def decode_key(encoded: Optional[Dict[str, Any]]) -> Any:
+    if encoded is None:
+        return None
+    if encoded["type"] == "string":
+        return encoded["value"]
+    return decode_watermark(encoded["type"], encoded["value"])
+
+
+@dataclass
+class Remainder:
+    """Незафиксированная часть единицы: строки, которые мог оставить в цели прерванный запуск."""
+    column: str
+    after: Any = None   # ключ >= after (последний зафиксированный: его строки перечитываются)
+    lower: Any = None   # ключ >= lower, если порций ещё не было
+    upper: Any = None   # ключ < upper
+    nulls: bool = False
+
+
+@dataclass
+class LoadUnit:
+    """Единица загрузки. open(position) — батчи с позиции; key_column=None — позиция в строках."""
+    name: str
+    open: Callable[[Optional[Dict[str, Any]]], Iterator[pa.RecordBatch]]
+    key_column: Optional[str] = None
+    key_range: Optional[KeyRange] = None
+    resumable: bool = True
+
+    def advance(self, position: Optional[Dict[str, Any]], rows: int,
+                last: Optional[pa.RecordBatch]) -> Dict[str, Any]:
+        position = dict(position or {})
+        position["rows"] = position.get("rows", 0) + rows
+        position["chunk"] = position.get("chunk", 0) + 1
+        if self.key_column and last is not None and last.num_rows:
+            position["key"] = encode_key(last.column(self.key_column)[-1].as_py())
+        return position
+
+    def remainder(self, position: Optional[Dict[str, Any]]) -> Optional[Remainder]:
+        if not self.key_column:
+            return None
+        key_range = self.key_range or KeyRange()
+        if key_range.nulls:
+            return Remainder(self.key_column, nulls=True)
+        after = decode_key((position or {}).get("key"))
+        return Remainder(self.key_column, after=after, lower=None if after is not None else key_range.lower,
+                         upper=key_range.upper)
+
+
+class CheckpointStore:
+    """Контрольные точки одной загрузки в БД метаданных."""
+
+    def __init__(self, load_id: str, target_table: str, run_id: Optional[int] = None) -> None:
+        self.load_id = load_id
+        self.target_table = target_table
+        self.run_id = run_id
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        with db_manager.get_metadata_session() as session:
+            rows = session.query(LoadCheckpoint).filter_by(load_id=self.load_id).all()
+            return {r.unit: {"status": r.status, "position": r.position, "rows": r.rows_loaded or 0}
+                    for r in rows}
+
+    def save(self, unit: str, status: str, position: Optional[Dict[str, Any]], rows: int) -> None:
+        with db_manager.get_metadata_session() as session:
+            row = session.query(LoadCheckpoint).filter_by(
+                load_id=self.load_id, unit=unit
+            ).with_for_update().one_or_none()
+            if row is None:
+                row = LoadCheckpoint(load_id=self.load_id, unit=unit, target_table=self.target_table)
+                session.add(row)
+            row.status = status
+            row.position = position
+            row.rows_loaded = rows
+            row.pipeline_run_id = self.run_id
+            session.commit()
+
+
+class _Chunk:
+    """Порция: батчи общего итератора, пока не наберётся limit строк."""
+
+    def __init__(self, batches: Iterator[pa.RecordBatch], limit: Optional[int]) -> None:
+        self._batches = batches
+        self.limit = limit
+        self.rows = 0
+        self.last: Optional[pa.RecordBatch] = None
+        self.exhausted = False
+
+    def __iter__(self) -> Iterator[pa.RecordBatch]:
+        for batch in self._batches:
+            self.rows += batch.num_rows
+            self.last = batch
+            yield batch
+            if self.limit and self.rows >= self.limit:
+                return
+        self.exhausted = True
+
+
+@dataclass
+class ChunkRef:
+    """Порция единицы: номер и сколько строк единицы зафиксировано до неё."""
+    unit: str
+    number: int
+    rows_before: int = 0
+
+    @property
+    def token(self) -> str:
+        return f"{self.unit}-{self.number}"
+
+
+Writer = Callable[[Iterable[pa.RecordBatch], ChunkRef, Optional[Remainder]], Dict[str, Any]]
+
+
+def _run_unit(unit: LoadUnit, state: Optional[Dict[str, Any]], writer: Writer, store: CheckpointStore,
+              checkpoint_rows: int) -> Dict[str, Any]:
+    position = state["position"] if state else None
+    rows_total = state["rows"] if state else 0
+    if state is None:
+        store.save(unit.name, IN_PROGRESS, None, 0)
+    else:
+        logger.info(f"Resuming unit {unit.name} from {position}")
+    # хвост прерванного запуска чистится только при продолжении начатой единицы
+    remainder = unit.remainder(position) if state is not None else None
+
+    rows = bytes_written = 0
+    batches = unit.open(position)
+    try:
+        while True:
+            chunk = _Chunk(batches, checkpoint_rows if unit.resumable else None)
+            ref = ChunkRef(unit.name, (position or {}).get("chunk", 0), (position or {}).get("rows", 0))
+            stats = writer(chunk, ref, remainder)
+            if chunk.rows:
+                remainder = None
+                position = unit.advance(position, chunk.rows, chunk.last)
+                rows += chunk.rows
+                rows_total += chunk.rows
+                bytes_written += stats.get("bytes", 0)
+            if chunk.exhausted:
+                store.save(unit.name, COMPLETED, position, rows_total)
+                break
+            store.save(unit.name, IN_PROGRESS, position, rows_total)
+    finally:
+        close = getattr(batches, "close", None)
+        if close:
+            close()
+    return {"rows": rows, "bytes": bytes_written}
+
+
+def run_checkpointed(units: List[LoadUnit], writer: Writer, store: CheckpointStore,
+                     checkpoint_rows: int, parallelism: int = 1,
+                     saved: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Загрузить незавершённые единицы (не больше parallelism одновременно)."""
+    started = time.perf_counter()
+    saved = store.load() if saved is None else saved
+    pending = [u for u in units if saved.get(u.name, {}).get("status") != COMPLETED]
+    lock = threading.Lock()
+    totals = {"rows": 0, "bytes": 0}
+
+    def _one(unit: LoadUnit) -> None:
+        stats = _run_unit(unit, saved.get(unit.name), writer, store, checkpoint_rows)
+        with lock:
+            totals["rows"] += stats["rows"]
+            totals["bytes"] += stats["bytes"]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(pending) or 1)),
+                            thread_name_prefix="checkpoint-load") as pool:
+        for future in [pool.submit(_one, u) for u in pending]:
+            future.result()
+
+    seconds = time.perf_counter() - started
+    result = {
+        **totals,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(totals["rows"] / seconds, 1) if seconds > 0 else 0.0,
+        "mb_per_second": round(totals["bytes"] / 1_048_576 / seconds, 2) if seconds > 0 else 0.0,
+        "units": len(units),
+        "skipped_units": len(units) - len(pending),
+        "resumed_units": sum(1 for u in pending if u.name in saved),
+        "rows_committed": sum(s.get("rows", 0) for n, s in saved.items() if n != PLAN_UNIT) + totals["rows"],
+    }
+    logger.info(f"Checkpointed load {store.load_id} into {store.target_table}: {result}")
+    return result
+
+
+# ---------- единицы по типу источника ----------
+
+def _planned_ranges(extractor: Any, table: str, key: str, store: CheckpointStore,
+                    saved: Dict[str, Dict[str, Any]]) -> List[KeyRange]:
+    """Диапазоны ключа из сохранённого плана или новое разбиение (сохраняется до первой порции)."""
+    plan = (saved.get(PLAN_UNIT) or {}).get("position")
+    if plan:
+        return [KeyRange(decode_key(r["lower"]), decode_key(r["upper"]), r["nulls"]) for r in plan["ranges"]]
+    ranges = extractor.plan_ranges(table, key)
+    store.save(PLAN_UNIT, COMPLETED, {"ranges": [
+        {"lower": None if r.lower is None else encode_key(r.lower),
+         "upper": None if r.upper is None else encode_key(r.upper), "nulls": r.nulls}
+        for r in ranges
+    ]}, 0)
+    return ranges
+
+
+def _postgres_units(source: Dict[str, Any], batch_rows: int, store: CheckpointStore,
+                    saved: Dict[str, Dict[str, Any]]) -> List[LoadUnit]:
+    from app.connectors.postgres_extractor import PostgresExtractor
+
+    table, key = source["table"], source["key_column"]
+    extractor = PostgresExtractor(source.get("dsn"), batch_rows=batch_rows, mode=source.get("mode", "cursor"),
+                                  parallelism=source.get("parallelism"))
+    ranges = _planned_ranges(extractor, table, key, store, saved)
+
+    def _open(index: int, key_range: KeyRange):
+        def _batches(position: Optional[Dict[str, Any]]) -> Iterator[pa.RecordBatch]:
+            predicate, params = key_range.predicate(key, index)
+            last = decode_key((position or {}).get("key"))
+            if last is not None:
+                predicate += f" AND {_quote_pg(key)} >= :ck_last"
+                params["ck_last"] = last
+            where = f"({source['where']}) AND {predicate}" if source.get("where") else predicate
+            return extractor.iter_batches(table=table, columns=source.get("columns"), where=where,
+                                          params={**(source.get("params") or {}), **params},
+                                          order_by=None if key_range.nulls else key)
+        return _batches
+
+    # строки с NULL в ключе не упорядочить — такой диапазон пишется одной порцией
+    return [LoadUnit(f"range-{i}", _open(i, r), key_column=key, key_range=r, resumable=not r.nulls)
+            for i, r in enumerate(ranges)]
+
+
+def _clickhouse_range_conditions(key: str, key_type: str, key_range: KeyRange,
+                                 last: Any = None) -> Tuple[List[str], Dict[str, Any]]:
+    """Условия диапазона ключа с типизированными параметрами ClickHouse."""
+    col = _quote_ch(key)
+    if key_range.nulls:
+        return [f"{col} IS NULL"], {}
+    conditions, params = [f"{col} IS NOT NULL"], {}
+    if last is not None:
+        conditions.append(f"{col} >= {{ck_last:{key_type}}}")
+        params["ck_last"] = last
+    elif key_range.lower is not None:
+        conditions.append(f"{col} >= {{ck_lower:{key_type}}}")
+        params["ck_lower"] = key_range.lower
+    if key_range.upper is not None:
+        conditions.append(f"{col} < {{ck_upper:{key_type}}}")
+        params["ck_upper"] = key_range.upper
+    return conditions, params
+
+
+def _clickhouse_units(source: Dict[str, Any], batch_rows: int, store: CheckpointStore,
+                      saved: Dict[str, Dict[str, Any]]) -> List[LoadUnit]:
+    """
+    Единицы — диапазоны ключа, а не партиции: ключи партиций пересекаются,
+    и хвост прерванной партиции в цели по ключу не отделить от соседних.
+    """
+    from app.connectors.clickhouse_extractor import ClickHouseExtractor
+
+    table, key = source["table"], source["key_column"]
+    extractor = ClickHouseExtractor(host=source.get("host"), port=source.get("port"),
+                                    user=source.get("user"), password=source.get("password"),
+                                    database=source.get("database"), batch_rows=batch_rows,
+                                    parallelism=source.get("parallelism"))
+    key_type = extractor.column_type(table, key)
+    ranges = _planned_ranges(extractor, table, key, store, saved)
+
+    def _open(key_range: KeyRange):
+        def _batches(position: Optional[Dict[str, Any]]) -> Iterator[pa.RecordBatch]:
+            conditions, params = _clickhouse_range_conditions(key, key_type, key_range,
+                                                              decode_key((position or {}).get("key")))
+            if source.get("where"):
+                conditions.insert(0, f"({source['where']})")
+            return extractor.iter_batches(table=table, columns=source.get("columns"),
+                                          where=" AND ".join(conditions),
+                                          parameters={**(source.get("params") or {}), **params},
+                                          order_by=None if key_range.nulls else key)
+        return _batches
+
+    return [LoadUnit(f"range-{i}", _open(r), key_column=key, key_range=r, resumable=not r.nulls)
+            for i, r in enumerate(ranges)]
+
+
+def plan_units(source: Dict[str, Any], store: CheckpointStore, saved: Dict[str, Dict[str, Any]],
+               batch_rows: int = DEFAULT_BATCH_ROWS) -> List[LoadUnit]:
+    """
+    file — одна единица, позиция в строках;
+    postgres/clickhouse — таблица с key_column: диапазоны ключа, позиция — последний ключ.
+    """
+    source_type = (source.get("type") or "").lower()
+    if source_type == "file":
+        return [LoadUnit("file", lambda position: open_file_batches(source, batch_rows,
+                                                                    (position or {}).get("rows", 0)))]
+    if source_type in ("postgres", "clickhouse"):
+        if not source.get("table") or source.get("query") or not source.get("key_column"):
+            raise ValueError("Контрольные точки для БД-источника требуют table и key_column")
+        columns = source.get("columns")
+        if columns and source["key_column"] not in columns:
+            raise ValueError(f"key_column {source['key_column']} должен входить в columns")
+        if source_type == "postgres":
+            return _postgres_units(source, batch_rows, store, saved)
+        return _clickhouse_units(source, batch_rows, store, saved)
+    raise ValueError(f"Unsupported source type: {source_type}")
+
+
+def first_batch(units: List[LoadUnit]) -> Optional[pa.RecordBatch]:
+    """Первый непустой батч (для схемы и DDL); потоки единиц закрываются сразу."""
+    for unit in units:
+        batches = unit.open(None)
+        try:
+            for batch in batches:
+                if batch.num_rows:
+                    return batch
+        finally:
+            close = getattr(batches, "close", None)
+            if close:
+                close()
+    return None
+
+
+# ---------- запись в цель ----------
+
+def _remainder_predicates(column: str, remainder: Remainder) -> Tuple[str, Dict[str, Any]]:
+    """Условие хвоста единицы; параметры в формате %(name)s (psycopg2 и clickhouse_connect)."""
+    if remainder.nulls:
+        return f"{column} IS NULL", {}
+    predicates, params = [f"{column} IS NOT NULL"], {}
+    if remainder.after is not None:
+        predicates.append(f"{column} >= %(ck_after)s")
+        params["ck_after"] = remainder.after
+    elif remainder.lower is not None:
+        predicates.append(f"{column} >= %(ck_lower)s")
+        params["ck_lower"] = remainder.lower
+    if remainder.upper is not None:
+        predicates.append(f"{column} < %(ck_upper)s")
+        params["ck_upper"] = remainder.upper
+    return " AND ".join(predicates), params
+
+
+def _remainder_delete(table: str, remainder: Optional[Remainder]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    if remainder is None:
+        return None
+    where, params = _remainder_predicates(_quote_pg(staging_column_name(remainder.column)), remainder)
+    return f"DELETE FROM {_pg_table_ref(table)} WHERE {where}", params
+
+
+def _clickhouse_remainder_delete(table: str, remainder: Optional[Remainder]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    if remainder is None:
+        return None
+    where, params = _remainder_predicates(_quote_ch(remainder.column), remainder)
+    return f"ALTER TABLE {_ch_table_ref(table)} DELETE WHERE {where}", params
+
+
+def _offsets_table(table: str) -> str:
+    schema, _ = _split_table(table)
+    return _pg_table_ref(f"{schema}.{OFFSETS_TABLE}" if schema else OFFSETS_TABLE)
+
+
+def offsets_ddl(table: str) -> str:
+    return (f"CREATE TABLE IF NOT EXISTS {_offsets_table(table)} ("
+            "load_id TEXT NOT NULL, unit TEXT NOT NULL, chunk INTEGER NOT NULL, rows_loaded BIGINT NOT NULL, "
+            "updated_at TIMESTAMPTZ NOT NULL DEFAULT now(), PRIMARY KEY (load_id, unit))")
+
+
+def _offset_mark(table: str, load_id: str, ref: ChunkRef) -> Tuple[str, Dict[str, Any]]:
+    sql = (f"INSERT INTO {_offsets_table(table)} (load_id, unit, chunk, rows_loaded) "
+           "VALUES (%(ck_load_id)s, %(ck_unit)s, %(ck_chunk)s, %(ck_rows)s + %(copied_rows)s) "
+           "ON CONFLICT (load_id, unit) DO UPDATE SET chunk = EXCLUDED.chunk, "
+           "rows_loaded = EXCLUDED.rows_loaded, updated_at = now()")
+    return sql, {"ck_load_id": load_id, "ck_unit": ref.unit, "ck_chunk": ref.number + 1, "ck_rows": ref.rows_before}
+
+
+def reconcile_offsets(loader: PostgresLoader, table: str, load_id: str, units: List[LoadUnit],
+                      saved: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Единицы со смещением в строках: если в staging зафиксировано больше, чем
+    успели записать в load_checkpoints (сбой между COPY и сохранением), —
+    продолжать со смещения staging, иначе последняя порция задвоится.
+    """
+    by_rows = {u.name for u in units if not u.key_column}
+    if not by_rows:
+        return saved
+    rows = loader.fetch_all(f"SELECT unit, chunk, rows_loaded FROM {_offsets_table(table)} "
+                            "WHERE load_id = %(load_id)s", {"load_id": load_id})
+    saved = dict(saved)
+    for unit, chunk, rows_loaded in rows:
+        state = saved.get(unit)
+        if unit not in by_rows or state is None or state["status"] == COMPLETED:
+            continue
+        position = state.get("position") or {}
+        if rows_loaded > position.get("rows", 0):
+            logger.warning(f"Load {load_id} unit {unit}: staging has {rows_loaded} rows, "
+                           f"checkpoint {position.get('rows', 0)} — resuming from staging offset")
+            saved[unit] = {**state, "position": {**position, "rows": rows_loaded, "chunk": chunk},
+                           "rows": state["rows"] + rows_loaded - position.get("rows", 0)}
+    return saved
+
+
+def postgres_writer(loader: PostgresLoader, table: str, load_id: str) -> Writer:
+    """
+    Порция — одна транзакция COPY: хвост прерванной единицы удаляется в ней же,
+    смещение порции записывается в etl_load_offsets в ней же.
+    """
+    def _write(batches: Iterable[pa.RecordBatch], ref: ChunkRef, remainder: Optional[Remainder]) -> Dict[str, Any]:
+        return loader.copy_batches(table, (normalize_batch(b) for b in batches),
+                                   delete=_remainder_delete(table, remainder),
+                                   mark=_offset_mark(table, load_id, ref))
+    return _write
+
+
+def clickhouse_writer(table: str, target_schema: pa.Schema, load_id: str, **loader_kwargs: Any) -> Writer:
+    """
+    Порция — insert_batches с токенами {load_id}-{единица}-{порция}: повтор порции
+    после сбоя отсекается дедупликацией. Хвост продолжаемой единицы удаляется
+    до вставки (mutations_sync=2 — дождаться мутации и на репликах); такой порции
+    нужен новый токен: с прежним дедупликация отбросила бы блоки, совпавшие с
+    только что удалёнными. Свой загрузчик на порцию — единицы идут в разных потоках.
+    """
+    def _write(batches: Iterable[pa.RecordBatch], ref: ChunkRef, remainder: Optional[Remainder]) -> Dict[str, Any]:
+        loader = ClickHouseLoader(**loader_kwargs)
+        token = ref.token
+        delete = _clickhouse_remainder_delete(table, remainder)
+        if delete is not None:
+            sql, params = delete
+            loader.command(sql, settings={"mutations_sync": 2}, parameters=params)
+            token = f"{token}-{uuid.uuid4().hex[:8]}"
+        return loader.insert_batches(table, (convert_batch(b, target_schema) for b in batches),
+                                     load_id=f"{load_id}-{token}")
+    return _write
+
+
+
+# ---------- точки входа сервисов загрузки ----------
+
+async def load_to_staging_checkpointed(req: StagingLoadRequest) -> StagingLoadResponse:
+    """load_to_staging с контрольными точками; повтор с тем же load_id продолжает загрузку."""
+    if req.max_rejects is not None:
+        # смещение в строках не учитывает отброшенные строки — продолжение сдвинулось бы
+        raise ValueError("max_rejects несовместим с checkpoint_rows")
+    started_at = datetime.now(timezone.utc)
+    load_id = req.load_id or uuid.uuid4().hex
+    store = CheckpointStore(load_id, _qualified(req))
+    saved = await asyncio.to_thread(store.load)
+    units = await asyncio.to_thread(plan_units, req.source, store, saved, req.batch_rows)
+    first = await asyncio.to_thread(first_batch, units)
+    if first is None:
+        raise ValueError("Источник не содержит данных")
+    first = normalize_batch(first)
+
+    ddl_sql = await _staging_ddl(req, first.schema)
+    loader = PostgresLoader(db_manager.staging_engine)
+    statements = create_table_statements(ddl_sql)
+    statements.append(offsets_ddl(_qualified(req)))
+    if req.mode == "replace" and not saved:
+        # очищается только при первом запуске: продолжение дописывает к зафиксированному
+        statements.append(f"TRUNCATE {_pg_table_ref(_qualified(req))}")
+    stats: Dict[str, Any] = {"load_id": load_id}
+    try:
+        await asyncio.to_thread(loader.execute_ddl, statements)
+        if saved:
+            saved = await asyncio.to_thread(reconcile_offsets, loader, _qualified(req), load_id, units, saved)
+        stats.update(await asyncio.to_thread(run_checkpointed, units,
+                                             postgres_writer(loader, _qualified(req), load_id),
+                                             store, req.checkpoint_rows, req.parallelism, saved))
+    except Exception as e:
+        await asyncio.to_thread(_record_load, req, ProcessingStatus.FAILED.value, stats,
+                                started_at, first.num_columns, str(e))
+        raise
+
+    log_id = await asyncio.to_thread(_record_load, req, ProcessingStatus.COMPLETED.value, stats,
+                                     started_at, first.num_columns)
+    return StagingLoadResponse(
+        table=_qualified(req),
+        rows=stats["rows"],
+        bytes=stats["bytes"],
+        seconds=stats["seconds"],
+        rows_per_second=stats["rows_per_second"],
+        mb_per_second=stats["mb_per_second"],
+        ddl_sql=ddl_sql,
+        processing_log_id=log_id,
+        load_id=load_id,
+        checkpoint={k: stats[k] for k in ("units", "skipped_units", "resumed_units", "rows_committed")},
+    )
+
+
+async def transfer_checkpointed(req: TransferRequest) -> TransferResponse:
+    """transfer с контрольными точками (только append: подмена партиций и так идемпотентна)."""
+    if req.mode != "append":
+        raise ValueError("checkpoint_rows совместим только с mode=append")
+    load_id = req.load_id or uuid.uuid4().hex
+    store = CheckpointStore(load_id, req.target_table)
+    saved = await asyncio.to_thread(store.load)
+    units = await asyncio.to_thread(plan_units, req.source, store, saved, req.batch_rows)
+    first = await asyncio.to_thread(first_batch, units)
+    if first is None:
+        raise ValueError("Источник не содержит данных")
+
+    loader_kwargs = {"database": req.target_database, "concurrency": req.concurrency,
+                     "async_insert": req.async_insert}
+    ddl_sql = await _ensure_target_table(ClickHouseLoader(**loader_kwargs), req.target_table, first.schema,
+                                         req.create_table)
+    writer = clickhouse_writer(req.target_table, clickhouse_target_schema(first.schema), load_id, **loader_kwargs)
+    stats = await asyncio.to_thread(run_checkpointed, units, writer, store, req.checkpoint_rows,
+                                    req.parallelism, saved)
+    return TransferResponse(
+        target_table=req.target_table,
+        rows=stats["rows"],
+        seconds=stats["seconds"],
+        rows_per_second=stats["rows_per_second"],
+        stages={},
+        ddl_sql=ddl_sql,
+        load_id=load_id,
+        checkpoint={k: stats[k] for k in ("units", "skipped_units", "resumed_units", "rows_committed")},
+    )
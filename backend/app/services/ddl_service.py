@@ -1,7 +1,10 @@
 from app.schemas.ddl import DDLRequest, DDLResponse
 from typing import Dict, List, Optional
+import hashlib
 import re
+import pyarrow as pa
 from app.services.cache_service import cache_ddl
+from app.core.config import settings
 
 
 def _infer_sql_type(py_type: str, target: str, column_info: Optional[Dict] = None) -> str:
@@ -14,6 +17,10 @@ def _infer_sql_type(py_type: str, target: str, column_info: Optional[Dict] = Non
         "int32": "INTEGER",
         "int16": "SMALLINT",
         "int8": "SMALLINT",
+        "uint8": "SMALLINT",
+        "uint16": "INTEGER",
+        "uint32": "BIGINT",
+        "uint64": "NUMERIC(20)",
         "float": "DOUBLE PRECISION",
         "float64": "DOUBLE PRECISION",
         "float32": "REAL",
@@ -35,6 +42,10 @@ def _infer_sql_type(py_type: str, target: str, column_info: Optional[Dict] = Non
         "int32": "Int32",
         "int16": "Int16",
         "int8": "Int8",
+        "uint8": "UInt8",
+        "uint16": "UInt16",
+        "uint32": "UInt32",
+        "uint64": "UInt64",
         "float": "Float64",
         "float64": "Float64",
         "float32": "Float32",
@@ -56,6 +67,10 @@ def _infer_sql_type(py_type: str, target: str, column_info: Optional[Dict] = Non
         "int32": "INT",
         "int16": "SMALLINT",
         "int8": "TINYINT",
+        "uint8": "TINYINT UNSIGNED",
+        "uint16": "SMALLINT UNSIGNED",
+        "uint32": "INT UNSIGNED",
+        "uint64": "BIGINT UNSIGNED",
         "float": "DOUBLE",
         "float64": "DOUBLE",
         "float32": "FLOAT",
@@ -77,6 +92,10 @@ def _infer_sql_type(py_type: str, target: str, column_info: Optional[Dict] = Non
         "int32": "INT",
         "int16": "SMALLINT",
         "int8": "TINYINT",
+        "uint8": "SMALLINT",
+        "uint16": "INT",
+        "uint32": "BIGINT",
+        "uint64": "DECIMAL(20,0)",
         "float": "DOUBLE",
         "float64": "DOUBLE",
         "float32": "FLOAT",
@@ -125,19 +144,111 @@ def _infer_sql_type(py_type: str, target: str, column_info: Optional[Dict] = Non
     return base_type
 
 
-def _generate_constraints(columns: List[Dict], target: str) -> List[str]:
+def arrow_dtype_name(arrow_type: pa.DataType) -> str:
+    """Имя типа Arrow в терминах профиля (как dtype у pandas), понятное _infer_sql_type"""
+    if pa.types.is_boolean(arrow_type):
+        return "bool"
+    if pa.types.is_unsigned_integer(arrow_type):
+        # свои типы в ClickHouse; в Postgres — тип на ступень шире (uint64 -> NUMERIC)
+        return f"uint{arrow_type.bit_width}"
+    if pa.types.is_integer(arrow_type):
+        return f"int{min(max(arrow_type.bit_width, 16), 64)}"
+    if pa.types.is_floating(arrow_type):
+        return "float32" if arrow_type.bit_width <= 32 else "float64"
+    if pa.types.is_decimal(arrow_type):
+        return "float64"
+    if pa.types.is_timestamp(arrow_type):
+        return "timestamp"
+    if pa.types.is_date(arrow_type):
+        return "date"
+    return "string"
+
+
+def sample_from_arrow_schema(schema: pa.Schema, rows: int = 0) -> Dict:
+    """Минимальный профиль (колонки и типы) по Arrow-схеме — вход для generate_ddl"""
+    return {
+        "rows": rows,
+        "columns": [
+            {"name": field.name, "dtype": arrow_dtype_name(field.type), "nullable": field.nullable}
+            for field in schema
+        ],
+    }
+
+
+def clickhouse_partition_column(columns: List[Dict]) -> Optional[str]:
+    """Колонка для PARTITION BY toDate(...) в ClickHouse: первая похожая на время"""
+    for col in columns:
+        name = col.get("name", "").lower()
+        if name in ["ts", "timestamp", "created_at", "date"] or "time" in name:
+            return col.get("name")
+    return None
+
+
+def clickhouse_sort_and_partition(columns: List[Dict], key_columns: Optional[List[str]] = None,
+                                  merge_strategy: Optional[str] = None) -> tuple[List[str], Optional[str]]:
+    """ORDER BY и колонка PARTITION BY таблицы ClickHouse из generate_ddl."""
+    if key_columns and merge_strategy in ("replacing", "collapsing"):
+        # строки схлопываются только внутри партиции: ключ слияния — весь ORDER BY,
+        # партиция по изменяемой колонке времени оставила бы дубли
+        return list(key_columns), None
+    order_cols = [
+        col.get("name") for col in columns
+        if col.get("name", "").lower() in ["id", "ts", "timestamp", "created_at"] or "time" in col.get("name", "").lower()
+    ]
+    return order_cols[:3], clickhouse_partition_column(columns)  # максимум 3 колонки для сортировки
+
+
+def clickhouse_column_type(dtype: str, nullable: bool, is_key: bool = False) -> str:
+    """Тип колонки ClickHouse: Nullable(T) для колонок с пропусками, кроме ключей сортировки/партиции."""
+    base = _infer_sql_type(dtype, "clickhouse")
+    return f"Nullable({base})" if nullable and not is_key else base
+
+
+def _is_key_candidate(col: Dict, total_rows: int) -> bool:
+    name = col.get("name", "")
+    unique_count = col.get("unique_count", 0)
+    return name.lower() in ["id", "pk", "primary_key"] or (unique_count == total_rows and total_rows > 1)
+
+
+def key_candidates(profile: Dict) -> List[str]:
+    """
+    Колонки-кандидаты в ключ слияния по профилю: те же правила, что у PRIMARY KEY
+    в DDL; колонки без пропусков идут первыми.
+    """
+    total_rows = profile.get("rows", 0)
+    columns = [c for c in profile.get("columns", []) if _is_key_candidate(c, total_rows)]
+    columns.sort(key=lambda c: bool(c.get("null_count") or c.get("nulls")))
+    return [c.get("name") for c in columns]
+
+
+MERGE_VERSION_COLUMN = "_version"
+MERGE_SIGN_COLUMN = "_sign"
+
+
+def _constraint_name(prefix: str, table_name: str, *columns: str) -> str:
+    """
+    Имя ограничения, уникальное в схеме: префикс, таблица и колонки, не длиннее
+    63 байт (NAMEDATALEN Postgres); при обрезке добавляется хеш полного имени.
+    """
+    name = re.sub(r"\W+", "_", "_".join([prefix, table_name.split(".")[-1], *columns]))
+    if len(name.encode("utf-8")) <= 63:
+        return name
+    digest = hashlib.md5(name.encode("utf-8")).hexdigest()[:8]
+    return name.encode("utf-8")[:54].decode("utf-8", "ignore") + "_" + digest
+
+
+def _generate_constraints(columns: List[Dict], target: str, table_name: str = "") -> List[str]:
     """Генерация ограничений для таблицы"""
     constraints = []
     
     for col in columns:
         name = col.get("name", "")
-        unique_count = col.get("unique_count", 0)
         total_rows = col.get("total_rows", 0)
         
         # Первичный ключ
-        if name.lower() in ["id", "pk", "primary_key"] or (unique_count == total_rows and total_rows > 1):
+        if _is_key_candidate(col, total_rows):
             if target == "postgres":
-                constraints.append(f"CONSTRAINT pk_{name} PRIMARY KEY ({name})")
+                constraints.append(f"CONSTRAINT {_constraint_name('pk', table_name, name)} PRIMARY KEY ({name})")
             elif target == "mysql":
                 constraints.append(f"PRIMARY KEY ({name})")
             elif target == "clickhouse":
@@ -185,7 +296,7 @@ async def generate_ddl(req: DDLRequest) -> DDLResponse:
         cols_rendered.append(f"  {name} {sql_type}")
 
     # Генерация ограничений
-    constraints = _generate_constraints(sample_cols, req.target_system)
+    constraints = _generate_constraints(sample_cols, req.target_system, req.table_name)
     
     # Генерация индексов
     indexes = _generate_indexes(sample_cols, req.target_system)
@@ -195,10 +306,12 @@ async def generate_ddl(req: DDLRequest) -> DDLResponse:
     suggestions: list[str] = []
     
     if req.target_system == "postgres":
+        if req.key_columns and not any(c.endswith(f"PRIMARY KEY ({', '.join(req.key_columns)})") for c in constraints):
+            # ON CONFLICT (ключ) требует уникального ограничения ровно на эти колонки
+            constraint_name = _constraint_name("uq", req.table_name, *req.key_columns)
+            constraints.append(f"CONSTRAINT {constraint_name} UNIQUE ({', '.join(req.key_columns)})")
         ddl_parts.append(f"CREATE TABLE IF NOT EXISTS {req.table_name} (")
-        ddl_parts.extend(cols_rendered)
-        if constraints:
-            ddl_parts.append("  " + ",\n  ".join(constraints))
+        ddl_parts.append(",\n".join(cols_rendered + [f"  {c}" for c in constraints]))
         ddl_parts.append(");")
         
         # Добавляем индексы
@@ -212,31 +325,37 @@ async def generate_ddl(req: DDLRequest) -> DDLResponse:
         ])
         
     elif req.target_system == "clickhouse":
-        # Определяем колонку для партицирования
-        partition_col = None
-        for col in sample_cols:
-            name = col.get("name", "").lower()
-            if name in ["ts", "timestamp", "created_at", "date"] or "time" in name:
-                partition_col = col.get("name")
-                break
-        
-        # Определяем колонку для сортировки
-        order_cols = []
-        for col in sample_cols:
-            name = col.get("name", "").lower()
-            if name in ["id", "ts", "timestamp", "created_at"] or "time" in name:
-                order_cols.append(col.get("name"))
-        
+        order_cols, partition_col = clickhouse_sort_and_partition(sample_cols, req.key_columns, req.merge_strategy)
+        key_set = set(order_cols) | {partition_col}
+
+        # колонки с NULL — Nullable(T), иначе вставка молча запишет 0/''; ключи сортировки и партиции — без
+        ch_columns = [
+            f"  {c.get('name', 'col')} "
+            f"{clickhouse_column_type(c.get('dtype', 'string'), c.get('nullable', True), c.get('name') in key_set)}"
+            for c in sample_cols
+        ]
+        engine = "MergeTree()"
+        if req.key_columns and req.merge_strategy in ("replacing", "collapsing"):
+            # версионные вставки: слияние схлопывает строки с одинаковым ORDER BY
+            if req.merge_strategy == "replacing":
+                ch_columns.append(f"  {MERGE_VERSION_COLUMN} UInt64")
+                engine = f"ReplacingMergeTree({MERGE_VERSION_COLUMN})"
+            else:
+                ch_columns.append(f"  {MERGE_SIGN_COLUMN} Int8")
+                engine = f"CollapsingMergeTree({MERGE_SIGN_COLUMN})"
+
         ddl_parts.append(f"CREATE TABLE IF NOT EXISTS {req.table_name} (")
-        ddl_parts.extend(cols_rendered)
+        ddl_parts.append(",\n".join(ch_columns))
         ddl_parts.append(")")
         
-        # Добавляем движок
-        engine = "MergeTree()"
         if partition_col:
             engine += f"\nPARTITION BY toDate({partition_col})"
         if order_cols:
-            engine += f"\nORDER BY ({', '.join(order_cols[:3])})"  # Максимум 3 колонки для сортировки
+            engine += f"\nORDER BY ({', '.join(order_cols)})"
+        else:
+            engine += "\nORDER BY tuple()"  # MergeTree требует ORDER BY
+        # без окна нереплицированная MergeTree игнорирует insert_deduplication_token
+        engine += f"\nSETTINGS non_replicated_deduplication_window = {settings.load_dedup_window}"
         
         ddl_parts.append(f"ENGINE = {engine};")
         
@@ -248,9 +367,7 @@ async def generate_ddl(req: DDLRequest) -> DDLResponse:
         
     elif req.target_system == "mysql":
         ddl_parts.append(f"CREATE TABLE IF NOT EXISTS {req.table_name} (")
-        ddl_parts.extend(cols_rendered)
-        if constraints:
-            ddl_parts.append("  " + ",\n  ".join(constraints))
+        ddl_parts.append(",\n".join(cols_rendered + [f"  {c}" for c in constraints]))
         ddl_parts.append(") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;")
         
         if indexes:
@@ -264,7 +381,7 @@ async def generate_ddl(req: DDLRequest) -> DDLResponse:
         
     else:  # Hive/HDFS
         ddl_parts.append(f"CREATE TABLE {req.table_name} (")
-        ddl_parts.extend(cols_rendered)
+        ddl_parts.append(",\n".join(cols_rendered))
         ddl_parts.append(")")
         ddl_parts.append("STORED AS PARQUET")
         ddl_parts.append("LOCATION '/user/hive/warehouse/your_database.db/your_table';")
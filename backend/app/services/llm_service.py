@@ -8,31 +8,33 @@ from typing import Dict, Any, Optional, List
 from app.core.config import settings
 from loguru import logger
 import asyncio
-from tenacity import retry, stop_after_attempt, wait_exponential
+from ml.recommend.prompt_budget import compact_columns_json
+from ml.recommend.transport import LLMTransport, LLMTransportError, llm_transport
 
 
 class LLMService:
     """Сервис для работы с LLM"""
     
-    def __init__(self):
+    def __init__(self, transport: Optional[LLMTransport] = None):
         self.base_url = settings.llm_base_url
         self.timeout = 30.0
         self.max_retries = 3
+        # общий пул соединений, семафор и лимит частоты (провайдер "backend")
+        self.transport = transport or llm_transport
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     async def _make_request(self, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-        """Выполнение HTTP запроса к LLM сервису"""
+        """Выполнение HTTP запроса к LLM сервису (повторы 429/5xx — в транспорте)"""
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/{endpoint}",
-                    json=payload,
-                    headers={"Content-Type": "application/json"}
-                )
-                response.raise_for_status()
-                return response.json()
-        except httpx.TimeoutException:
-            logger.error(f"LLM request timeout for {endpoint}")
+            return await self.transport.post_json(
+                "backend",
+                f"{self.base_url}/{endpoint}",
+                payload,
+                headers={"Content-Type": "application/json"},
+                timeout=self.timeout,
+                retries=self.max_retries - 1,
+            )
+        except LLMTransportError as e:
+            logger.error(f"LLM request to {endpoint} failed: {e}")
             raise
         except httpx.HTTPStatusError as e:
             logger.error(f"LLM request failed with status {e.response.status_code}")
@@ -41,13 +43,17 @@ class LLMService:
             logger.error(f"LLM request error: {e}")
             raise
     
+    async def health_check(self) -> Dict[str, Any]:
+        """Лёгкая проверка LLM сервиса: GET /health без повторов + состояние автомата"""
+        return await self.transport.probe("backend", f"{self.base_url}/health")
+    
     async def analyze_data_structure(self, data_profile: Dict[str, Any]) -> Dict[str, Any]:
         """Анализ структуры данных с помощью LLM"""
         prompt = f"""
         Проанализируй следующую структуру данных и предоставь рекомендации:
         
         Количество строк: {data_profile.get('rows', 0)}
-        Колонки: {json.dumps(data_profile.get('columns', []), ensure_ascii=False, indent=2)}
+        Колонки: {compact_columns_json(data_profile.get('columns', []))}
         Временной ряд: {data_profile.get('is_time_series', False)}
         
         Пожалуйста, предоставь:
@@ -85,7 +91,7 @@ class LLMService:
         
         Таблица: {table_info.get('table_name', 'unknown')}
         СУБД: {table_info.get('target_system', 'postgres')}
-        Колонки: {json.dumps(table_info.get('columns', []), ensure_ascii=False, indent=2)}
+        Колонки: {compact_columns_json(table_info.get('columns', []))}
         
         Учти:
         1. Производительность запросов
@@ -154,7 +160,8 @@ class LLMService:
             return {
                 "recommendation": "Рекомендация недоступна",
                 "storage_type": "postgres",
-                "rationale": "Fallback решение"
+                "rationale": "Fallback решение",
+                "fallback": True
             }
     
     async def generate_pipeline_code(self, pipeline_info: Dict[str, Any]) -> Dict[str, Any]:
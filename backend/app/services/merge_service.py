@@ -0,0 +1,223 @@
+"""
+Повторяющиеся загрузки со слиянием по ключу (стоимость ~ числу изменившихся строк):
+
+- postgres / upsert — COPY во временную таблицу и INSERT ... ON CONFLICT DO UPDATE
+  одним запросом; неизменённые строки не переписываются;
+- clickhouse / replacing — ReplacingMergeTree(_version): новая версия строки
+  просто дописывается, старая исчезает при слиянии партов;
+- clickhouse / collapsing — CollapsingMergeTree(_sign): для ключей из батча
+  текущее состояние гасится строкой с _sign = -1, новое пишется с _sign = 1.
+  Запись ~ числу изменившихся строк, но чтение — нет: текущее состояние берётся
+  SELECT ... FINAL ... IN (ключи батча), то есть слиянием партов на чтении для
+  каждого батча; на больших таблицах replacing заметно дешевле. Ключ может
+  встретиться в загрузке один раз: повторы внутри батча схлопываются (побеждает
+  последняя строка), повтор в другом батче — ошибка, так как предыдущая вставка
+  ещё может быть не видна FINAL-чтению.
+
+Ключ берётся из запроса либо из кандидатов профиля (ddl_service.key_candidates).
+"""
+import asyncio
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+from loguru import logger
+
+from app.connectors.batch_sources import open_batches
+from app.connectors.clickhouse_loader import ClickHouseLoader
+from app.connectors.database_connector import _ch_table_ref, _quote_ch
+from app.connectors.database_manager import db_manager
+from app.connectors.postgres_loader import PostgresLoader
+from app.schemas.ddl import DDLRequest
+from app.schemas.pipelines import MergeRequest, MergeResponse
+from app.services.ddl_service import (
+    MERGE_SIGN_COLUMN, MERGE_VERSION_COLUMN, generate_ddl, key_candidates, sample_from_arrow_schema
+)
+from app.services.staging_load_service import create_table_statements, normalize_batch, staging_column_name
+from app.services.transfer_service import StageStats, clickhouse_target_schema, convert_batch, run_staged
+
+STRATEGIES = {"postgres": ("upsert",), "clickhouse": ("replacing", "collapsing")}
+
+
+def resolve_strategy(target: str, requested: Optional[str]) -> str:
+    allowed = STRATEGIES.get(target)
+    if not allowed:
+        raise ValueError(f"Слияние в {target} не поддерживается")
+    strategy = requested or allowed[0]
+    if strategy not in allowed:
+        raise ValueError(f"Стратегия {strategy} недоступна для {target}: {list(allowed)}")
+    return strategy
+
+
+def resolve_keys(explicit: Optional[List[str]], profile: Optional[Dict[str, Any]], schema: pa.Schema,
+                 rename: Callable[[str], str] = str) -> List[str]:
+    """
+    Явный ключ, иначе кандидаты из профиля, иначе из Arrow-схемы (id/pk по имени).
+    rename — нормализация имён источника к именам колонок в данных.
+    """
+    keys = [rename(k) for k in explicit or []]
+    if not keys and profile:
+        keys = [rename(k) for k in key_candidates(profile)[:1]]
+    if not keys:
+        keys = key_candidates(sample_from_arrow_schema(schema))[:1]
+    if not keys:
+        raise ValueError("Не удалось определить ключ слияния: передайте key_columns")
+    missing = [k for k in keys if k not in schema.names]
+    if missing:
+        raise ValueError(f"Ключевые колонки отсутствуют в данных: {missing}")
+    return keys
+
+
+class VersionStamper:
+    """Добавляет _version: монотонно растущий номер строки, последняя версия побеждает."""
+
+    def __init__(self, base: Optional[int] = None) -> None:
+        self._next = int(base if base is not None else time.time_ns())
+        self._lock = threading.Lock()
+
+    def __call__(self, batch: pa.RecordBatch) -> pa.RecordBatch:
+        with self._lock:
+            start, self._next = self._next, self._next + batch.num_rows
+        versions = pa.array(np.arange(start, start + batch.num_rows, dtype=np.uint64))
+        return batch.append_column(MERGE_VERSION_COLUMN, versions)
+
+
+class CollapsingStamper:
+    """
+    Для ключей батча читает текущее состояние (FINAL, _sign = 1) и добавляет
+    строки-отмены с _sign = -1 перед новыми строками с _sign = 1.
+    Повторы ключа внутри батча схлопываются до последней строки; ключ, уже
+    встречавшийся в предыдущем батче этой загрузки, — ValueError: стадия
+    работает раньше асинхронной вставки, и FINAL не увидит прошлую строку.
+    """
+
+    def __init__(self, loader: ClickHouseLoader, table: str, keys: List[str]) -> None:
+        self.loader = loader
+        self.table = table
+        self.keys = keys
+        self.cancelled = 0
+        self.collapsed = 0
+        self._seen: set = set()
+
+    def _key_tuples(self, batch: pa.RecordBatch) -> List[tuple]:
+        columns = [batch.column(k).to_pylist() for k in self.keys]
+        return list(zip(*columns))
+
+    def _unique_last(self, batch: pa.RecordBatch) -> Tuple[pa.RecordBatch, List[tuple]]:
+        """Последняя строка для каждого ключа батча; повтор ключа из прошлых батчей — ошибка."""
+        keys = self._key_tuples(batch)
+        last = {key: i for i, key in enumerate(keys)}
+        repeated = [key for key in last if key in self._seen]
+        if repeated:
+            raise ValueError(f"collapsing: ключ {repeated[0]} повторяется в разных батчах одной загрузки; "
+                             f"используйте strategy=replacing или уберите дубли в источнике")
+        self._seen.update(last)
+        if len(last) == len(keys):
+            return batch, keys
+        self.collapsed += len(keys) - len(last)
+        indices = sorted(last.values())
+        return batch.take(pa.array(indices)), [keys[i] for i in indices]
+
+    def _current_state(self, batch: pa.RecordBatch, key_tuples: List[tuple]) -> Optional[pa.Table]:
+        if len(self.keys) == 1:
+            keys = tuple(key[0] for key in key_tuples)
+            key_expr = _quote_ch(self.keys[0])
+        else:
+            keys = tuple(key_tuples)
+            key_expr = f"({', '.join(_quote_ch(k) for k in self.keys)})"
+        columns = ", ".join(_quote_ch(n) for n in batch.schema.names)
+        current = self.loader.query_arrow(
+            f"SELECT {columns} FROM {_ch_table_ref(self.table)} FINAL "
+            f"WHERE {_quote_ch(MERGE_SIGN_COLUMN)} = 1 AND {key_expr} IN %(keys)s",
+            parameters={"keys": keys},
+        )
+        return current if current.num_rows else None
+
+    def __call__(self, batch: pa.RecordBatch) -> pa.RecordBatch:
+        batch, key_tuples = self._unique_last(batch)
+        current = self._current_state(batch, key_tuples)
+        previous = [convert_batch(b, batch.schema) for b in current.to_batches()] if current is not None else []
+        cancelled = sum(b.num_rows for b in previous)
+        self.cancelled += cancelled
+        signs = np.concatenate([np.full(cancelled, -1, dtype=np.int8), np.ones(batch.num_rows, dtype=np.int8)])
+        table = pa.Table.from_batches([*previous, batch]).append_column(MERGE_SIGN_COLUMN, pa.array(signs))
+        return table.combine_chunks().to_batches()[0]
+
+
+def _chain(first: pa.RecordBatch, rest: Iterable[pa.RecordBatch]) -> Iterator[pa.RecordBatch]:
+    yield first
+    yield from rest
+
+
+def merge_postgres(table: str, batches: Iterable[pa.RecordBatch], keys: List[str],
+                   ddl_sql: str) -> Dict[str, Any]:
+    """Таблица по DDL (с UNIQUE на ключ) и upsert потока батчей в рабочую БД."""
+    loader = PostgresLoader(db_manager.staging_engine)
+    loader.execute_ddl(create_table_statements(ddl_sql))
+    return loader.upsert_batches(table, batches, keys)
+
+
+def merge_clickhouse(loader: ClickHouseLoader, table: str, first: pa.RecordBatch,
+                     batches: Iterable[pa.RecordBatch], keys: List[str], strategy: str, load_id: str,
+                     queue_size: int = 4) -> Tuple[Dict[str, Any], Dict[str, StageStats]]:
+    """Конвертация -> простановка версии/знака -> параллельная вставка, стадии в своих потоках."""
+    target_schema = clickhouse_target_schema(first.schema, keys, strategy)
+    stamper = VersionStamper() if strategy == "replacing" else CollapsingStamper(loader, table, keys)
+    stages = [
+        ("convert", lambda batch: convert_batch(batch, target_schema)),
+        (strategy, stamper),
+    ]
+    stats, stage_stats = run_staged(stages, _chain(first, batches),
+                                    lambda stream: loader.insert_batches(table, stream, load_id=load_id),
+                                    queue_size=queue_size)
+    if isinstance(stamper, CollapsingStamper):
+        stats["cancelled"] = stamper.cancelled
+        stats["collapsed"] = stamper.collapsed
+    return stats, stage_stats
+
+
+async def merge(req: MergeRequest) -> MergeResponse:
+    started = time.perf_counter()
+    strategy = resolve_strategy(req.target, req.strategy)
+    batches = open_batches(req.source, batch_rows=req.batch_rows)
+    if req.target == "postgres":
+        batches = (normalize_batch(b) for b in batches)
+    first = await asyncio.to_thread(next, batches, None)
+    if first is None:
+        raise ValueError("Источник не содержит данных")
+
+    keys = resolve_keys(req.key_columns, req.profile, first.schema,
+                        rename=staging_column_name if req.target == "postgres" else str)
+    ddl = await generate_ddl(DDLRequest(target_system=req.target, table_name=req.table_name,
+                                        sample=sample_from_arrow_schema(first.schema),
+                                        key_columns=keys, merge_strategy=strategy))
+
+    stages: Dict[str, Any] = {}
+    if req.target == "postgres":
+        stats = await asyncio.to_thread(merge_postgres, req.table_name, _chain(first, batches), keys, ddl.ddl_sql)
+        changed = stats["changed"]
+    else:
+        loader = ClickHouseLoader(database=req.target_database)
+        await asyncio.to_thread(loader.command, ddl.ddl_sql.strip().rstrip(";"))
+        stats, stage_stats = await asyncio.to_thread(merge_clickhouse, loader, req.table_name, first, batches,
+                                                     keys, strategy, req.load_id or uuid.uuid4().hex,
+                                                     req.queue_size)
+        stages = {name: s.as_dict() for name, s in stage_stats.items()}
+        changed = None
+
+    seconds = time.perf_counter() - started
+    logger.info(f"Merge into {req.table_name} ({strategy}, keys={keys}): {stats}")
+    return MergeResponse(
+        table=req.table_name,
+        strategy=strategy,
+        key_columns=keys,
+        rows=stats["rows"],
+        changed=changed,
+        seconds=round(seconds, 3),
+        stats={k: v for k, v in stats.items() if k not in ("rows", "changed")},
+        stages=stages,
+        ddl_sql=ddl.ddl_sql,
+    )
@@ -11,6 +11,7 @@ from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from loguru import logger
 import json
+from ml.recommend.transport import llm_transport
 
 
 @dataclass
@@ -216,10 +217,29 @@ class MonitoringService:
         self.alerts = [a for a in self.alerts if datetime.fromisoformat(a["timestamp"]) >= cutoff]
         
         logger.info(f"Cleaned up data older than {hours} hours")
+    
+    def record_llm_event(self, provider: str, kind: str, data: Dict[str, Any]):
+        """Наблюдатель транспорта LLM: вызовы, смена состояния автомата, проверки"""
+        if kind == "call":
+            self.record_request(f"llm:{provider}", data["duration"], data["success"])
+        elif kind == "state":
+            self.record_health_check(f"llm_{provider}", data["new"] != "open")
+            if data["new"] == "open":
+                self.add_alert(
+                    level="error",
+                    message=f"LLM {provider}: автомат открыт, запросы уходят на правила",
+                    context=data
+                )
+            else:
+                logger.info(f"LLM {provider}: автомат {data['old']} -> {data['new']}")
+        elif kind == "probe":
+            self.record_metric("llm_probe_latency", data["latency"], {"provider": provider}, "seconds")
 
 
 # Глобальный экземпляр сервиса мониторинга
 monitoring_service = MonitoringService()
+# вызовы LLM и состояние автоматов защиты — в метрики и алерты
+llm_transport.add_observer(monitoring_service.record_llm_event)
 
 
 def monitor_performance(endpoint: str):
@@ -298,9 +318,10 @@ async def periodic_health_checks():
             # Проверка LLM сервиса
             try:
                 from app.services.llm_service import llm_service
-                # Простая проверка доступности
-                llm_healthy = True  # В реальности нужно сделать ping запрос
-                monitoring_service.record_health_check("llm", llm_healthy)
+                probe = await llm_service.health_check()
+                monitoring_service.record_health_check("llm", probe["healthy"])
+                if not probe["healthy"]:
+                    monitoring_service.record_error("llm_service", f"LLM: {probe['error'] or probe['status_code']}")
             except Exception as e:
                 monitoring_service.record_health_check("llm", False)
                 monitoring_service.record_error("llm_service", f"LLM: {e}")
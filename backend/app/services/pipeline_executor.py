@@ -0,0 +1,532 @@
+"""
+Локальный исполнитель JSON-DAG пайплайна из ML-рекомендации
+({"dag": [{"op": "Extract"|"FilterByDate"|"Transform"|"Load", "params": {...}}]}).
+
+Каждая операция — потоковая стадия над Arrow-батчами в своём потоке,
+между стадиями ограниченные очереди. По каждой операции считаются
+строки, батчи, время работы и пропускная способность — пайплайн можно
+запустить и замерить без Airflow.
+
+FilterByDate с mode=incremental читает только строки новее сохранённой
+отметки уровня (watermark_service) минус окно перекрытия overlap; окно
+перекрытия в приёмнике сначала удаляется, поэтому повторная загрузка
+опоздавших строк не создаёт дублей. Отметка сдвигается после успешного Load.
+"""
+import asyncio
+import re
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from loguru import logger
+
+from app.connectors.batch_sources import open_batches
+from app.connectors.clickhouse_loader import ClickHouseLoader
+from app.connectors.database_connector import _pg_table_ref, _quote_pg
+from app.connectors.database_manager import db_manager
+from app.connectors.postgres_loader import PostgresLoader
+from app.schemas.ddl import DDLRequest
+from app.schemas.pipelines import PipelineRunRequest, PipelineRunResponse
+from app.services.ddl_service import clickhouse_partition_column, generate_ddl, sample_from_arrow_schema
+from app.services import watermark_service
+from app.services.merge_service import VersionStamper, merge_postgres, resolve_keys
+from app.services.staging_load_service import create_table_statements, normalize_batch, staging_column_name
+from app.services.transfer_service import StageStats, clickhouse_target_schema, convert_batch, run_staged
+from app.services.transform_service import compile_transform
+
+SUPPORTED_OPS = {"Extract", "FilterByDate", "Transform", "Load"}
+PREVIEW_ROWS = 20
+
+_WINDOW_RE = re.compile(r"^last_(\d+)([mhdw])$")
+_OVERLAP_RE = re.compile(r"^(\d+)([mhdw])$")
+_WINDOW_UNITS = {"m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
+BatchFn = Callable[[pa.RecordBatch], Optional[pa.RecordBatch]]
+
+
+class PipelineValidationError(ValueError):
+    """DAG не может быть выполнен (неизвестная операция, нет источника, ...)."""
+
+
+# ---------- FilterByDate ----------
+
+def _parse_dt(value: Any) -> datetime:
+    parsed = value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def resolve_window(params: Dict[str, Any], now: Optional[datetime] = None) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """
+    Окно фильтра: явные since/until (ISO) либо window вида last_30d / last_12h / last_2w.
+    Возвращает [since, until) в UTC.
+    """
+    now = now or datetime.now(timezone.utc)
+    since = _parse_dt(params["since"]) if params.get("since") else None
+    until = _parse_dt(params["until"]) if params.get("until") else None
+    window = params.get("window")
+    if window and since is None:
+        match = _WINDOW_RE.match(str(window).strip().lower())
+        if not match:
+            raise PipelineValidationError(f"Неизвестное окно FilterByDate: {window}")
+        amount, unit = int(match.group(1)), _WINDOW_UNITS[match.group(2)]
+        since = (until or now) - timedelta(**{unit: amount})
+    return since, until
+
+
+def parse_overlap(value: Any) -> Union[timedelta, int]:
+    """Окно перекрытия: "2h"/"30m"/"1d"/"1w" для времени, целое число — для монотонного id."""
+    if value in (None, "", 0):
+        return 0
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    match = _OVERLAP_RE.match(str(value).strip().lower())
+    if not match:
+        raise PipelineValidationError(f"Неизвестное окно перекрытия FilterByDate: {value}")
+    return timedelta(**{_WINDOW_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def watermark_lower(watermark: Any, overlap: Union[timedelta, int]) -> Any:
+    """Нижняя граница (исключительно) следующей инкрементальной выборки."""
+    if isinstance(watermark, (datetime, date)):
+        if isinstance(overlap, int):
+            raise PipelineValidationError("Для колонки времени overlap задаётся как 30m/2h/1d")
+        return _parse_dt(watermark) - overlap if isinstance(watermark, datetime) else watermark - overlap
+    if isinstance(overlap, timedelta):
+        raise PipelineValidationError("Для колонки id overlap задаётся целым числом")
+    return watermark - overlap
+
+
+def _comparable(column: pa.Array, allow_integer: bool = False) -> pa.Array:
+    """Колонка в виде timestamp/date; строки парсятся как ISO-даты."""
+    if pa.types.is_timestamp(column.type) or pa.types.is_date(column.type):
+        return column
+    if allow_integer and pa.types.is_integer(column.type):
+        return column
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        try:
+            return pc.cast(column, pa.timestamp("us"))
+        except pa.ArrowInvalid:
+            return pc.strptime(column, format="%Y-%m-%d", unit="us", error_is_null=True)
+    raise PipelineValidationError(f"Колонка типа {column.type} не подходит для FilterByDate")
+
+
+def _bound(value: Any, arrow_type: pa.DataType) -> pa.Scalar:
+    if pa.types.is_integer(arrow_type):
+        if not isinstance(value, int):
+            raise PipelineValidationError("Отметка уровня — время, а колонка целочисленная")
+        return pa.scalar(value, type=arrow_type)
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day, tzinfo=timezone.utc)
+    if not isinstance(value, datetime):
+        raise PipelineValidationError("Отметка уровня — число, а колонка содержит даты")
+    if pa.types.is_date(arrow_type):
+        return pa.scalar(value.astimezone(timezone.utc).date(), type=arrow_type)
+    if arrow_type.tz is None:
+        return pa.scalar(value.astimezone(timezone.utc).replace(tzinfo=None), type=arrow_type)
+    return pa.scalar(value, type=arrow_type)
+
+
+@dataclass
+class IncrementalWindow:
+    """Окно (lower, upper) по колонке: его же удаляем в приёмнике перед записью."""
+    column: str
+    lower: Any = None
+    upper: Optional[datetime] = None
+
+
+class DateFilter:
+    """
+    Стадия FilterByDate. mode=window — окно [since, until); mode=incremental —
+    строки с column > watermark - overlap (первый запуск — по window/since)
+    и учёт максимума column среди прошедших строк для новой отметки.
+    """
+
+    def __init__(self, params: Dict[str, Any], now: Optional[datetime] = None,
+                 watermark: Any = None) -> None:
+        self.column = params.get("column")
+        if not self.column:
+            raise PipelineValidationError("FilterByDate: не указан params.column")
+        self.incremental = str(params.get("mode") or "window").lower() == "incremental"
+        self.since, self.until = resolve_window(params, now)
+        self.watermark = watermark
+        self.lower: Any = None
+        if self.incremental:
+            self.lower = watermark_lower(watermark, parse_overlap(params.get("overlap"))) \
+                if watermark is not None else self.since
+            self.since = None
+        self.max_seen: Any = None
+
+    @property
+    def window(self) -> IncrementalWindow:
+        return IncrementalWindow(self.column, self.lower, self.until)
+
+    def __call__(self, batch: pa.RecordBatch) -> pa.RecordBatch:
+        index = batch.schema.get_field_index(self.column)
+        if index < 0:
+            raise PipelineValidationError(f"FilterByDate: колонка {self.column} отсутствует в данных")
+        values = _comparable(batch.column(index), allow_integer=self.incremental)
+        mask = None
+        if self.since is not None:
+            mask = pc.greater_equal(values, _bound(self.since, values.type))
+        if self.lower is not None:
+            mask = pc.greater(values, _bound(self.lower, values.type))
+        if self.until is not None:
+            upper = pc.less(values, _bound(self.until, values.type))
+            mask = upper if mask is None else pc.and_(mask, upper)
+        # строки с NULL в колонке даты в окно не попадают
+        if mask is None:
+            result = batch.filter(pc.is_valid(values)) if self.incremental else batch
+        else:
+            result = batch.filter(mask, null_selection_behavior="drop")
+        if self.incremental and result.num_rows:
+            self._track(_comparable(result.column(index), allow_integer=True))
+        return result
+
+    def _track(self, values: pa.Array) -> None:
+        batch_max = pc.max(values).as_py()
+        if batch_max is None:
+            return
+        if isinstance(batch_max, datetime) and batch_max.tzinfo is None:
+            batch_max = batch_max.replace(tzinfo=timezone.utc)
+        if self.max_seen is None or batch_max > self.max_seen:
+            self.max_seen = batch_max
+
+
+def make_date_filter(params: Dict[str, Any], now: Optional[datetime] = None,
+                     watermark: Any = None) -> DateFilter:
+    return DateFilter(params, now, watermark)
+
+
+def _ch_literal(value: Any) -> str:
+    if isinstance(value, datetime):
+        return f"toDateTime64('{_parse_dt(value).astimezone(timezone.utc):%Y-%m-%d %H:%M:%S.%f}', 6, 'UTC')"
+    if isinstance(value, date):
+        return f"toDate('{value.isoformat()}')"
+    return str(int(value))
+
+
+def push_down_window(source: Dict[str, Any], window: IncrementalWindow) -> Dict[str, Any]:
+    """
+    Добавить границы окна в WHERE табличного источника Postgres/ClickHouse,
+    чтобы из базы читались только новые строки. Файлы и произвольные query
+    фильтруются только стадией FilterByDate.
+    """
+    source_type = (source.get("type") or "").lower()
+    if window.lower is None and window.upper is None:
+        return source
+    if not source.get("table") or source.get("query") or source_type not in ("postgres", "clickhouse"):
+        return source
+
+    predicates: List[str] = []
+    params = dict(source.get("params") or {})
+    if source_type == "postgres":
+        column = _quote_pg(window.column)
+        if window.lower is not None:
+            predicates.append(f"{column} > :wm_lower")
+            params["wm_lower"] = window.lower
+        if window.upper is not None:
+            predicates.append(f"{column} < :wm_upper")
+            params["wm_upper"] = window.upper
+    else:
+        column = f"`{window.column}`"
+        if window.lower is not None:
+            predicates.append(f"{column} > {_ch_literal(window.lower)}")
+        if window.upper is not None:
+            predicates.append(f"{column} < {_ch_literal(window.upper)}")
+
+    if source.get("where"):
+        predicates.insert(0, f"({source['where']})")
+    return {**source, "where": " AND ".join(predicates), "params": params or None}
+
+
+# ---------- Load ----------
+
+def _ddl_sync(loop: asyncio.AbstractEventLoop, target: str, table: str, schema: pa.Schema,
+              key_columns: Optional[List[str]] = None, merge_strategy: Optional[str] = None) -> str:
+    """generate_ddl асинхронный (кэш); из потока стадии вызываем его в цикле событий запроса."""
+    future = asyncio.run_coroutine_threadsafe(
+        generate_ddl(DDLRequest(target_system=target, table_name=table, sample=sample_from_arrow_schema(schema),
+                                key_columns=key_columns, merge_strategy=merge_strategy)),
+        loop,
+    )
+    return future.result().ddl_sql
+
+
+def _peek(stream: Iterable[pa.RecordBatch]) -> Tuple[Optional[pa.RecordBatch], Iterator[pa.RecordBatch]]:
+    iterator = iter(stream)
+    first = next(iterator, None)
+
+    def _rest() -> Iterator[pa.RecordBatch]:
+        if first is not None:
+            yield first
+        yield from iterator
+
+    return first, _rest()
+
+
+def _postgres_delete(table: str, window: IncrementalWindow) -> Tuple[str, Dict[str, Any]]:
+    column = _quote_pg(staging_column_name(window.column))
+    predicates, params = [], {}
+    if window.lower is not None:
+        predicates.append(f"{column} > %(wm_lower)s")
+        params["wm_lower"] = window.lower
+    if window.upper is not None:
+        predicates.append(f"{column} < %(wm_upper)s")
+        params["wm_upper"] = window.upper
+    return f"DELETE FROM {_pg_table_ref(table)} WHERE {' AND '.join(predicates)}", params
+
+
+def _clickhouse_delete(table: str, window: IncrementalWindow) -> str:
+    predicates = []
+    if window.lower is not None:
+        predicates.append(f"`{window.column}` > {_ch_literal(window.lower)}")
+    if window.upper is not None:
+        predicates.append(f"`{window.column}` < {_ch_literal(window.upper)}")
+    return f"ALTER TABLE {table} DELETE WHERE {' AND '.join(predicates)}"
+
+
+def _has_bounds(window: Optional[IncrementalWindow]) -> bool:
+    return window is not None and (window.lower is not None or window.upper is not None)
+
+
+def _load_postgres(table: str, stream: Iterable[pa.RecordBatch], loop: asyncio.AbstractEventLoop,
+                   replace: Optional[IncrementalWindow] = None,
+                   keys: Optional[List[str]] = None) -> Dict[str, Any]:
+    first, batches = _peek(normalize_batch(b) for b in stream)
+    if first is None:
+        return {"rows": 0}
+    if keys is not None:
+        keys = resolve_keys(keys, None, first.schema, rename=staging_column_name)
+        ddl_sql = _ddl_sync(loop, "postgres", table, first.schema, keys, "upsert")
+        return {**merge_postgres(table, batches, keys, ddl_sql), "ddl_sql": ddl_sql}
+    loader = PostgresLoader(db_manager.staging_engine)
+    ddl_sql = _ddl_sync(loop, "postgres", table, first.schema)
+    loader.execute_ddl(create_table_statements(ddl_sql))
+    # DELETE окна и COPY в одной транзакции: перезагрузка перекрытия атомарна
+    delete = _postgres_delete(table, replace) if _has_bounds(replace) else None
+    return {**loader.copy_batches(table, batches, delete=delete), "ddl_sql": ddl_sql}
+
+
+def _load_clickhouse(table: str, stream: Iterable[pa.RecordBatch], loop: asyncio.AbstractEventLoop,
+                     load_id: Optional[str], replace: Optional[IncrementalWindow] = None,
+                     mode: str = "append", keys: Optional[List[str]] = None) -> Dict[str, Any]:
+    first, batches = _peek(stream)
+    if first is None:
+        return {"rows": 0}
+    loader = ClickHouseLoader()
+    if mode == "merge":
+        keys = resolve_keys(keys, None, first.schema)
+    target_schema = clickhouse_target_schema(first.schema, keys, "replacing" if mode == "merge" else None)
+    converted = (convert_batch(b, target_schema) for b in batches)
+    if mode == "merge":
+        # в пайплайне — версионные вставки ReplacingMergeTree: без чтения текущего состояния
+        ddl_sql = _ddl_sync(loop, "clickhouse", table, first.schema, keys, "replacing")
+        loader.command(ddl_sql.strip().rstrip(";"))
+        stamper = VersionStamper()
+        return {**loader.insert_batches(table, (stamper(b) for b in converted), load_id=load_id),
+                "ddl_sql": ddl_sql}
+    ddl_sql = _ddl_sync(loop, "clickhouse", table, first.schema)
+    loader.command(ddl_sql.strip().rstrip(";"))
+    if mode == "replace_partitions":
+        partition_column = clickhouse_partition_column(sample_from_arrow_schema(first.schema)["columns"])
+        if partition_column is None:
+            raise PipelineValidationError("Load replace_partitions: в данных нет колонки времени для PARTITION BY")
+        stats = loader.replace_partitions(table, converted, partition_column, load_id=load_id)
+        return {**stats, "ddl_sql": ddl_sql}
+    if _has_bounds(replace):
+        # не атомарно со вставкой, но отметка сдвигается только после успешной
+        # вставки, и повторный запуск снова удалит и зальёт то же окно
+        loader.command(_clickhouse_delete(table, replace), settings={"mutations_sync": 1})
+    return {**loader.insert_batches(table, converted, load_id=load_id), "ddl_sql": ddl_sql}
+
+
+def _load_memory(stream: Iterable[pa.RecordBatch]) -> Dict[str, Any]:
+    """Отладочный приёмник: считает строки и оставляет первые PREVIEW_ROWS."""
+    rows, preview = 0, []
+    for batch in stream:
+        if len(preview) < PREVIEW_ROWS:
+            preview.extend(batch.slice(0, PREVIEW_ROWS - len(preview)).to_pylist())
+        rows += batch.num_rows
+    return {"rows": rows, "preview": preview}
+
+
+def _load_null(stream: Iterable[pa.RecordBatch]) -> Dict[str, Any]:
+    """Приёмник для бенчмарка: только считает."""
+    return {"rows": sum(batch.num_rows for batch in stream)}
+
+
+def make_sink(params: Dict[str, Any], sink: str, loop: asyncio.AbstractEventLoop,
+              load_id: Optional[str], replace: Optional[IncrementalWindow] = None
+              ) -> Callable[[Iterable[pa.RecordBatch]], Dict[str, Any]]:
+    # рекомендация вида "clickhouse+postgres": основная витрина — первая
+    target = str(params.get("target") or "postgres").split("+")[0].strip().lower()
+    table = params.get("table") or "data"
+    mode = str(params.get("mode") or "append").lower()
+    if mode not in ("append", "replace_partitions", "merge"):
+        raise PipelineValidationError(f"Неизвестный режим Load: {mode}")
+    keys = list(params.get("keys") or []) if mode == "merge" else None
+    if mode == "merge":
+        # слияние по ключу само идемпотентно: окно перекрытия удалять не нужно
+        replace = None
+    if mode == "replace_partitions" and target != "clickhouse":
+        raise PipelineValidationError("Load replace_partitions поддерживается только для ClickHouse")
+    if mode == "replace_partitions" and replace is not None:
+        # подмена целой партиции данными одного окна потеряла бы остальные строки партиции
+        raise PipelineValidationError("Load replace_partitions несовместим с инкрементальным FilterByDate")
+    if sink == "null":
+        return _load_null
+    if sink == "memory":
+        return _load_memory
+    if target == "postgres":
+        return lambda stream: _load_postgres(table, stream, loop, replace, keys)
+    if target == "clickhouse":
+        return lambda stream: _load_clickhouse(table, stream, loop, load_id, replace, mode, keys)
+    raise PipelineValidationError(f"Load в {target} не поддерживается локальным исполнителем")
+
+
+class _MeteredStream:
+    """Итератор для приёмника: считает строки и время ожидания апстрима."""
+
+    def __init__(self, stream: Iterable[pa.RecordBatch]) -> None:
+        self._iterator = iter(stream)
+        self.stats = StageStats("Load")
+        self.wait_seconds = 0.0
+
+    def __iter__(self) -> "_MeteredStream":
+        return self
+
+    def __next__(self) -> pa.RecordBatch:
+        started = time.perf_counter()
+        try:
+            batch = next(self._iterator)
+        finally:
+            self.wait_seconds += time.perf_counter() - started
+        self.stats.rows += batch.num_rows
+        self.stats.bytes += batch.nbytes
+        self.stats.batches += 1
+        return batch
+
+
+# ---------- исполнение ----------
+
+def incremental_step(dag: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Параметры единственного FilterByDate с mode=incremental (или None)."""
+    steps = [step.get("params") or {} for step in dag
+             if step.get("op") == "FilterByDate"
+             and str((step.get("params") or {}).get("mode") or "").lower() == "incremental"]
+    if len(steps) > 1:
+        raise PipelineValidationError("В DAG допускается только один инкрементальный FilterByDate")
+    return steps[0] if steps else None
+
+
+def pipeline_key(pipeline: Dict[str, Any], explicit: Optional[str] = None) -> str:
+    """Ключ отметки уровня: явный, имя пайплайна или target:table шага Load."""
+    if explicit:
+        return explicit
+    if pipeline.get("name"):
+        return str(pipeline["name"])
+    dag = pipeline.get("dag") or []
+    load = (dag[-1].get("params") or {}) if dag else {}
+    return f"{load.get('target') or 'postgres'}:{load.get('table') or 'data'}"
+
+
+def plan(dag: List[Dict[str, Any]], source_override: Optional[Dict[str, Any]] = None,
+         now: Optional[datetime] = None,
+         watermark: Any = None) -> Tuple[Dict[str, Any], List[Tuple[str, BatchFn]], Dict[str, Any]]:
+    """Проверить DAG и разложить на источник, промежуточные стадии и параметры Load."""
+    if not dag:
+        raise PipelineValidationError("Пустой DAG")
+    unknown = [step.get("op") for step in dag if step.get("op") not in SUPPORTED_OPS]
+    if unknown:
+        raise PipelineValidationError(f"Неподдерживаемые операции: {unknown}")
+    if dag[0].get("op") != "Extract" or dag[-1].get("op") != "Load":
+        raise PipelineValidationError("DAG должен начинаться с Extract и заканчиваться Load")
+
+    source = source_override or (dag[0].get("params") or {}).get("source") or {}
+    if not source.get("type"):
+        raise PipelineValidationError("Extract: не задан источник (params.source или source в запросе)")
+
+    stages: List[Tuple[str, BatchFn]] = []
+    for index, step in enumerate(dag[1:-1], start=1):
+        params = step.get("params") or {}
+        if step["op"] == "FilterByDate":
+            stages.append((f"{index}:FilterByDate", make_date_filter(params, now, watermark)))
+        elif step["op"] == "Transform":
+            stages.append((f"{index}:Transform", compile_transform(params)))
+        else:
+            raise PipelineValidationError(f"Операция {step['op']} допустима только в начале/конце DAG")
+    return source, stages, dag[-1].get("params") or {}
+
+
+async def run_pipeline(req: PipelineRunRequest) -> PipelineRunResponse:
+    dag = (req.pipeline or {}).get("dag") or []
+    key = pipeline_key(req.pipeline or {}, req.pipeline_key)
+    incremental = incremental_step(dag)
+    previous = None
+    if incremental and incremental.get("column"):
+        previous = await asyncio.to_thread(watermark_service.get_watermark, key, incremental["column"])
+
+    source, stages, load_params = plan(dag, req.source, watermark=previous)
+    date_filter = next((fn for _, fn in stages if isinstance(fn, DateFilter) and fn.incremental), None)
+    replace = None
+    if date_filter is not None:
+        source = push_down_window(source, date_filter.window)
+        replace = date_filter.window
+    loop = asyncio.get_running_loop()
+    sink_fn = make_sink(load_params, req.sink, loop, req.load_id, replace)
+    started = time.perf_counter()
+    metered: Dict[str, _MeteredStream] = {}
+
+    def _sink(stream: Iterable[pa.RecordBatch]) -> Dict[str, Any]:
+        metered["load"] = _MeteredStream(stream)
+        load_started = time.perf_counter()
+        result = sink_fn(metered["load"])
+        load = metered["load"]
+        load.stats.busy_seconds = max(0.0, time.perf_counter() - load_started - load.wait_seconds)
+        return result
+
+    def _run() -> Tuple[Dict[str, Any], Dict[str, StageStats]]:
+        batches = open_batches(source, batch_rows=req.batch_rows)
+        return run_staged(stages, batches, _sink, queue_size=req.queue_size, source_name="0:Extract")
+
+    load_result, stage_stats = await asyncio.to_thread(_run)
+    seconds = time.perf_counter() - started
+
+    load_stats = metered["load"].stats
+    load_stats.name = f"{len(dag) - 1}:Load"
+    ops = []
+    for name, stats in [*stage_stats.items(), (load_stats.name, load_stats)]:
+        index, op = name.split(":", 1)
+        ops.append({"index": int(index), "op": op, **stats.as_dict()})
+
+    rows_in = stage_stats["0:Extract"].rows
+    logger.info(f"Pipeline run: {rows_in} rows in, {load_stats.rows} rows out in {seconds:.2f}s")
+
+    watermark = None
+    if date_filter is not None:
+        current = previous
+        # прогоны null/memory ничего не записали — отметку не двигаем
+        if req.sink == "target" and date_filter.max_seen is not None:
+            current = await asyncio.to_thread(watermark_service.advance_watermark, key, date_filter.column,
+                                              date_filter.max_seen, load_stats.rows, req.run_id)
+        watermark = {
+            "pipeline_key": key,
+            "column": date_filter.column,
+            "previous": previous,
+            "lower": date_filter.lower,
+            "max_seen": date_filter.max_seen,
+            "current": current,
+        }
+    return PipelineRunResponse(
+        status="completed",
+        rows_in=rows_in,
+        rows_out=load_stats.rows,
+        seconds=round(seconds, 3),
+        ops=ops,
+        preview=load_result.get("preview"),
+        ddl_sql=load_result.get("ddl_sql"),
+        watermark=watermark,
+    )
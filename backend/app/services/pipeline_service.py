@@ -1,13 +1,94 @@
+import json
 import textwrap
+from typing import Any, Dict, List, Optional
+
 from app.schemas.pipelines import PipelineDraftRequest, PipelineDraftResponse
+from app.services.transform_service import compile_transform, transform_steps
+
+# Секреты источника в код DAG не попадают: DSN и пароль воркер берёт из своих настроек
+_SECRET_SOURCE_KEYS = {"dsn", "password"}
+
+# Шаги extract и transform в DAG: те же batch_sources, transform_service и спецификация,
+# что у локального прогона. extract выгружает источник в parquet и кладёт путь в XCom,
+# transform читает его батчами и пишет результат рядом.
+_EXTRACT_TASK = '''
+SOURCE = json.loads({source!r})
+STAGE_DIR = os.getenv('ETL_STAGE_DIR', '/tmp')
+
+
+def run_extract(run_id, **_):
+    import pyarrow.parquet as pq
+    from app.connectors.batch_sources import open_batches
+
+    safe_run_id = ''.join(ch if ch.isalnum() else '_' for ch in run_id)
+    path, writer = os.path.join(STAGE_DIR, f"{dag_id}_{{safe_run_id}}.parquet"), None
+    for batch in open_batches(SOURCE):
+        writer = writer or pq.ParquetWriter(path, batch.schema)
+        writer.write_batch(batch)
+    if writer is not None:
+        writer.close()
+    return path if writer is not None else None
+
+'''
+
+_TRANSFORM_TASK = '''
+TRANSFORM_SPEC = json.loads({spec!r})
 
 
-def _render_airflow_dag(dag_id: str, schedule: str) -> str:
-    code = f"""
-from datetime import datetime
-from airflow import DAG
-from airflow.operators.empty import EmptyOperator
+def run_transform(ti, **_):
+    import pyarrow.parquet as pq
+    from app.services.transform_service import compile_transform
 
+    path = ti.xcom_pull(task_ids='extract')
+    if not path:
+        return None
+    transform = compile_transform(TRANSFORM_SPEC)
+    output, writer = f"{{path}}.transformed.parquet", None
+    for batch in pq.ParquetFile(path).iter_batches():
+        result = transform(batch)
+        if result is None:
+            continue
+        writer = writer or pq.ParquetWriter(output, result.schema)
+        writer.write_batch(result)
+    if writer is not None:
+        writer.close()
+    return output if writer is not None else None
+
+'''
+
+
+def _render_airflow_dag(dag_id: str, schedule: str, transform: Optional[Dict[str, Any]] = None,
+                        source: Optional[Dict[str, Any]] = None) -> str:
+    steps = transform_steps(transform)
+    header = ["import json", "import os"] if steps else []
+    header += [
+        "from datetime import datetime",
+        "from airflow import DAG",
+        "from airflow.operators.empty import EmptyOperator",
+    ]
+    prelude = ""
+    if steps:
+        header.append("from airflow.operators.python import PythonOperator")
+        # transform читает то, что выгрузил extract, — без реального extract он был бы пустым
+        public_source = {k: v for k, v in (source or {}).items() if k not in _SECRET_SOURCE_KEYS}
+        prelude = textwrap.dedent(_EXTRACT_TASK.format(source=json.dumps(public_source, ensure_ascii=False),
+                                                       dag_id=dag_id)) \
+            + textwrap.dedent(_TRANSFORM_TASK.format(spec=json.dumps({"steps": steps}, ensure_ascii=False)))
+    tasks = ["    start = EmptyOperator(task_id='start')"]
+    if steps:
+        tasks += [
+            "    extract = PythonOperator(task_id='extract', python_callable=run_extract)",
+            "    transform = PythonOperator(task_id='transform', python_callable=run_transform)",
+        ]
+    else:
+        tasks.append("    extract = EmptyOperator(task_id='extract')")
+    tasks += [
+        "    load = EmptyOperator(task_id='load')",
+        "    end = EmptyOperator(task_id='end')",
+        "",
+        "    start >> extract >> transform >> load >> end" if steps else "    start >> extract >> load >> end",
+    ]
+    code = "\n".join(header) + "\n" + prelude + f"""
 with DAG(
     dag_id='{dag_id}',
     schedule='{schedule}',
@@ -15,33 +96,26 @@ with DAG(
     catchup=False,
     tags=['etl-ai-assistant']
 ):
-    start = EmptyOperator(task_id='start')
-    extract = EmptyOperator(task_id='extract')
-    load = EmptyOperator(task_id='load')
-    end = EmptyOperator(task_id='end')
+""" + "\n".join(tasks)
+    return code.strip()
+
 
-    start >> extract >> load >> end
-"""
-    return textwrap.dedent(code).strip()
+def _preview_graph(with_transform: bool) -> Dict[str, List[Dict[str, str]]]:
+    chain = [("start", "Start"), ("extract", "Extract")]
+    if with_transform:
+        chain.append(("transform", "Transform"))
+    chain += [("load", "Load"), ("end", "End")]
+    return {
+        "nodes": [{"id": node_id, "label": label} for node_id, label in chain],
+        "edges": [{"from": a, "to": b} for (a, _), (b, _) in zip(chain, chain[1:])],
+    }
 
 
 async def create_pipeline_draft(req: PipelineDraftRequest) -> PipelineDraftResponse:
     dag_id = f"etl_{req.source.get('type', 'src')}_to_{req.destination.get('type', 'dst')}"
     schedule = req.schedule_cron or "0 * * * *"
-    dag_code = _render_airflow_dag(dag_id, schedule)
-    graph = {
-        "nodes": [
-            {"id": "start", "label": "Start"},
-            {"id": "extract", "label": "Extract"},
-            {"id": "load", "label": "Load"},
-            {"id": "end", "label": "End"},
-        ],
-        "edges": [
-            {"from": "start", "to": "extract"},
-            {"from": "extract", "to": "load"},
-            {"from": "load", "to": "end"},
-        ],
-    }
+    # компиляция проверяет спецификацию: ошибка — до публикации DAG, а не в Airflow
+    compile_transform(req.transform)
+    dag_code = _render_airflow_dag(dag_id, schedule, req.transform, req.source)
+    graph = _preview_graph(bool(transform_steps(req.transform)))
     return PipelineDraftResponse(dag_id=dag_id, dag_code=dag_code, schedule_cron=schedule, preview_graph=graph)
-
-
@@ -1,9 +1,16 @@
 from app.schemas.recommend import RecommendationRequest, RecommendationResponse
 from app.services.llm_service import llm_service
-from typing import Dict, Any
+from ml.recommend.deadline import within_budget
+from ml.recommend.similarity import SimilarityIndex, text_tokens
+from loguru import logger
+from typing import Dict, Any, Optional
 import asyncio
 
 
+# ответы LLM для запросов с похожим описанием данных и той же нагрузкой
+storage_index = SimilarityIndex("storage")
+
+
 async def recommend_storage_and_schedule(req: RecommendationRequest) -> RecommendationResponse:
     """Улучшенные рекомендации с интеграцией LLM"""
     
@@ -32,12 +39,17 @@ async def recommend_storage_and_schedule(req: RecommendationRequest) -> Recommen
         if storage == "postgres":
             rationale += " (ускоренное обновление для низкой задержки)"
     
-    # Попытка получить рекомендации от LLM
+    # Попытка получить рекомендации от LLM (в пределах бюджета задержки, если он задан)
+    source = "rules"
+    budget = None if req.latency_budget_ms is None else req.latency_budget_ms / 1000
     try:
-        llm_recommendation = await _get_llm_recommendation(req)
-        if llm_recommendation:
+        llm_recommendation, late = await within_budget(_get_llm_recommendation(req), budget)
+        if late:
+            logger.info(f"LLM не уложилась в {req.latency_budget_ms} мс — ответ по правилам")
+        elif llm_recommendation:
             storage = llm_recommendation.get("storage_type", storage)
             rationale = llm_recommendation.get("rationale", rationale)
+            source = llm_recommendation.get("source", "llm")
     except Exception as e:
         # Если LLM недоступен, используем базовую логику
         pass
@@ -49,12 +61,24 @@ async def recommend_storage_and_schedule(req: RecommendationRequest) -> Recommen
         storage=storage, 
         rationale=rationale, 
         refresh_cron=cron,
-        additional_recommendations=additional_recommendations
+        additional_recommendations=additional_recommendations,
+        source=source
     )
 
 
-async def _get_llm_recommendation(req: RecommendationRequest) -> Dict[str, Any]:
-    """Получение рекомендаций от LLM"""
+def _storage_scope(req: RecommendationRequest) -> str:
+    sla = req.latency_sla_seconds
+    sla_class = None if sla is None else ("low" if sla <= 300 else "high" if sla > 3600 else "mid")
+    return f"{req.workload}|sla={sla_class}|{req.data_volume}|{req.update_frequency}"
+
+
+async def _get_llm_recommendation(req: RecommendationRequest) -> Optional[Dict[str, Any]]:
+    """Получение рекомендаций от LLM (или готовой — для похожего запроса)"""
+    scope, tokens = _storage_scope(req), text_tokens(req.profile_summary)
+    match = storage_index.lookup(scope, tokens)
+    if match is not None:
+        return dict(match.value, similarity=round(match.similarity, 4), source="similar")
+
     workload_info = {
         "workload": req.workload,
         "latency_sla_seconds": req.latency_sla_seconds,
@@ -64,11 +88,16 @@ async def _get_llm_recommendation(req: RecommendationRequest) -> Dict[str, Any]:
     
     try:
         result = await llm_service.recommend_storage_strategy(workload_info)
-        return {
+        if result.get("fallback"):
+            # LLM недоступен — остаются правила, а не заглушка сервиса
+            return None
+        recommendation = {
             "storage_type": result.get("storage_type", "postgres"),
             "rationale": result.get("rationale", "LLM рекомендация"),
             "confidence": result.get("confidence", 0.8)
         }
+        storage_index.add(scope, tokens, recommendation)
+        return recommendation
     except Exception:
         return None
 
@@ -0,0 +1,160 @@
+"""
+Оценка статистик таблицы по выборке (TABLESAMPLE / SAMPLE).
+Экстраполяция числа строк, доли NULL и числа уникальных значений
+с доверительными интервалами.
+"""
+import math
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.schemas.analysis import SamplingOptions
+
+# Если ни fraction, ни target_rows не заданы — берём выборку такого размера
+DEFAULT_TARGET_ROWS = 100_000
+
+SAMPLING_METHODS = {"exact", "system", "bernoulli"}
+
+
+def z_score(confidence: float) -> float:
+    """Двусторонний квантиль нормального распределения для уровня доверия."""
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def resolve_fraction(sampling: SamplingOptions, total_rows_estimate: Optional[float]) -> float:
+    """Доля выборки в (0, 1]. 1.0 означает полный (точный) проход."""
+    if sampling.method == "exact":
+        return 1.0
+    if sampling.fraction is not None:
+        return float(sampling.fraction)
+    target = sampling.target_rows or DEFAULT_TARGET_ROWS
+    if not total_rows_estimate or total_rows_estimate <= target:
+        return 1.0
+    return max(min(target / float(total_rows_estimate), 1.0), 1e-6)
+
+
+def wilson_interval(successes: float, n: float, confidence: float) -> Tuple[float, float]:
+    """Интервал Уилсона для доли successes/n."""
+    if n <= 0:
+        return 0.0, 1.0
+    z = z_score(confidence)
+    p = successes / n
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def estimate_rows(sample_rows: int, fraction: float, confidence: float) -> Tuple[float, Tuple[float, float]]:
+    """Горвиц-Томпсон: N = n / f, Var(n) = N·f·(1-f) для бернуллиевской выборки."""
+    if fraction >= 1.0:
+        return float(sample_rows), (float(sample_rows), float(sample_rows))
+    estimate = sample_rows / fraction
+    half = z_score(confidence) * math.sqrt(max(sample_rows, 1) * (1 - fraction)) / fraction
+    return estimate, (max(float(sample_rows), estimate - half), estimate + half)
+
+
+def estimate_distinct(distinct: int, singletons: int, fraction: float,
+                      non_null_upper: float) -> Tuple[float, Tuple[float, float]]:
+    """
+    GEE-оценка числа уникальных (Charikar et al.): D = sqrt(1/f)·f1 + (d - f1).
+    Нижняя граница — уникальные в выборке, верхняя — каждый синглтон
+    представляет 1/f значений популяции.
+    """
+    if fraction >= 1.0:
+        return float(distinct), (float(distinct), float(distinct))
+    singletons = min(singletons, distinct)
+    estimate = math.sqrt(1 / fraction) * singletons + (distinct - singletons)
+    upper = min(singletons / fraction + (distinct - singletons), max(non_null_upper, distinct))
+    return min(estimate, upper), (float(distinct), upper)
+
+
+def build_estimated_columns(schema_columns: List[Dict[str, Any]], sample: Dict[str, Any],
+                            fraction: float, confidence: float) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Превращает агрегаты по выборке (n, non_null, distinct, singletons на колонку)
+    в описания колонок для ColumnProfile и оценку числа строк.
+    Для неслучайной выборки (random_sample=False, префикс через LIMIT) число строк
+    берётся точным из total_rows, а доли и уникальные — как наблюдаемые на префиксе,
+    без экстраполяции и доверительных интервалов.
+    """
+    n = int(sample.get("rows", 0))
+    exact = fraction >= 1.0
+    if not exact and sample.get("random_sample", True) is False:
+        return _non_random_columns(schema_columns, sample, n), _exact_rows(int(sample["total_rows"]))
+    rows_est, rows_ci = estimate_rows(n, fraction, confidence)
+
+    columns: List[Dict[str, Any]] = []
+    for col in schema_columns:
+        agg = (sample.get("columns") or {}).get(col["name"], {})
+        non_null = int(agg.get("non_null", 0))
+        nulls = n - non_null
+
+        if exact:
+            null_pct = nulls / n * 100 if n else 0.0
+            null_pct_ci = (null_pct, null_pct)
+        else:
+            low, high = wilson_interval(nulls, n, confidence)
+            null_pct = nulls / n * 100 if n else 0.0
+            null_pct_ci = (low * 100, high * 100)
+
+        null_count = null_pct / 100 * rows_est
+        null_count_ci = (null_pct_ci[0] / 100 * rows_ci[0], null_pct_ci[1] / 100 * rows_ci[1])
+
+        non_null_upper = (1 - null_pct_ci[0] / 100) * rows_ci[1]
+        distinct, distinct_ci = estimate_distinct(
+            int(agg.get("distinct", 0)), int(agg.get("singletons", 0)), fraction, non_null_upper
+        )
+
+        columns.append({
+            **col,
+            "null_count": int(round(null_count)),
+            "null_percentage": null_pct,
+            "unique_count": int(round(distinct)),
+            "is_estimated": not exact,
+            "estimate_source": None if exact else "random_sample",
+            "confidence_intervals": {
+                "null_count": [round(null_count_ci[0], 2), round(null_count_ci[1], 2)],
+                "null_percentage": [round(null_pct_ci[0], 4), round(null_pct_ci[1], 4)],
+                "unique_count": [round(distinct_ci[0], 2), round(distinct_ci[1], 2)],
+            },
+        })
+
+    rows = {
+        "rows": int(round(rows_est)),
+        "rows_is_estimated": not exact,
+        "rows_confidence_interval": [round(rows_ci[0], 2), round(rows_ci[1], 2)],
+    }
+    return columns, rows
+
+
+def _exact_rows(total_rows: int) -> Dict[str, Any]:
+    return {
+        "rows": total_rows,
+        "rows_is_estimated": False,
+        "rows_confidence_interval": [float(total_rows), float(total_rows)],
+    }
+
+
+def _non_random_columns(schema_columns: List[Dict[str, Any]], sample: Dict[str, Any],
+                        n: int) -> List[Dict[str, Any]]:
+    """
+    Колонки по неслучайному префиксу: доля NULL переносится на точное число строк
+    как есть, уникальные — нижняя граница (видимые в префиксе). Интервалов нет:
+    модель случайной выборки к префиксу в порядке хранения неприменима.
+    """
+    total_rows = int(sample["total_rows"])
+    columns: List[Dict[str, Any]] = []
+    for col in schema_columns:
+        agg = (sample.get("columns") or {}).get(col["name"], {})
+        nulls = n - int(agg.get("non_null", 0))
+        null_pct = nulls / n * 100 if n else 0.0
+        columns.append({
+            **col,
+            "null_count": int(round(null_pct / 100 * total_rows)),
+            "null_percentage": null_pct,
+            "unique_count": int(agg.get("distinct", 0)),
+            "is_estimated": True,
+            "estimate_source": "non_random_sample",
+            "confidence_intervals": None,
+        })
+    return columns
@@ -0,0 +1,158 @@
+"""
+Загрузка источника в рабочую БД (staging): таблица создаётся по
+сгенерированному DDL, данные идут потоком через COPY, результат
+фиксируется в processing_logs и staging_tables.
+"""
+import asyncio
+import re
+from datetime import datetime, timezone
+from itertools import chain
+from typing import Any, Dict, List, Optional
+
+import pyarrow as pa
+from loguru import logger
+
+from app.connectors.batch_sources import open_batches
+from app.connectors.database_connector import _pg_table_ref
+from app.connectors.database_manager import db_manager
+from app.connectors.postgres_loader import PostgresLoader
+from app.models.staging import ProcessingLog, ProcessingStatus, StagingTable
+from app.schemas.ddl import DDLRequest
+from app.schemas.pipelines import StagingLoadRequest, StagingLoadResponse
+from app.services.ddl_service import generate_ddl, sample_from_arrow_schema
+from ml.sources.csv_rejects import RejectSink
+
+
+def staging_column_name(name: str) -> str:
+    """Имя колонки, одинаково трактуемое DDL без кавычек и COPY: нижний регистр, [a-z0-9_]."""
+    normalized = re.sub(r"[^0-9a-zA-Z_]+", "_", str(name)).strip("_").lower() or "col"
+    return f"c_{normalized}" if normalized[0].isdigit() else normalized
+
+
+def normalize_batch(batch: pa.RecordBatch) -> pa.RecordBatch:
+    names = [staging_column_name(n) for n in batch.schema.names]
+    return batch if names == batch.schema.names else batch.rename_columns(names)
+
+
+def create_table_statements(ddl_sql: str) -> List[str]:
+    """Из сгенерированного DDL берём только CREATE TABLE: индексы — отдельная задача."""
+    statements = [s.strip() for s in ddl_sql.split(";") if s.strip()]
+    return [s for s in statements if s.upper().startswith("CREATE TABLE")]
+
+
+def _qualified(req: StagingLoadRequest) -> str:
+    return f"{req.schema_name}.{req.table_name}" if req.schema_name else req.table_name
+
+
+async def _staging_ddl(req: StagingLoadRequest, schema: pa.Schema) -> str:
+    if req.ddl_sql:
+        return req.ddl_sql
+    if req.profile:
+        sample = {
+            **req.profile,
+            "columns": [{**c, "name": staging_column_name(c.get("name", "col"))}
+                        for c in req.profile.get("columns", [])],
+        }
+    else:
+        sample = sample_from_arrow_schema(schema)
+    ddl = await generate_ddl(DDLRequest(target_system="postgres", table_name=_qualified(req), sample=sample))
+    return ddl.ddl_sql
+
+
+def _record_load(req: StagingLoadRequest, status: str, stats: Dict[str, Any], started_at: datetime,
+                 column_count: int, error: Optional[str] = None) -> Optional[int]:
+    """Записать результат в processing_logs и обновить staging_tables. Ошибки метаданных не роняют загрузку."""
+    try:
+        with db_manager.get_staging_session() as session:
+            log = ProcessingLog(
+                table_name=_qualified(req),
+                operation_type="load",
+                status=status,
+                records_processed=stats.get("rows", 0),
+                records_success=stats.get("rows", 0) if status == ProcessingStatus.COMPLETED.value else 0,
+                records_failed=stats.get("rejected_rows", 0),
+                processing_time_seconds=stats.get("seconds"),
+                started_at=started_at,
+                finished_at=datetime.now(timezone.utc),
+                error_message=error,
+                execution_context={"method": "copy_csv", "mode": req.mode,
+                                   **{k: v for k, v in stats.items() if k != "rejects_sample"}},
+            )
+            session.add(log)
+
+            if status == ProcessingStatus.COMPLETED.value:
+                table = session.query(StagingTable).filter_by(
+                    table_name=req.table_name, schema_name=req.schema_name
+                ).one_or_none()
+                if table is None:
+                    table = StagingTable(table_name=req.table_name, schema_name=req.schema_name,
+                                         source_type=req.source.get("type", "unknown"), source_config=req.source)
+                    session.add(table)
+                appended = (table.row_count or 0) if req.mode == "append" else 0
+                table.row_count = appended + stats.get("rows", 0)
+                table.column_count = column_count
+                table.file_size_bytes = stats.get("bytes")
+                table.is_active = True
+
+            session.commit()
+            return log.id
+    except Exception as e:
+        logger.warning(f"Failed to record staging load of {_qualified(req)}: {e}")
+        return None
+
+
+def _rejects_table(req: StagingLoadRequest) -> str:
+    return f"{_qualified(req)}_rejects"
+
+
+def write_rejects(loader: PostgresLoader, table: str, rejects: RejectSink) -> None:
+    """Битые строки — рядом с загруженной таблицей: номер строки, причина, исходный текст."""
+    loader.execute_ddl([
+        f"CREATE TABLE IF NOT EXISTS {_pg_table_ref(table)} (line_number BIGINT, reason TEXT, raw_text TEXT, "
+        f"rejected_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+    ])
+    loader.copy_batches(table, [rejects.to_batch()])
+
+
+async def load_to_staging(req: StagingLoadRequest) -> StagingLoadResponse:
+    if req.checkpoint_rows:
+        from app.services.checkpoint_service import load_to_staging_checkpointed
+        return await load_to_staging_checkpointed(req)
+
+    started_at = datetime.now(timezone.utc)
+    rejects = RejectSink(req.max_rejects, path=req.rejects_path) if req.max_rejects is not None else None
+    batches = (normalize_batch(b) for b in open_batches(req.source, batch_rows=req.batch_rows, rejects=rejects))
+    first = await asyncio.to_thread(next, batches, None)
+    if first is None:
+        raise ValueError("Источник не содержит данных")
+
+    ddl_sql = await _staging_ddl(req, first.schema)
+    loader = PostgresLoader(db_manager.staging_engine)
+    stats: Dict[str, Any] = {}
+    try:
+        await asyncio.to_thread(loader.execute_ddl, create_table_statements(ddl_sql))
+        stats = await asyncio.to_thread(
+            loader.copy_batches, _qualified(req), chain([first], batches), req.mode == "replace"
+        )
+        if rejects is not None and rejects.count:
+            await asyncio.to_thread(write_rejects, loader, _rejects_table(req), rejects)
+            stats.update(rejects.as_dict())
+    except Exception as e:
+        await asyncio.to_thread(_record_load, req, ProcessingStatus.FAILED.value, stats,
+                                started_at, first.num_columns, str(e))
+        raise
+
+    log_id = await asyncio.to_thread(_record_load, req, ProcessingStatus.COMPLETED.value, stats,
+                                     started_at, first.num_columns)
+    return StagingLoadResponse(
+        table=_qualified(req),
+        rows=stats["rows"],
+        bytes=stats["bytes"],
+        seconds=stats["seconds"],
+        rows_per_second=stats["rows_per_second"],
+        mb_per_second=stats["mb_per_second"],
+        ddl_sql=ddl_sql,
+        processing_log_id=log_id,
+        rejected_rows=rejects.count if rejects is not None else 0,
+        rejects_table=_rejects_table(req) if rejects is not None and rejects.count else None,
+    )
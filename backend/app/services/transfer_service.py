@@ -0,0 +1,273 @@
+"""
+Перенос Postgres -> ClickHouse без pandas: потоковый экстрактор, приведение
+типов по DDL-маппингу и колоночная вставка соединены ограниченными очередями,
+так что чтение, конвертация и вставка идут одновременно.
+"""
+import asyncio
+import queue
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from loguru import logger
+
+from app.connectors.batch_sources import open_batches
+from app.connectors.clickhouse_loader import ClickHouseLoader
+from app.schemas.ddl import DDLRequest
+from app.schemas.pipelines import TransferRequest, TransferResponse
+from app.services.ddl_service import (
+    _infer_sql_type, arrow_dtype_name, clickhouse_partition_column, clickhouse_sort_and_partition, generate_ddl,
+    sample_from_arrow_schema
+)
+
+# Типы ClickHouse из _infer_sql_type -> Arrow-тип, в котором их принимает insert_arrow
+_CH_TO_ARROW: Dict[str, pa.DataType] = {
+    "Int8": pa.int8(),
+    "Int16": pa.int16(),
+    "Int32": pa.int32(),
+    "Int64": pa.int64(),
+    "UInt8": pa.uint8(),
+    "UInt16": pa.uint16(),
+    "UInt32": pa.uint32(),
+    "UInt64": pa.uint64(),
+    "Float32": pa.float32(),
+    "Float64": pa.float64(),
+    "String": pa.string(),
+    "Date": pa.date32(),
+    "DateTime": pa.timestamp("s"),
+}
+
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    """Счётчики одной стадии: сколько строк/байт прошло и сколько времени стадия работала."""
+    name: str
+    rows: int = 0
+    bytes: int = 0
+    batches: int = 0
+    busy_seconds: float = 0.0
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    def add(self, batch: Any, seconds: float) -> None:
+        self.rows += batch.num_rows
+        self.bytes += batch.nbytes
+        self.batches += 1
+        self.busy_seconds += seconds
+
+    def as_dict(self) -> Dict[str, Any]:
+        busy = self.busy_seconds
+        return {
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "batches": self.batches,
+            "busy_seconds": round(busy, 3),
+            "rows_per_second": round(self.rows / busy, 1) if busy > 0 else None,
+            "mb_per_second": round(self.bytes / busy / 1024 / 1024, 2) if busy > 0 else None,
+            **self.extra,
+        }
+
+
+def clickhouse_target_schema(schema: pa.Schema, key_columns: Optional[List[str]] = None,
+                             merge_strategy: Optional[str] = None) -> pa.Schema:
+    """
+    Arrow-схема вставки: тип и nullability каждой колонки — как в сгенерированном
+    DDL ClickHouse (ключи сортировки и партиции не Nullable).
+    """
+    order_cols, partition_col = clickhouse_sort_and_partition(
+        sample_from_arrow_schema(schema)["columns"], key_columns, merge_strategy)
+    keys = set(order_cols) | {partition_col}
+    fields = []
+    for source_field in schema:
+        ch_type = _infer_sql_type(arrow_dtype_name(source_field.type), "clickhouse")
+        target = _CH_TO_ARROW.get(ch_type, pa.string())
+        if pa.types.is_timestamp(target) and pa.types.is_timestamp(source_field.type) and source_field.type.tz:
+            target = pa.timestamp("s", tz=source_field.type.tz)
+        fields.append(pa.field(source_field.name, target,
+                               nullable=source_field.nullable and source_field.name not in keys))
+    return pa.schema(fields)
+
+
+def convert_batch(batch: pa.RecordBatch, target: pa.Schema) -> pa.RecordBatch:
+    """
+    Привести колонки к целевым типам (векторно, без Python-цикла по строкам).
+    Приведение проверяемое: переполнение целых и потеря значений — ошибка,
+    а не тихий перенос; единственное допущенное усечение — метки времени до
+    секунд DateTime. NULL в не-Nullable колонке (ключ сортировки) — ошибка.
+    """
+    arrays = []
+    for column, target_field in zip(batch.columns, target):
+        if not target_field.nullable and column.null_count:
+            raise ValueError(f"Колонка {target_field.name} — ключ таблицы ClickHouse, но содержит NULL "
+                             f"({column.null_count} строк)")
+        if column.type.equals(target_field.type):
+            arrays.append(column)
+        else:
+            truncating = pa.types.is_timestamp(column.type) and pa.types.is_timestamp(target_field.type)
+            arrays.append(pc.cast(column, target_field.type, safe=not truncating))
+    return pa.RecordBatch.from_arrays(arrays, schema=target)
+
+
+def _timed(source: Iterable[Any], stats: StageStats) -> Iterator[Any]:
+    """Учитывает время, которое стадия тратит на получение очередного батча."""
+    iterator = iter(source)
+    while True:
+        started = time.perf_counter()
+        batch = next(iterator, _DONE)
+        if batch is _DONE:
+            return
+        stats.add(batch, time.perf_counter() - started)
+        yield batch
+
+
+def _pump(source: Callable[[], Iterable[Any]], out: "queue.Queue[Any]", stop: threading.Event) -> None:
+    """Поток стадии: складывает результаты в ограниченную очередь, ошибку — тоже в очередь."""
+    def _put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for item in source():
+            if not _put(item):
+                return
+        _put(_DONE)
+    except BaseException as e:
+        _put(e)
+
+
+def _drain(q: "queue.Queue[Any]", stop: Optional[threading.Event] = None) -> Iterator[Any]:
+    while True:
+        try:
+            item = q.get(timeout=0.2)
+        except queue.Empty:
+            if stop is not None and stop.is_set():
+                return
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def _apply(upstream: "queue.Queue[Any]", fn: Callable[[pa.RecordBatch], Optional[pa.RecordBatch]],
+           stats: StageStats, stop: threading.Event) -> Iterator[pa.RecordBatch]:
+    """Стадия «батч -> батч»: учитывается только время fn, без ожидания очереди."""
+    for batch in _drain(upstream, stop):
+        started = time.perf_counter()
+        result = fn(batch)
+        if result is None:
+            stats.busy_seconds += time.perf_counter() - started
+            continue
+        stats.add(result, time.perf_counter() - started)
+        if result.num_rows:
+            yield result
+
+
+def run_staged(stages: List[Tuple[str, Callable[[pa.RecordBatch], Optional[pa.RecordBatch]]]],
+               source: Iterable[pa.RecordBatch], sink: Callable[[Iterable[pa.RecordBatch]], Any],
+               queue_size: int = 4, source_name: str = "extract") -> Tuple[Any, Dict[str, StageStats]]:
+    """
+    source -> stage_1 -> ... -> stage_n -> sink. Каждая стадия в своём потоке,
+    между стадиями очереди на queue_size батчей, поэтому чтение, преобразования
+    и запись перекрываются, а память ограничена. sink выполняется в текущем потоке.
+    """
+    stop = threading.Event()
+    stats: Dict[str, StageStats] = {}
+    threads: List[threading.Thread] = []
+
+    def _start(name: str, produce: Callable[[], Iterable[Any]]) -> "queue.Queue[Any]":
+        q: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, queue_size))
+        thread = threading.Thread(target=_pump, args=(produce, q, stop), name=f"stage-{name}", daemon=True)
+        thread.start()
+        threads.append(thread)
+        return q
+
+    stats[source_name] = StageStats(source_name)
+    upstream = _start(source_name, lambda: _timed(source, stats[source_name]))
+    for name, fn in stages:
+        stats[name] = StageStats(name)
+        upstream = _start(name, lambda q=upstream, fn=fn, st=stats[name]: _apply(q, fn, st, stop))
+
+    try:
+        result = sink(_drain(upstream, stop))
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=5)
+    return result, stats
+
+
+async def _ensure_target_table(loader: ClickHouseLoader, table: str, schema: pa.Schema,
+                               create: bool) -> Optional[str]:
+    if not create:
+        return None
+    ddl = await generate_ddl(DDLRequest(target_system="clickhouse", table_name=table,
+                                        sample=sample_from_arrow_schema(schema)))
+    statement = ddl.ddl_sql.strip().rstrip(";")
+    await asyncio.to_thread(loader.command, statement)
+    return ddl.ddl_sql
+
+
+async def transfer(req: TransferRequest) -> TransferResponse:
+    """Postgres (или любой источник open_batches) -> ClickHouse."""
+    if req.checkpoint_rows:
+        from app.services.checkpoint_service import transfer_checkpointed
+        return await transfer_checkpointed(req)
+
+    started = time.perf_counter()
+    load_id = req.load_id or uuid.uuid4().hex
+    loader = ClickHouseLoader(database=req.target_database, concurrency=req.concurrency,
+                              async_insert=req.async_insert)
+
+    batches = open_batches(req.source, batch_rows=req.batch_rows)
+    first = await asyncio.to_thread(next, batches, None)
+    if first is None:
+        raise ValueError("Источник не содержит данных")
+
+    target_schema = clickhouse_target_schema(first.schema)
+    partition_column = None
+    if req.mode == "replace_partitions":
+        partition_column = clickhouse_partition_column(sample_from_arrow_schema(first.schema)["columns"])
+        if partition_column is None:
+            raise ValueError("replace_partitions: в данных нет колонки времени для PARTITION BY")
+    ddl_sql = await _ensure_target_table(loader, req.target_table, first.schema, req.create_table)
+
+    def _source() -> Iterator[pa.RecordBatch]:
+        yield first
+        yield from batches
+
+    def _sink(stream: Iterable[pa.RecordBatch]) -> Dict[str, Any]:
+        if partition_column:
+            return loader.replace_partitions(req.target_table, stream, partition_column, load_id=load_id)
+        return loader.insert_batches(req.target_table, stream, load_id=load_id)
+
+    def _run() -> Tuple[Dict[str, Any], Dict[str, StageStats]]:
+        return run_staged([("convert", lambda batch: convert_batch(batch, target_schema))], _source(), _sink,
+                          queue_size=req.queue_size)
+
+    insert_stats, stage_stats = await asyncio.to_thread(_run)
+    seconds = time.perf_counter() - started
+    stages = {name: s.as_dict() for name, s in stage_stats.items()}
+    stages["insert"] = {k: v for k, v in insert_stats.items() if k != "load_id"}
+    logger.info(f"Transfer into {req.target_table}: {insert_stats['rows']} rows in {seconds:.2f}s, stages={stages}")
+
+    return TransferResponse(
+        target_table=req.target_table,
+        rows=insert_stats["rows"],
+        seconds=round(seconds, 3),
+        rows_per_second=round(insert_stats["rows"] / seconds, 1) if seconds > 0 else 0.0,
+        stages=stages,
+        ddl_sql=ddl_sql,
+        load_id=load_id,
+    )
@@ -0,0 +1,391 @@
+"""
+Декларативные преобразования над Arrow-батчами.
+
+Спецификация {"steps": [{"op": ..., ...}, ...]} компилируется в цепочку
+функций «батч -> батч» на pyarrow.compute: фильтры, приведения типов,
+переименования, вычисляемые колонки, дедупликация, десятичные запятые и
+даты разбираются векторно, Python-кода на строку нет. Один и тот же движок
+исполняет шаг Transform в локальном прогоне и в сгенерированном DAG Airflow.
+
+Шаги:
+  {"op": "rename", "columns": {"Old Name": "new_name"}}
+  {"op": "select", "columns": ["a", "b"]} / {"op": "drop", "columns": ["c"]}
+  {"op": "cast", "columns": {"qty": "int64", "price": "decimal(18,2)", "day": "date"}}
+  {"op": "decimal_comma", "columns": ["amount"], "to": "float64"}      # "1 234,50" -> 1234.5
+  {"op": "parse_dates", "columns": {"day": "%d.%m.%Y"}, "to": "date"}  # формат или список форматов
+  {"op": "filter", "where": [{"column": "amount", "cmp": ">", "value": 0}]}  # условия через AND
+  {"op": "derive", "name": "total", "fn": "multiply", "args": [{"col": "price"}, {"col": "qty"}]}
+  {"op": "dedupe", "keys": ["id"]}  # первая строка по ключу, в том числе между батчами
+"""
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+BatchFn = Callable[[pa.RecordBatch], Optional[pa.RecordBatch]]
+
+DEFAULT_DATE_FORMATS = ["%Y-%m-%d", "%d.%m.%Y", "%d/%m/%Y", "%Y-%m-%d %H:%M:%S", "%d.%m.%Y %H:%M:%S"]
+
+_TYPES: Dict[str, pa.DataType] = {
+    "bool": pa.bool_(),
+    "int8": pa.int8(),
+    "int16": pa.int16(),
+    "int32": pa.int32(),
+    "int64": pa.int64(),
+    "float32": pa.float32(),
+    "float64": pa.float64(),
+    "string": pa.string(),
+    "date": pa.date32(),
+    "timestamp": pa.timestamp("us"),
+}
+_DECIMAL_RE = re.compile(r"^decimal\((\d+),\s*(\d+)\)$")
+
+_COMPARISONS = {
+    "==": "equal", "!=": "not_equal", ">": "greater", ">=": "greater_equal", "<": "less", "<=": "less_equal",
+}
+
+# функции derive: имя в спецификации -> функция pyarrow.compute
+_DERIVE_FUNCTIONS = {
+    "add": "add", "subtract": "subtract", "multiply": "multiply", "divide": "divide",
+    "abs": "abs", "round": "round", "negate": "negate",
+    "upper": "utf8_upper", "lower": "utf8_lower", "strip": "utf8_trim_whitespace", "length": "utf8_length",
+    "year": "year", "month": "month", "day": "day", "hour": "hour",
+    "coalesce": "coalesce", "if_else": "if_else",
+}
+
+
+class TransformSpecError(ValueError):
+    """Спецификация преобразования некорректна."""
+
+
+def arrow_type(name: str) -> pa.DataType:
+    normalized = str(name).strip().lower()
+    match = _DECIMAL_RE.match(normalized)
+    if match:
+        return pa.decimal128(int(match.group(1)), int(match.group(2)))
+    if normalized not in _TYPES:
+        raise TransformSpecError(f"Неизвестный тип: {name}")
+    return _TYPES[normalized]
+
+
+def _column(batch: pa.RecordBatch, name: str) -> pa.Array:
+    index = batch.schema.get_field_index(name)
+    if index < 0:
+        raise TransformSpecError(f"Колонка {name} отсутствует в данных")
+    return batch.column(index)
+
+
+def _replace(batch: pa.RecordBatch, name: str, values: pa.Array) -> pa.RecordBatch:
+    index = batch.schema.get_field_index(name)
+    return batch.set_column(index, pa.field(name, values.type), values)
+
+
+def _as_mapping(step: Dict[str, Any], key: str = "columns") -> Dict[str, Any]:
+    value = step.get(key)
+    if not isinstance(value, dict) or not value:
+        raise TransformSpecError(f"{step.get('op')}: ожидается непустой словарь {key}")
+    return value
+
+
+def _as_list(step: Dict[str, Any], key: str = "columns") -> List[str]:
+    value = step.get(key)
+    if isinstance(value, str):
+        return [value]
+    if not isinstance(value, list) or not value:
+        raise TransformSpecError(f"{step.get('op')}: ожидается непустой список {key}")
+    return value
+
+
+# ---------- шаги ----------
+
+def _rename(step: Dict[str, Any]) -> BatchFn:
+    mapping = _as_mapping(step)
+    return lambda batch: batch.rename_columns([mapping.get(n, n) for n in batch.schema.names])
+
+
+def _select(step: Dict[str, Any]) -> BatchFn:
+    columns = _as_list(step)
+    return lambda batch: batch.select(columns)
+
+
+def _drop(step: Dict[str, Any]) -> BatchFn:
+    columns = set(_as_list(step))
+    return lambda batch: batch.select([n for n in batch.schema.names if n not in columns])
+
+
+def _cast(step: Dict[str, Any]) -> BatchFn:
+    targets = {name: arrow_type(type_name) for name, type_name in _as_mapping(step).items()}
+    safe = bool(step.get("safe", True))
+
+    def _apply(batch: pa.RecordBatch) -> pa.RecordBatch:
+        for name, target in targets.items():
+            values = _column(batch, name)
+            if not values.type.equals(target):
+                batch = _replace(batch, name, pc.cast(values, target, safe=safe))
+        return batch
+
+    return _apply
+
+
+def normalize_decimal_comma(values: pa.Array, target: pa.DataType = pa.float64()) -> pa.Array:
+    """'1 234,50' / '1.234,50' -> 1234.5: убираем разделители тысяч, запятую -> точку."""
+    if not (pa.types.is_string(values.type) or pa.types.is_large_string(values.type)):
+        return pc.cast(values, target)
+    text = pc.utf8_trim_whitespace(values)
+    # пробелы, неразрывные пробелы и апострофы — разделители тысяч
+    text = pc.replace_substring_regex(text, pattern=r"[\s\x{00A0}\x{202F}']", replacement="")
+    # если есть запятая, точки — тоже разделители тысяч ("1.234,50")
+    text = pc.if_else(pc.match_substring(text, ","), pc.replace_substring(text, pattern=".", replacement=""), text)
+    text = pc.replace_substring(text, pattern=",", replacement=".")
+    text = pc.if_else(pc.equal(text, ""), pa.scalar(None, pa.string()), text)
+    return pc.cast(text, target)
+
+
+def _decimal_comma(step: Dict[str, Any]) -> BatchFn:
+    columns = _as_list(step)
+    target = arrow_type(step.get("to", "float64"))
+
+    def _apply(batch: pa.RecordBatch) -> pa.RecordBatch:
+        for name in columns:
+            batch = _replace(batch, name, normalize_decimal_comma(_column(batch, name), target))
+        return batch
+
+    return _apply
+
+
+def parse_dates(values: pa.Array, formats: List[str], to: str = "timestamp") -> pa.Array:
+    """Строки -> даты: пробуем форматы по очереди, первая удачная интерпретация побеждает."""
+    if pa.types.is_string(values.type) or pa.types.is_large_string(values.type):
+        text = pc.utf8_trim_whitespace(values)
+        parsed = [pc.strptime(text, format=fmt, unit="us", error_is_null=True) for fmt in formats]
+        values = pc.coalesce(*parsed) if len(parsed) > 1 else parsed[0]
+    elif not (pa.types.is_timestamp(values.type) or pa.types.is_date(values.type)):
+        raise TransformSpecError(f"parse_dates: колонка типа {values.type} не содержит дат")
+    return pc.cast(values, arrow_type(to), safe=False)
+
+
+def _parse_dates(step: Dict[str, Any]) -> BatchFn:
+    raw = step.get("columns")
+    if isinstance(raw, (list, str)):
+        raw = {name: None for name in _as_list(step)}
+    columns = {name: ([fmt] if isinstance(fmt, str) else list(fmt or DEFAULT_DATE_FORMATS))
+               for name, fmt in _as_mapping({"op": "parse_dates", "columns": raw}).items()}
+    to = step.get("to", "timestamp")
+    arrow_type(to)
+
+    def _apply(batch: pa.RecordBatch) -> pa.RecordBatch:
+        for name, formats in columns.items():
+            batch = _replace(batch, name, parse_dates(_column(batch, name), formats, to))
+        return batch
+
+    return _apply
+
+
+def _condition(batch: pa.RecordBatch, cond: Dict[str, Any]) -> pa.Array:
+    values = _column(batch, cond.get("column"))
+    cmp = cond.get("cmp", "==")
+    if cmp == "is_null":
+        return pc.is_null(values)
+    if cmp == "not_null":
+        return pc.is_valid(values)
+    if cmp in ("in", "not_in"):
+        mask = pc.is_in(values, value_set=pa.array(cond.get("value") or [], type=values.type))
+        return pc.invert(mask) if cmp == "not_in" else mask
+    if cmp not in _COMPARISONS:
+        raise TransformSpecError(f"filter: неизвестное сравнение {cmp}")
+    value = cond.get("value")
+    if cond.get("value_column"):
+        value = _column(batch, cond["value_column"])
+    else:
+        value = pa.scalar(value).cast(values.type) if value is not None else pa.scalar(None, values.type)
+    return getattr(pc, _COMPARISONS[cmp])(values, value)
+
+
+def _filter(step: Dict[str, Any]) -> BatchFn:
+    conditions = step.get("where")
+    if isinstance(conditions, dict):
+        conditions = [conditions]
+    if not conditions:
+        raise TransformSpecError("filter: пустой список where")
+    for cond in conditions:
+        if cond.get("cmp", "==") not in (*_COMPARISONS, "in", "not_in", "is_null", "not_null"):
+            raise TransformSpecError(f"filter: неизвестное сравнение {cond.get('cmp')}")
+
+    def _apply(batch: pa.RecordBatch) -> pa.RecordBatch:
+        mask = _condition(batch, conditions[0])
+        for cond in conditions[1:]:
+            mask = pc.and_kleene(mask, _condition(batch, cond))
+        return batch.filter(mask, null_selection_behavior="drop")
+
+    return _apply
+
+
+def _argument(batch: pa.RecordBatch, arg: Any) -> Any:
+    if isinstance(arg, dict) and "col" in arg:
+        return _column(batch, arg["col"])
+    return pa.scalar(arg)
+
+
+def _derive(step: Dict[str, Any]) -> BatchFn:
+    name, fn = step.get("name"), step.get("fn")
+    if not name:
+        raise TransformSpecError("derive: не задано имя новой колонки")
+    args = step.get("args") or []
+    if fn == "concat":
+        separator = str(step.get("separator", ""))
+
+        def _compute(batch: pa.RecordBatch) -> pa.Array:
+            parts = [pc.cast(_argument(batch, a), pa.string()) for a in args]
+            return pc.binary_join_element_wise(*parts, separator)
+    elif fn == "cast":
+        target = arrow_type(step.get("to", "string"))
+
+        def _compute(batch: pa.RecordBatch) -> pa.Array:
+            return pc.cast(_argument(batch, args[0]), target)
+    elif fn in _DERIVE_FUNCTIONS:
+        function = _DERIVE_FUNCTIONS[fn]
+
+        def _compute(batch: pa.RecordBatch) -> pa.Array:
+            return pc.call_function(function, [_argument(batch, a) for a in args])
+    else:
+        raise TransformSpecError(f"derive: неизвестная функция {fn}")
+
+    def _apply(batch: pa.RecordBatch) -> pa.RecordBatch:
+        values = _compute(batch)
+        if isinstance(values, pa.Scalar):
+            values = pa.repeat(values, batch.num_rows)
+        if name in batch.schema.names:
+            return _replace(batch, name, values)
+        return batch.append_column(name, values)
+
+    return _apply
+
+
+class _SeenHashes:
+    """
+    Множество 64-битных хешей в отсортированных numpy-прогонах: новый прогон
+    сливается с последним, пока тот не вдвое больше (как уровни LSM), — слияния
+    обходятся в O(n log n) на весь запуск, проверка — searchsorted по прогонам.
+    """
+
+    def __init__(self) -> None:
+        self._runs: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return sum(len(r) for r in self._runs)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        # отсортированные запросы идут по прогону последовательно — без промахов кеша
+        order = np.argsort(hashes)
+        queries = hashes[order]
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self._runs:
+            idx = np.minimum(np.searchsorted(run, queries), len(run) - 1)
+            found[order] |= run[idx] == queries
+        return found
+
+    def add(self, hashes: np.ndarray) -> None:
+        """hashes — новые, попарно различные (уникальные ключи батча, не найденные в множестве)."""
+        run = np.sort(hashes)
+        while self._runs and len(self._runs[-1]) <= 2 * len(run):
+            run = np.sort(np.concatenate([self._runs.pop(), run]))
+        if len(run):
+            self._runs.append(run)
+
+
+class _Deduplicate:
+    """
+    Первая строка на ключ. Внутри батча — group_by по ключу с минимальным
+    номером строки, между батчами — 64-битные хеши встреченных ключей
+    (целый ключ — само значение), проверяются только уникальные ключи батча,
+    без цикла Python по строкам. Память — 8 байт на уникальный ключ; коллизия
+    хешей строковых ключей (вероятность ~n²/2^65) приняла бы новый ключ за встреченный.
+    """
+
+    def __init__(self, step: Dict[str, Any]) -> None:
+        self.keys = _as_list(step, "keys")
+        self._seen = _SeenHashes()
+        self._seen_null = False
+        self._lock = threading.Lock()
+
+    def _key(self, batch: pa.RecordBatch) -> pa.Array:
+        columns = [_column(batch, k) for k in self.keys]
+        if len(columns) == 1:
+            return columns[0]
+        parts = [pc.fill_null(pc.cast(c, pa.string()), "\x00") for c in columns]
+        return pc.binary_join_element_wise(*parts, "\x1f")
+
+    @staticmethod
+    def _hashes(values: pa.Array) -> np.ndarray:
+        """Хеши непустых ключей: целые — без хеширования, остальное — хеш строкового представления."""
+        if pa.types.is_integer(values.type):
+            return pc.cast(values, pa.int64(), safe=False).to_numpy().view(np.uint64)
+        if not (pa.types.is_string(values.type) or pa.types.is_binary(values.type)):
+            values = pc.cast(values, pa.string())
+        # bytes, а не str: строки pandas хеширует как C-строки, до первого \x00
+        return pd.util.hash_array(pc.cast(values, pa.binary()).to_numpy(zero_copy_only=False), categorize=False)
+
+    def __call__(self, batch: pa.RecordBatch) -> pa.RecordBatch:
+        key = self._key(batch)
+        indexed = pa.table({"key": key, "row": pa.array(np.arange(batch.num_rows, dtype=np.int64))})
+        first_rows = indexed.group_by("key", use_threads=False).aggregate([("row", "min")])
+        first_rows = first_rows.combine_chunks()
+        order = pc.sort_indices(first_rows.column("row_min"))
+        keep = first_rows.column("row_min").chunk(0).take(order)
+        candidates = first_rows.column("key").chunk(0).take(order)
+        valid = pc.is_valid(candidates).to_numpy(zero_copy_only=False)
+        hashes = self._hashes(pc.drop_null(candidates))
+        fresh = np.zeros(len(candidates), dtype=bool)
+        with self._lock:
+            fresh[valid] = ~self._seen.contains(hashes)
+            self._seen.add(hashes[fresh[valid]])
+            if not valid.all():
+                fresh[~valid] = not self._seen_null
+                self._seen_null = True
+        return batch.take(keep.filter(pa.array(fresh)))
+
+
+_STEPS: Dict[str, Callable[[Dict[str, Any]], BatchFn]] = {
+    "rename": _rename,
+    "select": _select,
+    "drop": _drop,
+    "cast": _cast,
+    "decimal_comma": _decimal_comma,
+    "parse_dates": _parse_dates,
+    "filter": _filter,
+    "derive": _derive,
+    "dedupe": _Deduplicate,
+}
+
+
+def transform_steps(spec: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Шаги спецификации: {"steps": [...]} или сразу список."""
+    if not spec:
+        return []
+    steps = spec.get("steps") if isinstance(spec, dict) else spec
+    if not isinstance(steps, list):
+        raise TransformSpecError("Спецификация преобразования: ожидается список steps")
+    return steps
+
+
+def compile_transform(spec: Optional[Dict[str, Any]]) -> BatchFn:
+    """Скомпилировать спецификацию в одну функцию «батч -> батч» (ошибки спецификации — сразу)."""
+    functions: List[BatchFn] = []
+    for step in transform_steps(spec):
+        op = step.get("op") if isinstance(step, dict) else None
+        if op not in _STEPS:
+            raise TransformSpecError(f"Неизвестный шаг преобразования: {op}")
+        functions.append(_STEPS[op](step))
+
+    def _run(batch: pa.RecordBatch) -> Optional[pa.RecordBatch]:
+        for fn in functions:
+            batch = fn(batch)
+            if batch is None or batch.num_rows == 0:
+                return None
+        return batch
+
+    return _run
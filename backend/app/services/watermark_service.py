@@ -0,0 +1,75 @@
+"""
+Отметки уровня (high-water mark) инкрементальных пайплайнов: максимальное
+загруженное значение колонки времени или монотонного id хранится в БД
+метаданных рядом с pipeline_runs и сдвигается только после успешной загрузки.
+"""
+from datetime import date, datetime, timezone
+from typing import Any, Optional, Tuple
+
+from loguru import logger
+
+from app.connectors.database_manager import db_manager
+from app.models.metadata import PipelineWatermark
+
+
+def encode_watermark(value: Any) -> Tuple[str, str]:
+    """Значение -> (value_type, строка для хранения)."""
+    if isinstance(value, datetime):
+        aware = value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+        return "timestamp", aware.astimezone(timezone.utc).isoformat()
+    if isinstance(value, date):
+        return "date", value.isoformat()
+    if isinstance(value, int) and not isinstance(value, bool):
+        return "integer", str(value)
+    raise ValueError(f"Тип {type(value).__name__} не подходит для отметки уровня")
+
+
+def decode_watermark(value_type: str, value: str) -> Any:
+    if value_type == "timestamp":
+        return datetime.fromisoformat(value)
+    if value_type == "date":
+        return date.fromisoformat(value)
+    if value_type == "integer":
+        return int(value)
+    raise ValueError(f"Неизвестный тип отметки уровня: {value_type}")
+
+
+def _comparable(value: Any) -> Any:
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def get_watermark(pipeline_key: str, column: str) -> Optional[Any]:
+    """Текущая отметка или None, если пайплайн ещё не загружался."""
+    with db_manager.get_metadata_session() as session:
+        row = session.query(PipelineWatermark).filter_by(
+            pipeline_key=pipeline_key, column_name=column
+        ).one_or_none()
+        return decode_watermark(row.value_type, row.watermark_value) if row else None
+
+
+def advance_watermark(pipeline_key: str, column: str, value: Any, rows_loaded: int,
+                      run_id: Optional[int] = None) -> Any:
+    """
+    Сдвинуть отметку вперёд. Отметка не откатывается назад: если value
+    меньше сохранённой (перезагрузили окно перекрытия), остаётся старая.
+    """
+    value_type, encoded = encode_watermark(value)
+    with db_manager.get_metadata_session() as session:
+        row = session.query(PipelineWatermark).filter_by(
+            pipeline_key=pipeline_key, column_name=column
+        ).with_for_update().one_or_none()
+        if row is None:
+            row = PipelineWatermark(pipeline_key=pipeline_key, column_name=column)
+            session.add(row)
+        elif row.value_type == value_type and \
+                _comparable(decode_watermark(row.value_type, row.watermark_value)) >= _comparable(value):
+            value_type, encoded = row.value_type, row.watermark_value
+        row.value_type = value_type
+        row.watermark_value = encoded
+        row.rows_loaded = rows_loaded
+        row.last_run_id = run_id
+        session.commit()
+    logger.info(f"Watermark {pipeline_key}.{column} -> {encoded} ({rows_loaded} rows)")
+    return decode_watermark(value_type, encoded)
@@ -0,0 +1,274 @@
+"""
+Локальная замена LLM-провайдеров для нагрузочных прогонов без сети.
+
+Маршруты:
+  POST /analyze, /generate_ddl, /recommend_storage, /generate_pipeline — формат LLMService
+       ({"prompt", "max_tokens", "temperature"} -> {"response", "confidence"});
+  POST /foundationModels/v1/completion (и /completion) — формат YandexGPT, в т.ч.
+       completionOptions.stream=true: NDJSON с накопленным текстом по токенам;
+  GET  /health — для проверки доступности;
+  GET/PUT /_config — текущие настройки, изменение на лету;
+  GET  /_stats, POST /_reset — счётчики ответов по маршрутам и кодам.
+
+Поведение провайдера (переменные окружения LLM_STUB_*, или PUT /_config):
+  LATENCY       — задержка ответа: "fixed:0.2", "uniform:0.1,0.8", "normal:0.5,0.1",
+                  "lognormal:-1.0,0.6" (параметры ln), "exp:0.3" (среднее), секунды;
+  TOKEN_DELAY   — пауза между кусками потока, CHUNK_CHARS — символов в куске;
+  RATE_429, RATE_5XX — доля ответов 429 / 503; RETRY_AFTER — заголовок для 429;
+  SEED          — сид генератора: одинаковая последовательность задержек и ошибок.
+Заголовок X-Stub-Status: 429|500|503 принудительно задаёт код одного ответа.
+
+Ответы детерминированы: одинаковый промпт — одинаковый JSON; рекомендация
+проходит схему ml/prompts/recommendation_schema.json (колонки берутся из
+PROFILE в промпте).
+
+Запуск: uvicorn server:app --port 8000 (из каталога llm_stub).
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+
+class StubConfig(BaseModel):
+    latency: str = os.getenv("LLM_STUB_LATENCY", "lognormal:-1.2,0.5")
+    token_delay: float = float(os.getenv("LLM_STUB_TOKEN_DELAY", "0.02"))
+    chunk_chars: int = int(os.getenv("LLM_STUB_CHUNK_CHARS", "12"))
+    rate_429: float = float(os.getenv("LLM_STUB_RATE_429", "0"))
+    rate_5xx: float = float(os.getenv("LLM_STUB_RATE_5XX", "0"))
+    retry_after: Optional[float] = float(os.getenv("LLM_STUB_RETRY_AFTER", "1"))
+    seed: int = int(os.getenv("LLM_STUB_SEED", "42"))
+
+
+class StubConfigUpdate(BaseModel):
+    latency: Optional[str] = None
+    token_delay: Optional[float] = None
+    chunk_chars: Optional[int] = None
+    rate_429: Optional[float] = None
+    rate_5xx: Optional[float] = None
+    retry_after: Optional[float] = None
+    seed: Optional[int] = None
+
+
+app = FastAPI(title="LLM stub", version="0.1.0")
+config = StubConfig()
+rng = random.Random(config.seed)
+stats: Counter = Counter()
+
+
+# ---------- поведение провайдера ----------
+
+def sample_latency(spec: str) -> float:
+    kind, _, args = spec.partition(":")
+    params = [float(x) for x in args.split(",") if x.strip()]
+    if kind == "fixed":
+        value = params[0] if params else 0.0
+    elif kind == "uniform":
+        value = rng.uniform(params[0], params[1])
+    elif kind == "normal":
+        value = rng.gauss(params[0], params[1])
+    elif kind == "lognormal":
+        value = rng.lognormvariate(params[0], params[1])
+    elif kind == "exp":
+        value = rng.expovariate(1 / params[0]) if params[0] > 0 else 0.0
+    else:
+        raise ValueError(f"unknown latency distribution: {spec}")
+    return max(0.0, value)
+
+
+def injected_failure(request: Request) -> Optional[JSONResponse]:
+    forced = request.headers.get("X-Stub-Status")
+    roll = rng.random()
+    status = int(forced) if forced else (
+        429 if roll < config.rate_429 else 503 if roll < config.rate_429 + config.rate_5xx else None
+    )
+    if status is None:
+        return None
+    headers = {"Retry-After": str(config.retry_after)} if status == 429 and config.retry_after is not None else None
+    return JSONResponse({"error": {"code": status, "message": "injected by llm stub"}}, status_code=status,
+                        headers=headers)
+
+
+async def provider_call(request: Request, route: str) -> Optional[JSONResponse]:
+    """Задержка и возможная ошибка; None — отвечать штатно."""
+    await asyncio.sleep(sample_latency(config.latency))
+    failure = injected_failure(request)
+    stats[f"{route}:{failure.status_code if failure else 200}"] += 1
+    return failure
+
+
+def _digest(text: str) -> int:
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+# ---------- детерминированные ответы ----------
+
+def _profile_from_prompt(text: str) -> Dict[str, Any]:
+    match = re.search(r"PROFILE:\s*(\{.*?\})\s*USER_PREFS:\s*(\{.*?\})\s*```", text, re.S)
+    if not match:
+        return {}
+    try:
+        profile = json.loads(match.group(1))
+        profile["_prefs"] = json.loads(match.group(2))
+        return profile
+    except ValueError:
+        return {}
+
+
+def recommendation_json(prompt: str) -> Dict[str, Any]:
+    """Рекомендация по схеме recommendation_schema.json из профиля в промпте."""
+    profile = _profile_from_prompt(prompt)
+    prefs = profile.get("_prefs") or {}
+    columns = [str(c.get("column", c.get("name", ""))) for c in profile.get("schema") or profile.get("columns") or []
+               if isinstance(c, dict)]
+    checks = profile.get("checks") or {}
+    rows = int(checks.get("rows") or profile.get("rows") or 0)
+    date_col = next((c for c in columns if "date" in c.lower() or "time" in c.lower()), None)
+    pk = prefs.get("primary_key") or next((c for c in columns if c.lower() == "id"), None)
+    if prefs.get("mode") == "oltp":
+        store = "postgres"
+    elif rows >= 5_000_000:
+        store = "hdfs"
+    elif rows >= 1_000_000 or checks.get("has_time") or date_col:
+        store = "clickhouse"
+    else:
+        store = "postgres"
+    table = prefs.get("table_name") or "data"
+    dag = [{"op": "Extract", "params": {"source": profile.get("source") or {}}}]
+    if date_col:
+        dag.append({"op": "FilterByDate", "params": {"column": date_col, "window": "last_30d"}})
+    dag.append({"op": "Load", "params": {"target": store, "table": table}})
+    cron = ["0 * * * *", "0 3 * * *", "0 3 * * 1"][_digest(prompt) % 3]
+    return {
+        "target_store": store,
+        "ddl_hints": {
+            "primary_key": pk,
+            "partition_by": date_col,
+            "order_by": [c for c in (pk, date_col) if c] or columns[:1],
+            "table_name": table,
+        },
+        "pipeline": {"dag": dag},
+        "schedule": {"cron": cron, "reason": "детерминированный ответ заглушки"},
+        "risks": [f"ответ заглушки LLM ({len(columns)} колонок)"],
+    }
+
+
+def service_text(route: str, prompt: str) -> str:
+    lower = prompt.lower()
+    if route == "recommend_storage":
+        store = "ClickHouse" if "analytical" in lower or "mixed" in lower else \
+            "HDFS" if "streaming" in lower else "PostgreSQL"
+        return f"Рекомендуется {store}: подходит под указанный тип нагрузки и SLA. Следует настроить мониторинг."
+    if route == "generate_ddl":
+        return ("-- DDL от заглушки LLM\n"
+                "CREATE TABLE IF NOT EXISTS data (id BIGINT PRIMARY KEY, created_at TIMESTAMP);\n"
+                "-- индекс по дате ускорит выборки: оптимизация диапазонных запросов\n"
+                "CREATE INDEX IF NOT EXISTS idx_data_created_at ON data (created_at);")
+    if route == "generate_pipeline":
+        return ("from airflow import DAG\n"
+                "from airflow.operators.python import PythonOperator\n"
+                "schedule_interval = '0 * * * *'\n"
+                "retries = 3")
+    return ("Структура данных согласованная. Рекомендуется добавить первичный ключ, "
+            "следует партиционировать по дате при больших объёмах.")
+
+
+# ---------- маршруты формата LLMService ----------
+
+class ServiceRequest(BaseModel):
+    prompt: str = ""
+    max_tokens: int = 1000
+    temperature: float = 0.3
+
+
+def _service_route(route: str):
+    async def handler(body: ServiceRequest, request: Request):
+        failure = await provider_call(request, route)
+        if failure is not None:
+            return failure
+        return {"response": service_text(route, body.prompt), "confidence": 0.8}
+    handler.__name__ = route
+    return handler
+
+
+for _route in ("analyze", "generate_ddl", "recommend_storage", "generate_pipeline"):
+    app.post(f"/{_route}")(_service_route(_route))
+
+
+# ---------- маршрут формата YandexGPT ----------
+
+def _completion_chunk(text: str, status: str) -> Dict[str, Any]:
+    return {"result": {
+        "alternatives": [{"message": {"role": "assistant", "text": text}, "status": status}],
+        "usage": {"inputTextTokens": "0", "completionTokens": str(max(1, len(text) // 4)),
+                  "totalTokens": str(max(1, len(text) // 4))},
+        "modelVersion": "stub",
+    }}
+
+
+@app.post("/foundationModels/v1/completion")
+@app.post("/completion")
+async def completion(request: Request):
+    body = await request.json()
+    failure = await provider_call(request, "completion")
+    if failure is not None:
+        return failure
+    prompt = "\n".join(m.get("text", "") for m in body.get("messages") or [])
+    text = json.dumps(recommendation_json(prompt), ensure_ascii=False)
+    if not (body.get("completionOptions") or {}).get("stream"):
+        return _completion_chunk(text, "ALTERNATIVE_STATUS_FINAL")
+
+    async def _ndjson():
+        # как у провайдера: каждая строка несёт весь накопленный текст
+        step = max(1, config.chunk_chars)
+        for end in range(step, len(text) + step, step):
+            await asyncio.sleep(config.token_delay)
+            status = "ALTERNATIVE_STATUS_FINAL" if end >= len(text) else "ALTERNATIVE_STATUS_PARTIAL"
+            yield json.dumps(_completion_chunk(text[:end], status), ensure_ascii=False) + "\n"
+
+    return StreamingResponse(_ndjson(), media_type="application/json")
+
+
+# ---------- служебные ----------
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "time": time.time()}
+
+
+@app.get("/_config")
+async def get_config():
+    return config.model_dump()
+
+
+@app.put("/_config")
+async def update_config(update: StubConfigUpdate):
+    global rng
+    for key, value in update.model_dump(exclude_none=True).items():
+        setattr(config, key, value)
+    if update.seed is not None:
+        rng = random.Random(update.seed)
+    sample_latency(config.latency)  # ошибка в описании распределения — сразу 500, а не на вызове
+    return config.model_dump()
+
+
+@app.get("/_stats")
+async def get_stats():
+    return dict(stats)
+
+
+@app.post("/_reset")
+async def reset():
+    global rng
+    stats.clear()
+    rng = random.Random(config.seed)
+    return {"status": "reset"}
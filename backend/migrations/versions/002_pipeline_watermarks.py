@@ -0,0 +1,40 @@
+"""Add pipeline_watermarks table for incremental loads
+
+Revision ID: 002
+Revises: 001
+Create Date: 2025-10-20 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '002'
+down_revision: Union[str, None] = '001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('pipeline_watermarks',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False, comment='Время создания записи'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True, comment='Время последнего обновления записи'),
+        sa.Column('pipeline_key', sa.String(length=255), nullable=False, comment='Ключ пайплайна (имя пайплайна или целевой таблицы)'),
+        sa.Column('column_name', sa.String(length=255), nullable=False, comment='Колонка инкремента (время или монотонный id)'),
+        sa.Column('value_type', sa.String(length=20), nullable=False, comment='Тип значения (timestamp, date, integer)'),
+        sa.Column('watermark_value', sa.String(length=64), nullable=False, comment='Максимальное загруженное значение (ISO-8601 или число)'),
+        sa.Column('last_run_id', sa.Integer(), nullable=True, comment='ID запуска, который сдвинул отметку'),
+        sa.Column('rows_loaded', sa.BigInteger(), nullable=True, comment='Сколько строк загрузил последний запуск'),
+        sa.ForeignKeyConstraint(['last_run_id'], ['pipeline_runs.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('pipeline_key', 'column_name', name='uq_pipeline_watermark')
+    )
+    op.create_index('idx_watermark_pipeline_key', 'pipeline_watermarks', ['pipeline_key'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_watermark_pipeline_key', table_name='pipeline_watermarks')
+    op.drop_table('pipeline_watermarks')
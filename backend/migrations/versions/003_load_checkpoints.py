@@ -0,0 +1,41 @@
+"""Add load_checkpoints table for resumable loads
+
+Revision ID: 003
+Revises: 002
+Create Date: 2025-10-21 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '003'
+down_revision: Union[str, None] = '002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('load_checkpoints',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False, comment='Время создания записи'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True, comment='Время последнего обновления записи'),
+        sa.Column('load_id', sa.String(length=255), nullable=False, comment='ID загрузки (повторный запуск с тем же ID продолжает её)'),
+        sa.Column('unit', sa.String(length=255), nullable=False, comment='Единица загрузки: файл, диапазон ключа или партиция'),
+        sa.Column('target_table', sa.String(length=255), nullable=False, comment='Целевая таблица'),
+        sa.Column('status', sa.String(length=20), nullable=False, comment='Статус единицы (in_progress, completed)'),
+        sa.Column('position', sa.JSON(), nullable=True, comment='Позиция в источнике: смещение в строках или последний загруженный ключ'),
+        sa.Column('rows_loaded', sa.BigInteger(), nullable=True, comment='Строк единицы, зафиксированных в цели'),
+        sa.Column('pipeline_run_id', sa.Integer(), nullable=True, comment='ID запуска пайплайна'),
+        sa.ForeignKeyConstraint(['pipeline_run_id'], ['pipeline_runs.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('load_id', 'unit', name='uq_load_checkpoint')
+    )
+    op.create_index('idx_load_checkpoint_load_id', 'load_checkpoints', ['load_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_load_checkpoint_load_id', table_name='load_checkpoints')
+    op.drop_table('load_checkpoints')
@@ -0,0 +1,35 @@
+import json
+
+from app.services import analysis_service
+
+
+class FakePostgres:
+    def __init__(self, dsn=None):
+        self.dsn = dsn
+
+    async def list_schema_columns(self, schema=None, tables=None, budget=None):
+        assert schema == "sales"
+        return {
+            "sales.orders": [{"name": "id", "dtype": "bigint", "nullable": False},
+                             {"name": "created_at", "dtype": "timestamp", "nullable": False}],
+            "sales.customers": [{"name": "id", "dtype": "bigint", "nullable": False}],
+        }
+
+
+def test_analyze_db_bulk_streams_ndjson(client, monkeypatch):
+    monkeypatch.setattr(analysis_service, "PostgresConnector", FakePostgres)
+
+    payload = {"db_type": "postgres", "schema_name": "sales", "connection": {}, "max_concurrency": 2}
+    r = client.post("/api/v1/analysis/db/bulk", json=payload)
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = [json.loads(line) for line in r.text.splitlines() if line]
+    tables = {item["table"]: item for item in lines if item["type"] == "table"}
+    assert set(tables) == {"sales.orders", "sales.customers"}
+    assert tables["sales.orders"]["status"] == "ok"
+    assert tables["sales.orders"]["profile"]["is_time_series"] is True
+
+    summary = lines[-1]
+    assert summary["type"] == "summary"
+    assert summary["tables"] == 2 and summary["ok"] == 2
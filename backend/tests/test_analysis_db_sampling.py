@@ -0,0 +1,149 @@
+import asyncio
+
+from app.services import analysis_service
+from app.connectors.database_connector import ClickHouseConnector
+from app.connectors.query_budget import QueryBudgetExceeded
+
+
+class FakePostgres:
+    def __init__(self, dsn=None):
+        self.dsn = dsn
+
+    async def sample_table_schema(self, table, budget=None):
+        return {"table": table, "columns": [
+            {"name": "id", "dtype": "bigint", "nullable": False},
+            {"name": "comment", "dtype": "text", "nullable": True},
+        ]}
+
+    async def table_size_estimate(self, table, budget=None):
+        return {"total_rows": 1_000_000.0}
+
+    async def sample_column_stats(self, table, columns, method, fraction, seed=None, budget=None):
+        # 1% выборка: 10 000 строк, id уникален, comment на 20% пустой
+        assert method == "bernoulli"
+        assert abs(fraction - 0.01) < 1e-9
+        return {"rows": 10_000, "columns": {
+            "id": {"non_null": 10_000, "distinct": 10_000, "singletons": 10_000},
+            "comment": {"non_null": 8_000, "distinct": 50, "singletons": 0},
+        }}
+
+
+def test_analyze_db_sampled_extrapolates(client, monkeypatch):
+    monkeypatch.setattr(analysis_service, "PostgresConnector", FakePostgres)
+
+    payload = {
+        "db_type": "postgres",
+        "table": "public.events",
+        "connection": {"dsn": "postgresql+psycopg2://u:p@localhost/db"},
+        "sampling": {"method": "bernoulli", "target_rows": 10_000},
+    }
+    r = client.post("/api/v1/analysis/db", json=payload)
+    assert r.status_code == 200
+    body = r.json()
+
+    assert body["rows"] == 1_000_000
+    assert body["rows_is_estimated"] is True
+    low, high = body["rows_confidence_interval"]
+    assert low < 1_000_000 < high
+    assert body["sampling"]["sample_rows"] == 10_000
+
+    cols = {c["name"]: c for c in body["columns"]}
+    assert cols["id"]["is_estimated"] is True
+    assert cols["id"]["unique_count"] == 100_000  # GEE: sqrt(1/f) * f1
+    assert cols["id"]["confidence_intervals"]["unique_count"][1] >= 999_000
+    assert abs(cols["comment"]["null_percentage"] - 20.0) < 1e-9
+    ci = cols["comment"]["confidence_intervals"]["null_percentage"]
+    assert ci[0] < 20.0 < ci[1]
+    assert cols["comment"]["unique_count"] == 50
+
+
+def test_analyze_db_exact_mode(client, monkeypatch):
+    monkeypatch.setattr(analysis_service, "PostgresConnector", FakePostgres)
+
+    async def exact_stats(self, table, columns, method, fraction, seed=None, budget=None):
+        assert fraction == 1.0
+        return {"rows": 5, "columns": {
+            "id": {"non_null": 5, "distinct": 5, "singletons": 5},
+            "comment": {"non_null": 4, "distinct": 2, "singletons": 1},
+        }}
+
+    monkeypatch.setattr(FakePostgres, "sample_column_stats", exact_stats)
+    payload = {"db_type": "postgres", "table": "t", "connection": {}, "sampling": {"method": "exact"}}
+    body = client.post("/api/v1/analysis/db", json=payload).json()
+
+    assert body["rows"] == 5
+    assert body["rows_is_estimated"] is False
+    cols = {c["name"]: c for c in body["columns"]}
+    assert cols["comment"]["is_estimated"] is False
+    assert cols["comment"]["confidence_intervals"]["null_percentage"] == [20.0, 20.0]
+
+
+def test_analyze_db_returns_schema_when_budget_exceeded(client, monkeypatch):
+    monkeypatch.setattr(analysis_service, "PostgresConnector", FakePostgres)
+
+    async def slow_stats(self, table, columns, method, fraction, seed=None, budget=None):
+        raise QueryBudgetExceeded("statement timeout")
+
+    monkeypatch.setattr(FakePostgres, "sample_column_stats", slow_stats)
+    payload = {"db_type": "postgres", "table": "t", "connection": {},
+               "sampling": {"fraction": 0.1}, "timeout_seconds": 5}
+    r = client.post("/api/v1/analysis/db", json=payload)
+    assert r.status_code == 200
+    body = r.json()
+    assert [c["name"] for c in body["columns"]] == ["id", "comment"]
+    assert "sampling" not in body
+    assert "statement timeout" in body["notes"]
+
+
+class FakeClickHouseClient:
+    def __init__(self):
+        self.queries = []
+
+    def query(self, sql, settings=None, parameters=None):
+        self.queries.append(sql)
+        row = {"n": 100, "nn_0": 100, "d_0": 100, "s_0": 100}
+
+        class _Result:
+            def named_results(self_inner):
+                return [row]
+
+        return _Result()
+
+
+def test_clickhouse_sample_stats_single_query_and_limit_fallback():
+    connector = ClickHouseConnector(host="localhost", database="db")
+    connector._client = FakeClickHouseClient()
+
+    stats = asyncio.run(connector.sample_column_stats("events", ["id"], "bernoulli", 0.01, total_rows=10_000))
+    assert len(connector._client.queries) == 1
+    assert "LIMIT 100" in connector._client.queries[0] and "sumMapIf" in connector._client.queries[0]
+    assert stats["method"] == "limit" and stats["columns"]["id"]["singletons"] == 100
+
+    stats = asyncio.run(connector.sample_column_stats("events", ["id"], "bernoulli", 0.01))
+    assert stats["method"] == "full_scan" and stats["fraction"] == 1.0
+
+
+class FakeClickHouse(ClickHouseConnector):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._client = FakeClickHouseClient()
+
+    async def sample_table_schema(self, table, budget=None):
+        return {"table": table, "columns": [{"name": "id", "dtype": "UInt64", "nullable": False}]}
+
+    async def table_size_estimate(self, table, budget=None):
+        return {"total_rows": 10_000.0, "sampling_key": None}
+
+
+def test_clickhouse_limit_prefix_reports_exact_rows_without_intervals(client, monkeypatch):
+    monkeypatch.setattr(analysis_service, "ClickHouseConnector", FakeClickHouse)
+    payload = {"db_type": "clickhouse", "table": "db.events", "connection": {"database": "db"},
+               "sampling": {"method": "bernoulli", "fraction": 0.01}}
+    body = client.post("/api/v1/analysis/db", json=payload).json()
+
+    # префикс LIMIT 100 — не случайная выборка: ни экстраполяции, ни интервалов
+    assert body["rows"] == 10_000 and body["rows_is_estimated"] is False
+    assert body["sampling"]["method"] == "limit" and body["sampling"]["random_sample"] is False
+    (col,) = body["columns"]
+    assert col["estimate_source"] == "non_random_sample" and "confidence_intervals" not in col
+    assert col["unique_count"] == 100 and col["null_count"] == 0
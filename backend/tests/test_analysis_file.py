@@ -32,3 +32,17 @@ def test_analyze_file_json_ok(client, monkeypatch, SAMPLE_PROFILE):
     assert body["rows"] == 3
     assert isinstance(body["columns"], list)
     assert "data_quality" in body
+
+
+def test_csv_bad_rows_are_counted_in_quality(tmp_path):
+    import asyncio
+    from app.connectors.file_connector import FileConnector
+
+    src = tmp_path / "events.csv"
+    src.write_text("id;kind;value\n1;a;2\n2;b\n3;c;4;5\n4;d;6\n", encoding="utf-8")
+    meta = asyncio.run(FileConnector.analyze_file(str(src), "csv", {}))
+
+    assert meta["rows"] == 2 and meta["rejected_rows"] == 2
+    assert [r["line"] for r in meta["rejects_sample"]] == [3, 4]
+    assert meta["data_quality"]["consistency_score"] < 100
+    assert any("неверным числом полей" in issue for issue in meta["data_quality"]["issues"])
@@ -0,0 +1,160 @@
+import pyarrow as pa
+import pytest
+
+from app.connectors.postgres_extractor import KeyRange
+from app.connectors.postgres_loader import CSVBatchStream
+from app.services import checkpoint_service
+
+
+class FakeStore:
+    saved = {}
+
+    def __init__(self, load_id, target_table, run_id=None):
+        self.load_id = load_id
+        self.target_table = target_table
+
+    def load(self):
+        return {unit: dict(state) for (load_id, unit), state in FakeStore.saved.items() if load_id == self.load_id}
+
+    def save(self, unit, status, position, rows):
+        FakeStore.saved[(self.load_id, unit)] = {"status": status, "position": position, "rows": rows}
+
+
+class FlakyLoader:
+    copied = []
+    offsets = {}  # etl_load_offsets: пишется вместе с COPY
+    fail_on_call = None
+    calls = 0
+
+    def __init__(self, engine=None):
+        pass
+
+    def execute_ddl(self, statements):
+        pass
+
+    def fetch_all(self, sql, params=None):
+        return [(unit, chunk, rows) for (load_id, unit), (chunk, rows) in FlakyLoader.offsets.items()
+                if load_id == params["load_id"]]
+
+    def copy_batches(self, table, batches, truncate=False, delete=None, mark=None):
+        FlakyLoader.calls += 1
+        stream = CSVBatchStream(batches)
+        data = b""
+        while chunk := stream.read(64):
+            data += chunk
+        if FlakyLoader.calls == FlakyLoader.fail_on_call:
+            raise RuntimeError("connection lost")
+        FlakyLoader.copied.extend(line.split(",")[0] for line in data.decode().splitlines())
+        _, params = mark
+        FlakyLoader.offsets[(params["ck_load_id"], params["ck_unit"])] = (
+            params["ck_chunk"], params["ck_rows"] + stream.rows)
+        return {"rows": stream.rows, "bytes": stream.bytes}
+
+
+def test_failed_staging_load_resumes_from_checkpoint(client, monkeypatch, tmp_path):
+    src = tmp_path / "orders.csv"
+    src.write_text("id,amount\n" + "".join(f"{i},{i * 10}\n" for i in range(10)), encoding="utf-8")
+    monkeypatch.setattr(checkpoint_service, "CheckpointStore", FakeStore)
+    monkeypatch.setattr(checkpoint_service, "PostgresLoader", FlakyLoader)
+    monkeypatch.setattr(checkpoint_service, "_record_load", lambda *a, **k: 7)
+    payload = {"source": {"type": "file", "path": str(src)}, "table_name": "orders_stage",
+               "batch_rows": 2, "checkpoint_rows": 4, "load_id": "orders-2025-10-21"}
+
+    # вторая порция падает: первая (строки 0-3) уже зафиксирована
+    FlakyLoader.fail_on_call = 2
+    with pytest.raises(RuntimeError):
+        client.post("/api/v1/pipelines/load/staging", json=payload)
+    assert FakeStore.saved[("orders-2025-10-21", "file")]["position"]["rows"] == 4
+
+    r = client.post("/api/v1/pipelines/load/staging", json=payload)
+    assert r.status_code == 200
+    body = r.json()
+    assert body["rows"] == 6 and body["load_id"] == "orders-2025-10-21"
+    assert body["checkpoint"] == {"units": 1, "skipped_units": 0, "resumed_units": 1, "rows_committed": 10}
+    # каждая строка записана ровно один раз
+    assert FlakyLoader.copied == [str(i) for i in range(10)]
+    assert FakeStore.saved[("orders-2025-10-21", "file")]["status"] == checkpoint_service.COMPLETED
+
+    # завершённая загрузка при повторе ничего не пишет
+    r = client.post("/api/v1/pipelines/load/staging", json=payload)
+    assert r.json()["rows"] == 0 and r.json()["checkpoint"]["skipped_units"] == 1
+
+
+def test_resumed_key_range_clears_uncommitted_tail():
+    unit = checkpoint_service.LoadUnit("range-1", lambda position: iter(()), key_column="Order ID",
+                                       key_range=KeyRange(100, 200))
+    position = {"rows": 40, "chunk": 2, "key": checkpoint_service.encode_key(139)}
+
+    sql, params = checkpoint_service._remainder_delete("orders", unit.remainder(position))
+    # граничный ключ удаляется и перечитывается: ключ может повторяться
+    assert sql == ('DELETE FROM "orders" WHERE "order_id" IS NOT NULL AND "order_id" >= %(ck_after)s '
+                   'AND "order_id" < %(ck_upper)s')
+    assert params == {"ck_after": 139, "ck_upper": 200}
+
+    # единица начата, но ни одной порции не зафиксировано — чистится весь диапазон
+    _, params = checkpoint_service._remainder_delete("orders", unit.remainder(None))
+    assert params == {"ck_lower": 100, "ck_upper": 200}
+
+
+def test_clickhouse_resume_deletes_tail_before_insert(monkeypatch):
+    calls = []
+
+    class FakeLoader:
+        def __init__(self, **kwargs):
+            pass
+
+        def command(self, sql, settings=None, parameters=None):
+            calls.append(("command", sql, settings, parameters))
+
+        def insert_batches(self, table, batches, load_id=None):
+            calls.append(("insert", [b.num_rows for b in batches], load_id))
+            return {"rows": 2}
+
+    monkeypatch.setattr(checkpoint_service, "ClickHouseLoader", FakeLoader)
+    schema = pa.schema([("order_id", pa.int64())])
+    write = checkpoint_service.clickhouse_writer("dwh.orders", schema, "load-1")
+    remainder = checkpoint_service.Remainder("order_id", after=139, upper=200)
+
+    write([pa.record_batch({"order_id": [139, 140]})], checkpoint_service.ChunkRef("range-1", 2), remainder)
+    write([pa.record_batch({"order_id": [141, 142]})], checkpoint_service.ChunkRef("range-1", 3), None)
+
+    (_, sql, settings, params), (_, rows, token), (_, _, next_token) = calls
+    assert sql == ("ALTER TABLE `dwh`.`orders` DELETE WHERE `order_id` IS NOT NULL "
+                   "AND `order_id` >= %(ck_after)s AND `order_id` < %(ck_upper)s")
+    assert settings == {"mutations_sync": 2} and params == {"ck_after": 139, "ck_upper": 200}
+    # после удаления хвоста — свежий токен, следующие порции — детерминированные
+    assert rows == [2] and token.startswith("load-1-range-1-2-") and next_token == "load-1-range-1-3"
+
+    conditions, params = checkpoint_service._clickhouse_range_conditions("order_id", "Int64", KeyRange(100, 200),
+                                                                        last=139)
+    assert conditions == ["`order_id` IS NOT NULL", "`order_id` >= {ck_last:Int64}", "`order_id` < {ck_upper:Int64}"]
+    assert params == {"ck_last": 139, "ck_upper": 200}
+
+
+def test_file_chunk_committed_before_checkpoint_save_is_not_copied_again(client, monkeypatch, tmp_path):
+    src = tmp_path / "orders.csv"
+    src.write_text("id,amount\n" + "".join(f"{i},{i * 10}\n" for i in range(10)), encoding="utf-8")
+    FlakyLoader.copied, FlakyLoader.fail_on_call, FlakyLoader.calls = [], None, 0
+
+    class CrashAfterCommitStore(FakeStore):
+        def save(self, unit, status, position, rows):
+            if (position or {}).get("chunk") == 2:
+                raise RuntimeError("metadata db unavailable")
+            super().save(unit, status, position, rows)
+
+    monkeypatch.setattr(checkpoint_service, "CheckpointStore", CrashAfterCommitStore)
+    monkeypatch.setattr(checkpoint_service, "PostgresLoader", FlakyLoader)
+    monkeypatch.setattr(checkpoint_service, "_record_load", lambda *a, **k: 7)
+    payload = {"source": {"type": "file", "path": str(src)}, "table_name": "orders_stage",
+               "batch_rows": 2, "checkpoint_rows": 4, "load_id": "orders-offsets"}
+
+    # вторая порция (строки 4-7) зафиксирована в staging, но не в load_checkpoints
+    with pytest.raises(RuntimeError):
+        client.post("/api/v1/pipelines/load/staging", json=payload)
+    assert FakeStore.saved[("orders-offsets", "file")]["position"]["rows"] == 4
+
+    monkeypatch.setattr(checkpoint_service, "CheckpointStore", FakeStore)
+    r = client.post("/api/v1/pipelines/load/staging", json=payload)
+    assert r.status_code == 200 and r.json()["rows"] == 2
+    assert FlakyLoader.copied == [str(i) for i in range(10)]
+    assert FlakyLoader.offsets[("orders-offsets", "file")] == (3, 10)
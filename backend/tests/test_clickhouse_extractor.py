@@ -0,0 +1,26 @@
+import pyarrow as pa
+
+from app.connectors.clickhouse_extractor import ClickHouseExtractor
+
+
+def test_build_query_with_partition_and_predicate():
+    sql = ClickHouseExtractor.build_query("etl.events", columns=["id", "ts"], where="ts >= {since:Date}",
+                                          partition_id="202401")
+    assert sql == ("SELECT `id`, `ts` FROM `etl`.`events` "
+                   "WHERE _partition_id = {etl_partition_id:String} AND (ts >= {since:Date})")
+
+
+def test_parallel_extract_reads_all_partitions(monkeypatch):
+    extractor = ClickHouseExtractor(parallelism=2)
+    partitions = [{"partition_id": p, "rows": 4} for p in ("202401", "202402", "202403")]
+    monkeypatch.setattr(ClickHouseExtractor, "list_partitions", lambda self, table: partitions)
+
+    def fake_batches(self, table=None, columns=None, where=None, parameters=None, partition_id=None, **kwargs):
+        assert columns == ["id"] and where == "id > 0"
+        for _ in range(2):
+            yield pa.record_batch({"partition": pa.array([partition_id] * 2)})
+
+    monkeypatch.setattr(ClickHouseExtractor, "iter_batches", fake_batches)
+    batches = list(extractor.iter_batches_parallel("events", columns=["id"], where="id > 0", ordered=True))
+    values = [v for b in batches for v in b.column(0).to_pylist()]
+    assert values == ["202401"] * 4 + ["202402"] * 4 + ["202403"] * 4
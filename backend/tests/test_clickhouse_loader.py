@@ -0,0 +1,95 @@
+import threading
+
+import numpy as np
+import pyarrow as pa
+from clickhouse_connect.driver.exceptions import OperationalError
+
+from app.connectors.clickhouse_loader import ClickHouseLoader
+
+
+class RecordingClient:
+    def __init__(self):
+        self.inserts = []
+        self.failed_tokens = set()
+        self.commands = []
+        self.lock = threading.Lock()
+
+    def query(self, sql, parameters=None):
+        class Result:
+            result_rows = [("MergeTree", "MergeTree ORDER BY id SETTINGS index_granularity = 8192")]
+        return Result()
+
+    def command(self, sql, settings=None):
+        self.commands.append(sql)
+
+    def insert_arrow(self, table, arrow_table, database=None, settings=None):
+        token = settings["insert_deduplication_token"]
+        with self.lock:
+            if token.startswith("load1-0-") and token not in self.failed_tokens:
+                self.failed_tokens.add(token)  # первый блок падает один раз по сети
+                raise OperationalError("connection reset")
+            self.inserts.append((database, table, arrow_table.num_rows, token, settings))
+
+    def close(self):
+        pass
+
+
+def test_insert_batches_sizes_blocks_and_retries_with_same_token(monkeypatch):
+    client = RecordingClient()
+    loader = ClickHouseLoader(database="etl_target", max_block_bytes=8 * 1000, concurrency=2,
+                              async_insert=True)
+    monkeypatch.setattr(ClickHouseLoader, "_client", lambda self: client)
+
+    # 10 батчей по 500 int64 = по 4000 байт -> блоки по 2 батча
+    batches = [{"id": np.arange(i * 500, (i + 1) * 500, dtype=np.int64)} for i in range(10)]
+    stats = loader.insert_batches("events", batches, load_id="load1")
+
+    assert stats["rows"] == 5000
+    assert stats["inserts"] == 5
+    assert stats["retries"] == 1
+    tokens = sorted(t for _, _, _, t, _ in client.inserts)
+    assert [t.rsplit("-", 1)[0] for t in tokens] == [f"load1-{i}" for i in range(5)]
+    assert all(db == "etl_target" and rows == 1000 for db, _, rows, _, _ in client.inserts)
+    assert all(s["async_insert"] == 1 and s["async_insert_deduplicate"] == 1 for *_, s in client.inserts)
+    # MergeTree без окна дедупликации игнорирует токены — окно включается перед вставкой
+    assert client.commands == ["ALTER TABLE `etl_target`.`events` MODIFY SETTING non_replicated_deduplication_window = 1000"]
+    assert stats["deduplication"] is True
+
+    # повторный запуск: те же блоки — те же токены; другие строки под тем же номером — другой токен
+    client.inserts.clear()
+    loader.insert_batches("events", batches, load_id="load1")
+    assert sorted(t for _, _, _, t, _ in client.inserts) == tokens
+    client.inserts.clear()
+    loader.insert_batches("events", [{"id": b["id"] + 1} for b in batches], load_id="load1")
+    assert not set(t for _, _, _, t, _ in client.inserts) & set(tokens)
+
+
+def test_replace_partitions_loads_one_partition_per_block_and_swaps(monkeypatch):
+    import datetime as dt
+
+    client = RecordingClient()
+    client.insert_arrow = lambda table, arrow_table, database=None, settings=None: client.inserts.append(
+        (table, sorted({v.date() for v in arrow_table.column("ts").to_pylist()})))
+
+    class Parts:
+        result_rows = [("20250102",), ("20250101",)]
+
+    client.query = lambda sql, parameters=None: Parts()
+    commands = []
+    loader = ClickHouseLoader(database="etl_target", concurrency=2)
+    monkeypatch.setattr(ClickHouseLoader, "_client", lambda self: client)
+    monkeypatch.setattr(ClickHouseLoader, "command", lambda self, sql, settings=None: commands.append(sql))
+
+    day1, day2 = dt.datetime(2025, 1, 1, 10), dt.datetime(2025, 1, 2, 10)
+    batches = [pa.table({"ts": [day2, day1, day2], "v": [1, 2, 3]}), pa.table({"ts": [day1], "v": [4]})]
+    stats = loader.replace_partitions("events", batches, "ts", load_id="run-7")
+
+    assert stats["rows"] == 4 and stats["partitions"] == ["20250101", "20250102"]
+    assert all(len(days) == 1 for _, days in client.inserts)
+    assert {table for table, _ in client.inserts} == {"events__load_run_7"}
+    assert commands[1] == "CREATE TABLE `etl_target`.`events__load_run_7` AS `etl_target`.`events`"
+    assert sorted(c for c in commands if "REPLACE PARTITION" in c) == [
+        f"ALTER TABLE `etl_target`.`events` REPLACE PARTITION ID '{pid}' FROM `etl_target`.`events__load_run_7`"
+        for pid in ("20250101", "20250102")
+    ]
+    assert commands[-1] == "DROP TABLE IF EXISTS `etl_target`.`events__load_run_7`"
@@ -0,0 +1,58 @@
+from app.services.cache_service import cache_service
+from ml.recommend import orchestrator
+from ml.recommend.fingerprint import recommendation_fingerprint
+
+
+PROFILE = {
+    "rows": 1520,
+    "schema": [
+        {"column": "id", "dtype": "int64", "nulls": 0, "uniques": 1520},
+        {"column": "ts", "dtype": "datetime64[ns]", "nulls": 0, "uniques": 1500},
+    ],
+    "checks": {"rows": 1520, "has_time": True},
+    "preview": [{"id": 1, "ts": "2024-01-01"}],
+}
+
+LLM_ANSWER = {
+    "target_store": "clickhouse",
+    "ddl_hints": {"table_name": "events", "order_by": ["ts"]},
+    "pipeline": {"dag": {"nodes": [], "edges": []}},
+    "schedule": {"cron": "0 * * * *"},
+    "risks": [],
+}
+
+
+def test_fingerprint_ignores_row_count_and_preview_but_not_schema():
+    key = dict(model="gpt://f/yandexgpt/latest", temperature=0.2)
+    base = recommendation_fingerprint(PROFILE, {}, **key)
+
+    next_day = {**PROFILE, "rows": 1710, "checks": {"rows": 1710, "has_time": True},
+                "schema": [dict(c, uniques=1710 if c["column"] == "id" else 1690) for c in PROFILE["schema"]],
+                "preview": [{"id": 7, "ts": "2024-01-02"}]}
+    assert recommendation_fingerprint(next_day, {}, **key) == base
+
+    retyped = {**PROFILE, "schema": [dict(PROFILE["schema"][0], dtype="object"), PROFILE["schema"][1]]}
+    assert recommendation_fingerprint(retyped, {}, **key) != base
+    assert recommendation_fingerprint(PROFILE, {}, model=key["model"], temperature=0.7) != base
+
+
+def test_recommend_reuses_cached_llm_answer(client, monkeypatch):
+    cache_service._memory_cache.clear()
+    orchestrator.recommendation_index.clear()
+    calls = []
+
+    async def fake_llm(system, user, json_schema=None, **kwargs):
+        calls.append(kwargs.get("temperature"))
+        return dict(LLM_ANSWER)
+
+    monkeypatch.setattr(orchestrator, "ayandex_llm_json", fake_llm)
+
+    first = client.post("/api/ml/recommend", json={"profile": PROFILE})
+    orchestrator.recommendation_index.clear()  # проверяем точный кэш, а не индекс похожих
+    second = client.post("/api/ml/recommend", json={"profile": {**PROFILE, "preview": []}})
+
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert first.json()["target_store"] == "clickhouse"
+    assert calls == [orchestrator.LLM_TEMPERATURE]
+    cache_service._memory_cache.clear()
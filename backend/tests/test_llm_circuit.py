@@ -0,0 +1,91 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services.monitoring_service import MonitoringService
+from ml.recommend.circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from ml.recommend.transport import CircuitOpenError, LLMTransport, LLMTransportError
+
+
+def test_open_circuit_rejects_without_calling_provider_and_feeds_monitoring():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(503, text="overloaded")
+
+    transport = LLMTransport(retries=0, http_transport=httpx.MockTransport(handler))
+    breaker = transport.breaker("stub")
+    breaker.min_calls, breaker.open_seconds = 2, 60
+    monitoring = MonitoringService()
+    transport.add_observer(monitoring.record_llm_event)
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(LLMTransportError):
+                await transport.post_json("stub", "http://llm/analyze", {})
+        with pytest.raises(CircuitOpenError):
+            await transport.post_json("stub", "http://llm/analyze", {})
+        await transport.aclose()
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+    assert breaker.state == OPEN and not transport.available("stub")
+    assert monitoring.health_checks["llm_stub"] is False
+    assert monitoring.performance_metrics["llm:stub"].error_count == 2
+    assert any("автомат открыт" in a["message"] for a in monitoring.alerts)
+
+
+def test_half_open_trial_closes_or_reopens_circuit():
+    now = [0.0]
+    breaker = CircuitBreaker("p", min_calls=2, failure_rate=0.5, slow_call_seconds=5,
+                             open_seconds=10, clock=lambda: now[0])
+    breaker.record(False, 0.1)
+    breaker.record(True, 9.0)  # медленный успех тоже считается, но порог по ошибкам уже достигнут
+    assert breaker.state == OPEN and not breaker.allow()
+
+    now[0] = 11
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() and not breaker.allow()  # только один пробный вызов
+    breaker.record(False, 0.1)
+    assert breaker.state == OPEN
+
+    now[0] = 22
+    assert breaker.allow()
+    breaker.record(True, 0.2)
+    assert breaker.state == CLOSED and breaker.snapshot()["window_calls"] == 0
+
+
+def test_slow_call_threshold_follows_request_timeout(monkeypatch):
+    monkeypatch.delenv("LLM_CB_SLOW_CALL_SECONDS", raising=False)
+    monkeypatch.setenv("LLM_TIMEOUT_SECONDS", "40")
+    assert CircuitBreaker.from_env("p").slow_call_seconds == 30
+
+    monkeypatch.setenv("LLM_CB_SLOW_CALL_SECONDS", "12")
+    assert CircuitBreaker.from_env("p").slow_call_seconds == 12
+
+
+def test_stream_latency_is_time_to_first_line():
+    async def body():
+        yield b'{"n": 1}\n'
+        for n in range(2, 5):
+            await asyncio.sleep(0.05)
+            yield b'{"n": %d}\n' % n
+
+    async def handler(request):
+        return httpx.Response(200, content=body())
+
+    transport = LLMTransport(retries=0, http_transport=httpx.MockTransport(handler))
+    events = []
+    transport.add_observer(lambda provider, kind, data: events.append((kind, data)))
+
+    async def scenario():
+        lines = [line async for line in transport.stream_lines("stub", "http://llm/completion", {})]
+        await transport.aclose()
+        return lines
+
+    assert len(asyncio.run(scenario())) == 4
+    # одна запись на вызов, длительность — до первой строки, а не всего потока (~0.15 с)
+    [(kind, data)] = [e for e in events if e[0] == "call"]
+    assert data["success"] and data["duration"] < 0.1
@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import httpx
+
+from app.services.cache_service import cache_service
+from ml.recommend import orchestrator
+from ml.recommend.json_stream import IncrementalJSONObjectParser
+from ml.recommend.llm_yandex import YandexLLM
+from ml.recommend.transport import LLMTransport
+
+ANSWER = {
+    "target_store": "clickhouse",
+    "ddl_hints": {"table_name": "events", "primary_key": "id", "partition_by": "ts", "order_by": ["ts"]},
+    "pipeline": {"dag": [{"op": "Load", "params": {"target": "clickhouse", "table": "events"}}]},
+    "schedule": {"cron": "0 * * * *", "reason": "ежечасно"},
+    "risks": ['строки с запятыми, скобками } и "кавычками"'],
+}
+
+
+def test_parser_emits_fields_as_soon_as_they_close():
+    text = json.dumps(ANSWER, ensure_ascii=False)
+    parser = IncrementalJSONObjectParser()
+    cut = text.index('"ddl_hints"') + 5
+    first = parser.feed(text[:cut])
+    assert first == [("target_store", "clickhouse")]
+    rest = [field for i in range(cut, len(text), 7) for field in parser.feed(text[i:i + 7])]
+    assert [name for name, _ in first + rest] == list(ANSWER)
+    assert parser.done and parser.result() == ANSWER
+
+
+def test_yandex_stream_consumes_cumulative_chunks(monkeypatch):
+    monkeypatch.setenv("YC_FOLDER_ID", "folder")
+    monkeypatch.setenv("YC_API_KEY", "key")
+    text = json.dumps(ANSWER, ensure_ascii=False)
+    cuts = [40, 120, 300, len(text)]
+    body = "\n".join(json.dumps({"result": {"alternatives": [{"message": {"role": "assistant", "text": text[:c]}}]}},
+                                ensure_ascii=False) for c in cuts)
+    seen = {}
+
+    def handler(request):
+        seen["stream"] = json.loads(request.content)["completionOptions"]["stream"]
+        return httpx.Response(200, text=body)
+
+    client = YandexLLM(transport=LLMTransport(http_transport=httpx.MockTransport(handler)))
+
+    async def scenario():
+        return [field async for field in client.astream_json("s", "u")]
+
+    fields = asyncio.run(scenario())
+    assert seen["stream"] is True
+    assert dict(fields) == ANSWER and fields[0][0] == "target_store"
+
+
+def test_recommend_stream_sse_sends_fields_then_done(client, monkeypatch):
+    cache_service._memory_cache.clear()
+    orchestrator.recommendation_index.clear()
+
+    async def fake_stream(system, user, json_schema=None, **kwargs):
+        for name, value in ANSWER.items():
+            yield name, value
+
+    monkeypatch.setattr(orchestrator, "ayandex_llm_stream", fake_stream)
+    profile = {"schema": [{"column": "id", "dtype": "int64"}, {"column": "ts", "dtype": "datetime64[ns]"}],
+               "checks": {"rows": 100, "has_time": True}}
+    r = client.post("/api/ml/recommend/stream", json={"profile": profile})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+
+    events = []
+    for block in r.text.strip().split("\n\n"):
+        name, data = block.split("\n", 1)
+        events.append((name.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    assert [e[1]["name"] for e in events if e[0] == "field"] == list(ANSWER)
+    assert events[-1][0] == "done" and events[-1][1]["source"] == "llm"
+
+    # собранный из потока ответ попал в кэш: повтор — без LLM, сразу из кэша
+    monkeypatch.setattr(orchestrator, "ayandex_llm_stream", None)
+    orchestrator.recommendation_index.clear()
+    again = client.post("/api/ml/recommend/stream", json={"profile": profile})
+    assert '"source": "llm"' in again.text
+    orchestrator.recommendation_index.clear()
+    cache_service._memory_cache.clear()
@@ -0,0 +1,67 @@
+import asyncio
+import importlib.util
+from pathlib import Path
+
+import httpx
+import pytest
+
+from app.services.llm_service import LLMService
+from ml.recommend import llm_yandex, orchestrator
+from ml.recommend.llm_yandex import YandexLLM
+from ml.recommend.transport import LLMTransport, LLMTransportError
+
+_spec = importlib.util.spec_from_file_location(
+    "llm_stub_server", Path(__file__).resolve().parents[1] / "llm_stub" / "server.py")
+stub = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(stub)
+
+PROFILE = {
+    "source": {"type": "csv", "path": "/data/events.csv"},
+    "schema": [{"column": "id", "dtype": "int64"}, {"column": "event_time", "dtype": "datetime64"},
+               {"column": "amount", "dtype": "float64"}],
+    "checks": {"rows": 2_000_000, "has_time": True},
+}
+
+
+@pytest.fixture
+def stub_transport(monkeypatch):
+    monkeypatch.setattr(stub, "config", stub.StubConfig(latency="fixed:0", token_delay=0, chunk_chars=16,
+                                                        retry_after=None))
+    asyncio.run(stub.reset())
+    monkeypatch.setattr(llm_yandex, "YANDEX_LLM_URL", "http://llm/foundationModels/v1/completion")
+    monkeypatch.setenv("YC_FOLDER_ID", "folder")
+    monkeypatch.setenv("YC_API_KEY", "key")
+    return LLMTransport(retries=1, backoff=0, http_transport=httpx.ASGITransport(app=stub.app))
+
+
+def test_completion_is_deterministic_and_schema_valid(stub_transport):
+    system, user, schema = orchestrator._render_prompt(PROFILE, {"table_name": "events"})
+    client = YandexLLM(transport=stub_transport)
+
+    async def scenario():
+        first = await client.agenerate_json(system, user, schema)
+        second = await client.agenerate_json(system, user, schema)
+        streamed = [field async for field in client.astream_json(system, user, schema)]
+        return first, second, streamed
+
+    first, second, streamed = asyncio.run(scenario())
+    assert first == second
+    assert orchestrator._validated(dict(first))["target_store"] == "clickhouse"
+    assert first["ddl_hints"] == {"primary_key": "id", "partition_by": "event_time",
+                                  "order_by": ["id", "event_time"], "table_name": "events"}
+    assert dict(streamed) == first and streamed[0][0] == "target_store"
+
+
+def test_service_routes_and_injected_errors(stub_transport, monkeypatch):
+    service = LLMService(transport=stub_transport)
+    monkeypatch.setattr(service, "base_url", "http://llm")
+
+    result = asyncio.run(service.recommend_storage_strategy({"workload_type": "analytical"}))
+    assert "ClickHouse" in result["rationale"]
+
+    stub.config.rate_429 = 1.0
+    with pytest.raises(LLMTransportError):
+        asyncio.run(stub_transport.post_json("backend", "http://llm/analyze", {"prompt": "x"}))
+    # первая попытка и один повтор — оба отклонены заглушкой
+    assert stub.stats["analyze:429"] == 2
+    assert stub.stats["recommend_storage:200"] == 1
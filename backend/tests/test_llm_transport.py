@@ -0,0 +1,57 @@
+import asyncio
+
+import httpx
+
+from ml.recommend.transport import LLMTransport, LLMTransportError
+
+
+def test_retries_honour_retry_after_and_reuse_one_client():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0"}, text="slow down")
+        return httpx.Response(200, json={"response": "ok"})
+
+    transport = LLMTransport(retries=2, backoff=0.01, http_transport=httpx.MockTransport(handler))
+
+    async def scenario():
+        first = await transport.post_json("stub", "http://llm/analyze", {"prompt": "x"})
+        client = transport._state().client
+        second = await transport.post_json("stub", "http://llm/analyze", {"prompt": "y"})
+        assert transport._state().client is client
+        await transport.aclose()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == second == {"response": "ok"}
+    assert len(calls) == 3
+
+
+def test_global_semaphore_bounds_in_flight_requests_and_gives_up():
+    in_flight, peak = 0, 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(503 if request.url.path == "/down" else 200, json={})
+
+    transport = LLMTransport(max_concurrency=2, retries=1, backoff=0.001,
+                             http_transport=httpx.MockTransport(handler))
+
+    async def scenario():
+        await asyncio.gather(*(transport.post_json("stub", "http://llm/ok", {}) for _ in range(6)))
+        try:
+            await transport.post_json("stub", "http://llm/down", {})
+        except LLMTransportError as e:
+            return e
+        finally:
+            await transport.aclose()
+
+    error = asyncio.run(scenario())
+    assert peak == 2
+    assert error.status_code == 503
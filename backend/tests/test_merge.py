@@ -0,0 +1,107 @@
+import pyarrow as pa
+import pytest
+
+from app.connectors.postgres_loader import PostgresLoader
+from app.services import merge_service
+
+
+class FakeCursor:
+    def __init__(self, log):
+        self.log = log
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self.log.append(sql)
+        if sql.startswith("INSERT INTO"):
+            self.rowcount = 2
+
+    def fetchone(self):
+        return None  # уникального индекса на ключ ещё нет
+
+    def copy_expert(self, sql, stream, size=None):
+        self.log.append(sql)
+        while stream.read(size):
+            pass
+
+
+class FakeEngine:
+    def __init__(self):
+        self.log = []
+
+    def raw_connection(self):
+        engine = self
+
+        class Raw:
+            def cursor(self):
+                return FakeCursor(engine.log)
+
+            def commit(self):
+                engine.log.append("COMMIT")
+
+            def rollback(self):
+                engine.log.append("ROLLBACK")
+
+            def close(self):
+                pass
+
+        return Raw()
+
+
+def test_postgres_upsert_goes_through_temp_table_and_skips_unchanged_rows():
+    engine = FakeEngine()
+    batch = pa.record_batch({"id": [1, 2, 2], "name": ["a", "b", "c"]})
+    stats = PostgresLoader(engine).upsert_batches("public.customers", [batch], ["id"])
+
+    assert stats["rows"] == 3 and stats["changed"] == 2
+    log = engine.log
+    # транзакция загрузки не наследует таймаут сессии
+    assert log[0] == "SET LOCAL statement_timeout = 0"
+    assert log[2] == 'CREATE UNIQUE INDEX IF NOT EXISTS "ux_customers_id" ON "public"."customers" ("id")'
+    assert log[3].startswith('CREATE TEMP TABLE "_merge_') and log[3].endswith("ON COMMIT DROP")
+    assert log[4].startswith('COPY "_merge_')
+    upsert = log[5]
+    assert 'SELECT DISTINCT ON ("id") "id", "name"' in upsert
+    assert 'ON CONFLICT ("id") DO UPDATE SET "name" = EXCLUDED."name"' in upsert
+    assert 'WHERE ROW(t."name") IS DISTINCT FROM ROW(EXCLUDED."name")' in upsert
+    assert log[-1] == "COMMIT"
+
+
+def test_postgres_copy_uses_configured_load_timeout():
+    engine = FakeEngine()
+    batch = pa.record_batch({"id": [1, 2]})
+    stats = PostgresLoader(engine, statement_timeout_seconds=600).copy_batches("public.t", [batch], truncate=True)
+
+    assert stats["rows"] == 2
+    assert engine.log[:2] == ["SET LOCAL statement_timeout = 600000", 'TRUNCATE "public"."t"']
+
+
+def test_collapsing_stamper_cancels_current_state():
+    class FakeLoader:
+        def query_arrow(self, sql, parameters=None):
+            self.sql, self.keys = sql, parameters["keys"]
+            return pa.table({"id": [1], "name": ["old"]})
+
+    loader = FakeLoader()
+    stamper = merge_service.CollapsingStamper(loader, "dwh.customers", ["id"])
+    out = stamper(pa.record_batch({"id": [1, 3], "name": ["new", "x"]}))
+
+    assert loader.keys == (1, 3)
+    assert "FROM `dwh`.`customers` FINAL WHERE `_sign` = 1 AND `id` IN %(keys)s" in loader.sql
+    assert out.to_pydict() == {"id": [1, 1, 3], "name": ["old", "new", "x"], "_sign": [-1, 1, 1]}
+    assert stamper.cancelled == 1
+
+    # повтор ключа внутри батча — побеждает последняя строка; в следующем батче — ошибка
+    out = stamper(pa.record_batch({"id": [7, 7], "name": ["first", "last"]}))
+    assert loader.keys == (7,) and out.column("name").to_pylist() == ["old", "last"]
+    assert stamper.collapsed == 1
+    with pytest.raises(ValueError, match="повторяется"):
+        stamper(pa.record_batch({"id": [3], "name": ["again"]}))
+
+    versions = merge_service.VersionStamper(base=100)(pa.record_batch({"id": [5, 6]}))
+    assert versions.column("_version").to_pylist() == [100, 101]
+
+
+def test_key_is_taken_from_profile_candidates():
+    profile = {"rows": 3, "columns": [{"name": "Email", "unique_count": 3}, {"name": "city", "unique_count": 2}]}
+    schema = pa.schema([("email", pa.string()), ("city", pa.string())])
+    assert merge_service.resolve_keys(None, profile, schema, rename=str.lower) == ["email"]
@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta, timezone
+
+
+def _write_events(path, days_ago):
+    now = datetime.now(timezone.utc).replace(microsecond=0, tzinfo=None)
+    lines = ["id,event_time,amount"]
+    for i, d in enumerate(days_ago):
+        lines.append(f"{i},{(now - timedelta(days=d)).isoformat(sep=' ')},{i * 1.5}")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def test_run_recommended_pipeline_in_memory(client, tmp_path):
+    src = tmp_path / "events.csv"
+    _write_events(src, [1, 5, 40, 100, 2, 31])
+    pipeline = {"dag": [
+        {"op": "Extract", "params": {"source": {"type": "file", "format": "csv", "name": "events.csv"}}},
+        {"op": "FilterByDate", "params": {"column": "event_time", "window": "last_30d"}},
+        {"op": "Load", "params": {"target": "clickhouse", "table": "events"}},
+    ]}
+    payload = {"pipeline": pipeline, "source": {"type": "file", "path": str(src)},
+               "sink": "memory", "batch_rows": 2, "queue_size": 1}
+    r = client.post("/api/v1/pipelines/run", json=payload)
+    assert r.status_code == 200
+    body = r.json()
+
+    assert body["rows_in"] == 6 and body["rows_out"] == 3
+    assert sorted(row["id"] for row in body["preview"]) == [0, 1, 4]
+    assert [(op["index"], op["op"]) for op in body["ops"]] == [(0, "Extract"), (1, "FilterByDate"), (2, "Load")]
+    assert body["ops"][0]["batches"] == 3
+    assert body["ops"][1]["rows"] == 3
+
+
+def test_run_pipeline_rejects_unknown_op(client):
+    pipeline = {"dag": [{"op": "Extract", "params": {"source": {"type": "file", "path": "/nope.csv"}}},
+                        {"op": "Explode", "params": {}},
+                        {"op": "Load", "params": {"target": "postgres", "table": "t"}}]}
+    r = client.post("/api/v1/pipelines/run", json={"pipeline": pipeline, "sink": "null"})
+    assert r.status_code == 400
+    assert "Explode" in r.json()["detail"]
@@ -0,0 +1,96 @@
+import uuid
+from decimal import Decimal
+
+import pyarrow as pa
+from psycopg2.extensions import Column
+
+from app.connectors.postgres_extractor import (
+    PostgresExtractor, linspace_bounds, ranges_from_cuts, split_bounds,
+)
+from ml.sources import loader
+
+
+def test_build_query_projection_and_render():
+    sql = PostgresExtractor.build_query("public.events", columns=["id", "ts"], where="ts >= :since")
+    assert sql == 'SELECT "id", "ts" FROM "public"."events" WHERE ts >= :since'
+
+    extractor = PostgresExtractor("postgresql+psycopg2://u:p@localhost/db", mode="copy")
+    rendered = extractor._render(sql, {"since": "2024-01-01"})
+    assert rendered.endswith("ts >= '2024-01-01'")
+
+
+def test_cursor_batches_share_one_schema_from_description():
+    description = [Column(name="id", type_code=2950), Column(name="amount", type_code=1700, precision=10, scale=2),
+                   Column(name="total", type_code=1700), Column(name="attrs", type_code=3802),
+                   Column(name="tags", type_code=1009), Column(name="ip", type_code=869)]
+    extractor = PostgresExtractor("postgresql+psycopg2://u:p@h/db")
+    schema = extractor._schema_from_description(description)
+    converters = extractor._converters(description, schema)
+    key = uuid.UUID("6f1c2a4e-0000-4000-8000-000000000001")
+
+    first = extractor._rows_to_batch([(key, Decimal("1.5"), Decimal("10"), {"a": 1}, ["x"], "10.0.0.1")],
+                                     schema, converters)
+    second = extractor._rows_to_batch([(None, Decimal("123.45"), None, None, None, None)], schema, converters)
+
+    assert first.schema == second.schema == schema
+    assert schema.field("amount").type == pa.decimal128(10, 2)
+    assert schema.field("total").type == pa.decimal128(38, 18)
+    assert schema.field("tags").type == pa.list_(pa.string())
+    assert first.column("id").to_pylist() == [str(key)]
+    assert first.column("attrs").to_pylist() == ['{"a": 1}'] and first.column("ip").type == pa.string()
+    assert pa.Table.from_batches([first, second]).num_rows == 2
+
+    # COPY отдаёт массивы текстом — в схеме COPY это строка
+    assert extractor._schema_from_description(description, copy=True).field("tags").type == pa.string()
+
+
+def test_load_sample_postgres_streams_until_limit(monkeypatch):
+    closed = []
+
+    def fake_batches(self, **kwargs):
+        try:
+            for i in range(100):
+                yield pa.record_batch({"id": pa.array(range(i * 10, i * 10 + 10), type=pa.int64())})
+        finally:
+            closed.append(True)
+
+    monkeypatch.setattr(PostgresExtractor, "iter_batches", fake_batches)
+    df, meta = loader.load_sample({"type": "postgres", "dsn": "postgresql+psycopg2://u:p@h/db",
+                                   "table": "public.events", "limit": 25})
+    assert len(df) == 25
+    assert list(df["id"][:3]) == [0, 1, 2]
+    assert meta["rows"] == 25
+    assert closed == [True]  # генератор закрыт, курсор отпущен
+
+
+def test_split_bounds_and_ranges():
+    bounds = [str(v) for v in range(0, 101, 10)]  # гистограмма pg_stats: 11 границ
+    cuts = split_bounds(bounds, 4)
+    assert cuts == ["20", "50", "80"]
+    ranges = ranges_from_cuts(cuts, with_nulls=True)
+    assert len(ranges) == 5 and ranges[-1].nulls
+    sql, params = ranges[1].predicate("id", 1)
+    assert sql == '"id" IS NOT NULL AND "id" >= :range_lo_1 AND "id" < :range_hi_1'
+    assert params == {"range_lo_1": "20", "range_hi_1": "50"}
+    assert linspace_bounds(0, 100, 4) == [25, 50, 75]
+
+
+def test_parallel_extract_reads_every_range(monkeypatch):
+    extractor = PostgresExtractor("postgresql+psycopg2://u:p@h/db", parallelism=3)
+    seen = []
+
+    def fake_batches(self, table=None, columns=None, where=None, params=None, **kwargs):
+        seen.append(where)
+        lo = params.get(next((k for k in params if k.startswith("range_lo")), ""), 0)
+        for i in range(3):
+            yield pa.record_batch({"lo": pa.array([lo] * 2, type=pa.int64())})
+
+    monkeypatch.setattr(PostgresExtractor, "iter_batches", fake_batches)
+    ranges = ranges_from_cuts([10, 20, 30], with_nulls=False)
+
+    ordered = list(extractor.iter_batches_parallel("t", "id", ranges=ranges, where="x > 0", ordered=True))
+    assert [b.column(0)[0].as_py() for b in ordered] == [0] * 3 + [10] * 3 + [20] * 3 + [30] * 3
+    assert all(w.startswith("(x > 0) AND ") for w in seen)
+
+    unordered = list(extractor.iter_batches_parallel("t", "id", ranges=ranges))
+    assert sum(b.num_rows for b in unordered) == 24
@@ -0,0 +1,52 @@
+from ml.recommend import orchestrator
+from ml.recommend.prompt_budget import compact_profile, dumps_compact, estimate_tokens
+
+
+def _wide_profile(n_metrics=600):
+    schema = [{"column": "id", "dtype": "int64", "nulls": 0, "uniques": 100_000},
+              {"column": "event_date", "dtype": "datetime64[ns]", "nulls": 0, "uniques": 365}]
+    schema += [{"column": f"metric_{i:03d}", "dtype": "float64", "nulls": i, "uniques": 90_000 + i}
+               for i in range(n_metrics)]
+    return {
+        "source": {"type": "csv", "path": "/data/wide.csv"},
+        "preview": [{c["column"]: 1.2345678 for c in schema} for _ in range(5)],
+        "schema": schema,
+        "checks": {"has_time": True, "rows": 100_000, "cols": len(schema)},
+    }
+
+
+def test_wide_schema_is_compacted_to_budget_keeping_key_columns():
+    profile = _wide_profile()
+    compacted, info = compact_profile(profile, budget_tokens=1500)
+
+    assert info["original_tokens"] > 1500 >= info["tokens"]
+    assert estimate_tokens(dumps_compact(compacted)) == info["tokens"]
+    assert "preview" not in compacted
+    names = [c["column"] for c in compacted["schema"]]
+    assert "id" in names and "event_date" in names
+    group = next(c for c in compacted["schema"] if c["column"] == "metric_#")
+    assert group["count"] == 600 and group["range"] == ["metric_000", "metric_599"]
+
+    small = _wide_profile(n_metrics=3)
+    compacted, info = compact_profile(small, budget_tokens=10_000)
+    assert compacted is small and info["level"] == 0
+
+
+def test_render_prompt_fits_budget_and_reads_template_once(monkeypatch):
+    orchestrator._template.cache_clear()
+    reads = []
+    original = type(orchestrator.PROMPTS_DIR).read_text
+
+    def counting_read_text(self, *args, **kwargs):
+        reads.append(self.name)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(type(orchestrator.PROMPTS_DIR), "read_text", counting_read_text)
+    monkeypatch.setattr(orchestrator, "PROMPT_TOKEN_BUDGET", 3000)
+
+    for _ in range(3):
+        system, user, schema = orchestrator._render_prompt(_wide_profile(), {"table_name": "wide"})
+        assert estimate_tokens(system) + estimate_tokens(user) <= 3000
+        assert "metric_#" in user and schema is not None
+    assert reads.count("recommendation.txt") == 1
+    orchestrator._template.cache_clear()
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.connectors.query_budget import QueryBudget, QueryBudgetExceeded, run_with_budget
+
+
+def test_budget_cancel_runs_off_event_loop():
+    released = threading.Event()
+    budget = QueryBudget(timeout_seconds=0.05)
+    loop_threads = set()
+
+    def slow_query():
+        released.wait(2)
+
+    def blocking_cancel():
+        # как KILL QUERY: сетевой вызов из отдельного клиента
+        loop_threads.add(threading.get_ident())
+        time.sleep(0.2)
+        released.set()
+
+    budget.on_cancel(blocking_cancel)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while not released.is_set():
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        tick_task = asyncio.create_task(ticker())
+        with pytest.raises(QueryBudgetExceeded):
+            await run_with_budget(slow_query, budget)
+        await tick_task
+        return ticks, threading.get_ident()
+
+    ticks, loop_thread = asyncio.run(scenario())
+    assert budget.cancelled
+    assert loop_thread not in loop_threads
+    assert ticks >= 10
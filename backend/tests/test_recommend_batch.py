@@ -0,0 +1,78 @@
+import json
+
+from app.services.cache_service import cache_service
+from ml.recommend import orchestrator
+from ml.recommend.rules import choose_store, choose_store_batch
+
+
+def _profile(rows, *columns):
+    return {"schema": [{"column": c, "dtype": d, "nulls": 0, "uniques": rows} for c, d in columns],
+            "checks": {"rows": rows, "has_time": any("date" in c for c, _ in columns)}}
+
+
+ORDERS = (("id", "int64"), ("order_date", "datetime64[ns]"), ("amount", "float64"))
+USERS = (("user_id", "int64"), ("email", "object"))
+
+
+def test_vectorized_rules_match_per_profile_rules():
+    profiles = [_profile(10, *USERS), _profile(2_000_000, *USERS), _profile(6_000_000, *ORDERS),
+                _profile(10, *ORDERS), _profile(6_000_000, *USERS)]
+    prefs = [{}, {}, {}, {}, {"mode": "oltp"}]
+    assert choose_store_batch(profiles, prefs) == [choose_store(p, pr) for p, pr in zip(profiles, prefs)]
+
+
+def test_batch_dedupes_fingerprints_and_streams_ndjson(client, monkeypatch):
+    cache_service._memory_cache.clear()
+    orchestrator.recommendation_index.clear()
+    calls = []
+
+    async def fake_llm(system, user, json_schema=None, **kwargs):
+        calls.append(user)
+        return {"target_store": "clickhouse", "ddl_hints": {"table_name": "orders", "order_by": ["order_date"]},
+                "pipeline": {"dag": []}, "schedule": {"cron": "0 3 * * *", "reason": "ежедневно"}, "risks": []}
+
+    monkeypatch.setattr(orchestrator, "ayandex_llm_json", fake_llm)
+    payload = {"items": [
+        {"id": "jan", "profile": _profile(41_000, *ORDERS)},
+        {"id": "feb", "profile": _profile(43_500, *ORDERS)},  # тот же отпечаток — один вызов LLM
+        {"id": "users", "profile": _profile(900, *USERS), "user_prefs": {"use_llm": False}},
+        {"id": "broken", "profile": {"schema": []}, "user_prefs": {"use_llm": False}},
+    ]}
+    r = client.post("/api/ml/recommend/batch", json=payload)
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = [json.loads(line) for line in r.text.splitlines() if line]
+    by_id = {line["id"]: line for line in lines if line["type"] == "recommendation"}
+    assert len(calls) == 1
+    assert by_id["jan"]["source"] == by_id["feb"]["source"] == "llm"
+    assert by_id["feb"]["deduplicated"] is True
+    assert by_id["users"]["source"] == "rules" and by_id["users"]["recommendation"]["target_store"] == "postgres"
+    assert by_id["broken"]["status"] == "error"
+
+    summary = lines[-1]
+    assert summary["type"] == "summary" and summary["items"] == 4
+    assert summary["llm_groups"] == 1 and summary["deduplicated"] == 1
+    assert summary["by_source"] == {"llm": 2, "rules": 1, "error": 1}
+    orchestrator.recommendation_index.clear()
+    cache_service._memory_cache.clear()
+
+
+def test_batch_rejects_malformed_rule_profiles_without_breaking_stream(client):
+    bad_columns = _profile(10, *USERS)
+    bad_columns["schema"].append({"column": "note"})
+    payload = {"use_llm": False, "items": [
+        {"id": "none_rows", "profile": {"schema": [], "checks": {"rows": None}}},
+        {"id": "text_rows", "profile": {"schema": [], "checks": {"rows": "many"}}},
+        {"id": "no_dtype", "profile": bad_columns},
+        {"id": "users", "profile": _profile(900, *USERS)},
+    ]}
+    r = client.post("/api/ml/recommend/batch", json=payload)
+    assert r.status_code == 200
+
+    lines = [json.loads(line) for line in r.text.splitlines() if line]
+    by_id = {line["id"]: line for line in lines if line["type"] == "recommendation"}
+    assert {i for i, line in by_id.items() if line["status"] == "error"} == {"none_rows", "text_rows", "no_dtype"}
+    assert "schema[2]" in by_id["no_dtype"]["error"]
+    assert by_id["users"]["recommendation"]["target_store"] == "postgres"
+    assert lines[-1]["type"] == "summary" and lines[-1]["by_source"] == {"error": 3, "rules": 1}
@@ -0,0 +1,36 @@
+import asyncio
+
+from app.schemas.recommend import RecommendationRequest
+from app.services import recommendation_service
+from ml.recommend import deadline
+
+
+def test_rules_returned_by_deadline_and_late_llm_answer_is_reused(monkeypatch):
+    recommendation_service.storage_index.clear()
+    calls = []
+
+    async def slow_llm(workload_info):
+        calls.append(workload_info["workload"])
+        await asyncio.sleep(0.2)
+        return {"storage_type": "clickhouse", "rationale": "LLM: колоночное хранилище"}
+
+    monkeypatch.setattr(recommendation_service.llm_service, "recommend_storage_strategy", slow_llm)
+    req = RecommendationRequest(profile_summary="ежемесячная выгрузка продаж по регионам",
+                                workload="operational", latency_budget_ms=20)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        first = await recommendation_service.recommend_storage_and_schedule(req)
+        elapsed = loop.time() - started
+        while deadline.pending_count():
+            await asyncio.sleep(0.01)
+        second = await recommendation_service.recommend_storage_and_schedule(req)
+        return first, elapsed, second
+
+    first, elapsed, second = asyncio.run(scenario())
+    assert first.source == "rules" and first.storage == "postgres"
+    assert elapsed < 0.15
+    assert second.source == "similar" and second.storage == "clickhouse"
+    assert calls == ["operational"]
+    recommendation_service.storage_index.clear()
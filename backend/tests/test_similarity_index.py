@@ -0,0 +1,67 @@
+from app.services.cache_service import cache_service
+from ml.recommend import orchestrator
+from ml.recommend.similarity import SimilarityIndex, profile_tokens
+
+
+def _profile(*columns, rows=40_000):
+    return {
+        "rows": rows,
+        "schema": [{"column": name, "dtype": dtype} for name, dtype in columns],
+        "checks": {"rows": rows, "has_time": True},
+    }
+
+
+JANUARY = _profile(("id", "int64"), ("order_date", "datetime64[ns]"), ("region", "object"),
+                   ("amount", "float64"), ("qty", "int64"), ("sku", "object"), ("store_id", "int64"))
+# февральская выгрузка: те же колонки плюс одна новая, int32 вместо int64
+FEBRUARY = _profile(("id", "int32"), ("order_date", "datetime64[ns]"), ("region", "object"),
+                    ("amount", "float64"), ("qty", "int64"), ("sku", "object"), ("store_id", "int64"),
+                    ("promo", "object"), rows=52_000)
+OTHER = _profile(("user_id", "int64"), ("email", "object"), ("created_at", "datetime64[ns]"))
+
+
+def test_lsh_finds_variant_and_rejects_unrelated_schema():
+    index = SimilarityIndex("test", threshold=0.8)
+    index.add("scope", profile_tokens(JANUARY), "jan")
+
+    match = index.lookup("scope", profile_tokens(FEBRUARY))
+    assert match is not None and match.value == "jan" and 0.8 <= match.similarity < 1
+    assert index.lookup("scope", profile_tokens(OTHER)) is None
+    assert index.lookup("other-scope", profile_tokens(JANUARY)) is None
+
+    stats = index.stats()
+    assert stats["lookups"] == 3 and stats["hits"] == 1
+    assert stats["hit_rate"] == round(1 / 3, 4) and stats["threshold"] == 0.8
+
+
+def test_similar_profile_reuses_llm_answer(client, monkeypatch):
+    cache_service._memory_cache.clear()
+    orchestrator.recommendation_index.clear()
+    calls = []
+
+    async def fake_llm(system, user, json_schema=None, **kwargs):
+        calls.append(1)
+        return {
+            "target_store": "clickhouse",
+            "ddl_hints": {"table_name": "orders", "primary_key": "id",
+                          "partition_by": "order_date", "order_by": ["order_date", "store_id"]},
+            "pipeline": {"dag": []},
+            "schedule": {"cron": "0 2 1 * *", "reason": "monthly"},
+            "risks": [],
+        }
+
+    monkeypatch.setattr(orchestrator, "ayandex_llm_json", fake_llm)
+
+    first = client.post("/api/ml/recommend", json={"profile": JANUARY})
+    second = client.post("/api/ml/recommend", json={"profile": FEBRUARY})
+    assert first.status_code == second.status_code == 200
+    assert len(calls) == 1
+    body = second.json()
+    assert body["target_store"] == "clickhouse"
+    assert body["ddl_hints"]["order_by"] == ["order_date", "store_id"]
+    assert any("сходство" in r for r in body["risks"])
+
+    stats = client.get("/api/ml/recommend/similarity").json()["recommendations"]
+    assert stats["hits"] == 1 and stats["lookups"] == 2
+    orchestrator.recommendation_index.clear()
+    cache_service._memory_cache.clear()
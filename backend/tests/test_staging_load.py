@@ -0,0 +1,114 @@
+import asyncio
+import csv
+import io
+
+import pyarrow as pa
+
+from app.schemas.ddl import DDLRequest
+from app.services import staging_load_service
+from app.services.ddl_service import generate_ddl
+from app.connectors.postgres_loader import CSVBatchStream
+
+
+class FakeLoader:
+    executed = []
+    copied = {}
+
+    def __init__(self, engine=None):
+        pass
+
+    def execute_ddl(self, statements):
+        FakeLoader.executed.extend(statements)
+
+    def copy_batches(self, table, batches, truncate=False):
+        stream = CSVBatchStream(batches)
+        data = b""
+        while chunk := stream.read(64):
+            data += chunk
+        FakeLoader.copied = {"table": table, "csv": data.decode(), "truncate": truncate}
+        return {"rows": stream.rows, "bytes": stream.bytes, "batches": stream.batches,
+                "seconds": 0.01, "rows_per_second": 100.0, "mb_per_second": 0.1}
+
+
+def test_load_csv_into_staging(client, monkeypatch, tmp_path):
+    src = tmp_path / "orders.csv"
+    src.write_text('Order ID,Customer Name,amount\n1,"Ann",10.5\n2,,7\n3,"",\n', encoding="utf-8")
+    monkeypatch.setattr(staging_load_service, "PostgresLoader", FakeLoader)
+    monkeypatch.setattr(staging_load_service, "_record_load", lambda *a, **k: 42)
+
+    payload = {"source": {"type": "file", "path": str(src)}, "table_name": "orders_stage",
+               "schema_name": "public", "mode": "replace", "batch_rows": 2}
+    r = client.post("/api/v1/pipelines/load/staging", json=payload)
+    assert r.status_code == 200
+    body = r.json()
+    assert body["rows"] == 3 and body["processing_log_id"] == 42
+
+    create = FakeLoader.executed[-1]
+    assert create.startswith("CREATE TABLE IF NOT EXISTS public.orders_stage")
+    assert "order_id BIGINT" in create and "customer_name TEXT" in create
+    assert "CREATE INDEX" not in create
+
+    copied = FakeLoader.copied
+    assert copied["table"] == "public.orders_stage" and copied["truncate"] is True
+    rows = list(csv.reader(io.StringIO(copied["csv"])))
+    assert rows[0] == ["1", "Ann", "10.5"]
+    # NULL — пустое поле без кавычек, пустая строка — ""
+    assert copied["csv"].splitlines()[1].startswith("2,,")
+    assert copied["csv"].splitlines()[2].startswith('3,"",')
+
+
+def test_bad_csv_rows_go_to_rejects_table(client, monkeypatch, tmp_path):
+    src = tmp_path / "orders.csv"
+    src.write_text("id,amount\n1,10\n2\n3,30\n4,40,extra\n5,50\n", encoding="utf-8")
+    monkeypatch.setattr(staging_load_service, "PostgresLoader", FakeLoader)
+    recorded = {}
+    monkeypatch.setattr(staging_load_service, "_record_load",
+                        lambda req, status, stats, *a, **k: recorded.update(stats) or 1)
+
+    payload = {"source": {"type": "file", "path": str(src)}, "table_name": "orders_stage", "max_rejects": 10}
+    r = client.post("/api/v1/pipelines/load/staging", json=payload)
+    assert r.status_code == 200
+    body = r.json()
+    assert body["rows"] == 3 and body["rejected_rows"] == 2
+    assert body["rejects_table"] == "orders_stage_rejects"
+    assert FakeLoader.copied["table"] == "orders_stage_rejects"
+    # номер строки в файле (с заголовком), причина, исходный текст
+    assert FakeLoader.copied["csv"].splitlines() == ['3,"expected 2 columns, got 1","2"',
+                                                     '5,"expected 2 columns, got 3","4,40,extra"']
+    assert recorded["rejected_rows"] == 2
+
+    # порог превышен — это уже не шум, а неверный формат: 400, ничего не дописано
+    payload["max_rejects"] = 1
+    r = client.post("/api/v1/pipelines/load/staging", json=payload)
+    assert r.status_code == 400
+    assert "Битых строк больше 1" in r.json()["detail"]
+
+
+def test_constraint_names_are_unique_per_table():
+    sample = {"rows": 2, "columns": [{"name": "id", "dtype": "int64", "unique_count": 2}]}
+    ddls = [asyncio.run(generate_ddl(DDLRequest(target_system="postgres", table_name=f"staging.{name}",
+                                                sample=sample, key_columns=["id"]))).ddl_sql
+            for name in ("orders", "customers", "x" * 80)]
+
+    assert "CONSTRAINT pk_orders_id PRIMARY KEY (id)" in ddls[0]
+    assert "CONSTRAINT pk_customers_id PRIMARY KEY (id)" in ddls[1]
+    long_name = ddls[2].split("CONSTRAINT ")[1].split()[0]
+    assert len(long_name.encode()) <= 63 and long_name.startswith("pk_xxx")
+
+
+def test_csv_value_of_wrong_type_is_rejected_not_fatal(tmp_path):
+    from app.connectors.batch_sources import open_batches
+    from ml.sources.csv_rejects import RejectSink
+
+    src = tmp_path / "orders.csv"
+    # тип amount выводится по первому блоку (int64); "abc" — в следующем блоке
+    src.write_text("id,amount\n" + "".join(f"{i},{i * 10}\n" for i in range(300))
+                   + "300\n301,abc\n302,3020\n", encoding="utf-8")
+    rejects = RejectSink(max_rows=10)
+    batches = list(open_batches({"type": "file", "path": str(src), "block_bytes": 1024}, rejects=rejects))
+
+    table = pa.Table.from_batches(batches)
+    assert table.schema.field("amount").type == pa.int64()
+    assert table.num_rows == 301 and table.column("id").to_pylist()[-1] == 302
+    assert [(r.line, r.text) for r in rejects.rows] == [(302, "300"), (303, "301,abc")]
+    assert "cannot convert 'abc' to int64" in rejects.rows[1].reason
@@ -0,0 +1,84 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pyarrow as pa
+import pytest
+
+from app.services import transfer_service
+
+
+class FakeCHLoader:
+    commands = []
+    inserted = []
+
+    def __init__(self, **kwargs):
+        pass
+
+    def command(self, sql):
+        FakeCHLoader.commands.append(sql)
+
+    def insert_batches(self, table, batches, load_id=None):
+        rows = 0
+        for batch in batches:
+            FakeCHLoader.inserted.append(batch)
+            rows += batch.num_rows
+        return {"rows": rows, "bytes": 0, "inserts": 1, "retries": 0, "load_id": load_id, "seconds": 0.01}
+
+
+def fake_batches(source, batch_rows=50_000):
+    for i in range(3):
+        yield pa.record_batch({
+            "id": pa.array([i * 2, i * 2 + 1], type=pa.int64()),
+            "amount": pa.array([Decimal("1.50"), None], type=pa.decimal128(10, 2)),
+            "paid": pa.array([True, False]),
+            "created_at": pa.array([datetime(2024, 1, 1, 10, 0, 0, 123456)] * 2, type=pa.timestamp("us")),
+        })
+
+
+def test_transfer_converts_types_and_reports_stages(client, monkeypatch):
+    monkeypatch.setattr(transfer_service, "open_batches", fake_batches)
+    monkeypatch.setattr(transfer_service, "ClickHouseLoader", FakeCHLoader)
+
+    payload = {"source": {"type": "postgres", "table": "public.orders"}, "target_table": "orders",
+               "load_id": "run-1", "queue_size": 1}
+    r = client.post("/api/v1/pipelines/transfer", json=payload)
+    assert r.status_code == 200
+    body = r.json()
+
+    assert body["rows"] == 6 and body["load_id"] == "run-1"
+    assert set(body["stages"]) == {"extract", "convert", "insert"}
+    assert body["stages"]["convert"]["rows"] == 6
+
+    create = FakeCHLoader.commands[-1]
+    assert create.startswith("CREATE TABLE IF NOT EXISTS orders")
+    # источник допускает NULL — Nullable, иначе ClickHouse запишет 0; ключи сортировки — без Nullable
+    assert "amount Nullable(Float64)" in create and "paid Nullable(UInt8)" in create
+    assert "  id Int64," in create and "created_at DateTime" in create and "Nullable(DateTime)" not in create
+    assert "PARTITION BY toDate(created_at)" in create
+
+    schema = FakeCHLoader.inserted[-1].schema
+    assert schema.field("amount").type == pa.float64()
+    assert schema.field("paid").type == pa.uint8()
+    assert schema.field("created_at").type == pa.timestamp("s")
+    assert FakeCHLoader.inserted[0].column("amount").to_pylist() == [1.5, None]
+
+
+def test_convert_batch_keeps_uint64_and_rejects_lossy_casts():
+    big = 2 ** 63 + 5
+    source = pa.schema([("id", pa.int64()), ("hits", pa.uint64()), ("ts", pa.timestamp("us"))])
+    target = transfer_service.clickhouse_target_schema(source)
+    assert target.field("hits").type == pa.uint64() and target.field("hits").nullable
+    assert not target.field("id").nullable
+
+    batch = pa.record_batch([pa.array([1]), pa.array([big], pa.uint64()),
+                             pa.array([datetime(2024, 1, 1, 0, 0, 0, 999)], pa.timestamp("us"))], schema=source)
+    out = transfer_service.convert_batch(batch, target)
+    assert out.column("hits").to_pylist() == [big]
+    assert out.column("ts").to_pylist() == [datetime(2024, 1, 1)]
+
+    narrow = pa.schema([pa.field("hits", pa.int64())])
+    with pytest.raises(pa.ArrowInvalid):
+        transfer_service.convert_batch(pa.record_batch([pa.array([big], pa.uint64())], names=["hits"]), narrow)
+    with pytest.raises(ValueError, match="NULL"):
+        transfer_service.convert_batch(pa.record_batch([pa.array([None], pa.int64()), pa.array([1], pa.uint64()),
+                                                        pa.array([None], pa.timestamp("us"))], schema=source), target)
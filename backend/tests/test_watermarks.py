@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta, timezone
+
+from app.services import pipeline_executor, watermark_service
+
+
+def _write_events(path, hours_ago, now):
+    lines = ["id,event_time"]
+    for i, h in enumerate(hours_ago):
+        lines.append(f"{i},{(now - timedelta(hours=h)).replace(tzinfo=None).isoformat(sep=' ')}")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def test_incremental_run_reads_after_watermark_minus_overlap(client, tmp_path, monkeypatch):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    src = tmp_path / "events.csv"
+    _write_events(src, [10, 5, 2.5, 1, 0.5], now)
+    watermark = now - timedelta(hours=2)
+    calls = []
+    monkeypatch.setattr(watermark_service, "get_watermark", lambda key, column: watermark)
+    monkeypatch.setattr(watermark_service, "advance_watermark", lambda *args, **kwargs: calls.append(args))
+
+    pipeline = {"name": "events_hourly", "dag": [
+        {"op": "Extract", "params": {}},
+        {"op": "FilterByDate", "params": {"column": "event_time", "window": "last_30d",
+                                          "mode": "incremental", "overlap": "1h"}},
+        {"op": "Load", "params": {"target": "postgres", "table": "events"}},
+    ]}
+    r = client.post("/api/v1/pipelines/run", json={
+        "pipeline": pipeline, "source": {"type": "file", "path": str(src)}, "sink": "memory",
+    })
+    assert r.status_code == 200
+    body = r.json()
+
+    # окно перекрытия 1h: всё новее (watermark - 1h), т.е. последние 3 часа
+    assert sorted(row["id"] for row in body["preview"]) == [2, 3, 4]
+    assert body["watermark"]["pipeline_key"] == "events_hourly"
+    assert datetime.fromisoformat(body["watermark"]["max_seen"]) == now - timedelta(minutes=30)
+    # прогон в memory ничего не записал — отметка не сдвигается
+    assert calls == []
+
+
+def test_window_is_pushed_down_and_deleted_in_target():
+    window = pipeline_executor.IncrementalWindow("updated_at", datetime(2025, 1, 1, tzinfo=timezone.utc))
+    source = pipeline_executor.push_down_window(
+        {"type": "postgres", "table": "public.orders", "where": "status = 'paid'"}, window)
+    assert source["where"] == "(status = 'paid') AND \"updated_at\" > :wm_lower"
+    assert source["params"] == {"wm_lower": window.lower}
+
+    sql, params = pipeline_executor._postgres_delete("orders", window)
+    assert sql == 'DELETE FROM "orders" WHERE "updated_at" > %(wm_lower)s'
+    assert "toDateTime64('2025-01-01 00:00:00.000000', 6, 'UTC')" in \
+        pipeline_executor._clickhouse_delete("orders", window)
+
+    ids = pipeline_executor.DateFilter({"column": "id", "mode": "incremental", "overlap": 10}, watermark=100)
+    assert ids.lower == 90
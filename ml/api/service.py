@@ -1,10 +1,15 @@
 # ml/api/service.py
+import json
+
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel, Field
-from ml.recommend.orchestrator import make_recommendation
+from ml.recommend.batch import DEFAULT_BATCH_CONCURRENCY, arecommend_batch
+from ml.recommend.orchestrator import amake_recommendation, astream_recommendation
+from ml.recommend.similarity import index_stats
 from ml.generators.ddl import generate_ddl
 
 router = APIRouter(prefix="", tags=["ml"])
@@ -26,6 +31,19 @@ class ReportOut(BaseModel):
 class RecommendIn(BaseModel):
     profile: Dict[str, Any]          # output профайлера
     user_prefs: Optional[Dict[str, Any]] = None
+    latency_budget_ms: Optional[int] = Field(None, ge=0, description="Ждать LLM не дольше; затем — правила")
+
+class RecommendBatchItem(BaseModel):
+    id: Optional[Any] = None          # по умолчанию — позиция в списке
+    profile: Dict[str, Any]
+    user_prefs: Optional[Dict[str, Any]] = None
+
+class RecommendBatchIn(BaseModel):
+    items: List[RecommendBatchItem] = Field(..., min_length=1, max_length=5000)
+    use_llm: bool = True
+    max_concurrency: int = Field(DEFAULT_BATCH_CONCURRENCY, ge=1, le=64,
+                                 description="Сколько групп одновременно ждут LLM")
+    latency_budget_ms: Optional[int] = Field(None, ge=0, description="Бюджет ожидания LLM на группу")
 
 class RecommendOut(BaseModel):
     target_store: str
@@ -33,6 +51,7 @@ class RecommendOut(BaseModel):
     pipeline: Dict[str, Any]
     schedule: Dict[str, Any]
     risks: list[str]
+    source: str = Field("rules", description="llm | similar | rules")
 
 class DDLIn(BaseModel):
     target_store: str
@@ -45,8 +64,39 @@ class DDLOut(BaseModel):
 # --------- ручки ---------
 
 @router.post("/recommend", response_model=RecommendOut)
-def recommend(inp: RecommendIn):
-    return make_recommendation(inp.profile, inp.user_prefs or {}, use_llm=True)
+async def recommend(inp: RecommendIn):
+    # асинхронно: ожидание LLM и паузы между повторами не занимают потоки пула
+    rec = await amake_recommendation(inp.profile, inp.user_prefs or {}, use_llm=True,
+                                     latency_budget_ms=inp.latency_budget_ms)
+    return {**rec, "source": rec.get("_source", "rules")}
+
+@router.post("/recommend/stream", summary="Рекомендация по полям по мере готовности (SSE)", response_model=None)
+async def recommend_stream(inp: RecommendIn) -> StreamingResponse:
+    async def _sse():
+        async for event in astream_recommendation(inp.profile, inp.user_prefs or {}, use_llm=True):
+            data = {k: v for k, v in event.items() if k != "event"}
+            yield f"event: {event['event']}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+    # без буферизации на прокси: поля должны доходить сразу
+    return StreamingResponse(_sse(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.post("/recommend/batch", summary="Рекомендации для многих профилей (NDJSON-стрим)", response_model=None)
+async def recommend_batch(inp: RecommendBatchIn) -> StreamingResponse:
+    items = [item.model_dump(exclude_none=True) for item in inp.items]
+    for pos, item in enumerate(items):
+        item.setdefault("id", pos)
+
+    async def _ndjson():
+        async for line in arecommend_batch(items, use_llm=inp.use_llm, max_concurrency=inp.max_concurrency,
+                                           latency_budget_ms=inp.latency_budget_ms):
+            yield json.dumps(line, ensure_ascii=False, default=str) + "\n"
+
+    return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
+
+@router.get("/recommend/similarity", summary="Порог и доля попаданий индексов похожих рекомендаций")
+def recommend_similarity():
+    return index_stats()
 
 @router.post("/ddl", response_model=DDLOut)
 def ddl(inp: DDLIn):
@@ -2,7 +2,9 @@
 
 def simple_pipeline(profile: dict, target_store: str, hints: dict) -> dict:
     """
-    Возвращает минимальный DAG: Extract -> (опц. FilterByDate) -> Load
+    Возвращает минимальный DAG: Extract -> (опц. FilterByDate) -> Load.
+    FilterByDate инкрементальный: window — только первичная загрузка,
+    дальше читаются строки новее отметки уровня минус overlap.
     """
     dag = [
         {"op": "Extract", "params": {"source": profile.get("source")}}
@@ -11,7 +13,9 @@ def simple_pipeline(profile: dict, target_store: str, hints: dict) -> dict:
     part_col = (hints or {}).get("partition_by")
     if part_col:
         dag.append({"op": "FilterByDate",
-                    "params": {"column": part_col, "window": "last_30d"}})
+                    "params": {"column": part_col, "window": "last_30d",
+                               "mode": "incremental",
+                               "overlap": (hints or {}).get("overlap", "1h")}})
 
     dag.append({"op": "Load",
                 "params": {"target": target_store,
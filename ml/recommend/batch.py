@@ -0,0 +1,155 @@
+"""
+Пакетные рекомендации для сотен профилей (онбординг озера данных).
+
+1. Профили с одинаковым отпечатком (recommendation_cache_key) схлопываются:
+   LLM спрашивается один раз на группу.
+2. Группы, похожие на уже известные (индекс похожих), отдаются сразу.
+3. Профили, которым LLM не нужна (use_llm=false, prefs.use_llm=false или
+   открыт автомат провайдера), решаются правилами за один векторный проход.
+4. Остальные уходят в LLM параллельно: не больше max_concurrency групп
+   одновременно, частоту дополнительно ограничивает общий транспорт.
+
+Результаты отдаются по мере готовности (NDJSON), последней строкой — сводка.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import Counter, OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from ml.recommend import orchestrator
+from ml.recommend.rules import choose_store_batch
+from ml.recommend.similarity import profile_scope, profile_tokens
+from ml.recommend.transport import llm_transport
+
+DEFAULT_BATCH_CONCURRENCY = 8
+
+
+def _line(item_id: Any, rec: Dict[str, Any], group_size: int = 1) -> Dict[str, Any]:
+    return {
+        "type": "recommendation",
+        "id": item_id,
+        "status": "ok",
+        "source": rec.get("_source", "rules"),
+        "deduplicated": group_size > 1,
+        "recommendation": {k: v for k, v in rec.items() if not k.startswith("_")},
+    }
+
+
+def _error(item_id: Any, error: str) -> Dict[str, Any]:
+    return {"type": "recommendation", "id": item_id, "status": "error", "error": error}
+
+
+def _rules_input_error(profile: Dict[str, Any]) -> Optional[str]:
+    """Проверка профиля до векторного прохода: одна плохая строка не должна обрывать поток."""
+    checks, schema = profile.get("checks"), profile.get("schema")
+    if not isinstance(checks, dict) or "rows" not in checks or not isinstance(schema, list):
+        return "нужны checks.rows и schema"
+    try:
+        rows = int(checks["rows"])
+    except (TypeError, ValueError, OverflowError):
+        return f"checks.rows должно быть целым числом, получено {checks['rows']!r}"
+    if not -2**63 <= rows < 2**63:
+        return f"checks.rows вне диапазона int64: {rows}"
+    for i, col in enumerate(schema):
+        if not isinstance(col, dict) or "column" not in col or "dtype" not in col:
+            return f"schema[{i}]: нужны ключи column и dtype"
+    return None
+
+
+async def arecommend_batch(items: List[Dict[str, Any]], use_llm: bool = True,
+                           max_concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+                           latency_budget_ms: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    items — [{"id", "profile", "user_prefs"}]; id по умолчанию — позиция в списке.
+    Строки результата: {"type": "recommendation", "id", "status", "source", ...},
+    в конце {"type": "summary", ...}.
+    """
+    started = time.perf_counter()
+    counts: Counter = Counter()
+    llm_ready = use_llm and llm_transport.available("yandex")
+
+    rule_items: List[tuple] = []
+    groups: "OrderedDict[str, List[tuple]]" = OrderedDict()
+    for pos, item in enumerate(items):
+        item_id = item.get("id", pos)
+        profile, prefs = item.get("profile") or {}, item.get("user_prefs") or {}
+        if not llm_ready or prefs.get("use_llm") is False:
+            rule_items.append((item_id, profile, prefs))
+            continue
+        try:
+            key = orchestrator.recommendation_cache_key(profile, prefs)
+        except Exception as e:
+            counts["error"] += 1
+            yield _error(item_id, f"Некорректный профиль: {e}")
+            continue
+        groups.setdefault(key, []).append((item_id, profile, prefs))
+
+    deduplicated = sum(len(members) - 1 for members in groups.values())
+
+    # похожие на известные — сразу, без LLM
+    for key in list(groups):
+        _, profile, prefs = groups[key][0]
+        match = orchestrator.recommendation_index.lookup(profile_scope(profile, prefs), profile_tokens(profile))
+        if match is None:
+            continue
+        members = groups.pop(key)
+        for item_id, member_profile, member_prefs in members:
+            rec = orchestrator._adapt_recommendation(match.value, member_profile, member_prefs, match.similarity)
+            counts[rec["_source"]] += 1
+            yield _line(item_id, rec, len(members))
+
+    # правила — признаки по профилю, выбор хранилища одним проходом
+    valid = []
+    for item_id, profile, prefs in rule_items:
+        error = _rules_input_error(profile)
+        if error is None:
+            valid.append((item_id, profile, prefs))
+        else:
+            counts["error"] += 1
+            yield _error(item_id, f"Некорректный профиль: {error}")
+    if valid:
+        stores = choose_store_batch([p for _, p, _ in valid], [pr for _, _, pr in valid])
+        for (item_id, profile, prefs), store in zip(valid, stores):
+            rec = orchestrator._rules_recommendation(profile, prefs, store)
+            rec["risks"] = ["LLM не запрашивалась — применены правила"]
+            counts["rules"] += 1
+            yield _line(item_id, rec)
+
+    # LLM — по одному вызову на группу, параллельно под семафором
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _one(members: List[tuple]):
+        _, profile, prefs = members[0]
+        async with semaphore:
+            try:
+                return members, await orchestrator.amake_recommendation(
+                    profile, prefs, use_llm=True, latency_budget_ms=latency_budget_ms), None
+            except Exception as e:
+                return members, None, str(e)
+
+    tasks = [asyncio.create_task(_one(members)) for members in groups.values()]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            members, rec, error = await fut
+            for item_id, _, _ in members:
+                if rec is None:
+                    counts["error"] += 1
+                    yield _error(item_id, error)
+                else:
+                    counts[rec.get("_source", "rules")] += 1
+                    yield _line(item_id, rec, len(members))
+    finally:
+        # клиент отключился или генератор закрыт — не продолжаем звать LLM впустую
+        for task in tasks:
+            task.cancel()
+
+    yield {
+        "type": "summary",
+        "items": len(items),
+        "llm_groups": len(tasks),
+        "deduplicated": deduplicated,
+        "by_source": dict(counts),
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
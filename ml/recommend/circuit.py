@@ -0,0 +1,154 @@
+"""
+Автомат защиты (circuit breaker) для эндпоинта LLM.
+
+closed    — запросы идут; в скользящем окне последних вызовов считаются
+            ошибки и медленные ответы. Доля выше порога (при минимуме
+            вызовов) — переход в open.
+open      — запросы сразу отклоняются, вызывающий уходит на правила;
+            через open_seconds — half-open.
+half-open — пропускается не больше half_open_calls пробных вызовов:
+            успех закрывает автомат, ошибка снова открывает.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+StateListener = Callable[[str, str, str], None]
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_rate: float = 0.5, slow_call_seconds: float = 45.0,
+                 slow_call_rate: float = 0.8, window: int = 20, min_calls: int = 5,
+                 open_seconds: float = 30.0, half_open_calls: int = 1,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._clock = clock
+        self._calls: Deque[Tuple[bool, bool]] = deque(maxlen=window)  # (ошибка, медленный)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trials = 0
+        self._lock = threading.Lock()
+        self.listeners: List[StateListener] = []
+
+    @classmethod
+    def from_env(cls, name: str) -> "CircuitBreaker":
+        # «медленный» — заметно выше обычного p95 провайдера (единицы-десятки секунд):
+        # по умолчанию 3/4 таймаута запроса, иначе автомат открывался бы на штатной нагрузке
+        slow_default = 0.75 * float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+        return cls(
+            name,
+            failure_rate=float(os.getenv("LLM_CB_FAILURE_RATE", "0.5")),
+            slow_call_seconds=float(os.getenv("LLM_CB_SLOW_CALL_SECONDS") or slow_default),
+            slow_call_rate=float(os.getenv("LLM_CB_SLOW_CALL_RATE", "0.8")),
+            window=int(os.getenv("LLM_CB_WINDOW", "20")),
+            min_calls=int(os.getenv("LLM_CB_MIN_CALLS", "5")),
+            open_seconds=float(os.getenv("LLM_CB_OPEN_SECONDS", "30")),
+        )
+
+    # ---------- состояние ----------
+
+    def _set_state(self, new: str) -> Optional[Tuple[str, str]]:
+        old, self._state = self._state, new
+        if new == OPEN:
+            self._opened_at = self._clock()
+        if new != HALF_OPEN:
+            self._trials = 0
+        if new == CLOSED:
+            self._calls.clear()
+        return (old, new) if old != new else None
+
+    def _notify(self, change: Optional[Tuple[str, str]]) -> None:
+        # слушатели вызываются вне блокировки: они могут писать метрики и логи
+        if change is None:
+            return
+        for listener in list(self.listeners):
+            listener(self.name, *change)
+
+    def _cooled_down(self) -> bool:
+        return self._clock() - self._opened_at >= self.open_seconds
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self._cooled_down():
+                return HALF_OPEN
+            return self._state
+
+    def available(self) -> bool:
+        """Пропустит ли автомат запрос сейчас (без резервирования пробного вызова)."""
+        with self._lock:
+            if self._state == OPEN:
+                return self._cooled_down()
+            return self._state == CLOSED or self._trials < self.half_open_calls
+
+    # ---------- вызовы ----------
+
+    def allow(self) -> bool:
+        """Разрешить вызов; в half-open занимает один из пробных слотов."""
+        change = None
+        with self._lock:
+            if self._state == OPEN:
+                if not self._cooled_down():
+                    return False
+                change = self._set_state(HALF_OPEN)
+            if self._state == HALF_OPEN:
+                if self._trials >= self.half_open_calls:
+                    allowed = False
+                else:
+                    self._trials += 1
+                    allowed = True
+            else:
+                allowed = True
+        self._notify(change)
+        return allowed
+
+    def record(self, success: bool, duration: float) -> None:
+        slow = duration >= self.slow_call_seconds
+        change = None
+        with self._lock:
+            if self._state == HALF_OPEN:
+                change = self._set_state(CLOSED if success and not slow else OPEN)
+            elif self._state == CLOSED:
+                self._calls.append((not success, slow))
+                if len(self._calls) >= self.min_calls and self._tripped():
+                    change = self._set_state(OPEN)
+        self._notify(change)
+
+    def release(self) -> None:
+        """Вызов прерван без результата (отмена) — вернуть пробный слот half-open."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._trials:
+                self._trials -= 1
+
+    def _tripped(self) -> bool:
+        n = len(self._calls)
+        failures = sum(1 for failed, _ in self._calls if failed)
+        slow = sum(1 for _, is_slow in self._calls if is_slow)
+        return failures / n >= self.failure_rate or slow / n >= self.slow_call_rate
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            n = len(self._calls)
+            failures = sum(1 for failed, _ in self._calls if failed)
+            slow = sum(1 for _, is_slow in self._calls if is_slow)
+            opened = self._state == OPEN
+            return {
+                "state": HALF_OPEN if opened and self._cooled_down() else self._state,
+                "window_calls": n,
+                "error_rate": round(failures / n, 4) if n else 0.0,
+                "slow_rate": round(slow / n, 4) if n else 0.0,
+                "retry_in_seconds": round(max(0.0, self.open_seconds - (self._clock() - self._opened_at)), 1)
+                if opened else 0.0,
+            }
@@ -0,0 +1,44 @@
+"""
+Гонка LLM с бюджетом задержки: ответ по правилам готов сразу, LLM ждём не
+дольше бюджета. Опоздавший вызов не отменяется — он дорабатывает в фоне и
+наполняет кэши (точный и индекс похожих), чтобы следующий запрос получил
+ответ LLM мгновенно.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Optional, Set, Tuple
+
+# ссылки на фоновые задачи: без них незавершённую задачу может собрать GC
+_background: Set[asyncio.Task] = set()
+
+
+def _finish_late(task: asyncio.Task) -> None:
+    _background.discard(task)
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        print("[LLM LATE ERROR]", error)
+
+
+async def within_budget(aw: Awaitable[Any], budget_seconds: Optional[float]) -> Tuple[Any, bool]:
+    """
+    (результат, False), если aw завершился за budget_seconds (None — без
+    ограничения); ошибка aw пробрасывается. Иначе (None, True), а aw
+    продолжает выполняться в фоне.
+    """
+    if budget_seconds is None:
+        return await aw, False
+    task = asyncio.ensure_future(aw)
+    done, _ = await asyncio.wait({task}, timeout=max(0.0, budget_seconds))
+    if done:
+        return task.result(), False
+    _background.add(task)
+    task.add_done_callback(_finish_late)
+    return None, True
+
+
+def pending_count() -> int:
+    """Сколько опоздавших вызовов LLM ещё выполняется."""
+    return len(_background)
@@ -0,0 +1,92 @@
+"""
+Канонический отпечаток входа LLM-рекомендации: одинаковый для источника,
+который приходит каждый день с тем же набором колонок, но другим числом
+строк и другими примерами. В отпечаток входят имена и типы колонок,
+статистики по корзинам, флаги профиля, настройки пользователя, модель,
+температура и версия шаблона промпта; preview, source и точные счётчики — нет.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+from typing import Any, Dict, List, Optional
+
+
+def rows_bucket(rows: Optional[int]) -> Optional[int]:
+    """Порядок величины числа строк: 0, 1 (1-9), 2 (10-99), ..."""
+    if rows is None:
+        return None
+    rows = int(rows)
+    return 0 if rows <= 0 else int(math.log10(rows)) + 1
+
+
+def null_bucket(nulls: Optional[int], rows: Optional[int]) -> Optional[str]:
+    if nulls is None:
+        return None
+    if not nulls:
+        return "none"
+    if not rows:
+        return "some"
+    ratio = nulls / rows
+    if ratio >= 1:
+        return "all"
+    if ratio < 0.01:
+        return "rare"
+    if ratio < 0.1:
+        return "low"
+    return "high" if ratio >= 0.5 else "medium"
+
+
+def unique_bucket(uniques: Optional[int], rows: Optional[int]) -> Optional[str]:
+    if uniques is None:
+        return None
+    if uniques <= 1:
+        return "constant"
+    if rows and uniques >= rows:
+        return "unique"
+    if uniques <= 20:
+        return "categorical"
+    if not rows:
+        return "many"
+    ratio = uniques / rows
+    if ratio >= 0.9:
+        return "near_unique"
+    return "high" if ratio >= 0.1 else "low"
+
+
+def _columns(profile: Dict[str, Any], rows: Optional[int]) -> List[Dict[str, Any]]:
+    columns = []
+    for col in profile.get("schema") or profile.get("columns") or []:
+        if not isinstance(col, dict):
+            continue
+        columns.append({
+            "name": str(col.get("column", col.get("name", ""))).strip().lower(),
+            "dtype": str(col.get("dtype", "")).lower(),
+            "nulls": null_bucket(col.get("nulls", col.get("null_count")), rows),
+            "uniques": unique_bucket(col.get("uniques", col.get("unique_count")), rows),
+        })
+    return sorted(columns, key=lambda c: c["name"])
+
+
+def canonical_profile(profile: Dict[str, Any]) -> Dict[str, Any]:
+    checks = profile.get("checks") or {}
+    rows = checks.get("rows", profile.get("rows"))
+    return {
+        "columns": _columns(profile, rows),
+        "rows": rows_bucket(rows),
+        "has_time": bool(checks.get("has_time", profile.get("is_time_series", False))),
+    }
+
+
+def recommendation_fingerprint(profile: Dict[str, Any], prefs: Optional[Dict[str, Any]], *,
+                               model: str, temperature: float, prompt_version: str = "") -> str:
+    payload = {
+        "profile": canonical_profile(profile or {}),
+        "prefs": prefs or {},
+        "model": model,
+        "temperature": round(float(temperature), 3),
+        "prompt": prompt_version,
+    }
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
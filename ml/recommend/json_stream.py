@@ -0,0 +1,88 @@
+"""
+Инкрементальный разбор JSON-объекта из потока текста модели.
+
+Модель печатает ответ кусками; поле верхнего уровня отдаётся, как только
+его значение закончилось (после него встретились «,» или закрывающая «}»),
+не дожидаясь конца всего объекта. Вложенные объекты, массивы и строки с
+экранированием отслеживаются посимвольно; уже просмотренный текст повторно
+не сканируется. Текст до первой «{» (например, ```json) пропускается.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class IncrementalJSONObjectParser:
+    def __init__(self) -> None:
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._mode = "start"          # start | key | colon | value | done
+        self._token_start = 0
+        self._key: Optional[str] = None
+        self.fields: Dict[str, Any] = {}
+
+    @property
+    def done(self) -> bool:
+        return self._mode == "done"
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Добавить кусок текста; вернуть поля верхнего уровня, завершившиеся в нём."""
+        if self.done or not chunk:
+            return []
+        self._text += chunk
+        out: List[Tuple[str, Any]] = []
+        text = self._text
+        i = self._pos
+        while i < len(text) and not self.done:
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._mode == "key" and self._depth == 1:
+                        self._key = json.loads(text[self._token_start:i + 1])
+                        self._mode = "colon"
+            elif self._mode == "start":
+                if ch == "{":
+                    self._depth, self._mode = 1, "key"
+            elif ch == '"':
+                self._in_string = True
+                if self._mode == "key" and self._depth == 1:
+                    self._token_start = i
+            elif self._mode == "colon":
+                if ch == ":":
+                    self._mode, self._token_start = "value", i + 1
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    if self._mode == "value":
+                        out.append(self._finish_value(text[self._token_start:i]))
+                    self._mode = "done"
+            elif ch == "," and self._depth == 1 and self._mode == "value":
+                out.append(self._finish_value(text[self._token_start:i]))
+                self._mode = "key"
+            i += 1
+        self._pos = i
+        return out
+
+    def _finish_value(self, raw: str) -> Tuple[str, Any]:
+        value = json.loads(raw)
+        key = self._key or ""
+        self.fields[key] = value
+        self._key = None
+        return key, value
+
+    def result(self) -> Dict[str, Any]:
+        """Весь объект; ValueError, если поток оборвался до закрывающей «}»."""
+        if not self.done:
+            raise ValueError(f"incomplete JSON object: {self._text[-200:]!r}")
+        return dict(self.fields)
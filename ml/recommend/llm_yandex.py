@@ -1,9 +1,13 @@
 from __future__ import annotations
-from typing import Dict, Any, Optional
+from typing import Dict, Any, AsyncIterator, Optional, Tuple
+import asyncio
 import os
 import json
-import time
-import requests
+
+import httpx
+
+from ml.recommend.json_stream import IncrementalJSONObjectParser
+from ml.recommend.transport import LLMTransport, LLMTransportError, llm_transport
 
 # Эндпоинт REST API YandexGPT
 YANDEX_LLM_URL = os.getenv(
@@ -14,6 +18,11 @@ YANDEX_LLM_URL = os.getenv(
 class YandexLLMError(RuntimeError):
     ...
 
+def default_model_uri() -> str:
+    """Модель по умолчанию: YC_MODEL_URI или yandexgpt/latest в каталоге YC_FOLDER_ID."""
+    env_model_uri = os.getenv("YC_MODEL_URI", "").strip()
+    return env_model_uri or f"gpt://{os.getenv('YC_FOLDER_ID', '').strip()}/yandexgpt/latest"
+
 class YandexLLM:
     """
     Мини-клиент для YandexGPT (AI Studio, REST /completion).
@@ -38,6 +47,7 @@ class YandexLLM:
         use_schema: bool = True,
         retries: int = 3,                    # ретраи на 429/5xx
         backoff_sec: float = 1.0,
+        transport: Optional[LLMTransport] = None,
     ):
         folder_id = os.getenv("YC_FOLDER_ID", "").strip()
         self.iam = os.getenv("YC_IAM_TOKEN", "").strip()
@@ -48,12 +58,7 @@ class YandexLLM:
             raise YandexLLMError("Provide YC_IAM_TOKEN or YC_API_KEY")
 
         # Позволяем переопределять модель через ENV
-        env_model_uri = os.getenv("YC_MODEL_URI", "").strip()
-        self.model_uri = (
-            model_uri
-            or env_model_uri
-            or f"gpt://{folder_id}/yandexgpt/latest"
-        )
+        self.model_uri = model_uri or default_model_uri()
 
         self.temperature = float(temperature)
         # API ожидает строку для maxTokens
@@ -62,6 +67,8 @@ class YandexLLM:
         self.use_schema = bool(use_schema)
         self.retries = int(retries)
         self.backoff_sec = float(backoff_sec)
+        # общий пул соединений, семафор и лимит частоты процесса
+        self.transport = transport or llm_transport
 
     # -------------------- internal helpers --------------------
 
@@ -76,48 +83,25 @@ class YandexLLM:
             "Authorization": f"Bearer {self.iam}",
         }
 
-    def _request(self, payload: Dict[str, Any]) -> Dict[str, Any]:
-        last_err_txt = ""
-        for attempt in range(1, self.retries + 1):
-            try:
-                r = requests.post(
-                    YANDEX_LLM_URL,
-                    headers=self._headers(),
-                    json=payload,
-                    timeout=self.timeout,
-                )
-                # Ретраим 429/5xx
-                if r.status_code in (429, 500, 502, 503, 504):
-                    last_err_txt = f"HTTP {r.status_code}: {r.text[:400]}"
-                    time.sleep(self.backoff_sec * attempt)
-                    continue
-                if r.status_code != 200:
-                    raise YandexLLMError(f"HTTP {r.status_code}: {r.text[:400]}")
-                return r.json()
-            except requests.RequestException as e:
-                last_err_txt = str(e)
-                time.sleep(self.backoff_sec * attempt)
-
-        raise YandexLLMError(f"Yandex LLM request failed after retries: {last_err_txt}")
-
-    # -------------------- public API --------------------
+    async def _request(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return await self.transport.post_json(
+                "yandex", YANDEX_LLM_URL, payload, headers=self._headers(),
+                timeout=self.timeout, retries=max(0, self.retries - 1), backoff=self.backoff_sec,
+            )
+        except httpx.HTTPStatusError as e:
+            raise YandexLLMError(f"HTTP {e.response.status_code}: {e.response.text[:400]}")
+        except (LLMTransportError, ValueError) as e:
+            raise YandexLLMError(f"Yandex LLM request failed after retries: {e}")
 
-    def generate_json(
-        self,
-        system: str,
-        user: str,
-        json_schema: Optional[Dict[str, Any]] = None,
-    ) -> Dict[str, Any]:
-        """
-        Возвращает dict (JSON от модели), иначе бросает YandexLLMError.
-        """
+    def _body(self, system: str, user: str, json_schema: Optional[Dict[str, Any]], stream: bool) -> Dict[str, Any]:
         if not isinstance(system, str) or not isinstance(user, str):
             raise YandexLLMError("system and user must be strings")
 
         body = {
             "modelUri": self.model_uri,
             "completionOptions": {
-                "stream": False,
+                "stream": stream,
                 "temperature": self.temperature,
                 "maxTokens": self.max_tokens,
                 # отключаем reasoning, чтобы не тратить лимиты впустую
@@ -134,8 +118,20 @@ class YandexLLM:
             body["jsonSchema"] = {"schema": json_schema}
         else:
             body["jsonObject"] = True
+        return body
+
+    # -------------------- public API --------------------
 
-        data = self._request(body)
+    async def agenerate_json(
+        self,
+        system: str,
+        user: str,
+        json_schema: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Возвращает dict (JSON от модели), иначе бросает YandexLLMError.
+        """
+        data = await self._request(self._body(system, user, json_schema, stream=False))
 
         # ожидаем формат: result.alternatives[0].message.text -> JSON-строка
         try:
@@ -149,8 +145,97 @@ class YandexLLM:
             # на всякий случай логируем первые символы, но не шумим слишком сильно
             raise YandexLLMError(f"Model didn't return valid JSON: {text[:200]}")
 
+    async def astream_json(
+        self,
+        system: str,
+        user: str,
+        json_schema: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Потоковый режим (stream=true): провайдер шлёт NDJSON, в каждой строке
+        result.alternatives[0].message.text — накопленный текст ответа.
+        Отдаёт поля верхнего уровня JSON по мере их завершения; если поток
+        оборвался до конца объекта — YandexLLMError.
+        """
+        parser = IncrementalJSONObjectParser()
+        seen = ""
+        try:
+            async for line in self.transport.stream_lines(
+                "yandex", YANDEX_LLM_URL, self._body(system, user, json_schema, stream=True),
+                headers=self._headers(), timeout=self.timeout,
+                retries=max(0, self.retries - 1), backoff=self.backoff_sec,
+            ):
+                try:
+                    text = json.loads(line)["result"]["alternatives"][0]["message"]["text"]
+                except Exception as e:
+                    raise YandexLLMError(f"Bad stream chunk: {e}; raw={line[:400]}")
+                # текст накопительный; если провайдер прислал только прирост — дописываем его
+                if text.startswith(seen):
+                    delta, seen = text[len(seen):], text
+                else:
+                    delta, seen = text, seen + text
+                for field in parser.feed(delta):
+                    yield field
+        except httpx.HTTPStatusError as e:
+            raise YandexLLMError(f"HTTP {e.response.status_code}")
+        except (LLMTransportError, ValueError) as e:
+            raise YandexLLMError(f"Yandex LLM stream failed: {e}")
+        if not parser.done:
+            raise YandexLLMError(f"Model stream ended before JSON was complete: {seen[-200:]}")
+
+    def generate_json(
+        self,
+        system: str,
+        user: str,
+        json_schema: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Синхронная версия для скриптов; из работающего event loop — agenerate_json."""
+        async def _once() -> Dict[str, Any]:
+            try:
+                return await self.agenerate_json(system, user, json_schema)
+            finally:
+                await self.transport.aclose()
+        return asyncio.run(_once())
+
 # -------------------- удобная обёртка (совместимость) --------------------
 
+async def ayandex_llm_json(
+    system: str,
+    user: str,
+    json_schema: Optional[Dict[str, Any]] = None,
+    *,
+    temperature: float = 0.2,
+    max_tokens: int = 1200,
+    use_schema: bool = True,
+) -> Dict[str, Any]:
+    """Один асинхронный вызов через общий транспорт."""
+    client = YandexLLM(
+        temperature=temperature,
+        max_tokens=max_tokens,
+        use_schema=use_schema,
+    )
+    return await client.agenerate_json(system=system, user=user, json_schema=json_schema)
+
+
+async def ayandex_llm_stream(
+    system: str,
+    user: str,
+    json_schema: Optional[Dict[str, Any]] = None,
+    *,
+    temperature: float = 0.2,
+    max_tokens: int = 1200,
+    use_schema: bool = True,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """Потоковый вызов через общий транспорт: поля JSON по мере готовности."""
+    client = YandexLLM(
+        temperature=temperature,
+        max_tokens=max_tokens,
+        use_schema=use_schema,
+    )
+    async for field in client.astream_json(system=system, user=user, json_schema=json_schema):
+        yield field
+
+
 def yandex_llm_json(
     system: str,
     user: str,
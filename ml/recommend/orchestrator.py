@@ -1,24 +1,49 @@
 from __future__ import annotations
-from typing import Any, Dict
+from typing import Any, AsyncIterator, Dict
+from functools import lru_cache
 from pathlib import Path
+import asyncio
+import copy
+import hashlib
 import json
+import os
 
-from ml.recommend.llm_yandex import yandex_llm_json, YandexLLMError
+from ml.recommend.fingerprint import recommendation_fingerprint
+from ml.recommend.llm_yandex import ayandex_llm_json, ayandex_llm_stream, default_model_uri, YandexLLMError
+from ml.recommend.transport import llm_transport
 from ml.recommend.rules import choose_store, ddl_hints
 from ml.generators.pipeline import simple_pipeline
 from ml.generators.schedule import schedule as sched_rule
+from ml.recommend.deadline import within_budget
 from ml.recommend.postprocess import normalize_recommendation
+from ml.recommend.prompt_budget import DEFAULT_PROMPT_TOKEN_BUDGET, compact_profile, dumps_compact, estimate_tokens
+from ml.recommend.similarity import SimilarityIndex, profile_scope, profile_tokens
+
+try:
+    from app.services.cache_service import cache_llm
+except ImportError:  # ml без бэкенда — без кэша
+    def cache_llm(ttl: int = 3600, key_builder=None):
+        return lambda func: func
 
 # каталог с промптами/схемами
 PROMPTS_DIR = Path(__file__).resolve().parent.parent / "prompts"
 
-def _render_prompt(profile: dict, prefs: dict) -> tuple[str, str, dict | None]:
+LLM_TEMPERATURE = 0.2
+# бюджет всего промпта (SYSTEM + USER) в токенах; профиль сжимается под остаток
+PROMPT_TOKEN_BUDGET = DEFAULT_PROMPT_TOKEN_BUDGET
+# одинаковый по схеме источник приходит ежедневно — кэшируем на неделю
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# ответы LLM для похожих схем (варианты одной выгрузки) переиспользуются без вызова
+recommendation_index = SimilarityIndex("recommendations")
+
+@lru_cache(maxsize=1)
+def _template() -> tuple[str, str, dict | None]:
     """
-    Читает текстовый шаблон промпта из ml/prompts/recommendation.txt и
-    извлекает блоки SYSTEM/USER. В USER подставляет JSON профиля/настроек.
+    Шаблон ml/prompts/recommendation.txt, разобранный на блоки SYSTEM/USER,
+    и JSON-схема ответа; читаются с диска один раз на процесс.
     """
-    tpl_path = PROMPTS_DIR / "recommendation.txt"
-    tpl = tpl_path.read_text(encoding="utf-8")
+    tpl = (PROMPTS_DIR / "recommendation.txt").read_text(encoding="utf-8")
 
     # Разделители в файле: "### SYSTEM" и "### USER"
     try:
@@ -30,44 +55,65 @@ def _render_prompt(profile: dict, prefs: dict) -> tuple[str, str, dict | None]:
         system = "Следуй инструкции. Верни ТОЛЬКО JSON строго по схеме."
         user = tpl
 
-    user = (
-        user
-        .replace("{{PROFILE_JSON}}", json.dumps(profile, ensure_ascii=False))
-        .replace("{{PREFS_JSON}}",   json.dumps(prefs or {}, ensure_ascii=False))
-    )
-
     # JSON-схема для строгого ответа
     schema_path = PROMPTS_DIR / "recommendation_schema.json"
     schema = json.loads(schema_path.read_text(encoding="utf-8")) if schema_path.exists() else None
     return system, user, schema
 
-def make_recommendation(profile: dict, user_prefs: dict | None, use_llm: bool = True) -> Dict[str, Any]:
-    prefs = user_prefs or {}
-    if use_llm:
-        try:
-            system, user, schema = _render_prompt(profile, prefs)
-            rec = yandex_llm_json(system=system, user=user, json_schema=schema)
+def _render_prompt(profile: dict, prefs: dict) -> tuple[str, str, dict | None]:
+    """
+    Подставляет в USER-блок шаблона JSON профиля/настроек. Профиль сжимается
+    так, чтобы весь промпт уложился в PROMPT_TOKEN_BUDGET.
+    """
+    system, user, schema = _template()
+    prefs_json = json.dumps(prefs or {}, ensure_ascii=False)
+    fixed = estimate_tokens(system) + estimate_tokens(user) + estimate_tokens(prefs_json)
+    compacted, _ = compact_profile(profile, max(0, PROMPT_TOKEN_BUDGET - fixed), prefs)
 
-            # нормализуем ответ от LLM
-            rec = normalize_recommendation(rec)
+    user = (
+        user
+        .replace("{{PROFILE_JSON}}", dumps_compact(compacted))
+        .replace("{{PREFS_JSON}}",   prefs_json)
+    )
+    return system, user, schema
 
-            # мини-валидация ключей
-            for k in ("target_store", "ddl_hints", "pipeline", "schedule", "risks"):
-                if k not in rec:
-                    raise ValueError(f"missing key: {k}")
-            if rec["target_store"] not in {"postgres", "clickhouse", "hdfs"}:
-                raise ValueError("bad target_store")
+@lru_cache(maxsize=1)
+def _prompt_version() -> str:
+    """Хэш шаблона, схемы и бюджета: правка промпта инвалидирует кэш ответов."""
+    digest = hashlib.sha256(str(PROMPT_TOKEN_BUDGET).encode())
+    for name in ("recommendation.txt", "recommendation_schema.json"):
+        path = PROMPTS_DIR / name
+        if path.exists():
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
 
-            rec["_source"] = "llm"
-            return rec
+def recommendation_cache_key(profile: dict, prefs: dict) -> str:
+    return recommendation_fingerprint(profile, prefs, model=default_model_uri(),
+                                      temperature=LLM_TEMPERATURE, prompt_version=_prompt_version())
 
-        except (YandexLLMError, ValueError) as e:
-            print("[LLM ERROR]", e)
-            # уходим в fallback
+def _validated(rec: Dict[str, Any]) -> Dict[str, Any]:
+    # нормализуем ответ от LLM
+    rec = normalize_recommendation(rec)
 
+    # мини-валидация ключей
+    for k in ("target_store", "ddl_hints", "pipeline", "schedule", "risks"):
+        if k not in rec:
+            raise ValueError(f"missing key: {k}")
+    if rec["target_store"] not in {"postgres", "clickhouse", "hdfs"}:
+        raise ValueError("bad target_store")
 
-    # Fallback: правила
-    store = choose_store(profile, prefs)
+    rec["_source"] = "llm"
+    return rec
+
+@cache_llm(ttl=LLM_CACHE_TTL, key_builder=recommendation_cache_key)
+async def _llm_recommendation(profile: dict, prefs: dict) -> Dict[str, Any]:
+    """Вызов LLM и проверка ответа; кэшируется только успешный результат."""
+    system, user, schema = _render_prompt(profile, prefs)
+    rec = await ayandex_llm_json(system=system, user=user, json_schema=schema, temperature=LLM_TEMPERATURE)
+    return _validated(rec)
+
+def _rules_recommendation(profile: dict, prefs: dict, store: str | None = None) -> Dict[str, Any]:
+    store = store or choose_store(profile, prefs)
     hints = ddl_hints(profile, prefs)
     pipe  = simple_pipeline(profile, store, hints)
     sch   = sched_rule(prefs.get("latency_sla"))
@@ -77,4 +123,134 @@ def make_recommendation(profile: dict, user_prefs: dict | None, use_llm: bool =
         "pipeline": pipe,
         "schedule": sch,
         "risks": ["LLM недоступна/ответ невалиден — применены правила"],
+        "_source": "rules",
     }
+
+async def _llm_and_index(profile: dict, prefs: dict, scope: str, tokens) -> Dict[str, Any]:
+    rec = await _llm_recommendation(profile, prefs)
+    recommendation_index.add(scope, tokens, rec)
+    return rec
+
+def _adapt_recommendation(rec: Dict[str, Any], profile: dict, prefs: dict, similarity: float) -> Dict[str, Any]:
+    """
+    Рекомендация похожего источника под текущий профиль: колонки из
+    ddl_hints, которых здесь нет, заменяются на выбранные правилами.
+    """
+    out = copy.deepcopy(rec)
+    columns = {str(c.get("column", "")).lower() for c in profile.get("schema") or []}
+    fresh = ddl_hints(profile, prefs)
+    hints = dict(out.get("ddl_hints") or {})
+    for key in ("primary_key", "partition_by"):
+        if hints.get(key) and str(hints[key]).lower() not in columns:
+            hints[key] = fresh.get(key)
+    order_by = [c for c in hints.get("order_by") or [] if str(c).lower() in columns]
+    hints["order_by"] = order_by or fresh["order_by"]
+    out["ddl_hints"] = hints
+
+    out = normalize_recommendation(out)
+    out["risks"] = list(out.get("risks") or []) + [
+        f"Рекомендация похожего источника (сходство схемы {similarity:.2f}) без вызова LLM"
+    ]
+    out["_source"] = "similar"
+    out["_similarity"] = round(similarity, 4)
+    return out
+
+async def amake_recommendation(profile: dict, user_prefs: dict | None, use_llm: bool = True,
+                              latency_budget_ms: int | None = None) -> Dict[str, Any]:
+    """
+    Рекомендация: похожая из индекса, иначе LLM, иначе правила (_source).
+    При открытом автомате провайдера LLM не вызывается.
+    latency_budget_ms — ждать LLM не дольше бюджета и вернуть правила;
+    опоздавший ответ LLM попадёт в кэш для следующего запроса.
+    """
+    prefs = user_prefs or {}
+    # открытый автомат YandexGPT — сразу правила, без рендера промпта и ожидания
+    if use_llm and llm_transport.available("yandex"):
+        scope, tokens = profile_scope(profile, prefs), profile_tokens(profile)
+        match = recommendation_index.lookup(scope, tokens)
+        if match is not None:
+            return _adapt_recommendation(match.value, profile, prefs, match.similarity)
+        budget = None if latency_budget_ms is None else latency_budget_ms / 1000
+        try:
+            rec, late = await within_budget(_llm_and_index(profile, prefs, scope, tokens), budget)
+            if not late:
+                # копия: закэшированный объект не должен меняться у вызывающего
+                return copy.deepcopy(rec)
+            rules = _rules_recommendation(profile, prefs)
+            rules["risks"] = [f"LLM не ответила за {latency_budget_ms} мс — применены правила"]
+            return rules
+        except (YandexLLMError, ValueError) as e:
+            print("[LLM ERROR]", e)
+            # уходим в fallback
+
+    # Fallback: правила
+    return _rules_recommendation(profile, prefs)
+
+# порядок полей в ответе модели (и в схеме): клиент видит target_store первым
+STREAM_FIELDS = ("target_store", "ddl_hints", "pipeline", "schedule", "risks")
+
+async def _cached_llm_answer(profile: dict, prefs: dict) -> Dict[str, Any] | None:
+    cache = getattr(_llm_recommendation, "cache", None)
+    if cache is None:
+        return None
+    return await cache.get(_llm_recommendation.cache_key(profile, prefs))
+
+async def _remember(profile: dict, prefs: dict, rec: Dict[str, Any]) -> None:
+    """Ответ, собранный из потока, — в те же кэши, что и обычный вызов."""
+    recommendation_index.add(profile_scope(profile, prefs), profile_tokens(profile), rec)
+    cache = getattr(_llm_recommendation, "cache", None)
+    if cache is not None:
+        await cache.set(_llm_recommendation.cache_key(profile, prefs), rec, _llm_recommendation.cache_ttl)
+
+async def astream_recommendation(profile: dict, user_prefs: dict | None,
+                                 use_llm: bool = True) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Потоковая рекомендация. События:
+      {"event": "field", "name", "value"} — поле верхнего уровня, как только готово;
+      {"event": "done", "source", "recommendation"} — итог (нормализован, проверен).
+    Из кэша, индекса похожих и правил поля отдаются сразу. Если поток LLM
+    оборвался, поля правил переотправляются и перекрывают присланные ранее.
+    """
+    prefs = user_prefs or {}
+    sent: Dict[str, Any] = {}
+    rec: Dict[str, Any] | None = None
+    if use_llm and llm_transport.available("yandex"):
+        match = recommendation_index.lookup(profile_scope(profile, prefs), profile_tokens(profile))
+        if match is not None:
+            rec = _adapt_recommendation(match.value, profile, prefs, match.similarity)
+        else:
+            cached = await _cached_llm_answer(profile, prefs)
+            rec = copy.deepcopy(cached) if cached is not None else None
+        if rec is None:
+            partial: Dict[str, Any] = {}
+            try:
+                system, user, schema = _render_prompt(profile, prefs)
+                async for name, value in ayandex_llm_stream(system=system, user=user, json_schema=schema,
+                                                            temperature=LLM_TEMPERATURE):
+                    partial[name] = value
+                    if name in STREAM_FIELDS:
+                        # pipeline/schedule сразу в каноническом виде
+                        sent[name] = normalize_recommendation(partial).get(name, value)
+                        yield {"event": "field", "name": name, "value": sent[name]}
+                rec = _validated(partial)
+                await _remember(profile, prefs, rec)
+            except (YandexLLMError, ValueError) as e:
+                print("[LLM STREAM ERROR]", e)
+                rec = None
+
+    if rec is None:
+        rec = _rules_recommendation(profile, prefs)
+    for name in STREAM_FIELDS:
+        if name in rec and sent.get(name) != rec[name]:
+            yield {"event": "field", "name": name, "value": rec[name]}
+    yield {"event": "done", "source": rec.get("_source", "rules"),
+           "recommendation": {k: v for k, v in rec.items() if not k.startswith("_")}}
+
+def make_recommendation(profile: dict, user_prefs: dict | None, use_llm: bool = True) -> Dict[str, Any]:
+    """Синхронная обёртка для скриптов (demo_recommend); в API — amake_recommendation."""
+    async def _once() -> Dict[str, Any]:
+        try:
+            return await amake_recommendation(profile, user_prefs, use_llm)
+        finally:
+            await llm_transport.aclose()
+    return asyncio.run(_once())
@@ -86,6 +86,10 @@ def normalize_recommendation(rec: Dict[str, Any]) -> Dict[str, Any]:
         elif op == "FilterByDate":
             clean_dag.append({"op": "FilterByDate", "params": params or {}})
 
+        elif op == "Transform" and params.get("steps"):
+            # декларативные шаги (rename/cast/filter/...) исполняет backend transform_service
+            clean_dag.append({"op": "Transform", "params": {"steps": list(params["steps"])}})
+
         elif op == "Load":
             # на всякий случай гарантируем target/table
             target = params.get("target")
@@ -94,7 +98,12 @@ def normalize_recommendation(rec: Dict[str, Any]) -> Dict[str, Any]:
                 target = target_store
             if not table:
                 table = table_name
-            clean_dag.append({"op": "Load", "params": {"target": target, "table": table}})
+            load_params = {"target": target, "table": table}
+            if params.get("mode"):
+                load_params["mode"] = params["mode"]  # append | replace_partitions | merge
+            if params.get("keys"):
+                load_params["keys"] = list(params["keys"])  # ключ слияния для mode=merge
+            clean_dag.append({"op": "Load", "params": load_params})
 
     # 3b) Гарантируем, что есть шаг Load
     have_load = any(it.get("op") == "Load" for it in clean_dag)
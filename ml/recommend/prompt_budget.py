@@ -0,0 +1,169 @@
+"""
+Сжатие профиля под бюджет токенов промпта.
+
+Профиль широкой таблицы (сотни колонок) целиком в промпте — это долгий
+time-to-first-token и обрезка ответа по max_tokens. Уровни сжатия
+применяются по очереди, пока оценка не уложится в бюджет:
+
+  0 — как есть, компактный JSON без отступов;
+  1 — без примеров (preview, sample_data, example), статистики округлены;
+  2 — однотипные колонки вида metric_001..metric_600 свёрнуты в группы;
+  3 — ключевые колонки (id, даты, primary_key) поимённо, остальные — сводкой по типам;
+  4 — ключевые колонки без статистик и число колонок каждого типа.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ml.recommend.similarity import dtype_family
+
+DEFAULT_PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "6000"))
+
+_SAMPLE_KEYS = ("preview", "sample_data")
+_COLUMN_DROP_KEYS = ("example", "confidence_intervals", "is_estimated")
+_KEY_NAME_RE = re.compile(r"(^id$|_id$|^id_|date|time|_ts$|^ts$|created|updated)", re.IGNORECASE)
+_MAX_KEY_COLUMNS = 20
+_GROUP_MIN_SIZE = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка: ~4 символа латиницы/JSON или ~2.5 символа кириллицы на токен."""
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return math.ceil((len(text) - non_ascii) / 4 + non_ascii / 2.5)
+
+
+def dumps_compact(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _round(value: Any) -> Any:
+    if isinstance(value, float):
+        return float(f"{value:.3g}") if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: _round(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_round(v) for v in value]
+    return value
+
+
+def _columns_key(profile: Dict[str, Any]) -> str:
+    # профайлер ml отдаёт "schema" ({column, ...}), бэкенд — "columns" ({name, ...})
+    return "schema" if "schema" in profile else "columns"
+
+
+def _name(col: Dict[str, Any]) -> str:
+    return str(col.get("column", col.get("name", "")))
+
+
+def _name_key(col: Dict[str, Any]) -> str:
+    return "column" if "column" in col else "name"
+
+
+def _stat(col: Dict[str, Any], *keys: str) -> Optional[int]:
+    for key in keys:
+        if col.get(key) is not None:
+            return col[key]
+    return None
+
+
+def key_columns(columns: Iterable[Dict[str, Any]], prefs: Optional[Dict[str, Any]] = None) -> List[str]:
+    """Колонки, которые модель выбирает в primary_key/partition_by/order_by — их не сворачиваем."""
+    wanted = {str(v).lower() for v in (prefs or {}).values() if isinstance(v, str)}
+    out = [_name(c) for c in columns if _name(c).lower() in wanted or _KEY_NAME_RE.search(_name(c))]
+    return out[:_MAX_KEY_COLUMNS]
+
+
+def _strip_column(col: Dict[str, Any]) -> Dict[str, Any]:
+    return _round({k: v for k, v in col.items() if k not in _COLUMN_DROP_KEYS})
+
+
+def _group_columns(columns: List[Dict[str, Any]], keep: set) -> List[Dict[str, Any]]:
+    """Колонки с одинаковым шаблоном имени (цифры -> #) и семейством типа — одной записью."""
+    groups: "OrderedDict[Tuple[str, str], List[Dict[str, Any]]]" = OrderedDict()
+    for col in columns:
+        name = _name(col)
+        pattern = re.sub(r"\d+", "#", name)
+        key = (pattern, dtype_family(col.get("dtype", ""))) if "#" in pattern and name not in keep else (name, "")
+        groups.setdefault(key, []).append(col)
+
+    out = []
+    for (pattern, family), cols in groups.items():
+        if family == "" or len(cols) < _GROUP_MIN_SIZE:
+            out.extend(cols)
+            continue
+        nulls = [n for n in (_stat(c, "nulls", "null_count") for c in cols) if n is not None]
+        uniques = [u for u in (_stat(c, "uniques", "unique_count") for c in cols) if u is not None]
+        group = {
+            _name_key(cols[0]): pattern,
+            "dtype": family,
+            "count": len(cols),
+            "range": [_name(cols[0]), _name(cols[-1])],
+        }
+        if nulls:
+            group["max_nulls"] = max(nulls)
+        if uniques:
+            group["max_uniques"] = max(uniques)
+        out.append(group)
+    return out
+
+
+def _by_type(columns: List[Dict[str, Any]], examples: int) -> List[Dict[str, Any]]:
+    summary: "OrderedDict[str, List[str]]" = OrderedDict()
+    for col in columns:
+        summary.setdefault(dtype_family(col.get("dtype", "")), []).append(_name(col))
+    return [{"dtype": family, "count": len(names), "examples": names[:examples]}
+            for family, names in summary.items()]
+
+
+def _levels(profile: Dict[str, Any], prefs: Optional[Dict[str, Any]]):
+    list_key = _columns_key(profile)
+    columns = [c for c in profile.get(list_key) or [] if isinstance(c, dict)]
+    keys = key_columns(columns, prefs)
+    keep = set(keys)
+
+    yield profile
+
+    base = {k: v for k, v in profile.items() if k not in _SAMPLE_KEYS}
+    stripped = [_strip_column(c) for c in columns]
+    level1 = _round(dict(base, **{list_key: stripped}))
+    yield level1
+
+    yield dict(level1, **{list_key: _group_columns(stripped, keep)})
+
+    key_cols = [c for c in stripped if _name(c) in keep]
+    rest = [c for c in stripped if _name(c) not in keep]
+    yield dict(level1, **{list_key: key_cols, "other_columns": _by_type(rest, examples=5),
+                          "columns_total": len(columns)})
+
+    yield dict(level1, **{list_key: [{_name_key(c): _name(c), "dtype": c.get("dtype")} for c in key_cols],
+                          "other_columns": _by_type(rest, examples=0), "columns_total": len(columns)})
+
+
+def compact_profile(profile: Dict[str, Any], budget_tokens: int = DEFAULT_PROMPT_TOKEN_BUDGET,
+                    prefs: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    """
+    Первый уровень сжатия, чей компактный JSON укладывается в budget_tokens
+    (иначе — самый сжатый). Возвращает профиль и {level, tokens, original_tokens}.
+    """
+    original_tokens = None
+    compacted, tokens, level = profile, 0, 0
+    for level, compacted in enumerate(_levels(profile, prefs)):
+        tokens = estimate_tokens(dumps_compact(compacted))
+        if original_tokens is None:
+            original_tokens = tokens
+        if tokens <= budget_tokens:
+            break
+    return compacted, {"level": level, "tokens": tokens, "original_tokens": original_tokens or tokens}
+
+
+def compact_columns_json(columns: List[Dict[str, Any]], budget_tokens: int = DEFAULT_PROMPT_TOKEN_BUDGET) -> str:
+    """Список колонок для текстовых промптов LLMService: JSON, сжатый под бюджет."""
+    compacted, _ = compact_profile({"columns": columns}, budget_tokens)
+    if set(compacted) == {"columns"}:
+        return dumps_compact(compacted["columns"])
+    return dumps_compact(compacted)
@@ -1,4 +1,6 @@
 # ml/recommend/rules.py
+import numpy as np
+
 def _count_types(schema):
     n_num = sum(1 for c in schema if any(str(c["dtype"]).startswith(t) for t in ("int","float","decimal")))
     n_dt  = sum(1 for c in schema if "datetime" in str(c["dtype"]).lower()
@@ -16,6 +18,18 @@ def choose_store(profile: dict, prefs: dict) -> str:
     if rows >= 1_000_000 or has_time or n_dt > 0: return "clickhouse"
     return "postgres"
 
+def choose_store_batch(profiles: list, prefs_list: list) -> list:
+    """choose_store для пачки профилей: признаки собираются по профилю, решение — одним проходом numpy."""
+    rows = np.array([int(p["checks"]["rows"]) for p in profiles], dtype=np.int64)
+    has_time = np.array([bool(p["checks"].get("has_time", False)) for p in profiles])
+    n_dt = np.array([_count_types(p["schema"])[1] for p in profiles], dtype=np.int64)
+    oltp = np.array([(prefs or {}).get("mode") == "oltp" for prefs in prefs_list])
+    return np.select(
+        [oltp, rows >= 5_000_000, (rows >= 1_000_000) | has_time | (n_dt > 0)],
+        ["postgres", "hdfs", "clickhouse"],
+        default="postgres",
+    ).tolist()
+
 def ddl_hints(profile: dict, prefs: dict) -> dict:
     cols = [c["column"] for c in profile["schema"]]
     pk = (prefs or {}).get("primary_key") or ("id" if any(c.lower()=="id" for c in cols) else None)
@@ -0,0 +1,230 @@
+"""
+Локальный индекс прошлых рекомендаций для «родственных» источников:
+ежемесячные выгрузки, файлы по регионам — та же схема с мелкими отличиями.
+
+Признаки профиля — токены имён и типов колонок; по ним MinHash-сигнатура,
+а LSH (полосы сигнатуры) даёт кандидатов за O(число полос) без перебора
+всего индекса. Кандидат принимается, если точный коэффициент Жаккара
+токенов не ниже порога. Размер (порядок числа строк), признак временного
+ряда и настройки пользователя входят в «область» (scope): выбор хранилища
+зависит от них скачком, поэтому источники разного масштаба не смешиваются.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ml.recommend.fingerprint import rows_bucket
+
+DEFAULT_THRESHOLD = float(os.getenv("RECOMMEND_SIMILARITY_THRESHOLD", "0.8"))
+DEFAULT_MAX_ENTRIES = int(os.getenv("RECOMMEND_INDEX_MAX_ENTRIES", "5000"))
+
+# все индексы процесса — для отдачи статистики одной ручкой
+_REGISTRY: Dict[str, "SimilarityIndex"] = {}
+
+
+@lru_cache(maxsize=65536)
+def _hash64(token: str) -> int:
+    return struct.unpack("<Q", hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest())[0]
+
+
+def _permutations(num_perm: int, seed: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Коэффициенты multiply-shift хэшей (a*h + b) mod 2^64 >> 32, a нечётное;
+    детерминированы — сигнатуры совместимы между перезапусками.
+    """
+    a = np.array([_hash64(f"minhash-a-{seed}-{i}") | 1 for i in range(num_perm)], dtype=np.uint64)
+    b = np.array([_hash64(f"minhash-b-{seed}-{i}") for i in range(num_perm)], dtype=np.uint64)
+    return a[:, None], b[:, None]
+
+
+def dtype_family(dtype: Any) -> str:
+    """Семейство типа: int32/int64 или float32/float64 одной выгрузки считаем одним и тем же."""
+    d = str(dtype).lower()
+    for family in ("datetime", "date", "bool", "int", "float", "decimal"):
+        if family in d:
+            return family
+    return "str" if d in {"object", "string", "str", "text"} or "char" in d else d
+
+
+def profile_tokens(profile: Dict[str, Any]) -> FrozenSet[str]:
+    """Токены схемы: имя колонки, её семейство типа и пара имя:тип."""
+    tokens = set()
+    for col in profile.get("schema") or profile.get("columns") or []:
+        if not isinstance(col, dict):
+            continue
+        name = str(col.get("column", col.get("name", ""))).strip().lower()
+        family = dtype_family(col.get("dtype", ""))
+        tokens.update({f"col:{name}", f"type:{family}", f"col_type:{name}:{family}"})
+    return frozenset(tokens)
+
+
+def text_tokens(text: str) -> FrozenSet[str]:
+    return frozenset(f"w:{w}" for w in re.findall(r"\w+", (text or "").lower()))
+
+
+def profile_scope(profile: Dict[str, Any], prefs: Optional[Dict[str, Any]]) -> str:
+    checks = profile.get("checks") or {}
+    rows = checks.get("rows", profile.get("rows"))
+    has_time = bool(checks.get("has_time", profile.get("is_time_series", False)))
+    prefs_part = ",".join(f"{k}={prefs[k]}" for k in sorted(prefs or {}))
+    return f"rows={rows_bucket(rows)}|time={has_time}|{prefs_part}"
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+@dataclass
+class SimilarMatch:
+    value: Any
+    similarity: float
+    tokens: FrozenSet[str]
+
+
+@dataclass
+class _Entry:
+    scope: str
+    tokens: FrozenSet[str]
+    bands: Tuple[Tuple[int, ...], ...]
+    value: Any
+
+
+@dataclass
+class _Stats:
+    lookups: int = 0
+    hits: int = 0
+    lookup_seconds: float = 0.0
+    evictions: int = 0
+    last_similarity: Optional[float] = None
+
+
+class SimilarityIndex:
+    """
+    MinHash/LSH-индекс: num_perm = bands * rows_per_band. Вероятность
+    попасть в кандидаты при сходстве s — 1 - (1 - s^rows)^bands; для
+    16x4 это ~0.98 при s=0.8 и ~0.23 при s=0.4. Хранит не больше
+    max_entries записей, вытесняя давно не использованные.
+    """
+
+    def __init__(self, name: str, threshold: float = DEFAULT_THRESHOLD, bands: int = 16,
+                 rows_per_band: int = 4, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.name = name
+        self.threshold = threshold
+        self.bands = bands
+        self.rows_per_band = rows_per_band
+        self.max_entries = max_entries
+        self._perms = _permutations(bands * rows_per_band)
+        self._entries: "OrderedDict[Tuple[str, FrozenSet[str]], _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], set] = {}
+        self._stats = _Stats()
+        self._lock = threading.Lock()
+        _REGISTRY[name] = self
+
+    # ---------- сигнатуры ----------
+
+    def signature(self, tokens: Iterable[str]) -> List[int]:
+        hashes = np.array([_hash64(t) for t in tokens] or [0], dtype=np.uint64)
+        a, b = self._perms
+        # матрица num_perm x число токенов; умножение uint64 по модулю 2^64 — это и нужно
+        return ((a * hashes + b) >> np.uint64(32)).min(axis=1).tolist()
+
+    def _bands(self, tokens: FrozenSet[str]) -> Tuple[Tuple[int, ...], ...]:
+        sig = self.signature(sorted(tokens))
+        r = self.rows_per_band
+        return tuple(tuple(sig[i * r:(i + 1) * r]) for i in range(self.bands))
+
+    # ---------- операции ----------
+
+    def add(self, scope: str, tokens: FrozenSet[str], value: Any) -> None:
+        key = (scope, tokens)
+        bands = self._bands(tokens)
+        with self._lock:
+            if key in self._entries:
+                self._entries[key].value = value
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = _Entry(scope, tokens, bands, value)
+            for i, band in enumerate(bands):
+                self._buckets.setdefault((scope, i, band), set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        key, entry = self._entries.popitem(last=False)
+        for i, band in enumerate(entry.bands):
+            bucket = self._buckets.get((entry.scope, i, band))
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[(entry.scope, i, band)]
+        self._stats.evictions += 1
+
+    def lookup(self, scope: str, tokens: FrozenSet[str],
+               threshold: Optional[float] = None) -> Optional[SimilarMatch]:
+        """Самая похожая запись той же области со сходством >= threshold либо None."""
+        started = time.perf_counter()
+        threshold = self.threshold if threshold is None else threshold
+        bands = self._bands(tokens)
+        best: Optional[_Entry] = None
+        best_score = -1.0
+        with self._lock:
+            candidates = set()
+            for i, band in enumerate(bands):
+                candidates.update(self._buckets.get((scope, i, band), ()))
+            for key in candidates:
+                entry = self._entries[key]
+                score = jaccard(tokens, entry.tokens)
+                if score > best_score:
+                    best, best_score = entry, score
+            hit = best is not None and best_score >= threshold
+            if hit:
+                self._entries.move_to_end((best.scope, best.tokens))
+            self._stats.lookups += 1
+            self._stats.hits += int(hit)
+            self._stats.last_similarity = round(best_score, 4) if best is not None else None
+            self._stats.lookup_seconds += time.perf_counter() - started
+        return SimilarMatch(best.value, best_score, best.tokens) if hit else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._stats = _Stats()
+
+    def stats(self) -> Dict[str, Any]:
+        s = self._stats
+        return {
+            "threshold": self.threshold,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "lookups": s.lookups,
+            "hits": s.hits,
+            "hit_rate": round(s.hits / s.lookups, 4) if s.lookups else 0.0,
+            "avg_lookup_us": round(s.lookup_seconds / s.lookups * 1e6, 1) if s.lookups else 0.0,
+            "last_similarity": s.last_similarity,
+            "evictions": s.evictions,
+        }
+
+
+def index_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: index.stats() for name, index in _REGISTRY.items()}
+
+
+def set_threshold(threshold: float, name: Optional[str] = None) -> None:
+    """Поменять порог во время работы (для всех индексов или одного)."""
+    for index_name, index in _REGISTRY.items():
+        if name is None or index_name == name:
+            index.threshold = threshold
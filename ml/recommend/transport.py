@@ -0,0 +1,355 @@
+"""
+Общий асинхронный транспорт к LLM-провайдерам (YandexGPT, сервис бэкенда).
+
+- один долгоживущий httpx.AsyncClient с пулом keep-alive соединений на
+  event loop (HTTP/2, если установлен пакет h2) — без TCP/TLS рукопожатия
+  на каждый запрос;
+- глобальный семафор: не больше LLM_MAX_CONCURRENCY запросов одновременно;
+- ограничение частоты по провайдеру (token bucket, LLM_RATE_<PROVIDER> rps);
+- повтор на 429/5xx и сетевых ошибках с асинхронной паузой: Retry-After,
+  если провайдер его прислал, иначе экспонента с полным джиттером;
+- автомат защиты на провайдера (circuit.py): при открытом автомате запрос
+  сразу завершается CircuitOpenError без повторов, вызывающий уходит на правила;
+- наблюдатели (add_observer) получают длительность и исход каждого вызова
+  и смену состояния автомата — так транспорт питает мониторинг бэкенда.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import time
+import weakref
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import httpx
+
+from ml.recommend.circuit import OPEN, CircuitBreaker
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+try:  # HTTP/2 мультиплексирует запросы в одном соединении
+    import h2  # type: ignore  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:  # pragma: no cover
+    HTTP2_AVAILABLE = False
+
+
+class LLMTransportError(RuntimeError):
+    """Запрос не удался после всех повторов."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(LLMTransportError):
+    """Автомат провайдера открыт — запрос не отправлялся."""
+
+
+# observer(provider, kind, data): kind "call" — {duration, success, status_code},
+# "state" — {old, new}, "probe" — {healthy, latency, status_code, error}
+Observer = Callable[[str, str, Dict[str, Any]], None]
+
+
+class RateLimiter:
+    """Token bucket: rate запросов в секунду, всплеск до burst."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1, int(rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        # один event loop — без блокировок: между проверкой и списанием нет await
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class _LoopState:
+    """Клиент и примитивы синхронизации привязаны к своему event loop."""
+    client: httpx.AsyncClient
+    semaphore: asyncio.Semaphore
+    limiters: Dict[str, RateLimiter] = field(default_factory=dict)
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Retry-After в секундах (число или HTTP-дата) либо None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMTransport:
+    def __init__(self, max_concurrency: int = 8, max_connections: int = 20, keepalive: int = 10,
+                 timeout: float = 60.0, retries: int = 3, backoff: float = 1.0, max_backoff: float = 30.0,
+                 rates: Optional[Dict[str, float]] = None, default_rate: Optional[float] = None,
+                 http2: Optional[bool] = None, http_transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.max_concurrency = max_concurrency
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=keepalive)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.rates = dict(rates or {})
+        self.default_rate = default_rate
+        self.http2 = HTTP2_AVAILABLE if http2 is None else http2
+        self.http_transport = http_transport  # подмена сетевого уровня (прокси, тесты)
+        self._states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = \
+            weakref.WeakKeyDictionary()
+        # автоматы общие для всех event loop процесса: здоровье провайдера от loop не зависит
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._observers: List[Observer] = []
+
+    @classmethod
+    def from_env(cls) -> "LLMTransport":
+        rates = {
+            key[len("LLM_RATE_"):].lower(): float(value)
+            for key, value in os.environ.items()
+            if key.startswith("LLM_RATE_") and key != "LLM_RATE_DEFAULT" and value
+        }
+        rates.setdefault("yandex", 10.0)
+        default_rate = os.getenv("LLM_RATE_DEFAULT")
+        return cls(
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+            timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", "60")),
+            retries=int(os.getenv("LLM_RETRIES", "3")),
+            rates=rates,
+            default_rate=float(default_rate) if default_rate else None,
+        )
+
+    # ---------- состояние на event loop ----------
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None or state.client.is_closed:
+            state = _LoopState(
+                client=httpx.AsyncClient(timeout=self.timeout, limits=self.limits, http2=self.http2,
+                                         transport=self.http_transport),
+                semaphore=asyncio.Semaphore(self.max_concurrency),
+            )
+            self._states[loop] = state
+        return state
+
+    def _limiter(self, state: _LoopState, provider: str) -> Optional[RateLimiter]:
+        rate = self.rates.get(provider, self.default_rate)
+        if not rate:
+            return None
+        limiter = state.limiters.get(provider)
+        if limiter is None:
+            limiter = state.limiters[provider] = RateLimiter(rate)
+        return limiter
+
+    # ---------- автоматы и наблюдатели ----------
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        breaker = self.breakers.get(provider)
+        if breaker is None:
+            breaker = self.breakers[provider] = CircuitBreaker.from_env(provider)
+            breaker.listeners.append(
+                lambda name, old, new: self._emit(name, "state", {"old": old, "new": new}))
+        return breaker
+
+    def available(self, provider: str) -> bool:
+        """False — автомат провайдера открыт: вызывать LLM бессмысленно, сразу правила."""
+        return self.breaker(provider).available()
+
+    def add_observer(self, observer: Observer) -> None:
+        if observer not in self._observers:
+            self._observers.append(observer)
+
+    def _emit(self, provider: str, kind: str, data: Dict[str, Any]) -> None:
+        for observer in list(self._observers):
+            try:
+                observer(provider, kind, data)
+            except Exception:  # pragma: no cover - наблюдатель не должен ронять запрос
+                pass
+
+    def _record(self, provider: str, breaker: CircuitBreaker, success: bool, started: float,
+                status_code: Optional[int]) -> None:
+        duration = time.monotonic() - started
+        breaker.record(success, duration)
+        self._emit(provider, "call", {"duration": duration, "success": success, "status_code": status_code})
+
+    def backoff_delay(self, attempt: int, backoff: Optional[float] = None) -> float:
+        """Полный джиттер: случайная пауза в [0, base * 2^attempt], не больше max_backoff."""
+        base = self.backoff if backoff is None else backoff
+        return random.uniform(0, min(self.max_backoff, base * (2 ** attempt)))
+
+    # ---------- запросы ----------
+
+    async def post_json(self, provider: str, url: str, payload: Dict[str, Any],
+                        headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None,
+                        retries: Optional[int] = None, backoff: Optional[float] = None) -> Dict[str, Any]:
+        """
+        POST с JSON и разбор JSON-ответа. Повторяются 429/5xx и сетевые ошибки;
+        остальные коды — сразу httpx.HTTPStatusError. Пауза между попытками
+        не держит слот семафора. Каждая попытка учитывается автоматом
+        провайдера; если он открыт (или открылся между попытками) —
+        CircuitOpenError без дальнейших повторов.
+        """
+        state = self._state()
+        limiter = self._limiter(state, provider)
+        breaker = self.breaker(provider)
+        retries = self.retries if retries is None else retries
+        last_error = ""
+        last_status: Optional[int] = None
+        for attempt in range(retries + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(
+                    f"{provider} circuit is {breaker.state}" + (f"; last error: {last_error}" if last_error else ""),
+                    status_code=last_status)
+            if limiter is not None:
+                await limiter.acquire()
+            delay: Optional[float] = None
+            async with state.semaphore:
+                started = time.monotonic()
+                try:
+                    response = await state.client.post(url, json=payload, headers=headers,
+                                                       timeout=timeout or self.timeout)
+                except httpx.TransportError as e:
+                    last_error, last_status = f"{type(e).__name__}: {e}", None
+                    self._record(provider, breaker, False, started, None)
+                except BaseException:
+                    breaker.release()
+                    raise
+                else:
+                    if response.status_code not in RETRY_STATUSES:
+                        # 4xx — ошибка запроса, а не провайдера: для автомата это успех
+                        self._record(provider, breaker, True, started, response.status_code)
+                        response.raise_for_status()
+                        return response.json()
+                    last_error = f"HTTP {response.status_code}: {response.text[:400]}"
+                    last_status = response.status_code
+                    delay = retry_after_seconds(response)
+                    self._record(provider, breaker, False, started, response.status_code)
+            if attempt == retries:
+                break
+            delay = min(self.max_backoff, delay) if delay is not None else self.backoff_delay(attempt, backoff)
+            await asyncio.sleep(delay)
+        raise LLMTransportError(f"{provider} request failed after {retries + 1} attempts: {last_error}",
+                                status_code=last_status)
+
+    async def stream_lines(self, provider: str, url: str, payload: Dict[str, Any],
+                           headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None,
+                           retries: Optional[int] = None, backoff: Optional[float] = None
+                           ) -> AsyncIterator[str]:
+        """
+        POST с потоковым ответом: строки тела по мере прихода (NDJSON провайдера).
+        Повторы 429/5xx и сетевых ошибок — только пока не пришла первая строка;
+        слот семафора занят до конца потока. Автомат получает исход и время до
+        первой строки (длина потока зависит от объёма ответа, а не от здоровья
+        провайдера); обрыв после первой строки — ошибка вызывающему, без повтора.
+        """
+        state = self._state()
+        limiter = self._limiter(state, provider)
+        breaker = self.breaker(provider)
+        retries = self.retries if retries is None else retries
+        last_error = ""
+        last_status: Optional[int] = None
+        for attempt in range(retries + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(f"{provider} circuit is {breaker.state}", status_code=last_status)
+            if limiter is not None:
+                await limiter.acquire()
+            delay: Optional[float] = None
+            started_stream = False
+            async with state.semaphore:
+                started = time.monotonic()
+                try:
+                    async with state.client.stream("POST", url, json=payload, headers=headers,
+                                                   timeout=timeout or self.timeout) as response:
+                        if response.status_code in RETRY_STATUSES:
+                            await response.aread()
+                            last_error = f"HTTP {response.status_code}: {response.text[:400]}"
+                            last_status = response.status_code
+                            delay = retry_after_seconds(response)
+                            self._record(provider, breaker, False, started, response.status_code)
+                        else:
+                            if response.is_error:
+                                await response.aread()
+                                self._record(provider, breaker, True, started, response.status_code)
+                                response.raise_for_status()
+                            async for line in response.aiter_lines():
+                                if line.strip():
+                                    if not started_stream:
+                                        started_stream = True
+                                        self._record(provider, breaker, True, started, response.status_code)
+                                    yield line
+                            if not started_stream:
+                                self._record(provider, breaker, True, started, response.status_code)
+                            return
+                except httpx.TransportError as e:
+                    if started_stream:
+                        raise LLMTransportError(f"{provider} stream broken: {type(e).__name__}: {e}")
+                    self._record(provider, breaker, False, started, None)
+                    last_error, last_status = f"{type(e).__name__}: {e}", None
+                except (GeneratorExit, asyncio.CancelledError):
+                    # потребитель бросил поток до первой строки — исход для автомата неизвестен
+                    if not started_stream:
+                        breaker.release()
+                    raise
+            if attempt == retries:
+                break
+            delay = min(self.max_backoff, delay) if delay is not None else self.backoff_delay(attempt, backoff)
+            await asyncio.sleep(delay)
+        raise LLMTransportError(f"{provider} stream failed after {retries + 1} attempts: {last_error}",
+                                status_code=last_status)
+
+    async def probe(self, provider: str, url: str, timeout: float = 2.0) -> Dict[str, Any]:
+        """
+        Лёгкая проверка доступности: один GET без повторов, семафора и лимита
+        частоты. Состояние автомата проверка не меняет — его меняют только
+        реальные вызовы; открытый автомат делает результат нездоровым.
+        """
+        state = self._state()
+        started = time.monotonic()
+        result: Dict[str, Any] = {"healthy": False, "status_code": None, "error": None}
+        try:
+            response = await state.client.get(url, timeout=timeout)
+            result["status_code"] = response.status_code
+            result["healthy"] = response.status_code < 500
+        except httpx.HTTPError as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["latency"] = round(time.monotonic() - started, 4)
+        result["circuit"] = self.breaker(provider).snapshot()
+        result["healthy"] = result["healthy"] and result["circuit"]["state"] != OPEN
+        self._emit(provider, "probe", result)
+        return result
+
+    async def aclose(self) -> None:
+        """Закрыть клиент текущего event loop (остановка приложения, конец asyncio.run)."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        state = self._states.pop(loop, None)
+        if state is not None:
+            await state.client.aclose()
+
+
+# общий экземпляр для всех клиентов LLM процесса
+llm_transport = LLMTransport.from_env()
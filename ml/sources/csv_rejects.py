@@ -0,0 +1,117 @@
+"""
+Битые строки CSV (не то число полей) не роняют и не замедляют чтение:
+парсер pyarrow остаётся на быстром пути, а строка через invalid_row_handler
+уходит в ограниченный приёмник — с номером строки, причиной и исходным текстом.
+Приёмник можно выгрузить в JSONL-файл или таблицу рабочей БД (<table>_rejects).
+"""
+import json
+import threading
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+DEFAULT_MAX_REJECTS = 10_000
+REJECTS_SCHEMA = pa.schema([
+    ("line_number", pa.int64()),
+    ("reason", pa.string()),
+    ("raw_text", pa.string()),
+])
+
+
+class TooManyRejectsError(ValueError):
+    """Битых строк больше порога — скорее всего, неверный разделитель или формат."""
+
+
+@dataclass
+class RejectedRow:
+    line: Optional[int]
+    reason: str
+    text: str
+
+
+class RejectSink:
+    """
+    Ограниченный приёмник: хранит не больше max_rows строк, дальше чтение
+    прерывается с TooManyRejectsError. path — дублировать строки в JSONL.
+    """
+
+    def __init__(self, max_rows: int = DEFAULT_MAX_REJECTS, path: Optional[str] = None,
+                 sample_size: int = 20) -> None:
+        self.max_rows = max_rows
+        self.path = Path(path) if path else None
+        self.sample_size = sample_size
+        self.rows: List[RejectedRow] = []
+        self._lock = threading.Lock()
+        self._file = None
+        self._overflow: Optional[tuple] = None
+
+    @property
+    def count(self) -> int:
+        return len(self.rows)
+
+    @property
+    def overflowed(self) -> bool:
+        return self._overflow is not None
+
+    def overflow_error(self) -> TooManyRejectsError:
+        line, reason = self._overflow or (None, "")
+        return TooManyRejectsError(
+            f"Битых строк больше {self.max_rows} (строка {line}: {reason}) — проверьте разделитель и формат"
+        )
+
+    def add(self, line: Optional[int], reason: str, text: str) -> bool:
+        """Запомнить строку; False — порог исчерпан, чтение нужно прервать."""
+        with self._lock:
+            if len(self.rows) >= self.max_rows:
+                self._overflow = (line, reason)
+                return False
+            row = RejectedRow(line, reason, text)
+            self.rows.append(row)
+            if self.path is not None:
+                if self._file is None:
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write(json.dumps(asdict(row), ensure_ascii=False) + "\n")
+            return True
+
+    def handler(self, row: Any) -> str:
+        """
+        invalid_row_handler для pyarrow.csv: запомнить строку и пропустить её.
+        Исключения из обработчика pyarrow глотает, поэтому при переполнении
+        возвращаем "error": чтение падает с ArrowInvalid, а вызывающий
+        подменяет её на overflow_error().
+        """
+        reason = f"expected {row.expected_columns} columns, got {row.actual_columns}"
+        return "skip" if self.add(row.number, reason, row.text) else "error"
+
+    def pandas_handler(self, fields: List[str]) -> None:
+        """on_bad_lines для pandas (engine="python"), когда pyarrow не справился; номера строки нет."""
+        if not self.add(None, f"unexpected {len(fields)} columns", ",".join(fields)):
+            raise self.overflow_error()
+        return None
+
+    def to_batch(self) -> pa.RecordBatch:
+        return pa.RecordBatch.from_pydict({
+            "line_number": [r.line for r in self.rows],
+            "reason": [r.reason for r in self.rows],
+            "raw_text": [r.text for r in self.rows],
+        }, schema=REJECTS_SCHEMA)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "rejected_rows": self.count,
+            "rejects_sample": [asdict(r) for r in self.rows[:self.sample_size]],
+            "rejects_path": str(self.path) if self.path else None,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def csv_parse_options(delimiter: str = ",", rejects: Optional[RejectSink] = None) -> pacsv.ParseOptions:
+    return pacsv.ParseOptions(delimiter=delimiter, invalid_row_handler=rejects.handler if rejects else None)
@@ -1,12 +1,66 @@
 # ml/sources/loader.py
 from __future__ import annotations
 from pathlib import Path
-from io import StringIO, BytesIO
-from typing import Tuple, Dict, Any
+from io import BytesIO
+from typing import Tuple, Dict, Any, Iterable
 import pandas as pd
 import numpy as np
 import xml.etree.ElementTree as ET
 
+from ml.sources.csv_rejects import RejectSink, csv_parse_options
+
+# сколько строк из БД берём в выборку, если limit не задан
+DEFAULT_SAMPLE_ROWS = 10_000
+
+def _batches_to_frame(batches: Iterable[Any], limit: int) -> pd.DataFrame:
+    """Собрать Arrow-батчи в DataFrame, не читая источник дальше limit строк."""
+    import pyarrow as pa
+    taken, rows = [], 0
+    try:
+        for batch in batches:
+            taken.append(batch)
+            rows += batch.num_rows
+            if rows >= limit:
+                break
+    finally:
+        # закрыть генератор сразу: отпускает серверный курсор / отменяет COPY
+        close = getattr(batches, "close", None)
+        if close:
+            close()
+    if not taken:
+        return pd.DataFrame()
+    return pa.Table.from_batches(taken).slice(0, limit).to_pandas()
+
+# сколько битых строк CSV допускаем в выборке, прежде чем считать разделитель неверным
+DEFAULT_MAX_REJECTS = 1_000
+
+def _sniff_delimiter(text: str) -> str:
+    import csv
+    try:
+        return csv.Sniffer().sniff(text[:50_000], delimiters=",;|\t").delimiter
+    except csv.Error:
+        # битые строки сбивают Sniffer — берём самый частый разделитель в заголовке
+        header = text.split("\n", 1)[0]
+        counts = {d: header.count(d) for d in (",", ";", "|", "\t")}
+        return max(counts, key=counts.get) if any(counts.values()) else ","
+
+def _read_csv_fast(text: str, sep: str, rejects: RejectSink) -> pd.DataFrame:
+    """
+    CSV парсером pyarrow (без engine="python"): строки с неверным числом полей
+    пропускаются и попадают в rejects с номером строки и причиной.
+    Переполнение приёмника — ошибка (скорее всего, не тот разделитель).
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    try:
+        reader = pacsv.open_csv(BytesIO(text.encode("utf-8")), parse_options=csv_parse_options(sep, rejects))
+        return reader.read_all().to_pandas(coerce_temporal_nanoseconds=True)
+    except pa.ArrowInvalid:
+        if rejects.overflowed:
+            raise rejects.overflow_error()
+        raise
+
 def _jsonable_preview(df: pd.DataFrame, n=5):
     return df.replace([np.nan, np.inf, -np.inf], None).head(n).to_dict(orient="records")
 
@@ -14,26 +68,34 @@ def load_sample(source: Dict[str, Any]) -> Tuple[pd.DataFrame, Dict[str, Any]]:
     """
     source:
       {"type":"file","format":"csv|json|xml","path":"/abs/path"}
-      {"type":"postgres","dsn":"...","query":"SELECT ... LIMIT 100"}
-      {"type":"clickhouse","url":"http://...","query":"..."}
+      {"type":"postgres","dsn":"...","query":"SELECT ...","limit":10000}
+      {"type":"postgres","dsn":"...","table":"schema.table","columns":[...],"where":"...","mode":"cursor|copy"}
+      {"type":"clickhouse","host":"...","port":8123,"database":"...","table":"...","columns":[...],"where":"..."}
+      {"type":"clickhouse","host":"...","query":"..."}
     """
     st = (source.get("type") or "").lower()
     if st == "file":
         path = Path(source["path"])
         fmt = (source.get("format") or path.suffix.lstrip(".")).lower()
         if fmt == "csv":
-            # устойчивый CSV
+            # устойчивый CSV: битые строки не теряются молча, а считаются и отдаются в meta
             raw = path.read_bytes()
+            max_rejects = int(source.get("max_rejects", DEFAULT_MAX_REJECTS))
             for enc in ["utf-8-sig","utf-8","cp1251","windows-1251","latin1"]:
                 try:
                     txt = raw.decode(enc, errors="ignore").replace("\x00", "")
-                    buf = StringIO(txt)
-                    try:
-                        df = pd.read_csv(buf, sep=None, engine="python", on_bad_lines="skip")
-                    except Exception:
-                        buf.seek(0)
-                        df = pd.read_csv(buf, sep=";", engine="python", on_bad_lines="skip")
-                    return df, {"type":"file","format":"csv","name":path.name}
+                    for sep in (_sniff_delimiter(txt), ";"):
+                        rejects = RejectSink(max_rows=max_rejects)
+                        try:
+                            df = _read_csv_fast(txt, sep, rejects)
+                            break
+                        except Exception:
+                            continue
+                    else:
+                        continue
+                    meta = rejects.as_dict()
+                    return df, {"type":"file","format":"csv","name":path.name,
+                                "rejected_rows": meta["rejected_rows"], "rejects_sample": meta["rejects_sample"]}
                 except Exception:
                     continue
             raise ValueError("CSV read failed (encoding/separator)")
@@ -57,12 +119,29 @@ def load_sample(source: Dict[str, Any]) -> Tuple[pd.DataFrame, Dict[str, Any]]:
             raise ValueError(f"Unsupported file format: {fmt}")
 
     elif st == "postgres":
-        # интерфейс-заглушка для демо; реал коннект добьём позже
-        # from sqlalchemy import create_engine; pd.read_sql(query, engine)
-        return pd.DataFrame(), {"type":"postgres", "note":"not_implemented_in_mvp_loader"}
+        # потоковый экстрактор бэкенда: читаем батчами до limit строк
+        try:
+            from app.connectors.postgres_extractor import PostgresExtractor
+        except ImportError:
+            return pd.DataFrame(), {"type":"postgres", "note":"backend_extractor_unavailable"}
+        extractor = PostgresExtractor(source.get("dsn"), mode=source.get("mode", "cursor"))
+        batches = extractor.iter_batches(table=source.get("table"), query=source.get("query"),
+                                         columns=source.get("columns"), where=source.get("where"))
+        df = _batches_to_frame(batches, int(source.get("limit", DEFAULT_SAMPLE_ROWS)))
+        return df, {"type":"postgres", "table":source.get("table"), "rows":len(df)}
 
     elif st == "clickhouse":
-        return pd.DataFrame(), {"type":"clickhouse", "note":"not_implemented_in_mvp_loader"}
+        try:
+            from app.connectors.clickhouse_extractor import ClickHouseExtractor
+        except ImportError:
+            return pd.DataFrame(), {"type":"clickhouse", "note":"backend_extractor_unavailable"}
+        extractor = ClickHouseExtractor(host=source.get("host"), port=source.get("port"),
+                                        user=source.get("user"), password=source.get("password"),
+                                        database=source.get("database"))
+        batches = extractor.iter_batches(table=source.get("table"), query=source.get("query"),
+                                         columns=source.get("columns"), where=source.get("where"))
+        df = _batches_to_frame(batches, int(source.get("limit", DEFAULT_SAMPLE_ROWS)))
+        return df, {"type":"clickhouse", "table":source.get("table"), "rows":len(df)}
 
     elif st == "hdfs":
         return pd.DataFrame(), {"type":"hdfs", "note":"not_implemented_in_mvp_loader"}